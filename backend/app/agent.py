@@ -11,6 +11,7 @@ from app.integrations.openai_client import (
     gen_product_from_image,
     DEFAULT_LLM_MODEL,
 )
+from app.llm_gateway import complete as llm_complete
 
 
 client = OpenAI()
@@ -178,9 +179,13 @@ def run_agent_until_final(
     final_text_parts: List[str] = []
 
     for _ in range(max_iters):
-        resp = client.chat.completions.create(
-            model=(model or DEFAULT_LLM_MODEL),
-            messages=working,
+        # Tool-calling turns run side effects, so they are never served from cache.
+        resp = llm_complete(
+            "openai",
+            model or DEFAULT_LLM_MODEL,
+            working,
+            client.chat.completions.create,
+            cache=False,
             tools=TOOLS,
             tool_choice="auto",
         )
@@ -4,11 +4,16 @@ Phase 1: Customer Profiler — identifies target demographics from product data
 Phase 2: Campaign Analyst — produces prioritized recommendations + scaling plan
 """
 
+import hashlib
 import json
 import logging
 import os
+import re
+import threading
+import time
 from tenacity import retry, stop_after_attempt, wait_exponential
 from app.integrations.openai_client import client, DEFAULT_LLM_MODEL
+from app.llm_gateway import complete as llm_complete
 
 logger = logging.getLogger(__name__)
 
@@ -143,23 +148,35 @@ CAMPAIGN_ANALYST_PROMPT = (
 # ─────────────── Orchestration ───────────────
 
 @retry(stop=stop_after_attempt(2), wait=wait_exponential(multiplier=1, max=8))
-def _call_llm(system_prompt: str, user_content: str, model: str | None = None) -> dict:
-    """Single LLM call returning parsed JSON."""
+def _call_llm(system_prompt: str, user_content: str, model: str | None = None, usage_out: dict | None = None) -> dict:
+    """Single LLM call returning parsed JSON.
+
+    When ``usage_out`` is given it receives the call's ``total_tokens``.
+    """
     use_model = model or ANALYZER_MODEL
     logger.info("Campaign Analyzer _call_llm: model=%s, input_len=%d", use_model, len(user_content))
     try:
-        resp = client.chat.completions.create(
-            model=use_model,
-            messages=[
+        # Bulk analysis runs many groups in parallel; the gateway's OpenAI
+        # slots keep the process under its concurrency/QPS budget.
+        resp = llm_complete(
+            "openai",
+            use_model,
+            [
                 {"role": "system", "content": "Respond ONLY with a JSON object. No prose, no markdown."},
                 {"role": "user", "content": system_prompt + "\n\n" + user_content},
             ],
+            client.chat.completions.create,
             response_format={"type": "json_object"},
         )
     except Exception as e:
         logger.error("Campaign Analyzer _call_llm: OpenAI API error: %s", e)
         raise
 
+    if usage_out is not None:
+        try:
+            usage_out["total_tokens"] = int(getattr(resp.usage, "total_tokens", 0) or 0)
+        except Exception:
+            usage_out["total_tokens"] = 0
     text = resp.choices[0].message.content
     logger.info("Campaign Analyzer _call_llm: response_len=%d, finish=%s", len(text or ""), resp.choices[0].finish_reason)
     try:
@@ -169,6 +186,118 @@ def _call_llm(system_prompt: str, user_content: str, model: str | None = None) -
         return {}
 
 
+# ─────────────── Phase memo (persistent) ───────────────
+# Phase 1 only depends on the product, so re-analyzing the same products every
+# week would otherwise pay for identical profiler calls. Outputs are stored in
+# AppSetting under ``analysis_memo:{phase}:{hash}`` where the hash covers the
+# model, the prompt version and the normalized product context, including the
+# product and image URLs the prompt shows. A product with neither title nor
+# description (failed Shopify fetch, ungrouped campaign) is never memoized:
+# those would all share one key.
+
+PHASE_MEMO_TTL_S = int(os.getenv("PTOS_ANALYSIS_MEMO_TTL_S", str(30 * 24 * 3600)) or "0")
+_PHASE_MEMO_PREFIX = "analysis_memo:"
+_MEMO_STATS_LOCK = threading.Lock()
+_MEMO_STATS: dict = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "tokens_saved": 0}
+
+
+def _prompt_version(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def _normalize_url(value, *, drop_query: bool = False) -> str:
+    url = str(value or "").strip()
+    if drop_query:
+        url = url.split("?", 1)[0].split("#", 1)[0]
+    return url
+
+
+def _normalize_product_context(product_info: dict) -> dict:
+    """The Phase-1 prompt fields reduced to what changes the profile (no HTML, spacing or CDN cache-busters)."""
+    info = product_info or {}
+    title = re.sub(r"\s+", " ", str(info.get("title") or "")).strip().casefold()
+    desc = re.sub(r"<[^>]+>", " ", str(info.get("description") or ""))
+    desc = re.sub(r"\s+", " ", desc).strip()[:2000]
+    price_raw = info.get("price")
+    try:
+        price = f"{float(price_raw):.2f}" if price_raw not in (None, "") else ""
+    except Exception:
+        price = str(price_raw or "").strip()
+    return {
+        "title": title,
+        "price": price,
+        "description": desc,
+        "product_url": _normalize_url(info.get("product_url")),
+        # Shopify CDN appends ?v=<timestamp> to the same file
+        "image_url": _normalize_url(info.get("image_url"), drop_query=True),
+    }
+
+
+def _phase_memoizable(product_info: dict) -> bool:
+    ctx = _normalize_product_context(product_info)
+    return bool(ctx["title"] or ctx["description"])
+
+
+def phase_memo_key(phase: str, model: str, prompt: str, product_info: dict) -> str:
+    raw = json.dumps(
+        {"model": model, "prompt": _prompt_version(prompt), "product": _normalize_product_context(product_info)},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return f"{_PHASE_MEMO_PREFIX}{phase}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+def _memo_count(name: str, amount: int = 1) -> None:
+    with _MEMO_STATS_LOCK:
+        _MEMO_STATS[name] = int(_MEMO_STATS.get(name, 0)) + int(amount or 0)
+
+
+def _memo_get(key: str) -> dict | None:
+    from app import db
+    try:
+        entry = db.get_app_setting(None, key)
+    except Exception:
+        return None
+    if not isinstance(entry, dict) or not isinstance(entry.get("value"), dict):
+        _memo_count("misses")
+        return None
+    if PHASE_MEMO_TTL_S > 0 and (time.time() - float(entry.get("created_at") or 0)) > PHASE_MEMO_TTL_S:
+        _memo_count("expired")
+        _memo_count("misses")
+        return None
+    _memo_count("hits")
+    _memo_count("tokens_saved", int(entry.get("tokens") or 0))
+    return entry["value"]
+
+
+def _memo_put(key: str, value: dict, *, model: str, tokens: int) -> None:
+    from app import db
+    try:
+        db.set_app_setting(None, key, {"value": value, "model": model, "tokens": int(tokens or 0), "created_at": time.time()})
+        _memo_count("stores")
+    except Exception as exc:
+        logger.warning("Campaign Analyzer: failed to store phase memo: %s", exc)
+
+
+def invalidate_phase_memo(product_info: dict | None = None, *, phase: str = "customer_profile", model: str | None = None) -> int:
+    """Drop memoized phase outputs: one product's entry, or every entry when ``product_info`` is None."""
+    from app import db
+    if product_info is None:
+        return db.delete_app_settings_by_prefix(None, _PHASE_MEMO_PREFIX)
+    key = phase_memo_key(phase, model or ANALYZER_MODEL, CUSTOMER_PROFILER_PROMPT, product_info)
+    return 1 if db.delete_app_setting(None, key) else 0
+
+
+def phase_memo_stats() -> dict:
+    """Hit/miss counters and tokens saved since process start."""
+    with _MEMO_STATS_LOCK:
+        stats = dict(_MEMO_STATS)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["ttl_s"] = PHASE_MEMO_TTL_S
+    return stats
+
+
 def analyze_campaign(
     *,
     campaign_metrics: dict,
@@ -178,6 +307,7 @@ def analyze_campaign(
     customer_profile_override: dict | None = None,
     model: str | None = None,
     previous_analysis_context: str | None = None,
+    use_memo: bool = True,
 ) -> dict:
     """Run the two-phase analysis pipeline.
 
@@ -189,6 +319,7 @@ def analyze_campaign(
         customer_profile_override: skip Phase 1 if already known
         model: OpenAI model override
         previous_analysis_context: formatted string describing previous analysis + implementation status
+        use_memo: reuse a stored Phase 1 profile for an unchanged product
 
     Returns:
         { customer_profile, recommendations, scaling_plan, creative_analysis, ... }
@@ -196,9 +327,20 @@ def analyze_campaign(
     use_model = model or ANALYZER_MODEL
 
     # ── Phase 1: Customer Profiler ──
+    memo_key = None
+    if use_memo and _phase_memoizable(product_info):
+        memo_key = phase_memo_key("customer_profile", use_model, CUSTOMER_PROFILER_PROMPT, product_info)
+    customer_profile = None
+    profile_source = "llm"
     if customer_profile_override:
         customer_profile = customer_profile_override
-    else:
+        profile_source = "override"
+    elif memo_key:
+        customer_profile = _memo_get(memo_key)
+        if customer_profile is not None:
+            profile_source = "memo"
+            logger.info("Campaign Analyzer: Phase 1 served from memo")
+    if customer_profile is None:
         product_context = (
             f"PRODUCT DATA:\n"
             f"Title: {product_info.get('title', 'Unknown')}\n"
@@ -208,9 +350,12 @@ def analyze_campaign(
             f"Image URL: {product_info.get('image_url', '')}\n"
         )
         logger.info("Campaign Analyzer: Phase 1 (Customer Profiler) with %s", use_model)
-        customer_profile = _call_llm(CUSTOMER_PROFILER_PROMPT, product_context, model=use_model)
+        usage: dict = {}
+        customer_profile = _call_llm(CUSTOMER_PROFILER_PROMPT, product_context, model=use_model, usage_out=usage)
         if not customer_profile:
             customer_profile = {"error": "Could not generate customer profile"}
+        elif memo_key:
+            _memo_put(memo_key, customer_profile, model=use_model, tokens=usage.get("total_tokens") or 0)
 
     # ── Phase 2: Campaign Analyst ──
     analyst_input = (
@@ -260,6 +405,7 @@ def analyze_campaign(
 
     return {
         "customer_profile": customer_profile,
+        "customer_profile_source": profile_source,
         **analysis,
     }
 
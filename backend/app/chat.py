@@ -31,7 +31,7 @@ from fastapi import APIRouter, File, Form, Request, Response, UploadFile, WebSoc
 from pydantic import BaseModel
 from sqlalchemy import Column, DateTime, Index, String, Text, desc, or_
 
-from app import db
+from app import db, db_async
 
 log = logging.getLogger("app.chat")
 
@@ -181,10 +181,76 @@ def upsert_account(
         return _account_dict(acc)
 
 
+def _get_account_in(session, account_id: str) -> Optional[Dict[str, Any]]:
+    acc = session.get(ChatAccount, _norm_id(account_id))
+    return _account_dict(acc) if acc else None
+
+
 def get_account(account_id: str) -> Optional[Dict[str, Any]]:
     with db.SessionLocal() as session:
-        acc = session.get(ChatAccount, _norm_id(account_id))
-        return _account_dict(acc) if acc else None
+        return _get_account_in(session, account_id)
+
+
+# Read queries of the async routes take a session so they run through
+# ``db_async.run`` instead of blocking the event loop.
+
+
+def _search_accounts_in(session, term: str, cap: int) -> List[Dict[str, Any]]:
+    query = session.query(ChatAccount)
+    if term:
+        like = f"%{term}%"
+        query = query.filter(or_(ChatAccount.handle.like(like), ChatAccount.display_name.ilike(like)))
+    return [_account_dict(a) for a in query.order_by(ChatAccount.handle).limit(cap * 2).all()]
+
+
+def _conversations_in(session, me_id: str) -> tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """({peer_id: {peer_id, last_message, unread}}, {peer_id: account}) for ``me_id``."""
+    rows = (
+        session.query(ChatMessage)
+        .filter(or_(ChatMessage.sender_id == me_id, ChatMessage.recipient_id == me_id))
+        .order_by(desc(ChatMessage.created_at))
+        .limit(2000)
+        .all()
+    )
+    convos: Dict[str, Dict[str, Any]] = {}
+    for m in rows:
+        peer_id = m.recipient_id if m.sender_id == me_id else m.sender_id
+        entry = convos.get(peer_id)
+        if entry is None:
+            entry = {"peer_id": peer_id, "last_message": _message_dict(m), "unread": 0}
+            convos[peer_id] = entry
+        # rows are newest-first, so the first one seen is the last_message
+        if m.recipient_id == me_id and m.status != "read":
+            entry["unread"] += 1
+    peer_ids = list(convos.keys())
+    accounts = {a.id: _account_dict(a) for a in session.query(ChatAccount).filter(ChatAccount.id.in_(peer_ids)).all()} if peer_ids else {}
+    return convos, accounts
+
+
+def _messages_in(session, cid: str, before: str | None, after: str | None, limit: int) -> List[Dict[str, Any]]:
+    query = session.query(ChatMessage).filter(ChatMessage.conversation_id == cid)
+    # Incremental poll: only messages newer than `after` (cheap, indexed), asc.
+    if after:
+        try:
+            adt = datetime.fromisoformat(after.replace("Z", ""))
+            rows = (
+                query.filter(ChatMessage.created_at > adt)
+                .order_by(ChatMessage.created_at)
+                .limit(200)
+                .all()
+            )
+            return [_message_dict(m) for m in rows]
+        except Exception:
+            pass
+    if before:
+        try:
+            bdt = datetime.fromisoformat(before.replace("Z", ""))
+            query = query.filter(ChatMessage.created_at < bdt)
+        except Exception:
+            pass
+    rows = query.order_by(desc(ChatMessage.created_at)).limit(max(1, min(limit, 100))).all()
+    rows.reverse()  # chronological asc
+    return [_message_dict(m) for m in rows]
 
 
 # ---------------------------------------------------------------------------
@@ -585,15 +651,9 @@ async def chat_search(q: str = "", me: str = "", limit: int = 20):
 
     merged: Dict[str, Dict[str, Any]] = {}
     # 1) Registered chat accounts (authoritative — keep real avatar/presence).
-    with db.SessionLocal() as session:
-        query = session.query(ChatAccount)
-        if term:
-            like = f"%{term}%"
-            query = query.filter(or_(ChatAccount.handle.like(like), ChatAccount.display_name.ilike(like)))
-        rows = query.order_by(ChatAccount.handle).limit(cap * 2).all()
-    for a in rows:
-        if a.id != me_id:
-            merged[a.id] = _account_dict(a)
+    for a in await db_async.run(_search_accounts_in, term, cap):
+        if a["id"] != me_id:
+            merged[a["id"]] = a
 
     # 2) Accounts known to other modules (vendors, customers...) not yet registered.
     for acc in _provider_accounts(term):
@@ -606,7 +666,7 @@ async def chat_search(q: str = "", me: str = "", limit: int = 20):
 
 @router.get("/api/chat/account/{account_id}")
 async def chat_account(account_id: str):
-    acc = get_account(account_id)
+    acc = await db_async.run(_get_account_in, account_id)
     if not acc:
         return {"error": "not_found"}
     return {"data": acc}
@@ -617,31 +677,12 @@ async def chat_conversations(me: str, limit: int = 100):
     me_id = _norm_id(me)
     if not me_id:
         return {"error": "me required"}
-    with db.SessionLocal() as session:
-        rows = (
-            session.query(ChatMessage)
-            .filter(or_(ChatMessage.sender_id == me_id, ChatMessage.recipient_id == me_id))
-            .order_by(desc(ChatMessage.created_at))
-            .limit(2000)
-            .all()
-        )
-        convos: Dict[str, Dict[str, Any]] = {}
-        for m in rows:
-            peer_id = m.recipient_id if m.sender_id == me_id else m.sender_id
-            entry = convos.get(peer_id)
-            if entry is None:
-                entry = {"peer_id": peer_id, "last_message": _message_dict(m), "unread": 0}
-                convos[peer_id] = entry
-            # rows are newest-first, so the first one seen is the last_message
-            if m.recipient_id == me_id and m.status != "read":
-                entry["unread"] += 1
-        peer_ids = list(convos.keys())
-        accounts = {a.id: a for a in session.query(ChatAccount).filter(ChatAccount.id.in_(peer_ids)).all()} if peer_ids else {}
+    convos, accounts = await db_async.run(_conversations_in, me_id)
 
     result = []
     for peer_id, entry in convos.items():
         acc = accounts.get(peer_id)
-        peer = _account_dict(acc) if acc else {
+        peer = acc or {
             "id": peer_id, "handle": peer_id, "name": peer_id, "avatar": "", "kind": "",
             "online": manager.is_online(peer_id), "last_seen": None,
         }
@@ -653,30 +694,7 @@ async def chat_conversations(me: str, limit: int = 100):
 @router.get("/api/chat/messages")
 async def chat_messages(me: str, peer: str, before: str | None = None, after: str | None = None, limit: int = 40):
     cid = conversation_id(me, peer)
-    with db.SessionLocal() as session:
-        query = session.query(ChatMessage).filter(ChatMessage.conversation_id == cid)
-        # Incremental poll: only messages newer than `after` (cheap, indexed), asc.
-        if after:
-            try:
-                adt = datetime.fromisoformat(after.replace("Z", ""))
-                rows = (
-                    query.filter(ChatMessage.created_at > adt)
-                    .order_by(ChatMessage.created_at)
-                    .limit(200)
-                    .all()
-                )
-                return {"data": [_message_dict(m) for m in rows]}
-            except Exception:
-                pass
-        if before:
-            try:
-                bdt = datetime.fromisoformat(before.replace("Z", ""))
-                query = query.filter(ChatMessage.created_at < bdt)
-            except Exception:
-                pass
-        rows = query.order_by(desc(ChatMessage.created_at)).limit(max(1, min(limit, 100))).all()
-    rows.reverse()  # chronological asc
-    return {"data": [_message_dict(m) for m in rows]}
+    return {"data": await db_async.run(_messages_in, cid, before, after, limit)}
 
 
 @router.post("/api/chat/send")
@@ -0,0 +1,229 @@
+"""Local mirror of the confirmation work queue.
+
+The confirmation UI used to page open/unfulfilled orders from Shopify and
+filter them by agent tags in Python. An agent could get a nearly empty page,
+and the analytics and stuck-orders probe re-paged up to 20×250 orders per call.
+Here, every order snapshot that reaches the Shopify order mirror (webhooks and
+reconcile, see ``app.shopify_mirror``) is also projected into
+``confirmation_queue``. A row holds the order id, created_at, its tags, n-stage
+and wtp-stage, and whether the order is still in the queue (open, unfulfilled,
+not cancelled, no COD tag). Each tag also gets an indexed row, so agent lists
+and counts are single indexed queries paginated by (created_at, id).
+
+Agents are resolved through their tags at query time, not stored per order,
+because the agent -> tags mapping is editable settings.
+
+``sync(store)`` keeps the queue fresh without webhooks. The first run (and one
+every RESEED_S) pages the full open/unfulfilled set and retires rows that are
+no longer in it. Later runs page ``updated_at_min`` from a watermark. Reads
+call ``ensure_fresh`` to schedule the sync job when it's due, and fall back to
+Shopify while the queue is not ``ready``.
+
+Env vars (optional):
+  PTOS_CONFIRMATION_QUEUE_SYNC_S     seconds between incremental syncs triggered by reads (default 120)
+  PTOS_CONFIRMATION_QUEUE_MAX_AGE_S  a queue not synced for this long is bypassed (default 1800)
+  PTOS_CONFIRMATION_QUEUE_RESEED_S   seconds between full re-reads of the open set (default 86400)
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any
+
+from app import db
+from app.job_runner import register_job
+
+_log = logging.getLogger("app.confirmation_queue")
+
+SYNC_S = int(os.getenv("PTOS_CONFIRMATION_QUEUE_SYNC_S", "120") or "120")
+MAX_AGE_S = int(os.getenv("PTOS_CONFIRMATION_QUEUE_MAX_AGE_S", "1800") or "1800")
+RESEED_S = int(os.getenv("PTOS_CONFIRMATION_QUEUE_RESEED_S", "86400") or "86400")
+
+CURSOR_PREFIX = "cq1."
+
+_SYNC_KEY = "confirmation_queue_sync"
+_LOCK = threading.Lock()
+_submitted: dict[str | None, float] = {}
+
+
+def _tags_list(tags_raw: Any) -> list[str]:
+    if isinstance(tags_raw, list):
+        return [str(t).strip() for t in tags_raw if str(t or "").strip()]
+    return [t.strip() for t in str(tags_raw or "").split(",") if t.strip()]
+
+
+def _stage(tags: list[str], prefix: str) -> int:
+    best = 0
+    for t in tags:
+        m = re.match(rf"^{prefix}(\d+)$", t.strip().lower())
+        if m:
+            best = max(best, int(m.group(1)))
+    return best
+
+
+def in_queue(order: dict, tags: list[str]) -> bool:
+    """Open, unfulfilled, not cancelled/closed and not yet COD-confirmed."""
+    from app.integrations.shopify_client import has_cod_tag
+
+    if has_cod_tag(tags):
+        return False
+    if order.get("cancelled_at") or order.get("canceled_at") or order.get("closed_at"):
+        return False
+    if str(order.get("status") or "").strip().lower() in ("closed", "cancelled", "canceled", "archived"):
+        return False
+    fulfillment = str(order.get("fulfillment_status") or "").strip().lower()
+    return not fulfillment or fulfillment == "unfulfilled"
+
+
+def project(order: dict) -> dict[str, Any]:
+    tags = _tags_list(order.get("tags"))
+    return {
+        "order_id": str(order.get("id") or ""),
+        "name": order.get("name"),
+        "created_at": order.get("created_at"),
+        "updated_at": order.get("updated_at"),
+        "tags": tags,
+        "n_stage": _stage(tags, "n"),
+        "wtp_stage": _stage(tags, "wtp"),
+        "active": in_queue(order, tags),
+    }
+
+
+def apply_orders(store: str | None, orders: list[dict]) -> int:
+    """Project mirrored order payloads into the queue."""
+    return db.apply_confirmation_queue(store, [project(o) for o in orders or [] if isinstance(o, dict)])
+
+
+def note_tags(store: str | None, order_id: str, tags: list[str]) -> None:
+    """Reflect an agent action (tag cycle / COD confirm) before Shopify's webhook arrives."""
+    try:
+        tags = _tags_list(tags)
+        from app.integrations.shopify_client import has_cod_tag
+        db.update_confirmation_queue_tags(
+            store, str(order_id), tags,
+            n_stage=_stage(tags, "n"), wtp_stage=_stage(tags, "wtp"), active=not has_cod_tag(tags),
+        )
+    except Exception as e:
+        _log.debug("confirmation queue tag update failed for %s: %s", order_id, e)
+
+
+def _state(store: str | None) -> dict:
+    state = db.get_app_setting(store, _SYNC_KEY)
+    return state if isinstance(state, dict) else {}
+
+
+def sync(store: str | None, *, full: bool = False) -> dict[str, Any]:
+    """Full re-read of the open set when due (or ``full``), else an ``updated_at_min`` sweep."""
+    from app.shopify_mirror import OVERLAP_S, _page_resource
+
+    state = _state(store)
+    started = time.time()
+    started_dt = datetime.utcnow()
+    full = full or not state.get("seeded_at") or started - float(state.get("seeded_at") or 0) > RESEED_S
+    if full:
+        params = {"status": "open", "fulfillment_status": "unfulfilled", "limit": 250, "order": "created_at desc"}
+    else:
+        last = db._shopify_ts(state.get("updated_at")) or started_dt
+        params = {"status": "any", "updated_at_min": (last - timedelta(seconds=OVERLAP_S)).isoformat() + "Z", "limit": 250, "order": "updated_at asc"}
+    rows, complete = _page_resource(store, "orders", params)
+    db.upsert_shopify_orders(store, rows)
+    written = apply_orders(store, rows)
+    out: dict[str, Any] = {"store": store, "mode": "full" if full else "incremental", "fetched": len(rows), "written": written, "complete": complete}
+    if full and complete:
+        # Anything we didn't see in the complete open set has left the queue.
+        out["retired"] = db.retire_confirmation_queue(store, synced_before=started)
+        db.prune_confirmation_queue(store, started - RESEED_S)
+        state["seeded_at"] = started
+    if complete:
+        state["updated_at"] = started_dt.isoformat() + "Z"
+        state["synced_at"] = started
+    elif not full and rows:
+        newest = max((str(r.get("updated_at") or "") for r in rows), default="")
+        if newest:
+            state["updated_at"] = newest
+    db.set_app_setting(store, _SYNC_KEY, state)
+    return out
+
+
+def _sync_job(job_id: str, params: dict) -> dict:
+    return sync(params.get("store"), full=bool(params.get("full")))
+
+
+def ready(store: str | None) -> bool:
+    """True when the queue was seeded and synced recently enough to serve reads."""
+    try:
+        state = _state(store)
+    except Exception:
+        return False
+    return bool(state.get("seeded_at")) and time.time() - float(state.get("synced_at") or 0) <= MAX_AGE_S
+
+
+def ensure_fresh(store: str | None) -> None:
+    """Schedule a sync when the last one is older than SYNC_S (at most one pending per store and instance)."""
+    now = time.time()
+    with _LOCK:
+        if now - _submitted.get(store, 0.0) < SYNC_S:
+            return
+        _submitted[store] = now
+    try:
+        if now - float(_state(store).get("synced_at") or 0) < SYNC_S:
+            return
+        from app.job_runner import submit_job
+        submit_job("confirmation.sync_queue", {"store": store}, store=store, label=f"confirmation queue {store or 'default'}")
+    except Exception as e:
+        _log.warning("confirmation queue sync submit failed for %s: %s", store, e)
+
+
+def encode_cursor(direction: str, row: dict) -> str:
+    created = row.get("created_at")
+    raw = json.dumps({"d": direction, "c": created.isoformat() if created else "", "o": row.get("order_id")})
+    return CURSOR_PREFIX + base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(value: str | None) -> tuple[str, tuple[datetime, str]] | None:
+    """("next" | "prev", (created_at, order_id)) for a queue cursor; None for anything else."""
+    if not value or not value.startswith(CURSOR_PREFIX):
+        return None
+    try:
+        body = value[len(CURSOR_PREFIX):]
+        data = json.loads(base64.urlsafe_b64decode(body + "=" * (-len(body) % 4)))
+        return str(data["d"]), (datetime.fromisoformat(data["c"]), str(data["o"]))
+    except Exception:
+        return None
+
+
+def list_page(store: str | None, agent_tags: list[str], *, limit: int = 50, cursor: str | None = None) -> dict[str, Any]:
+    """One page of an agent's queue: {rows, next_page_info, prev_page_info}."""
+    limit = max(1, min(int(limit or 50), 250))
+    decoded = decode_cursor(cursor)
+    kwargs: dict[str, Any] = {}
+    if decoded is not None:
+        kwargs["after" if decoded[0] == "next" else "before"] = decoded[1]
+    rows = db.list_confirmation_queue(store, any_tags=agent_tags, limit=limit + 1, **kwargs)
+    more = len(rows) > limit
+    if decoded is not None and decoded[0] == "prev":
+        rows = rows[-limit:] if more else rows
+        has_next, has_prev = True, more
+    else:
+        rows = rows[:limit]
+        has_next, has_prev = more, decoded is not None
+    return {
+        "rows": rows,
+        "next_page_info": encode_cursor("next", rows[-1]) if rows and has_next else None,
+        "prev_page_info": encode_cursor("prev", rows[0]) if rows and has_prev else None,
+    }
+
+
+def queue_status(store: str | None) -> dict[str, Any]:
+    state = _state(store)
+    return {"ready": ready(store), "seeded_at": state.get("seeded_at"), "synced_at": state.get("synced_at"), "updated_at": state.get("updated_at")}
+
+
+register_job("confirmation.sync_queue", _sync_job, queue="warm", priority=7)
@@ -1,23 +1,123 @@
 import json
 import os
+import re
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, Any
 
-from sqlalchemy import create_engine, Column, String, DateTime, Text, desc, Index, ForeignKey, event
+from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer, Float, desc, Index, ForeignKey, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+
+from app import settings_cache
 
 # Support external database via DATABASE_URL (e.g., Supabase Postgres). Fallback to SQLite.
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
-if DATABASE_URL:
-    engine = create_engine(DATABASE_URL, future=True, pool_pre_ping=True)
-else:
-    # Ensure data directory exists (works in both containers)
-    DATA_DIR = Path("/app/data")
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    # Simple SQLite persistence for MVP
-    engine = create_engine("sqlite:////app/data/app.db", future=True)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)) or str(default))
+
+
+# Engine tuning (env, optional):
+#   PTOS_DB_POOL_SIZE / PTOS_DB_MAX_OVERFLOW   pooled connections kept open / extra under burst (10 / 20)
+#   PTOS_DB_POOL_TIMEOUT_S                     max wait for a free connection before erroring (10)
+#   PTOS_DB_POOL_RECYCLE_S                     reopen connections older than this, e.g. behind poolers (1800)
+#   PTOS_DB_CONNECT_TIMEOUT_S                  Postgres connect timeout (10)
+#   PTOS_DB_STATEMENT_TIMEOUT_MS               Postgres per-session statement_timeout, 0 disables (60000)
+#   PTOS_DB_QUERY_CACHE_SIZE                   compiled-statement cache entries (1000)
+#   PTOS_DB_PREPARE_THRESHOLD                  psycopg 3 only: executions before a statement is server-prepared (5)
+#   PTOS_SQLITE_WAL                            SQLite journal_mode=WAL + synchronous=NORMAL (1)
+#   PTOS_SQLITE_BUSY_TIMEOUT_MS                SQLite wait on a locked database (5000)
+#   PTOS_SQLITE_MMAP_BYTES                     SQLite mmap_size (268435456)
+ENGINE_SETTINGS: Dict[str, Any] = {
+    "pool_size": _env_int("PTOS_DB_POOL_SIZE", 10),
+    "max_overflow": _env_int("PTOS_DB_MAX_OVERFLOW", 20),
+    "pool_timeout": _env_int("PTOS_DB_POOL_TIMEOUT_S", 10),
+    "pool_recycle": _env_int("PTOS_DB_POOL_RECYCLE_S", 1800),
+    "query_cache_size": _env_int("PTOS_DB_QUERY_CACHE_SIZE", 1000),
+}
+PG_CONNECT_TIMEOUT_S = _env_int("PTOS_DB_CONNECT_TIMEOUT_S", 10)
+PG_STATEMENT_TIMEOUT_MS = _env_int("PTOS_DB_STATEMENT_TIMEOUT_MS", 60000)
+PG_PREPARE_THRESHOLD = _env_int("PTOS_DB_PREPARE_THRESHOLD", 5)
+SQLITE_WAL = os.getenv("PTOS_SQLITE_WAL", "1").lower() in ("1", "true", "yes")
+SQLITE_BUSY_TIMEOUT_MS = _env_int("PTOS_SQLITE_BUSY_TIMEOUT_MS", 5000)
+SQLITE_MMAP_BYTES = _env_int("PTOS_SQLITE_MMAP_BYTES", 268435456)
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited for a connection to system_health."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        ok = True
+        try:
+            return super()._do_get()
+        except Exception:
+            ok = False
+            raise
+        finally:
+            try:
+                from app import system_health as _sh
+                _sh.record("db_pool", "checkout", (time.perf_counter() - started) * 1000.0, ok)
+            except Exception:
+                pass
+
+
+def _sqlite_on_connect(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    try:
+        cur.execute(f"PRAGMA busy_timeout = {int(SQLITE_BUSY_TIMEOUT_MS)}")
+        if SQLITE_WAL:
+            # WAL lets readers proceed while the chat/cache/health writers commit.
+            cur.execute("PRAGMA journal_mode = WAL")
+            cur.execute("PRAGMA synchronous = NORMAL")
+        cur.execute(f"PRAGMA mmap_size = {int(SQLITE_MMAP_BYTES)}")
+    finally:
+        cur.close()
+
+
+def _postgres_on_connect(dbapi_conn, _record) -> None:
+    if PG_STATEMENT_TIMEOUT_MS <= 0:
+        return
+    cur = dbapi_conn.cursor()
+    try:
+        cur.execute(f"SET statement_timeout = {int(PG_STATEMENT_TIMEOUT_MS)}")
+    finally:
+        cur.close()
+    dbapi_conn.commit()
+
+
+def _create_engine():
+    pool_args = {"poolclass": _TimedQueuePool, **ENGINE_SETTINGS}
+    if DATABASE_URL:
+        connect_args: Dict[str, Any] = {}
+        on_connect = None
+        if DATABASE_URL.startswith("postgres"):
+            connect_args["connect_timeout"] = PG_CONNECT_TIMEOUT_S
+            if DATABASE_URL.startswith("postgresql+psycopg:"):
+                connect_args["prepare_threshold"] = PG_PREPARE_THRESHOLD
+            on_connect = _postgres_on_connect
+        elif DATABASE_URL.startswith("sqlite"):
+            connect_args["check_same_thread"] = False
+            on_connect = _sqlite_on_connect
+            if DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+                pool_args = {"query_cache_size": ENGINE_SETTINGS["query_cache_size"]}  # one shared in-memory connection
+        eng = create_engine(DATABASE_URL, future=True, pool_pre_ping=True, connect_args=connect_args, **pool_args)
+    else:
+        # Ensure data directory exists (works in both containers)
+        DATA_DIR = Path("/app/data")
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        # Simple SQLite persistence for MVP
+        eng = create_engine("sqlite:////app/data/app.db", future=True, connect_args={"check_same_thread": False}, **pool_args)
+        on_connect = _sqlite_on_connect
+    if on_connect is not None:
+        event.listen(eng, "connect", on_connect)
+    return eng
+
+
+engine = _create_engine()
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
@@ -29,7 +129,11 @@ def _install_db_health_hooks():
     except Exception:
         return
     try:
-        _sh.attach_db_engine(engine)
+        _sh.attach_db_engine(engine, settings={
+            **ENGINE_SETTINGS,
+            **({"sqlite_wal": SQLITE_WAL, "sqlite_busy_timeout_ms": SQLITE_BUSY_TIMEOUT_MS, "sqlite_mmap_bytes": SQLITE_MMAP_BYTES}
+               if engine.dialect.name == "sqlite" else {"statement_timeout_ms": PG_STATEMENT_TIMEOUT_MS, "connect_timeout_s": PG_CONNECT_TIMEOUT_S}),
+        })
     except Exception:
         pass
 
@@ -95,12 +199,18 @@ class Test(Base):
     payload_json = Column(Text, nullable=True)
     result_json = Column(Text, nullable=True)
     error_json = Column(Text, nullable=True)
+    # Listing fields derived from the JSON blobs on write (see _test_list_fields)
+    store = Column(String, nullable=True)
+    flow_type = Column(String, nullable=True)
+    title = Column(String, nullable=True)
+    card_image = Column(String, nullable=True)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
 
 # Lightweight index to speed home listing by created date
 Index('ix_tests_created_at', Test.created_at)
+Index('ix_tests_store_created_at', Test.store, Test.created_at)
 
 Base.metadata.create_all(engine)
 
@@ -118,6 +228,7 @@ def create_test_row(test_id: str, payload: Dict[str, Any], status: str = "queued
             created_at=_now(),
             updated_at=_now(),
         )
+        _apply_test_list_fields(t, payload)
         session.add(t)
         session.commit()
 
@@ -129,8 +240,12 @@ class Flow(Base):
     id = Column(String, primary_key=True)
     status = Column(String, nullable=False, default="draft")
     title = Column(String, nullable=True)
-    card_image = Column(String, nullable=True)
+    card_image = Column(String, nullable=True)  # explicitly chosen card image
     page_url = Column(String, nullable=True)
+    # Listing fields derived from settings/product on write (see _flow_list_fields)
+    store = Column(String, nullable=True)
+    flow_type = Column(String, nullable=True)
+    list_image = Column(String, nullable=True)  # card_image, else the first feature/uploaded image
     product_json = Column(Text, nullable=True)
     flow_json = Column(Text, nullable=True)
     ui_json = Column(Text, nullable=True)
@@ -142,6 +257,7 @@ class Flow(Base):
 
 
 Index('ix_flows_created_at', Flow.created_at)
+Index('ix_flows_store_created_at', Flow.store, Flow.created_at)
 
 # Global app-wide prompts (key/value store)
 class AppPrompt(Base):
@@ -182,6 +298,23 @@ class ConfirmationEvent(Base):
 
 Index("ix_confirmation_events_store_agent_created_at", ConfirmationEvent.store, ConfirmationEvent.agent, ConfirmationEvent.created_at)
 
+
+# Daily per-(store, agent, kind) event counts, incremented with every logged
+# event so analytics read O(days x agents) rows instead of every event.
+class ConfirmationDailyRollup(Base):
+    __tablename__ = "confirmation_daily_rollups"
+
+    pk = Column(String, primary_key=True)  # composed key: f"{store or ''}|{agent}|{kind}|{day}"
+    store = Column(String, nullable=True)
+    agent = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    day = Column(String, nullable=False)  # YYYY-MM-DD (UTC)
+    count = Column(Integer, nullable=False, default=0)
+    last_at = Column(DateTime, nullable=True)
+
+
+Index("ix_confirmation_daily_rollups_store_day", ConfirmationDailyRollup.store, ConfirmationDailyRollup.day)
+
 # Campaign ID mappings (persist manual product/collection IDs per campaign row)
 class CampaignMapping(Base):
     __tablename__ = "campaign_mappings"
@@ -196,10 +329,138 @@ class CampaignMapping(Base):
 
 Index('ix_campaign_mappings_store_key', CampaignMapping.store, CampaignMapping.campaign_key)
 
+
+# Campaign timeline entries, one row per {text, at} entry of a campaign_meta:{key}
+# setting (which keeps only the slim fields). Appends are inserts, task toggles
+# single-row updates, and list views count tasks/activity days from the typed columns.
+class CampaignTimelineEntry(Base):
+    __tablename__ = "campaign_timeline"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # id order is timeline order
+    meta_pk = Column(String, nullable=False)  # AppSetting pk of the campaign_meta:{key} row
+    store = Column(String, nullable=True)
+    campaign_key = Column(String, nullable=False)
+    at = Column(String, nullable=True)
+    text = Column(Text, nullable=True)  # usually a JSON payload with a "type"
+    kind = Column(String, nullable=True)  # payload type ('analysis' | 'task' | 'campaign_action' | 'life_note' ...) or 'note' for plain text
+    done = Column(Integer, nullable=True)  # tasks only: 0 | 1
+    day = Column(String, nullable=True)  # YYYY-MM-DD of life activity entries
+    task_id = Column(String, nullable=True)
+
+
+Index("ix_campaign_timeline_meta_pk_id", CampaignTimelineEntry.meta_pk, CampaignTimelineEntry.id)
+Index("ix_campaign_timeline_store_meta_kind", CampaignTimelineEntry.store, CampaignTimelineEntry.meta_pk, CampaignTimelineEntry.kind, CampaignTimelineEntry.done, CampaignTimelineEntry.day)
+Index("ix_campaign_timeline_store_task_id", CampaignTimelineEntry.store, CampaignTimelineEntry.task_id)
+
 # Ensure new tables are created when module is imported (includes newly added tables)
 Base.metadata.create_all(engine)
 
 
+def _add_missing_columns(model, names: list[str]) -> None:
+    """create_all() never alters existing tables: add newly declared nullable columns (and their indexes)."""
+    from sqlalchemy import inspect as _inspect, text
+    try:
+        existing = {c["name"] for c in _inspect(engine).get_columns(model.__tablename__)}
+        missing = [n for n in names if n not in existing]
+        if missing:
+            with engine.begin() as conn:
+                for name in missing:
+                    col_type = model.__table__.c[name].type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {model.__tablename__} ADD COLUMN {name} {col_type}'))
+        for index in model.__table__.indexes:
+            index.create(engine, checkfirst=True)
+    except Exception as e:
+        try:
+            import logging
+            logging.getLogger("app.db").warning("adding columns to %s failed: %s", model.__tablename__, e)
+        except Exception:
+            pass
+
+
+_add_missing_columns(Test, ["store", "flow_type", "title", "card_image"])
+_add_missing_columns(Flow, ["store", "flow_type", "list_image"])
+
+DEFAULT_FLOW_STORE = "irrakids"  # flows saved before multi-store support
+_SHOPIFY_CDN_RE = re.compile(r"https://cdn\.shopify\.com[^\s\"'\\]+", re.IGNORECASE)
+
+
+def _first_str(value: Any) -> str | None:
+    if isinstance(value, list) and value and isinstance(value[0], str) and value[0]:
+        return value[0]
+    return None
+
+
+def _flow_list_fields(settings: Any, product: Any, card_image: str | None) -> Dict[str, Any]:
+    """store / flow_type / list_image as the flow cards show them."""
+    settings = settings if isinstance(settings, dict) else {}
+    product = product if isinstance(product, dict) else {}
+    store = settings.get("store")
+    flow_type = settings.get("flow_type")
+    image = card_image or _first_str((settings.get("assets_used") or {}).get("feature_gallery") if isinstance(settings.get("assets_used"), dict) else None)
+    return {
+        "store": store.strip().lower() if isinstance(store, str) and store.strip() else DEFAULT_FLOW_STORE,
+        "flow_type": flow_type if isinstance(flow_type, str) and flow_type else "product",
+        "list_image": image or _first_str(product.get("uploaded_images")),
+    }
+
+
+def _test_list_fields(payload: Any, payload_json: str | None, result_json: str | None) -> Dict[str, Any]:
+    """Listing fields of a test row; only Shopify-hosted images are used as its card image."""
+    payload = payload if isinstance(payload, dict) else {}
+    fields = _flow_list_fields(payload.get("settings"), None, None)
+    image = None
+    for raw in (result_json, payload_json):
+        m = _SHOPIFY_CDN_RE.search(raw or "")
+        if m:
+            image = m.group(0)
+            break
+    if not image and isinstance(payload.get("card_image"), str) and payload["card_image"].startswith("https://cdn.shopify.com"):
+        image = payload["card_image"]
+    title = payload.get("title")
+    return {"store": fields["store"], "flow_type": fields["flow_type"], "title": title if isinstance(title, str) else None, "card_image": image}
+
+
+def _apply_test_list_fields(t: "Test", payload: Any = None) -> None:
+    if payload is None:
+        try:
+            payload = json.loads(t.payload_json) if t.payload_json else None
+        except Exception:
+            payload = None
+    for key, value in _test_list_fields(payload, t.payload_json, t.result_json).items():
+        setattr(t, key, value)
+
+
+def keyset_cursor(item: Dict[str, Any], ts_field: str = "created_at") -> str:
+    """Cursor for the page after ``item`` (a listed row with ``ts_field`` and ``id``)."""
+    return f"{item[ts_field]}|{item['id']}"
+
+
+def _keyset_filter(model, cursor: str | None, ts_col=None, id_col=None, id_prefix: str = ""):
+    """Rows strictly after ``cursor`` in (ts desc, id desc) order; None for a missing/invalid cursor.
+
+    ``ts_col``/``id_col`` default to ``created_at``/``id``. ``id_prefix`` maps the listed id onto
+    the key column (AppSetting-backed lists keep ``profit_card:{id}`` in ``key``).
+    """
+    from sqlalchemy import and_, or_
+    if not cursor or "|" not in cursor:
+        return None
+    ts, _, row_id = cursor.partition("|")
+    try:
+        created = datetime.fromisoformat(ts.rstrip("Z"))
+    except Exception:
+        return None
+    ts_col = model.created_at if ts_col is None else ts_col
+    id_col = model.id if id_col is None else id_col
+    return or_(ts_col < created, and_(ts_col == created, id_col < id_prefix + row_id))
+
+
+def _list_version(q, ts_col) -> str:
+    """``count:max(ts)`` over the rows ``q`` selects: changes when one is added, removed or touched."""
+    from sqlalchemy import func
+    n, last = q.with_entities(func.count(), func.max(ts_col)).order_by(None).one()
+    return f"{int(n or 0)}:{last.isoformat() if last else ''}"
+
+
 def create_flow_row(flow_id: str, *, product: Dict[str, Any] | None = None, flow: Dict[str, Any] | None = None, ui: Dict[str, Any] | None = None, prompts: Dict[str, Any] | None = None, settings: Dict[str, Any] | None = None, ads: Dict[str, Any] | None = None, status: str = "draft", page_url: str | None = None, card_image: str | None = None):
     with SessionLocal() as session:
         # Derive title from product if provided
@@ -215,6 +476,7 @@ def create_flow_row(flow_id: str, *, product: Dict[str, Any] | None = None, flow
             title=title,
             card_image=card_image,
             page_url=page_url,
+            **_flow_list_fields(settings, product, card_image),
             product_json=json.dumps(product, ensure_ascii=False) if product is not None else None,
             flow_json=json.dumps(flow, ensure_ascii=False) if flow is not None else None,
             ui_json=json.dumps(ui, ensure_ascii=False) if ui is not None else None,
@@ -257,6 +519,16 @@ def update_flow_row(flow_id: str, *, product: Dict[str, Any] | None = None, flow
             f.settings_json = json.dumps(settings, ensure_ascii=False)
         if ads is not None:
             f.ads_json = json.dumps(ads, ensure_ascii=False)
+        if settings is not None or product is not None or card_image is not None:
+            try:
+                if settings is None:
+                    settings = json.loads(f.settings_json) if f.settings_json else None
+                if product is None and not f.card_image:
+                    product = json.loads(f.product_json) if f.product_json else None
+            except Exception:
+                pass
+            for key, value in _flow_list_fields(settings, product, f.card_image).items():
+                setattr(f, key, value)
         f.updated_at = _now()
         session.commit()
         return True
@@ -264,104 +536,142 @@ def update_flow_row(flow_id: str, *, product: Dict[str, Any] | None = None, flow
 
 def get_flow(flow_id: str) -> Optional[Dict[str, Any]]:
     with SessionLocal() as session:
-        f = session.get(Flow, flow_id)
-        if not f:
-            return None
-        return {
-            "id": f.id,
-            "status": f.status,
-            "title": f.title,
-            "card_image": f.card_image,
-            "page_url": f.page_url,
-            "product": json.loads(f.product_json) if f.product_json else None,
-            "flow": json.loads(f.flow_json) if f.flow_json else None,
-            "ui": json.loads(f.ui_json) if f.ui_json else None,
-            "prompts": json.loads(f.prompts_json) if f.prompts_json else None,
-            "settings": json.loads(f.settings_json) if f.settings_json else None,
-            "ads": json.loads(f.ads_json) if f.ads_json else None,
-            "created_at": f.created_at.isoformat() + "Z",
-            "updated_at": f.updated_at.isoformat() + "Z",
-        }
+        return _get_flow_in(session, flow_id)
 
 
-def list_flows_light(limit: int | None = None, store: str | None = None) -> list[Dict[str, Any]]:
+# Session-taking cores (``_*_in``) are shared by the sync helpers and their
+# app.db_async counterparts.
+def _get_flow_in(session, flow_id: str) -> Optional[Dict[str, Any]]:
+    f = session.get(Flow, flow_id)
+    if not f:
+        return None
+    return {
+        "id": f.id,
+        "status": f.status,
+        "title": f.title,
+        "card_image": f.card_image,
+        "page_url": f.page_url,
+        "product": json.loads(f.product_json) if f.product_json else None,
+        "flow": json.loads(f.flow_json) if f.flow_json else None,
+        "ui": json.loads(f.ui_json) if f.ui_json else None,
+        "prompts": json.loads(f.prompts_json) if f.prompts_json else None,
+        "settings": json.loads(f.settings_json) if f.settings_json else None,
+        "ads": json.loads(f.ads_json) if f.ads_json else None,
+        "created_at": f.created_at.isoformat() + "Z",
+        "updated_at": f.updated_at.isoformat() + "Z",
+    }
+
+
+def _flow_light_dict(r) -> Dict[str, Any]:
+    return {
+        "id": r.id,
+        "status": r.status,
+        "title": r.title,
+        "card_image": r.list_image,
+        "page_url": r.page_url,
+        "created_at": r.created_at.isoformat() + "Z",
+        "updated_at": r.updated_at.isoformat() + "Z",
+        "flow_type": r.flow_type or "product",
+        "store": r.store or DEFAULT_FLOW_STORE,
+    }
+
+
+_list_columns_backfilled = False
+
+
+def backfill_list_columns(batch: int = 200) -> Dict[str, int]:
+    """One-off: derive the listing columns for flows/tests written before they existed."""
+    global _list_columns_backfilled
+    counts = {"flows": 0, "tests": 0}
+    with SessionLocal() as session:
+        while True:
+            rows = session.query(Flow).filter(Flow.flow_type.is_(None)).limit(batch).all()
+            for f in rows:
+                try:
+                    settings = json.loads(f.settings_json) if f.settings_json else None
+                    product = json.loads(f.product_json) if f.product_json else None
+                except Exception:
+                    settings = product = None
+                for key, value in _flow_list_fields(settings, product, f.card_image).items():
+                    setattr(f, key, value)
+            session.commit()
+            counts["flows"] += len(rows)
+            if len(rows) < batch:
+                break
+        while True:
+            rows = session.query(Test).filter(Test.flow_type.is_(None)).limit(batch).all()
+            for t in rows:
+                _apply_test_list_fields(t)
+            session.commit()
+            counts["tests"] += len(rows)
+            if len(rows) < batch:
+                break
+    _list_columns_backfilled = True
+    return counts
+
+
+def _ensure_list_columns() -> None:
+    if not _list_columns_backfilled:
+        backfill_list_columns()
+
+
+def _flows_query(session, store: str | None = None, status: str | None = None, flow_type: str | None = None):
+    q = session.query(Flow)
+    if isinstance(store, str) and store.strip():
+        q = q.filter(Flow.store == store.strip().lower())
+    if status:
+        q = q.filter(Flow.status == status)
+    if flow_type:
+        q = q.filter(Flow.flow_type == flow_type)
+    return q
+
+
+def list_flows_light(limit: int | None = None, store: str | None = None, cursor: str | None = None, *, status: str | None = None, flow_type: str | None = None) -> list[Dict[str, Any]]:
+    """Flow cards, newest first; ``cursor`` continues after the last row of a previous page."""
+    _ensure_list_columns()
     with SessionLocal() as session:
-        # Include settings_json to derive flow_type without heavy loads
-        q = session.query(
+        q = _flows_query(session, store, status, flow_type).with_entities(
             Flow.id,
             Flow.status,
             Flow.title,
-            Flow.card_image,
+            Flow.list_image,
             Flow.page_url,
             Flow.created_at,
             Flow.updated_at,
-            Flow.settings_json,
-            Flow.product_json,
-        ).order_by(desc(Flow.created_at))
+            Flow.flow_type,
+            Flow.store,
+        )
+        after = _keyset_filter(Flow, cursor)
+        if after is not None:
+            q = q.filter(after)
+        q = q.order_by(desc(Flow.created_at), desc(Flow.id))
         if limit:
             q = q.limit(limit)
-        rows = q.all()
-        out: list[Dict[str, Any]] = []
-        for r in rows:
-            # Derive store from settings; default to 'irrakids' when missing for backwards compatibility
-            eff_store = "irrakids"
-            flow_type = "product"
-            try:
-                if r.settings_json:
-                    sj = json.loads(r.settings_json)
-                    # Store affinity (multi-store support)
-                    s = (sj or {}).get("store")
-                    if isinstance(s, str) and s.strip():
-                        eff_store = s.strip()
-                    t = (sj or {}).get("flow_type")
-                    if isinstance(t, str) and t:
-                        flow_type = t
-            except Exception:
-                flow_type = "product"
-                eff_store = "irrakids"
-            # Optional server-side filter by store
-            try:
-                if isinstance(store, str) and store.strip():
-                    wanted = store.strip().lower()
-                    if (eff_store or "").strip().lower() != wanted:
-                        continue
-            except Exception:
-                pass
-            # Derive a fallback card image if not explicitly set
-            card_image = r.card_image
-            if not card_image:
-                try:
-                    # Prefer assets_used.feature_gallery[0] in settings
-                    if r.settings_json:
-                        sj = json.loads(r.settings_json)
-                        assets = (sj or {}).get("assets_used") or {}
-                        gallery = assets.get("feature_gallery") or []
-                        if isinstance(gallery, list) and gallery:
-                            first = gallery[0]
-                            if isinstance(first, str) and first:
-                                card_image = first
-                    # Fallback: first uploaded image from product_json
-                    if (not card_image) and r.product_json:
-                        pj = json.loads(r.product_json)
-                        up = (pj or {}).get("uploaded_images") or []
-                        if isinstance(up, list) and up:
-                            first = up[0]
-                            if isinstance(first, str) and first:
-                                card_image = first
-                except Exception:
-                    card_image = r.card_image
-            out.append({
-                "id": r.id,
-                "status": r.status,
-                "title": r.title,
-                "card_image": card_image,
-                "page_url": r.page_url,
-                "created_at": r.created_at.isoformat() + "Z",
-                "updated_at": r.updated_at.isoformat() + "Z",
-                    "flow_type": flow_type,
-                    "store": eff_store,
-            })
-        return out
+        return [_flow_light_dict(r) for r in q.all()]
+
+
+def flows_list_version(store: str | None = None, *, status: str | None = None, flow_type: str | None = None) -> str:
+    with SessionLocal() as session:
+        return _list_version(_flows_query(session, store, status, flow_type), Flow.updated_at)
+
+
+def list_flow_ids_with_inline_images(limit: int | None = None) -> list[str]:
+    """Ids of flows whose JSON still embeds ``data:image/`` URLs (oldest first)."""
+    from sqlalchemy import or_
+    pattern = "%data:image/%"
+    with SessionLocal() as session:
+        q = session.query(Flow.id).filter(or_(
+            Flow.card_image.like(pattern),
+            Flow.product_json.like(pattern),
+            Flow.flow_json.like(pattern),
+            Flow.ui_json.like(pattern),
+            Flow.prompts_json.like(pattern),
+            Flow.settings_json.like(pattern),
+            Flow.ads_json.like(pattern),
+        )).order_by(Flow.created_at)
+        if isinstance(limit, int) and limit > 0:
+            q = q.limit(limit)
+        return [row[0] for row in q.all()]
 
 
 def delete_flow_row(flow_id: str) -> bool:
@@ -371,7 +681,11 @@ def delete_flow_row(flow_id: str) -> bool:
             return False
         session.delete(f)
         session.commit()
-        return True
+    try:
+        delete_flow_step_events(flow_id)
+    except Exception:
+        pass
+    return True
 
 
 def delete_test_row(test_id: str) -> bool:
@@ -432,32 +746,45 @@ def _mk_setting_pk(store: str | None, key: str) -> str:
 
 
 def get_app_setting(store: str | None, key: str) -> Any:
+    """Setting value; hot keys are served from ``app.settings_cache``."""
+    return settings_cache.get(store, key, lambda: _load_app_setting(store, key))
+
+
+def _load_app_setting(store: str | None, key: str) -> Any:
     with SessionLocal() as session:
-        pk = _mk_setting_pk(store, key)
-        item = session.get(AppSetting, pk)
-        if not item:
-            return None
-        try:
-            return json.loads(item.value) if item.value is not None else None
-        except Exception:
-            return item.value
+        return _get_app_setting_in(session, store, key)
+
+
+def _get_app_setting_in(session, store: str | None, key: str) -> Any:
+    pk = _mk_setting_pk(store, key)
+    item = session.get(AppSetting, pk)
+    if not item:
+        return None
+    try:
+        return json.loads(item.value) if item.value is not None else None
+    except Exception:
+        return item.value
 
 
 def get_app_settings(store: str | None, keys: list[str]) -> Dict[str, Any]:
     """Load many app settings in one query, keyed by setting key."""
+    with SessionLocal() as session:
+        return _get_app_settings_in(session, store, keys)
+
+
+def _get_app_settings_in(session, store: str | None, keys: list[str]) -> Dict[str, Any]:
     clean_keys = list(dict.fromkeys(str(key or "").strip() for key in (keys or []) if str(key or "").strip()))
     if not clean_keys:
         return {}
     pks = [_mk_setting_pk(store, key) for key in clean_keys]
-    with SessionLocal() as session:
-        rows = session.query(AppSetting).filter(AppSetting.pk.in_(pks)).all()
-        out: Dict[str, Any] = {}
-        for item in rows:
-            try:
-                out[item.key] = json.loads(item.value) if item.value is not None else None
-            except Exception:
-                out[item.key] = item.value
-        return out
+    rows = session.query(AppSetting).filter(AppSetting.pk.in_(pks)).all()
+    out: Dict[str, Any] = {}
+    for item in rows:
+        try:
+            out[item.key] = json.loads(item.value) if item.value is not None else None
+        except Exception:
+            out[item.key] = item.value
+    return out
 
 
 def set_app_setting(store: str | None, key: str, value: Any) -> Any:
@@ -472,12 +799,77 @@ def set_app_setting(store: str | None, key: str, value: Any) -> Any:
             item = AppSetting(pk=pk, store=store, key=key, value=payload, updated_at=_now())
             session.add(item)
         session.commit()
+        settings_cache.invalidate(store, key)
         try:
             return json.loads(item.value) if item.value is not None else None
         except Exception:
             return item.value
 
 
+def compare_and_set_app_setting(store: str | None, key: str, expected: Any, value: Any) -> bool:
+    """Write ``value`` only if the stored value still equals ``expected``; True when this call won."""
+    def _dump(v: Any) -> str:
+        return json.dumps(v, ensure_ascii=False) if not isinstance(v, str) else v
+
+    with SessionLocal() as session:
+        updated = (
+            session.query(AppSetting)
+            .filter(AppSetting.pk == _mk_setting_pk(store, key), AppSetting.value == _dump(expected))
+            .update({AppSetting.value: _dump(value), AppSetting.updated_at: _now()}, synchronize_session=False)
+        )
+        session.commit()
+    if updated:
+        settings_cache.invalidate(store, key)
+    return bool(updated)
+
+
+def delete_app_setting(store: str | None, key: str) -> bool:
+    with SessionLocal() as session:
+        item = session.get(AppSetting, _mk_setting_pk(store, key))
+        if not item:
+            return False
+        session.delete(item)
+        session.commit()
+        settings_cache.invalidate(store, key)
+        return True
+
+
+def delete_app_settings_by_prefix(store: str | None, prefix: str) -> int:
+    """Delete every setting whose key starts with ``prefix``; returns the row count.
+
+    With ``store=None`` rows from every store are removed.
+    """
+    p = str(prefix or "")
+    if not p:
+        return 0
+    with SessionLocal() as session:
+        q = session.query(AppSetting).filter(AppSetting.key.like(p + "%"))
+        if isinstance(store, str):
+            q = q.filter(AppSetting.store == store)
+        count = q.delete(synchronize_session=False)
+        session.commit()
+        settings_cache.invalidate_prefix(store if isinstance(store, str) else None, p)
+        return int(count or 0)
+
+
+def list_app_settings_by_prefix(store: str | None, prefix: str) -> list[tuple[str, Any]]:
+    """(key, value) for every setting whose key starts with ``prefix``, oldest write first."""
+    p = str(prefix or "")
+    if not p:
+        return []
+    with SessionLocal() as session:
+        q = session.query(AppSetting.key, AppSetting.value).filter(AppSetting.key.like(p + "%"))
+        if isinstance(store, str):
+            q = q.filter(AppSetting.store == store)
+        out: list[tuple[str, Any]] = []
+        for key, value in q.order_by(AppSetting.updated_at, AppSetting.key).all():
+            try:
+                out.append((key, json.loads(value) if value is not None else None))
+            except Exception:
+                out.append((key, value))
+        return out
+
+
 def set_app_settings(store: str | None, values: Dict[str, Any]) -> Dict[str, Any]:
     """Upsert many app settings in one transaction."""
     clean = {str(key or "").strip(): value for key, value in (values or {}).items() if str(key or "").strip()}
@@ -497,75 +889,259 @@ def set_app_settings(store: str | None, values: Dict[str, Any]) -> Dict[str, Any
             else:
                 session.add(AppSetting(pk=pk, store=store, key=key, value=payload, updated_at=now))
         session.commit()
+    for key in clean:
+        settings_cache.invalidate(store, key)
     return clean
 
 
+_CAMPAIGN_META_PREFIX = "campaign_meta:"
+_LIFE_ACTIVITY_KINDS = ("campaign_action", "life_note", "note")
+
+
+def _timeline_entry_fields(entry: Any) -> dict:
+    """Typed columns (kind, done, day, task_id) of a ``{text, at}`` timeline entry."""
+    fields: Dict[str, Any] = {"kind": None, "done": None, "day": None, "task_id": None}
+    if not isinstance(entry, dict) or not isinstance(entry.get("text"), str):
+        return fields
+    text = entry["text"]
+    try:
+        payload = json.loads(text)
+        kind = str(payload.get("type") or "")
+    except Exception:
+        if text.strip():
+            fields.update(kind="note", day=str(entry.get("at") or "")[:10] or None)
+        return fields
+    fields["kind"] = kind or None
+    if kind == "task":
+        fields["done"] = 1 if payload.get("done") else 0
+        fields["task_id"] = str(payload.get("id") or "") or None
+    elif kind in ("campaign_action", "life_note"):
+        fields["day"] = str(payload.get("day") or entry.get("at") or "")[:10] or None
+    return fields
+
+
+def _timeline_summary(groups) -> dict:
+    """List-view counts from ``(kind, done, day, count)`` groups of timeline entries."""
+    out: Dict[str, Any] = {"timeline_entries": 0, "incomplete_tasks": 0, "life_activity_days": {}}
+    for kind, done, day, n in groups:
+        n = int(n or 0)
+        out["timeline_entries"] += n
+        if kind == "task" and not done:
+            out["incomplete_tasks"] += n
+        if day and kind in _LIFE_ACTIVITY_KINDS:
+            bucket = out["life_activity_days"].setdefault(day, {"actions": 0, "notes": 0})
+            bucket["actions" if kind == "campaign_action" else "notes"] += n
+    return out
+
+
 def _campaign_meta_summary(value: dict) -> dict:
     """Return list-view fields without large analysis timeline payloads."""
     summary = {key: val for key, val in (value or {}).items() if key != "timeline"}
-    incomplete_tasks = 0
-    timeline_entries = 0
-    life_activity_days: Dict[str, dict] = {}
+    groups = []
     for entry in ((value or {}).get("timeline") or []):
-        if not isinstance(entry, dict):
-            continue
-        timeline_entries += 1
-        text = entry.get("text")
-        if not isinstance(text, str):
-            continue
-        try:
-            payload = json.loads(text)
-            entry_type = str(payload.get("type") or "")
-            if entry_type == "task" and not payload.get("done"):
-                incomplete_tasks += 1
-            if entry_type in ("campaign_action", "life_note"):
-                day = str(payload.get("day") or entry.get("at") or "")[:10]
-                if day:
-                    bucket = life_activity_days.setdefault(day, {"actions": 0, "notes": 0})
-                    bucket["actions" if entry_type == "campaign_action" else "notes"] += 1
-        except Exception:
-            day = str(entry.get("at") or "")[:10]
-            if day and text.strip():
-                bucket = life_activity_days.setdefault(day, {"actions": 0, "notes": 0})
-                bucket["notes"] += 1
-    summary["timeline_entries"] = timeline_entries
-    summary["incomplete_tasks"] = incomplete_tasks
-    summary["life_activity_days"] = life_activity_days
+        if isinstance(entry, dict):
+            f = _timeline_entry_fields(entry)
+            groups.append((f["kind"], f["done"], f["day"], 1))
+    summary.update(_timeline_summary(groups))
     return summary
 
 
-def list_campaign_meta(store: str | None = None, *, include_timeline: bool = True) -> Dict[str, dict]:
-    """Return dict keyed by campaign_key: { campaign_key: { supplier_name?, supplier_alt_name?, timeline?: [{text, at}] } }"""
+def _timeline_entry_value(entry: dict) -> tuple:
+    text, at = entry.get("text"), entry.get("at")
+    if text is not None and not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False)
+    return text, (str(at) if at is not None else None)
+
+
+def _set_timeline_entry(row: "CampaignTimelineEntry", entry: dict) -> None:
+    row.text, row.at = _timeline_entry_value(entry)
+    for name, value in _timeline_entry_fields({"text": row.text, "at": row.at}).items():
+        setattr(row, name, value)
+
+
+def _new_timeline_entry(item: AppSetting, entry: dict) -> "CampaignTimelineEntry":
+    row = CampaignTimelineEntry(meta_pk=item.pk, store=item.store, campaign_key=(item.key or "")[len(_CAMPAIGN_META_PREFIX):])
+    _set_timeline_entry(row, entry)
+    return row
+
+
+def _slim_campaign_meta_in(session, item: AppSetting) -> dict:
+    """The meta row's fields. An inline ``timeline`` (rows written before campaign_timeline existed) moves to the table first."""
+    try:
+        value = json.loads(item.value) if item.value else {}
+    except Exception:
+        value = {}
+    if not isinstance(value, dict):
+        return {}
+    if "timeline" in value:
+        from sqlalchemy.orm.attributes import set_committed_value
+        entries = value.pop("timeline")
+        slim = json.dumps(value, ensure_ascii=False)
+        # Conditional on the value we read: when two readers migrate the same row, only one moves the entries.
+        moved = (
+            session.query(AppSetting)
+            .filter(AppSetting.pk == item.pk, AppSetting.value == item.value)
+            .update({AppSetting.value: slim}, synchronize_session=False)
+        )
+        if moved != 1:
+            session.rollback()  # expires ``item``; re-read what the winner wrote
+            return _slim_campaign_meta_in(session, item)
+        for entry in (entries if isinstance(entries, list) else []):
+            if isinstance(entry, dict):
+                session.add(_new_timeline_entry(item, entry))
+        session.commit()
+        set_committed_value(item, "value", slim)
+    return value
+
+
+_campaign_timeline_ready = False
+
+
+def _ensure_campaign_timeline() -> None:
+    """Once per process: move inline timelines still left in campaign_meta rows into the table."""
+    global _campaign_timeline_ready
+    if _campaign_timeline_ready:
+        return
     with SessionLocal() as session:
-        q = session.query(AppSetting).filter(AppSetting.key.like("campaign_meta:%"))
-        if isinstance(store, str):
-            q = q.filter(AppSetting.store == store)
-        rows = q.all()
-        out: Dict[str, dict] = {}
-        for r in rows:
+        q = session.query(AppSetting).filter(AppSetting.key.like(f"{_CAMPAIGN_META_PREFIX}%"), AppSetting.value.like('%"timeline"%'))
+        for item in q.all():
             try:
-                key = r.key or ""
-                if key.startswith("campaign_meta:"):
-                    ck = key.split("campaign_meta:", 1)[1]
-                else:
-                    continue
-                val: dict
-                try:
-                    val = json.loads(r.value) if r.value else {}
-                except Exception:
-                    val = {}
-                out[ck] = (val or {}) if include_timeline else _campaign_meta_summary(val or {})
+                _slim_campaign_meta_in(session, item)
             except Exception:
-                continue
+                session.rollback()
+    _campaign_timeline_ready = True
+
+
+def _campaign_meta_item_in(session, store: str | None, campaign_key: str, *, create: bool = False) -> Optional[AppSetting]:
+    key = f"{_CAMPAIGN_META_PREFIX}{campaign_key}"
+    pk = _mk_setting_pk(store, key)
+    item = session.get(AppSetting, pk)
+    if item is None and create:
+        item = AppSetting(pk=pk, store=store, key=key, value="{}", updated_at=_now())
+        session.add(item)
+    return item
+
+
+def _timeline_query(session, store: str | None):
+    q = session.query(CampaignTimelineEntry)
+    if isinstance(store, str):
+        q = q.filter(CampaignTimelineEntry.store == store)
+    return q
+
+
+def _campaign_meta_in(session, store: str | None, campaign_key: str, *, include_timeline: bool = True) -> dict:
+    item = _campaign_meta_item_in(session, store, campaign_key)
+    if item is None:
+        return {}
+    value = _slim_campaign_meta_in(session, item)
+    T = CampaignTimelineEntry
+    q = session.query(T).filter(T.meta_pk == item.pk)
+    if include_timeline:
+        value["timeline"] = [{"text": r.text, "at": r.at} for r in q.order_by(T.id).all()]
+    return value
+
+
+def list_campaign_meta(store: str | None = None, *, include_timeline: bool = True) -> Dict[str, dict]:
+    """Return dict keyed by campaign_key: { campaign_key: { supplier_name?, supplier_alt_name?, timeline?: [{text, at}] } }"""
+    with SessionLocal() as session:
+        return _list_campaign_meta_in(session, store, include_timeline=include_timeline)
+
+
+def _campaign_meta_query(session, store: str | None = None):
+    q = session.query(AppSetting).filter(AppSetting.key.like(f"{_CAMPAIGN_META_PREFIX}%"))
+    if isinstance(store, str):
+        q = q.filter(AppSetting.store == store)
+    return q
+
+
+def campaign_meta_list_version(store: str | None = None) -> str:
+    # Timeline writes touch the owning meta row's updated_at.
+    with SessionLocal() as session:
+        return _list_version(_campaign_meta_query(session, store), AppSetting.updated_at)
+
+
+def _list_campaign_meta_in(session, store: str | None = None, *, include_timeline: bool = True) -> Dict[str, dict]:
+    return _campaign_meta_from_rows_in(session, store, _campaign_meta_query(session, store).all(), include_timeline=include_timeline)
+
+
+def list_campaign_meta_page(store: str | None = None, *, limit: int, cursor: str | None = None, include_timeline: bool = True) -> tuple[Dict[str, dict], Optional[str]]:
+    """One page of ``list_campaign_meta``, most recently updated first, and the cursor for the next."""
+    with SessionLocal() as session:
+        q = _campaign_meta_query(session, store)
+        after = _keyset_filter(AppSetting, cursor, AppSetting.updated_at, AppSetting.key, _CAMPAIGN_META_PREFIX)
+        if after is not None:
+            q = q.filter(after)
+        rows = q.order_by(desc(AppSetting.updated_at), desc(AppSetting.key)).limit(limit).all()
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1]
+            next_cursor = f"{last.updated_at.isoformat()}Z|{(last.key or '')[len(_CAMPAIGN_META_PREFIX):]}"
+        return _campaign_meta_from_rows_in(session, store, rows, include_timeline=include_timeline, paged=True), next_cursor
+
+
+def _campaign_meta_from_rows_in(session, store: str | None, rows: list, *, include_timeline: bool = True, paged: bool = False) -> Dict[str, dict]:
+    from sqlalchemy import func
+
+    out: Dict[str, dict] = {}
+    by_pk: Dict[str, str] = {}
+    for r in rows:
+        key = r.key or ""
+        if not key.startswith(_CAMPAIGN_META_PREFIX):
+            continue
+        try:
+            value = _slim_campaign_meta_in(session, r)
+        except Exception:
+            continue
+        ck = key[len(_CAMPAIGN_META_PREFIX):]
+        out[ck] = value
+        by_pk[r.pk] = ck
+    T = CampaignTimelineEntry
+    tq = _timeline_query(session, store)
+    if paged:
+        if not by_pk:
+            return out
+        tq = tq.filter(T.meta_pk.in_(list(by_pk)))
+    if include_timeline:
+        for value in out.values():
+            value["timeline"] = []
+        for r in tq.order_by(T.meta_pk, T.id).all():
+            ck = by_pk.get(r.meta_pk)
+            if ck is not None:
+                out[ck]["timeline"].append({"text": r.text, "at": r.at})
         return out
+    groups: Dict[str, list] = {}
+    gq = tq.with_entities(T.meta_pk, T.kind, T.done, T.day, func.count(T.id))
+    for meta_pk, kind, done, day, n in gq.group_by(T.meta_pk, T.kind, T.done, T.day).all():
+        groups.setdefault(meta_pk, []).append((kind, done, day, n))
+    for pk, ck in by_pk.items():
+        out[ck].update(_timeline_summary(groups.get(pk) or ()))
+    return out
 
 
-def get_campaign_meta(store: str | None, campaign_key: str) -> dict:
+def get_campaign_meta(store: str | None, campaign_key: str, *, include_timeline: bool = True) -> dict:
     key = str(campaign_key or "").strip()
     if not key:
         return {}
-    value = get_app_setting(store, f"campaign_meta:{key}") or {}
-    return value if isinstance(value, dict) else {}
+    with SessionLocal() as session:
+        return _campaign_meta_in(session, store, key, include_timeline=include_timeline)
+
+
+def last_campaign_timeline_entry(store: str | None, campaign_key: str, *, kind: str | None = None) -> Optional[dict]:
+    """The newest ``{text, at}`` entry of a campaign timeline (of ``kind`` when given)."""
+    key = str(campaign_key or "").strip()
+    if not key:
+        return None
+    T = CampaignTimelineEntry
+    with SessionLocal() as session:
+        item = _campaign_meta_item_in(session, store, key)
+        if item is None:
+            return None
+        _slim_campaign_meta_in(session, item)
+        q = session.query(T).filter(T.meta_pk == item.pk)
+        if kind:
+            q = q.filter(T.kind == kind)
+        r = q.order_by(desc(T.id)).first()
+        return {"text": r.text, "at": r.at} if r else None
 
 
 def list_profit_costs(store: str | None = None) -> Dict[str, dict]:
@@ -620,16 +1196,34 @@ def set_profit_costs(store: str | None, product_id: str, patch: Dict[str, Any])
 
 
 # ---------------- Profit Cards (stored in AppSetting) ----------------
-def list_profit_cards(store: str | None = None) -> list[dict]:
-    """Return a list of saved profit cards for the store.
+def _profit_cards_query(session, store: str | None = None):
+    q = session.query(AppSetting).filter(AppSetting.key.like("profit_card:%"))
+    if isinstance(store, str):
+        q = q.filter(AppSetting.store == store)
+    return q
+
+
+def profit_cards_list_version(store: str | None = None) -> str:
+    with SessionLocal() as session:
+        return _list_version(_profit_cards_query(session, store), AppSetting.updated_at)
 
-    Cards are stored under keys: profit_card:{card_id}
+
+def list_profit_cards(store: str | None = None, *, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+    """Return a list of saved profit cards for the store, most recently updated first.
+
+    Cards are stored under keys: profit_card:{card_id}. They have no creation
+    column, so pages are keyed on (updated_at, card id): pass
+    ``keyset_cursor(card, "updated_at")`` as ``cursor``.
     """
     with SessionLocal() as session:
-        q = session.query(AppSetting).filter(AppSetting.key.like("profit_card:%"))
-        if isinstance(store, str):
-            q = q.filter(AppSetting.store == store)
-        rows = q.order_by(desc(AppSetting.updated_at)).all()
+        q = _profit_cards_query(session, store)
+        after = _keyset_filter(AppSetting, cursor, AppSetting.updated_at, AppSetting.key, "profit_card:")
+        if after is not None:
+            q = q.filter(after)
+        q = q.order_by(desc(AppSetting.updated_at), desc(AppSetting.key))
+        if limit:
+            q = q.limit(limit)
+        rows = q.all()
         out: list[dict] = []
         for r in rows:
             try:
@@ -812,58 +1406,73 @@ def delete_profit_campaign_card(store: str | None, ad_account: str | None, campa
         return True
 
 
+_CAMPAIGN_META_FIELDS = ("supplier_name", "supplier_alt_name", "supply_available", "product_life_checks", "analysis_checks", "owner")
+
+
+def _replace_campaign_timeline_in(session, item: AppSetting, entries: list) -> None:
+    """Make the campaign's rows equal ``entries``, touching only rows that differ.
+
+    The UI sends the whole timeline after an append, delete or task toggle, so
+    rows matching the common prefix and suffix are kept. Ids carry the order,
+    so an entry inserted mid-timeline rewrites the rows after it.
+    """
+    T = CampaignTimelineEntry
+    rows = session.query(T).filter(T.meta_pk == item.pk).order_by(T.id).all()
+    clean = [e for e in entries or [] if isinstance(e, dict)]
+    old = [(r.text, r.at) for r in rows]
+    new = [_timeline_entry_value(e) for e in clean]
+    p = 0
+    while p < min(len(old), len(new)) and old[p] == new[p]:
+        p += 1
+    s = 0
+    while s < min(len(old), len(new)) - p and old[-1 - s] == new[-1 - s]:
+        s += 1
+    if len(new) > len(old):
+        s = 0
+    old_mid, new_mid = rows[p:len(rows) - s], clean[p:len(clean) - s]
+    for row, entry in zip(old_mid, new_mid):
+        if (row.text, row.at) != _timeline_entry_value(entry):
+            _set_timeline_entry(row, entry)
+    for row in old_mid[len(new_mid):]:
+        session.delete(row)
+    for entry in new_mid[len(old_mid):]:
+        session.add(_new_timeline_entry(item, entry))
+
+
 def set_campaign_meta(store: str | None, campaign_key: str, patch: Dict[str, Any]) -> dict:
-    """Upsert campaign meta by merging patch into existing JSON stored in AppSetting under key campaign_meta:{campaign_key}."""
+    """Merge ``patch`` into the campaign_meta:{campaign_key} setting; a ``timeline`` list replaces the campaign's timeline rows."""
     if not isinstance(campaign_key, str) or not campaign_key.strip():
         return {}
-    key = f"campaign_meta:{campaign_key.strip()}"
-    # Load existing
-    try:
-        existing = get_app_setting(store, key) or {}
-        if not isinstance(existing, dict):
-            existing = {}
-    except Exception:
-        existing = {}
-    # Merge shallow
-    data = dict(existing)
-    for k, v in (patch or {}).items():
-        # Only allow specific fields
-        if k in ("supplier_name", "supplier_alt_name", "supply_available", "timeline", "product_life_checks", "analysis_checks", "owner"):
-            data[k] = v
-    saved = set_app_setting(store, key, data)
-    try:
-        return saved if isinstance(saved, dict) else (json.loads(saved) if isinstance(saved, str) else {})
-    except Exception:
-        return {}
+    key = campaign_key.strip()
+    with SessionLocal() as session:
+        item = _campaign_meta_item_in(session, store, key, create=True)
+        data = _slim_campaign_meta_in(session, item)
+        for k, v in (patch or {}).items():
+            # Only allow specific fields
+            if k in _CAMPAIGN_META_FIELDS:
+                data[k] = v
+        if "timeline" in (patch or {}):
+            tl = patch["timeline"]
+            _replace_campaign_timeline_in(session, item, tl if isinstance(tl, list) else [])
+        item.value = json.dumps(data, ensure_ascii=False)
+        item.updated_at = _now()
+        session.commit()
+        return _campaign_meta_in(session, store, key)
 
 
-def append_campaign_timeline(store: str | None, campaign_key: str, text: str) -> dict:
-    """Append a timeline note to campaign meta; returns updated meta dict."""
+def append_campaign_timeline(store: str | None, campaign_key: str, text: str, *, return_meta: bool = True) -> dict:
+    """Append a timeline note to campaign meta; returns the updated meta (or just the note when ``return_meta`` is False)."""
     if not isinstance(campaign_key, str) or not campaign_key.strip():
         return {}
-    key = f"campaign_meta:{campaign_key.strip()}"
-    # Load existing
-    try:
-        existing = get_app_setting(store, key) or {}
-        if not isinstance(existing, dict):
-            existing = {}
-    except Exception:
-        existing = {}
-    timeline = []
-    try:
-        tl = existing.get("timeline")
-        if isinstance(tl, list):
-            timeline = list(tl)
-    except Exception:
-        timeline = []
+    key = campaign_key.strip()
     note = {"text": str(text or ""), "at": _now().isoformat() + "Z"}
-    timeline.append(note)
-    existing["timeline"] = timeline
-    saved = set_app_setting(store, key, existing)
-    try:
-        return saved if isinstance(saved, dict) else (json.loads(saved) if isinstance(saved, str) else {})
-    except Exception:
-        return {}
+    with SessionLocal() as session:
+        item = _campaign_meta_item_in(session, store, key, create=True)
+        _slim_campaign_meta_in(session, item)
+        session.add(_new_timeline_entry(item, note))
+        item.updated_at = _now()
+        session.commit()
+        return _campaign_meta_in(session, store, key) if return_meta else note
 
 
 def sync_campaign_timeline_task_states(store: str | None, task_states: Dict[str, bool]) -> int:
@@ -873,52 +1482,32 @@ def sync_campaign_timeline_task_states(store: str | None, task_states: Dict[str,
     """
     if not isinstance(task_states, dict) or not task_states:
         return 0
+    _ensure_campaign_timeline()
+    T = CampaignTimelineEntry
     changed = 0
+    touched: set[str] = set()
     with SessionLocal() as session:
-        q = session.query(AppSetting).filter(AppSetting.key.like("campaign_meta:%"))
-        if isinstance(store, str):
-            q = q.filter(AppSetting.store == store)
-        rows = q.all()
-        for row in rows:
+        q = _timeline_query(session, store).filter(T.kind == "task", T.task_id.in_([str(k) for k in task_states]))
+        for row in q.all():
+            done = bool(task_states.get(row.task_id))
+            if bool(row.done) == done:
+                continue
             try:
-                data = json.loads(row.value) if row.value else {}
-                if not isinstance(data, dict):
-                    continue
-                timeline = data.get("timeline")
-                if not isinstance(timeline, list):
-                    continue
-                row_changed = False
-                next_timeline = []
-                for entry in timeline:
-                    if not isinstance(entry, dict):
-                        next_timeline.append(entry)
-                        continue
-                    text = entry.get("text")
-                    try:
-                        parsed = json.loads(text) if isinstance(text, str) else None
-                    except Exception:
-                        parsed = None
-                    if isinstance(parsed, dict) and parsed.get("type") == "task":
-                        tid = str(parsed.get("id") or "")
-                        if tid and tid in task_states:
-                            done = bool(task_states[tid])
-                            if bool(parsed.get("done")) != done:
-                                parsed["done"] = done
-                                if done:
-                                    parsed["completed_at"] = _now().isoformat() + "Z"
-                                else:
-                                    parsed.pop("completed_at", None)
-                                entry = dict(entry)
-                                entry["text"] = json.dumps(parsed, ensure_ascii=False)
-                                row_changed = True
-                                changed += 1
-                    next_timeline.append(entry)
-                if row_changed:
-                    data["timeline"] = next_timeline
-                    row.value = json.dumps(data, ensure_ascii=False)
-                    row.updated_at = _now()
+                parsed = json.loads(row.text)
             except Exception:
                 continue
+            parsed["done"] = done
+            if done:
+                parsed["completed_at"] = _now().isoformat() + "Z"
+            else:
+                parsed.pop("completed_at", None)
+            row.text = json.dumps(parsed, ensure_ascii=False)
+            row.done = 1 if done else 0
+            touched.add(row.meta_pk)
+            changed += 1
+        if touched:
+            # Keeps campaign_meta_list_version (the list ETag) moving with the rows.
+            session.query(AppSetting).filter(AppSetting.pk.in_(list(touched))).update({AppSetting.updated_at: _now()}, synchronize_session=False)
         session.commit()
     return changed
 
@@ -940,6 +1529,105 @@ def save_bulk_analysis_job(store: str | None, job_id: str, data: dict) -> dict:
         return {}
 
 
+def patch_bulk_analysis_job(store: str | None, job_id: str, patch: dict) -> dict:
+    """Merge ``patch`` into the saved job state (keeps resume fields like groups/date_range)."""
+    current = get_bulk_analysis_job(store, job_id) or {}
+    merged = dict(current)
+    merged.update(patch or {})
+    return save_bulk_analysis_job(store, job_id, merged)
+
+
+def _bulk_heartbeat_key(job_id: str) -> str:
+    return f"bulk_analysis_heartbeat:{job_id.strip()}"
+
+
+def touch_bulk_analysis_heartbeat(store: str | None, job_id: str) -> None:
+    """Mark a bulk job as alive. Kept apart from the job row so the ticker never races its patches."""
+    set_app_setting(store, _bulk_heartbeat_key(job_id), {"at": _now().isoformat() + "Z"})
+
+
+def bulk_analysis_heartbeat_at(store: str | None, job_id: str) -> Optional[datetime]:
+    with SessionLocal() as session:
+        item = session.get(AppSetting, _mk_setting_pk(store, _bulk_heartbeat_key(job_id)))
+        return item.updated_at if item else None
+
+
+def claim_bulk_analysis_job(store: str | None, job_id: str, stale_s: float) -> bool:
+    """Atomically take over a bulk job whose heartbeat is older than ``stale_s`` (or missing).
+
+    Exactly one of several instances polling the same stale job wins; the
+    winner's heartbeat then counts as fresh for everyone else.
+    """
+    from sqlalchemy.exc import IntegrityError
+    key = _bulk_heartbeat_key(job_id)
+    pk = _mk_setting_pk(store, key)
+    now = _now()
+    payload = json.dumps({"at": now.isoformat() + "Z", "claimed": True})
+    with SessionLocal() as session:
+        updated = (
+            session.query(AppSetting)
+            .filter(AppSetting.pk == pk, AppSetting.updated_at <= now - timedelta(seconds=max(0.0, stale_s)))
+            .update({AppSetting.value: payload, AppSetting.updated_at: now}, synchronize_session=False)
+        )
+        if updated:
+            session.commit()
+            return True
+        if session.get(AppSetting, pk) is not None:
+            return False
+        session.add(AppSetting(pk=pk, store=store, key=key, value=payload, updated_at=now))
+        try:
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+            return False
+
+
+def delete_bulk_analysis_heartbeat(store: str | None, job_id: str) -> None:
+    delete_app_setting(store, _bulk_heartbeat_key(job_id))
+
+
+def save_bulk_analysis_group_result(store: str | None, job_id: str, group_key: str, result: dict) -> None:
+    """Checkpoint one analyzed product group so a restarted job can skip it."""
+    if not isinstance(job_id, str) or not job_id.strip() or not str(group_key or "").strip():
+        return
+    set_app_setting(store, f"bulk_analysis_group:{job_id.strip()}:{str(group_key).strip()}", result or {})
+
+
+def list_bulk_analysis_group_results(store: str | None, job_id: str) -> Dict[str, dict]:
+    """Return checkpointed group results for a job keyed by group key."""
+    if not isinstance(job_id, str) or not job_id.strip():
+        return {}
+    prefix = f"bulk_analysis_group:{job_id.strip()}:"
+    with SessionLocal() as session:
+        q = session.query(AppSetting).filter(AppSetting.key.like(prefix + "%"))
+        if isinstance(store, str):
+            q = q.filter(AppSetting.store == store)
+        out: Dict[str, dict] = {}
+        for r in q.all():
+            try:
+                val = json.loads(r.value) if r.value else {}
+                if isinstance(val, dict):
+                    out[(r.key or "")[len(prefix):]] = val
+            except Exception:
+                continue
+        return out
+
+
+def delete_bulk_analysis_group_results(store: str | None, job_id: str) -> int:
+    """Drop a finished job's checkpoints (the analyses live on campaign timelines)."""
+    if not isinstance(job_id, str) or not job_id.strip():
+        return 0
+    prefix = f"bulk_analysis_group:{job_id.strip()}:"
+    with SessionLocal() as session:
+        q = session.query(AppSetting).filter(AppSetting.key.like(prefix + "%"))
+        if isinstance(store, str):
+            q = q.filter(AppSetting.store == store)
+        count = q.delete(synchronize_session=False)
+        session.commit()
+        return int(count or 0)
+
+
 def get_bulk_analysis_job(store: str | None, job_id: str) -> dict | None:
     """Read a bulk analysis job state from DB."""
     if not isinstance(job_id, str) or not job_id.strip():
@@ -997,17 +1685,21 @@ def list_campaign_mappings(store: str | None = None) -> dict:
     If store is provided, filter by it; otherwise return all mappings across stores.
     """
     with SessionLocal() as session:
-        q = session.query(CampaignMapping)
-        if isinstance(store, str):
-            q = q.filter(CampaignMapping.store == store)
-        rows = q.all()
-        out: Dict[str, dict] = {}
-        for r in rows:
-            try:
-                out[r.campaign_key] = {"kind": r.kind, "id": r.target_id, "store": r.store}
-            except Exception:
-                continue
-        return out
+        return _list_campaign_mappings_in(session, store)
+
+
+def _list_campaign_mappings_in(session, store: str | None = None) -> dict:
+    q = session.query(CampaignMapping)
+    if isinstance(store, str):
+        q = q.filter(CampaignMapping.store == store)
+    rows = q.all()
+    out: Dict[str, dict] = {}
+    for r in rows:
+        try:
+            out[r.campaign_key] = {"kind": r.kind, "id": r.target_id, "store": r.store}
+        except Exception:
+            continue
+    return out
 
 
 def update_test_status(test_id: str, status: str, error: Optional[Dict[str, Any]] = None):
@@ -1036,6 +1728,7 @@ def set_test_result(test_id: str, page: Dict[str, Any], campaign: Dict[str, Any]
         if trace is not None:
             result_payload["trace"] = trace
         t.result_json = json.dumps(result_payload, ensure_ascii=False)
+        _apply_test_list_fields(t)
         t.updated_at = _now()
         session.commit()
 
@@ -1060,26 +1753,31 @@ def set_test_failed(test_id: str, error: Dict[str, Any], trace: Optional[list] =
             if partial is not None:
                 current.update(partial)
             t.result_json = json.dumps(current, ensure_ascii=False)
+            _apply_test_list_fields(t)
         t.updated_at = _now()
         session.commit()
 
 
 def get_test(test_id: str) -> Optional[Dict[str, Any]]:
     with SessionLocal() as session:
-        t = session.get(Test, test_id)
-        if not t:
-            return None
-        return {
-            "id": t.id,
-            "status": t.status,
-            "page_url": t.page_url,
-            "campaign_id": t.campaign_id,
-            "payload": json.loads(t.payload_json) if t.payload_json else None,
-            "result": json.loads(t.result_json) if t.result_json else None,
-            "error": json.loads(t.error_json) if t.error_json else None,
-            "created_at": t.created_at.isoformat() + "Z",
-            "updated_at": t.updated_at.isoformat() + "Z",
-        }
+        return _get_test_in(session, test_id)
+
+
+def _get_test_in(session, test_id: str) -> Optional[Dict[str, Any]]:
+    t = session.get(Test, test_id)
+    if not t:
+        return None
+    return {
+        "id": t.id,
+        "status": t.status,
+        "page_url": t.page_url,
+        "campaign_id": t.campaign_id,
+        "payload": json.loads(t.payload_json) if t.payload_json else None,
+        "result": json.loads(t.result_json) if t.result_json else None,
+        "error": json.loads(t.error_json) if t.error_json else None,
+        "created_at": t.created_at.isoformat() + "Z",
+        "updated_at": t.updated_at.isoformat() + "Z",
+    }
 
 
 def list_tests(limit: int | None = None) -> list[Dict[str, Any]]:
@@ -1104,22 +1802,44 @@ def list_tests(limit: int | None = None) -> list[Dict[str, Any]]:
         return out
 
 
-def list_tests_light(limit: int | None = None) -> list[Dict[str, Any]]:
+def _tests_query(session, store: str | None = None, status: str | None = None, flow_type: str | None = None):
+    q = session.query(Test)
+    if isinstance(store, str) and store.strip():
+        q = q.filter(Test.store == store.strip().lower())
+    if status:
+        q = q.filter(Test.status == status)
+    if flow_type:
+        q = q.filter(Test.flow_type == flow_type)
+    return q
+
+
+def tests_list_version(store: str | None = None, *, status: str | None = None, flow_type: str | None = None) -> str:
+    with SessionLocal() as session:
+        return _list_version(_tests_query(session, store, status, flow_type), Test.updated_at)
+
+
+def list_tests_light(limit: int | None = None, store: str | None = None, cursor: str | None = None, *, status: str | None = None, flow_type: str | None = None) -> list[Dict[str, Any]]:
+    """Test cards, newest first, from the listing columns only (no JSON blobs)."""
+    _ensure_list_columns()
     with SessionLocal() as session:
-        q = session.query(Test.id, Test.status, Test.page_url, Test.campaign_id, Test.payload_json, Test.result_json, Test.created_at, Test.updated_at).order_by(desc(Test.created_at))
+        q = _tests_query(session, store, status, flow_type).with_entities(Test.id, Test.status, Test.page_url, Test.campaign_id, Test.title, Test.card_image, Test.store, Test.flow_type, Test.created_at, Test.updated_at)
+        after = _keyset_filter(Test, cursor)
+        if after is not None:
+            q = q.filter(after)
+        q = q.order_by(desc(Test.created_at), desc(Test.id))
         if limit:
             q = q.limit(limit)
-        rows = q.all()
         out: list[Dict[str, Any]] = []
-        for r in rows:
+        for r in q.all():
             out.append({
                 "id": r.id,
                 "status": r.status,
                 "page_url": r.page_url,
                 "campaign_id": r.campaign_id,
-                # Return raw JSON strings to avoid eager parsing; caller can parse minimally
-                "payload_json": r.payload_json,
-                "result_json": r.result_json,
+                "title": r.title,
+                "card_image": r.card_image,
+                "store": r.store,
+                "flow_type": r.flow_type,
                 "created_at": r.created_at.isoformat() + "Z",
                 "updated_at": r.updated_at.isoformat() + "Z",
             })
@@ -1132,6 +1852,7 @@ def update_test_payload(test_id: str, payload: Dict[str, Any]) -> bool:
         if not t:
             return False
         t.payload_json = json.dumps(payload, ensure_ascii=False)
+        _apply_test_list_fields(t, payload)
         t.updated_at = _now()
         session.commit()
         return True
@@ -1219,12 +1940,29 @@ def get_agent(agent_id: str) -> Optional[Dict[str, Any]]:
         }
 
 
-def list_agents(limit: int | None = None) -> list[Dict[str, Any]]:
+def _agents_query(session, q: str | None = None):
+    query = session.query(Agent)
+    if q and q.strip():
+        query = query.filter(Agent.name.ilike(f"%{q.strip()}%"))
+    return query
+
+
+def agents_list_version(q: str | None = None) -> str:
+    with SessionLocal() as session:
+        return _list_version(_agents_query(session, q), Agent.updated_at)
+
+
+def list_agents(limit: int | None = None, cursor: str | None = None, *, q: str | None = None) -> list[Dict[str, Any]]:
+    """Agents, newest first; ``cursor`` continues after the last row of a previous page."""
     with SessionLocal() as session:
-        q = session.query(Agent).order_by(desc(Agent.created_at))
+        query = _agents_query(session, q).with_entities(Agent.id, Agent.name, Agent.description, Agent.created_at, Agent.updated_at)
+        after = _keyset_filter(Agent, cursor)
+        if after is not None:
+            query = query.filter(after)
+        query = query.order_by(desc(Agent.created_at), desc(Agent.id))
         if limit:
-            q = q.limit(limit)
-        items = q.all()
+            query = query.limit(limit)
+        items = query.all()
         out: list[Dict[str, Any]] = []
         for a in items:
             out.append({
@@ -1290,9 +2028,28 @@ def get_agent_run(agent_id: str, run_id: str) -> Optional[Dict[str, Any]]:
         }
 
 
-def list_agent_runs(agent_id: str, limit: int | None = None) -> list[Dict[str, Any]]:
+def _agent_runs_query(session, agent_id: str, status: str | None = None):
+    q = session.query(AgentRun).filter(AgentRun.agent_id == agent_id)
+    if status:
+        q = q.filter(AgentRun.status == status)
+    return q
+
+
+def agent_runs_list_version(agent_id: str, *, status: str | None = None) -> str:
     with SessionLocal() as session:
-        q = session.query(AgentRun).filter(AgentRun.agent_id == agent_id).order_by(desc(AgentRun.created_at))
+        return _list_version(_agent_runs_query(session, agent_id, status), AgentRun.updated_at)
+
+
+def list_agent_runs(agent_id: str, limit: int | None = None, cursor: str | None = None, *, status: str | None = None) -> list[Dict[str, Any]]:
+    """Run summaries, newest first, without the input/output/message blobs."""
+    with SessionLocal() as session:
+        q = _agent_runs_query(session, agent_id, status).with_entities(
+            AgentRun.id, AgentRun.agent_id, AgentRun.status, AgentRun.title, AgentRun.created_at, AgentRun.updated_at
+        )
+        after = _keyset_filter(AgentRun, cursor)
+        if after is not None:
+            q = q.filter(after)
+        q = q.order_by(desc(AgentRun.created_at), desc(AgentRun.id))
         if limit:
             q = q.limit(limit)
         rows = q.all()
@@ -1319,13 +2076,40 @@ def delete_all_agents() -> int:
         return int(count or 0)
 
 
+CONFIRMATION_KINDS = ("confirm", "phone", "whatsapp")
+CONFIRMATION_MAX_RANGE_DAYS = 366
+
+
+def _bump_confirmation_rollup(session, store: str | None, agent: str, kind: str, at: datetime) -> None:
+    """Increment the (store, agent, kind, day) counter in the caller's transaction."""
+    from sqlalchemy import case
+    from sqlalchemy.exc import IntegrityError
+    day = at.date().isoformat()
+    pk = f"{store or ''}|{agent}|{kind}|{day}"
+    R = ConfirmationDailyRollup
+
+    def _update() -> int:
+        return session.query(R).filter(R.pk == pk).update(
+            {R.count: R.count + 1, R.last_at: case((R.last_at < at, at), else_=R.last_at)},
+            synchronize_session=False,
+        )
+
+    if _update():
+        return
+    try:
+        with session.begin_nested():
+            session.add(R(pk=pk, store=store, agent=agent, kind=kind, day=day, count=1, last_at=at))
+    except IntegrityError:
+        _update()  # another writer created the row first
+
+
 def log_confirmation_event(store: str | None, agent: str, order_id: str | int, kind: str, meta: dict | None = None) -> dict:
     """Append an event. Intended for analytics/attribution (not access control)."""
     from uuid import uuid4
     a = (agent or "").strip()
     oid = str(order_id).strip()
     k = (kind or "").strip().lower()
-    if not a or not oid or k not in ("confirm", "phone", "whatsapp"):
+    if not a or not oid or k not in CONFIRMATION_KINDS:
         return {"ok": False}
     with SessionLocal() as session:
         row = ConfirmationEvent(
@@ -1338,32 +2122,69 @@ def log_confirmation_event(store: str | None, agent: str, order_id: str | int, k
             created_at=_now(),
         )
         session.add(row)
+        _bump_confirmation_rollup(session, row.store, a, k, row.created_at)
         session.commit()
         return {"ok": True, "id": row.id}
 
 
+def rebuild_confirmation_rollups(store: str | None = None) -> int:
+    """Recompute the daily rollups from the event log (all stores when ``store`` is None); returns rows written."""
+    from sqlalchemy import func
+    E = ConfirmationEvent
+    with SessionLocal() as session:
+        dq = session.query(ConfirmationDailyRollup)
+        q = session.query(E.store, E.agent, E.kind, func.date(E.created_at), func.count(E.id), func.max(E.created_at))
+        if isinstance(store, str) and store.strip():
+            dq = dq.filter(ConfirmationDailyRollup.store == store.strip())
+            q = q.filter(E.store == store.strip())
+        dq.delete(synchronize_session=False)
+        written = 0
+        for st, agent, kind, day, count, last_at in q.group_by(E.store, E.agent, E.kind, func.date(E.created_at)).all():
+            k = (kind or "").lower()
+            if k not in CONFIRMATION_KINDS or not day:
+                continue
+            d = str(day)[:10]
+            session.merge(ConfirmationDailyRollup(pk=f"{st or ''}|{agent}|{k}|{d}", store=st, agent=agent, kind=k, day=d, count=int(count or 0), last_at=last_at))
+            written += 1
+        session.commit()
+    set_app_setting(None, "confirmation_rollups_built", {"at": time.time(), "store": store})
+    return written
+
+
+_confirmation_rollups_ready = False
+
+
+def _ensure_confirmation_rollups() -> None:
+    """First read after upgrading: build the rollups once from the existing event log."""
+    global _confirmation_rollups_ready
+    if _confirmation_rollups_ready:
+        return
+    if not get_app_setting(None, "confirmation_rollups_built"):
+        rebuild_confirmation_rollups()
+    _confirmation_rollups_ready = True
+
+
 def count_confirmation_events(store: str | None = None, *, kind: str | None = None) -> dict:
     """Return counts grouped by agent."""
+    from sqlalchemy import func
+    _ensure_confirmation_rollups()
     k = (kind or "").strip().lower() if kind else None
+    R = ConfirmationDailyRollup
     with SessionLocal() as session:
-        q = session.query(ConfirmationEvent)
+        q = session.query(R.agent, func.sum(R.count))
         if isinstance(store, str) and store.strip():
-            q = q.filter(ConfirmationEvent.store == store.strip())
-        if k in ("confirm", "phone", "whatsapp"):
-            q = q.filter(ConfirmationEvent.kind == k)
-        rows = q.all()
-        out: dict[str, int] = {}
-        for r in rows:
-            try:
-                out[r.agent] = int(out.get(r.agent, 0)) + 1
-            except Exception:
-                continue
-        return out
+            q = q.filter(R.store == store.strip())
+        if k in CONFIRMATION_KINDS:
+            q = q.filter(R.kind == k)
+        return {agent: int(total or 0) for agent, total in q.group_by(R.agent).all()}
 
 
-def confirmation_analytics(store: str | None = None, *, days: int | None = 30) -> dict:
+def confirmation_analytics(store: str | None = None, *, days: int | None = 30, start: str | None = None, end: str | None = None) -> dict:
     """Compute per-agent counts and daily series for confirmation events.
 
+    The window is the last ``days`` days, or ``start``..``end`` (YYYY-MM-DD,
+    inclusive, UTC) when given; at most a year either way.
+
     Returns:
       {
         totals: { confirm:int, phone:int, whatsapp:int },
@@ -1371,57 +2192,955 @@ def confirmation_analytics(store: str | None = None, *, days: int | None = 30) -
         daily: [ { date: "YYYY-MM-DD", confirm, phone, whatsapp } ]
       }
     """
-    from datetime import timedelta
-    try:
-        n = int(days or 30)
-    except Exception:
-        n = 30
-    n = max(1, min(n, 365))
-    cutoff = _now() - timedelta(days=n)
+    from datetime import date as _date, timedelta
+    today = _now().date()
+    if start:
+        first = _date.fromisoformat(str(start)[:10])
+        last = _date.fromisoformat(str(end)[:10]) if end else today
+        if last < first:
+            raise ValueError("end before start")
+        if (last - first).days >= CONFIRMATION_MAX_RANGE_DAYS:
+            raise ValueError(f"range longer than {CONFIRMATION_MAX_RANGE_DAYS} days")
+    else:
+        try:
+            n = int(days or 30)
+        except Exception:
+            n = 30
+        n = max(1, min(n, 365))
+        first, last = today - timedelta(days=n), today
+    _ensure_confirmation_rollups()
+    R = ConfirmationDailyRollup
     with SessionLocal() as session:
-        q = session.query(ConfirmationEvent)
+        q = session.query(R).filter(R.day >= first.isoformat(), R.day <= last.isoformat())
         if isinstance(store, str) and store.strip():
-            q = q.filter(ConfirmationEvent.store == store.strip())
-        q = q.filter(ConfirmationEvent.created_at >= cutoff)
-        rows = q.all()
+            q = q.filter(R.store == store.strip())
         totals = {"confirm": 0, "phone": 0, "whatsapp": 0}
         agents: dict[str, dict] = {}
         daily: dict[str, dict] = {}
+        for r in q.all():
+            kind = (r.kind or "").lower()
+            if kind not in CONFIRMATION_KINDS:
+                continue
+            count = int(r.count or 0)
+            totals[kind] += count
+            a = (r.agent or "").strip().lower()
+            if a:
+                ag = agents.setdefault(a, {"confirm": 0, "phone": 0, "whatsapp": 0, "last_at": None})
+                ag[kind] += count
+                cur = (r.last_at.isoformat() + "Z") if r.last_at else None
+                if cur and (not ag["last_at"] or cur > str(ag["last_at"])):
+                    ag["last_at"] = cur
+            day = daily.setdefault(r.day, {"date": r.day, "confirm": 0, "phone": 0, "whatsapp": 0})
+            day[kind] += count
+        # fill missing days for stable chart display
+        cur_day = first
+        while cur_day <= last:
+            key = cur_day.isoformat()
+            daily.setdefault(key, {"date": key, "confirm": 0, "phone": 0, "whatsapp": 0})
+            cur_day = cur_day + timedelta(days=1)
+        daily_list = list(daily.values())
+        daily_list.sort(key=lambda x: x.get("date") or "")
+        return {"totals": totals, "agents": agents, "daily": daily_list, "start": first.isoformat(), "end": last.isoformat()}
+
+
+# ---------------- Translation memory ----------------
+class TranslationMemory(Base):
+    __tablename__ = "translation_memory"
+
+    key = Column(String, primary_key=True)  # sha256 of (kind, target, locale, domain, source)
+    source_hash = Column(String, nullable=False, index=True)
+    kind = Column(String, nullable=False)  # 'text' | 'html'
+    target_language = Column(String, nullable=False)
+    locale = Column(String, nullable=True)
+    domain = Column(String, nullable=True)
+    translation = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+Base.metadata.create_all(engine)
+
+
+def get_translation_memory(keys: list[str]) -> Dict[str, str]:
+    wanted = [str(k) for k in (keys or []) if k]
+    if not wanted:
+        return {}
+    out: Dict[str, str] = {}
+    with SessionLocal() as session:
+        # Chunk IN() lists so long pages stay under SQLite's bound-parameter limit.
+        for i in range(0, len(wanted), 500):
+            rows = session.query(TranslationMemory.key, TranslationMemory.translation).filter(
+                TranslationMemory.key.in_(wanted[i:i + 500])
+            ).all()
+            for key, translation in rows:
+                out[key] = translation
+    return out
+
+
+def save_translation_memory(entries: list[Dict[str, Any]]) -> int:
+    """Upsert translation-memory rows; each entry carries the TranslationMemory column names."""
+    if not entries:
+        return 0
+    with SessionLocal() as session:
+        for entry in entries:
+            session.merge(TranslationMemory(
+                key=str(entry["key"]),
+                source_hash=str(entry.get("source_hash") or ""),
+                kind=str(entry.get("kind") or "text"),
+                target_language=str(entry.get("target_language") or ""),
+                locale=entry.get("locale") or None,
+                domain=entry.get("domain") or None,
+                translation=str(entry.get("translation") or ""),
+                created_at=_now(),
+            ))
+        session.commit()
+    return len(entries)
+
+
+def delete_translation_memory(target_language: str | None = None) -> int:
+    with SessionLocal() as session:
+        q = session.query(TranslationMemory)
+        if target_language:
+            q = q.filter(TranslationMemory.target_language == target_language)
+        count = q.delete(synchronize_session=False)
+        session.commit()
+        return int(count or 0)
+
+
+# ---------------- Image fingerprints ----------------
+class ImageFingerprint(Base):
+    __tablename__ = "image_fingerprints"
+
+    sha256 = Column(String, primary_key=True)
+    dhash = Column(String, nullable=True, index=True)  # 64-bit difference hash, hex; NULL without Pillow
+    url = Column(Text, nullable=True, index=True)  # canonical asset URL (``/uploads/...`` for local files)
+    content_type = Column(String, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    source = Column(String, nullable=True)  # 'upload' | 'wholesale' | 'generated' | 'remote'
+    shopify_json = Column(Text, nullable=True)  # {"<store>|<owner>": shopify url or media id}
+    derived_json = Column(Text, nullable=True)  # {"<operation>": result} reused for identical inputs
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+Base.metadata.create_all(engine)
+
+
+def _image_fingerprint_dict(row: ImageFingerprint) -> Dict[str, Any]:
+    def _load(raw: str | None) -> dict:
+        try:
+            value = json.loads(raw) if raw else {}
+            return value if isinstance(value, dict) else {}
+        except Exception:
+            return {}
+
+    return {
+        "sha256": row.sha256,
+        "dhash": row.dhash,
+        "url": row.url,
+        "content_type": row.content_type,
+        "width": row.width,
+        "height": row.height,
+        "source": row.source,
+        "shopify": _load(row.shopify_json),
+        "derived": _load(row.derived_json),
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+    }
+
+
+def get_image_fingerprint(sha256: str) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as session:
+        row = session.get(ImageFingerprint, sha256)
+        return _image_fingerprint_dict(row) if row else None
+
+
+def find_image_fingerprint_by_url(url: str) -> Optional[Dict[str, Any]]:
+    if not url:
+        return None
+    with SessionLocal() as session:
+        row = session.query(ImageFingerprint).filter(ImageFingerprint.url == url).order_by(ImageFingerprint.created_at).first()
+        return _image_fingerprint_dict(row) if row else None
+
+
+def list_image_dhashes() -> list[tuple[str, str]]:
+    """(sha256, dhash) for every fingerprint that has a perceptual hash."""
+    with SessionLocal() as session:
+        rows = session.query(ImageFingerprint.sha256, ImageFingerprint.dhash).filter(ImageFingerprint.dhash.isnot(None)).all()
+        return [(sha, dh) for sha, dh in rows]
+
+
+def save_image_fingerprint(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Insert a fingerprint, keeping the existing row (and its URL) when the bytes were seen before."""
+    with SessionLocal() as session:
+        row = session.get(ImageFingerprint, entry["sha256"])
+        if row is None:
+            row = ImageFingerprint(
+                sha256=entry["sha256"],
+                dhash=entry.get("dhash"),
+                url=entry.get("url"),
+                content_type=entry.get("content_type"),
+                width=entry.get("width"),
+                height=entry.get("height"),
+                source=entry.get("source"),
+                created_at=_now(),
+            )
+            session.add(row)
+            session.commit()
+            session.refresh(row)
+        return _image_fingerprint_dict(row)
+
+
+def update_image_fingerprint_url(sha256: str, url: str | None) -> None:
+    with SessionLocal() as session:
+        row = session.get(ImageFingerprint, sha256)
+        if row is not None:
+            row.url = url or None
+            session.commit()
+
+
+def update_image_fingerprint_map(sha256: str, column: str, key: str, value: Any) -> bool:
+    """Set ``key`` in the shopify/derived JSON map of a fingerprint."""
+    attr = {"shopify": "shopify_json", "derived": "derived_json"}[column]
+    with SessionLocal() as session:
+        row = session.get(ImageFingerprint, sha256)
+        if row is None:
+            return False
+        try:
+            current = json.loads(getattr(row, attr) or "{}")
+            if not isinstance(current, dict):
+                current = {}
+        except Exception:
+            current = {}
+        current[key] = value
+        setattr(row, attr, json.dumps(current, ensure_ascii=False))
+        session.commit()
+        return True
+
+
+# ---------------- Flow step events ----------------
+# Append-only log of automation step transitions (one small row each). Flow
+# rows are rewritten only at milestones; live progress and resume checkpoints
+# are read from here.
+class FlowStepEvent(Base):
+    __tablename__ = "flow_step_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    flow_id = Column(String, nullable=False)
+    input_hash = Column(String, nullable=True)  # inputs the step ran with; checkpoints only match the same hash
+    step = Column(String, nullable=False)
+    angle_index = Column(Integer, nullable=True)
+    status = Column(String, nullable=False)  # 'running' | 'completed' | 'failed'
+    at = Column(Float, nullable=False)  # epoch seconds, like the step timestamps in ads_json
+    data_json = Column(Text, nullable=True)  # response (completed) or error (failed)
+
+    __table_args__ = (Index("ix_flow_step_events_flow_id_id", "flow_id", "id"),)
+
+
+Base.metadata.create_all(engine)
+
+
+def append_flow_step_event(
+    flow_id: str,
+    step: str,
+    status: str,
+    *,
+    input_hash: str | None = None,
+    angle_index: int | None = None,
+    data: Any = None,
+) -> Dict[str, Any]:
+    at = time.time()
+    with SessionLocal() as session:
+        row = FlowStepEvent(
+            flow_id=flow_id,
+            input_hash=input_hash,
+            step=step,
+            angle_index=angle_index,
+            status=status,
+            at=at,
+            data_json=json.dumps(data, ensure_ascii=False) if data is not None else None,
+        )
+        session.add(row)
+        session.commit()
+        return {"id": row.id, "flow_id": flow_id, "step": step, "angle_index": angle_index, "status": status, "at": at, "data": data}
+
+
+def list_flow_step_events(flow_id: str, *, after_id: int = 0, input_hash: str | None = None, limit: int | None = None) -> list[Dict[str, Any]]:
+    with SessionLocal() as session:
+        q = session.query(FlowStepEvent).filter(FlowStepEvent.flow_id == flow_id, FlowStepEvent.id > int(after_id or 0))
+        if input_hash is not None:
+            q = q.filter(FlowStepEvent.input_hash == input_hash)
+        q = q.order_by(FlowStepEvent.id)
+        if limit:
+            q = q.limit(int(limit))
+        out: list[Dict[str, Any]] = []
+        for r in q.all():
+            try:
+                data = json.loads(r.data_json) if r.data_json else None
+            except Exception:
+                data = None
+            out.append({
+                "id": r.id,
+                "flow_id": r.flow_id,
+                "input_hash": r.input_hash,
+                "step": r.step,
+                "angle_index": r.angle_index,
+                "status": r.status,
+                "at": r.at,
+                "data": data,
+            })
+        return out
+
+
+def delete_flow_step_events(flow_id: str) -> int:
+    with SessionLocal() as session:
+        count = session.query(FlowStepEvent).filter(FlowStepEvent.flow_id == flow_id).delete(synchronize_session=False)
+        session.commit()
+        return int(count or 0)
+
+
+# ---------------- Shopify mirrors (webhook-fed) ----------------
+# Durable log of Shopify webhook deliveries plus the local order/product/
+# inventory mirrors the appliers in app.shopify_mirror keep up to date.
+class ShopifyWebhookEvent(Base):
+    __tablename__ = "shopify_webhook_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    webhook_id = Column(String, nullable=False, unique=True)  # X-Shopify-Webhook-Id; retried deliveries reuse it
+    store = Column(String, nullable=True)
+    topic = Column(String, nullable=False)  # e.g. 'orders/updated'
+    resource_id = Column(String, nullable=True)
+    payload_json = Column(Text, nullable=False)
+    received_at = Column(Float, nullable=False)
+    processed_at = Column(Float, nullable=True)  # NULL until an applier has handled it
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (Index("ix_shopify_webhook_events_processed_id", "processed_at", "id"),)
+
+
+class ShopifyOrderMirror(Base):
+    __tablename__ = "shopify_orders_mirror"
+
+    pk = Column(String, primary_key=True)  # composed key: f"{(store or '').strip()}|{order_id}"
+    store = Column(String, nullable=True)
+    order_id = Column(String, nullable=False)
+    name = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=True)  # Shopify timestamps, normalized to naive UTC
+    processed_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    cancelled_at = Column(DateTime, nullable=True)
+    closed_at = Column(DateTime, nullable=True)
+    financial_status = Column(String, nullable=True)
+    fulfillment_status = Column(String, nullable=True)
+    tags = Column(Text, nullable=True)  # comma-separated, as Shopify sends them
+    total_price = Column(Float, nullable=True)
+    data_json = Column(Text, nullable=True)  # full order payload
+    synced_at = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_shopify_orders_mirror_store_processed_at", "store", "processed_at"),
+        Index("ix_shopify_orders_mirror_store_created_at", "store", "created_at"),
+    )
+
+
+class ShopifyProductMirror(Base):
+    __tablename__ = "shopify_products_mirror"
+
+    pk = Column(String, primary_key=True)  # composed key: f"{(store or '').strip()}|{product_id}"
+    store = Column(String, nullable=True)
+    product_id = Column(String, nullable=False)
+    title = Column(Text, nullable=True)
+    handle = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    vendor = Column(String, nullable=True)
+    product_type = Column(String, nullable=True)
+    tags = Column(Text, nullable=True)
+    total_inventory = Column(Integer, nullable=True)  # sum of variant inventory_quantity
+    updated_at = Column(DateTime, nullable=True)
+    data_json = Column(Text, nullable=True)  # full product payload (variants included)
+    synced_at = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_shopify_products_mirror_store_vendor", "store", "vendor"),)
+
+
+class ShopifyInventoryMirror(Base):
+    __tablename__ = "shopify_inventory_mirror"
+
+    pk = Column(String, primary_key=True)  # composed key: f"{(store or '').strip()}|{inventory_item_id}|{location_id}"
+    store = Column(String, nullable=True)
+    inventory_item_id = Column(String, nullable=False)
+    location_id = Column(String, nullable=False)
+    available = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    synced_at = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_shopify_inventory_mirror_store_item", "store", "inventory_item_id"),)
+
+
+Base.metadata.create_all(engine)
+
+
+def _shopify_ts(value: Any) -> datetime | None:
+    """Shopify ISO timestamp (with offset) -> naive UTC datetime."""
+    if not value:
+        return None
+    try:
+        from datetime import timezone
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return dt
+    except Exception:
+        return None
+
+
+def _mirror_pk(store: str | None, *parts: Any) -> str:
+    return "|".join([(store or "").strip(), *[str(p) for p in parts]])
+
+
+def record_shopify_webhook_event(webhook_id: str, store: str | None, topic: str, payload: Any, *, resource_id: str | None = None) -> bool:
+    """Append a delivery to the event log; False when ``webhook_id`` was already recorded."""
+    from sqlalchemy.exc import IntegrityError
+    with SessionLocal() as session:
+        if session.query(ShopifyWebhookEvent.id).filter(ShopifyWebhookEvent.webhook_id == webhook_id).first():
+            return False
+        session.add(ShopifyWebhookEvent(
+            webhook_id=webhook_id,
+            store=(store or "").strip() or None,
+            topic=topic,
+            resource_id=resource_id,
+            payload_json=json.dumps(payload, ensure_ascii=False),
+            received_at=time.time(),
+        ))
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return False
+        return True
+
+
+def list_pending_shopify_webhook_events(limit: int = 500) -> list[Dict[str, Any]]:
+    with SessionLocal() as session:
+        rows = (
+            session.query(ShopifyWebhookEvent)
+            .filter(ShopifyWebhookEvent.processed_at.is_(None))
+            .order_by(ShopifyWebhookEvent.id)
+            .limit(int(limit))
+            .all()
+        )
+        out: list[Dict[str, Any]] = []
         for r in rows:
             try:
-                kind = (r.kind or "").lower()
-                if kind not in ("confirm", "phone", "whatsapp"):
-                    continue
-                a = (r.agent or "").strip().lower()
-                d = (r.created_at.date().isoformat() if r.created_at else None)
-                totals[kind] = int(totals.get(kind, 0)) + 1
-                if a:
-                    ag = agents.setdefault(a, {"confirm": 0, "phone": 0, "whatsapp": 0, "last_at": None})
-                    ag[kind] = int(ag.get(kind, 0)) + 1
-                    try:
-                        last = ag.get("last_at")
-                        cur = (r.created_at.isoformat() + "Z") if r.created_at else None
-                        if cur and (not last or cur > str(last)):
-                            ag["last_at"] = cur
-                    except Exception:
-                        pass
-                if d:
-                    day = daily.setdefault(d, {"date": d, "confirm": 0, "phone": 0, "whatsapp": 0})
-                    day[kind] = int(day.get(kind, 0)) + 1
+                payload = json.loads(r.payload_json) if r.payload_json else None
+            except Exception:
+                payload = None
+            out.append({"id": r.id, "webhook_id": r.webhook_id, "store": r.store, "topic": r.topic, "resource_id": r.resource_id, "payload": payload, "received_at": r.received_at})
+        return out
+
+
+def mark_shopify_webhook_events(ids: list[int], *, errors: Dict[int, str] | None = None) -> int:
+    if not ids:
+        return 0
+    errors = errors or {}
+    now = time.time()
+    with SessionLocal() as session:
+        rows = session.query(ShopifyWebhookEvent).filter(ShopifyWebhookEvent.id.in_(list(ids))).all()
+        for r in rows:
+            r.processed_at = now
+            r.error = errors.get(r.id)
+        session.commit()
+        return len(rows)
+
+
+def prune_shopify_webhook_events(before: float) -> int:
+    """Delete processed events received before ``before`` (epoch seconds)."""
+    with SessionLocal() as session:
+        count = (
+            session.query(ShopifyWebhookEvent)
+            .filter(ShopifyWebhookEvent.processed_at.isnot(None), ShopifyWebhookEvent.received_at < before)
+            .delete(synchronize_session=False)
+        )
+        session.commit()
+        return int(count or 0)
+
+
+def _is_newer(incoming: datetime | None, current: datetime | None) -> bool:
+    # Deliveries can arrive out of order; never let an older snapshot overwrite a newer one.
+    return current is None or incoming is None or incoming >= current
+
+
+def upsert_shopify_orders(store: str | None, orders: list[dict]) -> int:
+    """Insert or refresh mirrored orders (REST/webhook order payloads); returns rows written."""
+    written = 0
+    now = time.time()
+    with SessionLocal() as session:
+        for o in orders or []:
+            oid = str((o or {}).get("id") or "").strip()
+            if not oid:
+                continue
+            pk = _mirror_pk(store, oid)
+            updated_at = _shopify_ts(o.get("updated_at"))
+            row = session.get(ShopifyOrderMirror, pk)
+            if row is not None and not _is_newer(updated_at, row.updated_at):
+                continue
+            if row is None:
+                row = ShopifyOrderMirror(pk=pk, store=(store or "").strip() or None, order_id=oid, synced_at=now)
+                session.add(row)
+            try:
+                total_price = float(o.get("total_price")) if o.get("total_price") not in (None, "") else None
             except Exception:
+                total_price = None
+            row.name = o.get("name")
+            row.created_at = _shopify_ts(o.get("created_at"))
+            row.processed_at = _shopify_ts(o.get("processed_at"))
+            row.updated_at = updated_at
+            row.cancelled_at = _shopify_ts(o.get("cancelled_at"))
+            row.closed_at = _shopify_ts(o.get("closed_at"))
+            row.financial_status = o.get("financial_status")
+            row.fulfillment_status = o.get("fulfillment_status")
+            row.tags = o.get("tags") if isinstance(o.get("tags"), str) else ", ".join(o.get("tags") or [])
+            row.total_price = total_price
+            row.data_json = json.dumps(o, ensure_ascii=False)
+            row.synced_at = now
+            written += 1
+        session.commit()
+    return written
+
+
+def upsert_shopify_products(store: str | None, products: list[dict]) -> int:
+    written = 0
+    now = time.time()
+    with SessionLocal() as session:
+        for p in products or []:
+            pid = str((p or {}).get("id") or "").strip()
+            if not pid:
                 continue
-        # fill missing days for stable chart display
+            pk = _mirror_pk(store, pid)
+            updated_at = _shopify_ts(p.get("updated_at"))
+            row = session.get(ShopifyProductMirror, pk)
+            if row is not None and not _is_newer(updated_at, row.updated_at):
+                continue
+            if row is None:
+                row = ShopifyProductMirror(pk=pk, store=(store or "").strip() or None, product_id=pid, synced_at=now)
+                session.add(row)
+            total = 0
+            has_qty = False
+            for v in p.get("variants") or []:
+                qty = (v or {}).get("inventory_quantity")
+                if isinstance(qty, (int, float)):
+                    total += int(qty)
+                    has_qty = True
+            row.title = p.get("title")
+            row.handle = p.get("handle")
+            row.status = p.get("status")
+            row.vendor = p.get("vendor")
+            row.product_type = p.get("product_type")
+            row.tags = p.get("tags") if isinstance(p.get("tags"), str) else ", ".join(p.get("tags") or [])
+            row.total_inventory = total if has_qty else None
+            row.updated_at = updated_at
+            row.data_json = json.dumps(p, ensure_ascii=False)
+            row.synced_at = now
+            written += 1
+        session.commit()
+    return written
+
+
+def upsert_shopify_inventory_levels(store: str | None, levels: list[dict]) -> int:
+    """``levels``: inventory_levels/update payloads ({inventory_item_id, location_id, available, updated_at})."""
+    written = 0
+    now = time.time()
+    with SessionLocal() as session:
+        for lv in levels or []:
+            item = str((lv or {}).get("inventory_item_id") or "").strip()
+            loc = str((lv or {}).get("location_id") or "").strip()
+            if not item or not loc:
+                continue
+            pk = _mirror_pk(store, item, loc)
+            updated_at = _shopify_ts(lv.get("updated_at"))
+            row = session.get(ShopifyInventoryMirror, pk)
+            if row is not None and not _is_newer(updated_at, row.updated_at):
+                continue
+            if row is None:
+                row = ShopifyInventoryMirror(pk=pk, store=(store or "").strip() or None, inventory_item_id=item, location_id=loc, synced_at=now)
+                session.add(row)
+            row.available = int(lv["available"]) if isinstance(lv.get("available"), (int, float)) else None
+            row.updated_at = updated_at
+            row.synced_at = now
+            written += 1
+        session.commit()
+    return written
+
+
+def delete_shopify_mirror_rows(store: str | None, kind: str, ids: list[str]) -> int:
+    model = {"orders": ShopifyOrderMirror, "products": ShopifyProductMirror}[kind]
+    pks = [_mirror_pk(store, i) for i in ids if str(i or "").strip()]
+    if not pks:
+        return 0
+    with SessionLocal() as session:
+        count = session.query(model).filter(model.pk.in_(pks)).delete(synchronize_session=False)
+        session.commit()
+        return int(count or 0)
+
+
+def _mirror_order_dict(r: ShopifyOrderMirror, *, with_data: bool = False) -> Dict[str, Any]:
+    def _iso(dt: datetime | None) -> str | None:
+        return dt.isoformat() + "Z" if dt else None
+
+    out: Dict[str, Any] = {
+        "order_id": r.order_id,
+        "store": r.store,
+        "name": r.name,
+        "created_at": _iso(r.created_at),
+        "processed_at": _iso(r.processed_at),
+        "updated_at": _iso(r.updated_at),
+        "cancelled_at": _iso(r.cancelled_at),
+        "closed_at": _iso(r.closed_at),
+        "financial_status": r.financial_status,
+        "fulfillment_status": r.fulfillment_status,
+        "tags": r.tags,
+        "total_price": r.total_price,
+    }
+    if with_data:
         try:
-            from datetime import date as _date
-            start = cutoff.date()
-            today = _now().date()
-            cur = start
-            while cur <= today:
-                key = cur.isoformat()
-                daily.setdefault(key, {"date": key, "confirm": 0, "phone": 0, "whatsapp": 0})
-                cur = cur + timedelta(days=1)
+            out["data"] = json.loads(r.data_json) if r.data_json else None
         except Exception:
-            pass
-        daily_list = list(daily.values())
-        daily_list.sort(key=lambda x: x.get("date") or "")
-        return {"totals": totals, "agents": agents, "daily": daily_list}
+            out["data"] = None
+    return out
+
+
+def list_mirrored_orders(
+    store: str | None,
+    *,
+    processed_min: datetime | None = None,
+    processed_max: datetime | None = None,
+    include_cancelled: bool = False,
+    with_data: bool = False,
+    limit: int | None = None,
+) -> list[Dict[str, Any]]:
+    """Mirrored orders for a store, newest processed first (bounds are naive UTC)."""
+    with SessionLocal() as session:
+        q = session.query(ShopifyOrderMirror).filter(ShopifyOrderMirror.store == ((store or "").strip() or None))
+        if processed_min is not None:
+            q = q.filter(ShopifyOrderMirror.processed_at >= processed_min)
+        if processed_max is not None:
+            q = q.filter(ShopifyOrderMirror.processed_at <= processed_max)
+        if not include_cancelled:
+            q = q.filter(ShopifyOrderMirror.cancelled_at.is_(None))
+        q = q.order_by(desc(ShopifyOrderMirror.processed_at))
+        if limit:
+            q = q.limit(int(limit))
+        return [_mirror_order_dict(r, with_data=with_data) for r in q.all()]
+
+
+def get_mirrored_inventory(store: str | None, inventory_item_ids: list[str]) -> Dict[str, Dict[str, Any]]:
+    """{inventory_item_id: {available (summed over locations), locations: {location_id: available}}}."""
+    ids = [str(i).strip() for i in inventory_item_ids or [] if str(i or "").strip()]
+    if not ids:
+        return {}
+    out: Dict[str, Dict[str, Any]] = {}
+    with SessionLocal() as session:
+        rows = (
+            session.query(ShopifyInventoryMirror)
+            .filter(ShopifyInventoryMirror.store == ((store or "").strip() or None), ShopifyInventoryMirror.inventory_item_id.in_(ids))
+            .all()
+        )
+        for r in rows:
+            entry = out.setdefault(r.inventory_item_id, {"available": 0, "locations": {}})
+            entry["locations"][r.location_id] = r.available
+            entry["available"] += int(r.available or 0)
+    return out
+
+
+def list_mirrored_inventory_item_ids(store: str | None) -> list[str]:
+    """Inventory item ids of every variant in the store's product mirror."""
+    ids: list[str] = []
+    seen: set[str] = set()
+    with SessionLocal() as session:
+        rows = session.query(ShopifyProductMirror.data_json).filter(ShopifyProductMirror.store == ((store or "").strip() or None)).all()
+    for (data_json,) in rows:
+        try:
+            variants = (json.loads(data_json) or {}).get("variants") or [] if data_json else []
+        except Exception:
+            continue
+        for v in variants:
+            item = str((v or {}).get("inventory_item_id") or "").strip()
+            if item and item not in seen:
+                seen.add(item)
+                ids.append(item)
+    return ids
+
+
+def shopify_mirror_counts(store: str | None = None) -> Dict[str, int]:
+    from sqlalchemy import func
+    label = (store or "").strip() or None
+    with SessionLocal() as session:
+        def _count(model) -> int:
+            q = session.query(func.count(model.pk))
+            if store is not None:
+                q = q.filter(model.store == label)
+            return int(q.scalar() or 0)
+
+        pending = session.query(func.count(ShopifyWebhookEvent.id)).filter(ShopifyWebhookEvent.processed_at.is_(None)).scalar()
+        return {
+            "orders": _count(ShopifyOrderMirror),
+            "products": _count(ShopifyProductMirror),
+            "inventory_levels": _count(ShopifyInventoryMirror),
+            "pending_events": int(pending or 0),
+        }
+
+
+# ---------------- Confirmation work queue (local mirror) ----------------
+# Open, unfulfilled, non-COD orders as the confirmation agents see them. One
+# row per order plus one row per (order, tag) so "orders of this agent" is an
+# indexed tag lookup instead of a Shopify scan. Rows that leave the queue are
+# kept with active=0 so a late, older snapshot can't bring them back.
+class ConfirmationQueueOrder(Base):
+    __tablename__ = "confirmation_queue"
+
+    pk = Column(String, primary_key=True)  # composed key: f"{(store or '').strip()}|{order_id}"
+    store = Column(String, nullable=True)
+    order_id = Column(String, nullable=False)
+    name = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=True)  # naive UTC
+    updated_at = Column(DateTime, nullable=True)  # Shopify updated_at of the snapshot this row reflects
+    tags_json = Column(Text, nullable=True)  # tags as Shopify has them (original case)
+    n_stage = Column(Integer, nullable=False, default=0)  # highest nX call tag, 0 when none
+    wtp_stage = Column(Integer, nullable=False, default=0)  # highest wtpX WhatsApp tag, 0 when none
+    active = Column(Integer, nullable=False, default=1)
+    synced_at = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_confirmation_queue_store_active_created", "store", "active", "created_at", "order_id"),)
+
+
+class ConfirmationQueueTag(Base):
+    __tablename__ = "confirmation_queue_tags"
+
+    pk = Column(String, primary_key=True)  # f"{queue_pk}|{tag}"
+    queue_pk = Column(String, nullable=False)
+    store = Column(String, nullable=True)
+    tag = Column(String, nullable=False)  # lower-cased
+
+    __table_args__ = (
+        Index("ix_confirmation_queue_tags_store_tag", "store", "tag", "queue_pk"),
+        Index("ix_confirmation_queue_tags_queue_pk", "queue_pk"),
+    )
+
+
+Base.metadata.create_all(engine)
+
+
+def _set_confirmation_queue_tags(session, row: ConfirmationQueueOrder, tags: list[str] | None) -> None:
+    session.query(ConfirmationQueueTag).filter(ConfirmationQueueTag.queue_pk == row.pk).delete(synchronize_session=False)
+    if not row.active:
+        return
+    for tag in sorted({str(t or "").strip().lower() for t in tags or [] if str(t or "").strip()}):
+        session.add(ConfirmationQueueTag(pk=f"{row.pk}|{tag}", queue_pk=row.pk, store=row.store, tag=tag))
+
+
+def apply_confirmation_queue(store: str | None, entries: list[Dict[str, Any]]) -> int:
+    """Upsert queue entries ({order_id, name, created_at, updated_at, tags, n_stage, wtp_stage, active}).
+
+    Timestamps are Shopify ISO strings. An entry older than the stored row is
+    ignored; returns rows written.
+    """
+    written = 0
+    now = time.time()
+    label = (store or "").strip() or None
+    with SessionLocal() as session:
+        for e in entries or []:
+            oid = str((e or {}).get("order_id") or "").strip()
+            if not oid:
+                continue
+            pk = _mirror_pk(store, oid)
+            updated_at = _shopify_ts(e.get("updated_at"))
+            row = session.get(ConfirmationQueueOrder, pk)
+            if row is not None and not _is_newer(updated_at, row.updated_at):
+                row.synced_at = now  # still seen by this sync
+                continue
+            if row is None:
+                if not e.get("active"):
+                    continue  # never queued, nothing to retire
+                row = ConfirmationQueueOrder(pk=pk, store=label, order_id=oid)
+                session.add(row)
+            row.name = e.get("name")
+            row.created_at = _shopify_ts(e.get("created_at"))
+            row.updated_at = updated_at
+            row.tags_json = json.dumps(list(e.get("tags") or []), ensure_ascii=False)
+            row.n_stage = int(e.get("n_stage") or 0)
+            row.wtp_stage = int(e.get("wtp_stage") or 0)
+            row.active = 1 if e.get("active") else 0
+            row.synced_at = now
+            _set_confirmation_queue_tags(session, row, e.get("tags"))
+            written += 1
+        session.commit()
+    return written
+
+
+def update_confirmation_queue_tags(store: str | None, order_id: str, tags: list[str], *, n_stage: int, wtp_stage: int, active: bool) -> bool:
+    """Apply an agent's tag edit right away (the orders/updated webhook follows with the full snapshot)."""
+    with SessionLocal() as session:
+        row = session.get(ConfirmationQueueOrder, _mirror_pk(store, order_id))
+        if row is None:
+            return False
+        row.tags_json = json.dumps(list(tags or []), ensure_ascii=False)
+        row.n_stage = int(n_stage or 0)
+        row.wtp_stage = int(wtp_stage or 0)
+        row.active = 1 if active else 0
+        _set_confirmation_queue_tags(session, row, tags)
+        session.commit()
+        return True
+
+
+def retire_confirmation_queue(store: str | None, *, order_ids: list[str] | None = None, synced_before: float | None = None) -> int:
+    """Take orders out of the queue: the given ids (deleted orders) or active rows not seen since ``synced_before``."""
+    label = (store or "").strip() or None
+    with SessionLocal() as session:
+        q = session.query(ConfirmationQueueOrder).filter(ConfirmationQueueOrder.store == label, ConfirmationQueueOrder.active == 1)
+        if order_ids is not None:
+            q = q.filter(ConfirmationQueueOrder.order_id.in_([str(i) for i in order_ids if str(i or "").strip()]))
+        if synced_before is not None:
+            q = q.filter(ConfirmationQueueOrder.synced_at < synced_before)
+        rows = q.all()
+        for row in rows:
+            row.active = 0
+            _set_confirmation_queue_tags(session, row, None)
+        session.commit()
+        return len(rows)
+
+
+def _confirmation_queue_query(session, store: str | None, any_tags: list[str] | None):
+    from sqlalchemy import exists, and_
+    label = (store or "").strip() or None
+    q = session.query(ConfirmationQueueOrder).filter(ConfirmationQueueOrder.store == label, ConfirmationQueueOrder.active == 1)
+    if any_tags is not None:
+        q = q.filter(exists().where(and_(
+            ConfirmationQueueTag.store == label,
+            ConfirmationQueueTag.tag.in_(list(any_tags)),
+            ConfirmationQueueTag.queue_pk == ConfirmationQueueOrder.pk,
+        )))
+    return q
+
+
+def list_confirmation_queue(
+    store: str | None,
+    *,
+    any_tags: list[str] | None = None,
+    limit: int = 50,
+    after: tuple[datetime, str] | None = None,
+    before: tuple[datetime, str] | None = None,
+) -> list[Dict[str, Any]]:
+    """Queue rows newest first, restricted to orders carrying any of ``any_tags`` (None = all).
+
+    Keyset pagination on (created_at, order_id): ``after`` continues past the
+    last row of a page, ``before`` returns the page preceding the first row.
+    Each row includes the mirrored order payload as ``data``.
+    """
+    from sqlalchemy import and_, or_
+    Q = ConfirmationQueueOrder
+    with SessionLocal() as session:
+        q = _confirmation_queue_query(session, store, any_tags)
+        if after is not None:
+            q = q.filter(or_(Q.created_at < after[0], and_(Q.created_at == after[0], Q.order_id < after[1])))
+            q = q.order_by(desc(Q.created_at), desc(Q.order_id))
+        elif before is not None:
+            q = q.filter(or_(Q.created_at > before[0], and_(Q.created_at == before[0], Q.order_id > before[1])))
+            q = q.order_by(Q.created_at, Q.order_id)
+        else:
+            q = q.order_by(desc(Q.created_at), desc(Q.order_id))
+        rows = q.limit(max(1, int(limit))).all()
+        if before is not None:
+            rows.reverse()
+        payloads: Dict[str, Any] = {}
+        if rows:
+            for pk, data_json in session.query(ShopifyOrderMirror.pk, ShopifyOrderMirror.data_json).filter(ShopifyOrderMirror.pk.in_([r.pk for r in rows])):
+                try:
+                    payloads[pk] = json.loads(data_json) if data_json else None
+                except Exception:
+                    payloads[pk] = None
+        out: list[Dict[str, Any]] = []
+        for r in rows:
+            try:
+                tags = json.loads(r.tags_json) if r.tags_json else []
+            except Exception:
+                tags = []
+            out.append({
+                "order_id": r.order_id,
+                "name": r.name,
+                "created_at": r.created_at,
+                "tags": tags,
+                "n_stage": r.n_stage,
+                "wtp_stage": r.wtp_stage,
+                "data": payloads.get(r.pk),
+            })
+        return out
+
+
+def confirmation_queue_counts(store: str | None, agent_tags: list[str], all_agent_tags: list[str]) -> Dict[str, int]:
+    """Assigned/unassigned totals and n1/n2/n3 tag counts for an agent's slice of the queue."""
+    from sqlalchemy import func, case
+    label = (store or "").strip() or None
+    with SessionLocal() as session:
+        unassigned = 0
+        if all_agent_tags:
+            total = _confirmation_queue_query(session, store, None).with_entities(func.count(ConfirmationQueueOrder.pk)).scalar()
+            assigned_any = _confirmation_queue_query(session, store, all_agent_tags).with_entities(func.count(ConfirmationQueueOrder.pk)).scalar()
+            unassigned = int(total or 0) - int(assigned_any or 0)
+        else:
+            unassigned = int(_confirmation_queue_query(session, store, None).with_entities(func.count(ConfirmationQueueOrder.pk)).scalar() or 0)
+        out = {"assigned_total": 0, "unassigned_total": unassigned, "n1": 0, "n2": 0, "n3": 0, "any_n": 0, "no_n": 0, "all_n": 0}
+        if not agent_tags:
+            return out
+        assigned = _confirmation_queue_query(session, store, agent_tags).with_entities(ConfirmationQueueOrder.pk).subquery()
+        per_order = (
+            session.query(
+                ConfirmationQueueTag.queue_pk.label("queue_pk"),
+                func.sum(case((ConfirmationQueueTag.tag == "n1", 1), else_=0)).label("n1"),
+                func.sum(case((ConfirmationQueueTag.tag == "n2", 1), else_=0)).label("n2"),
+                func.sum(case((ConfirmationQueueTag.tag == "n3", 1), else_=0)).label("n3"),
+            )
+            .filter(ConfirmationQueueTag.store == label, ConfirmationQueueTag.tag.in_(["n1", "n2", "n3"]))
+            .group_by(ConfirmationQueueTag.queue_pk)
+            .subquery()
+        )
+        row = (
+            session.query(
+                func.count(assigned.c.pk),
+                func.sum(per_order.c.n1),
+                func.sum(per_order.c.n2),
+                func.sum(per_order.c.n3),
+                func.count(per_order.c.queue_pk),
+                func.sum(case((per_order.c.n1 + per_order.c.n2 + per_order.c.n3 == 3, 1), else_=0)),
+            )
+            .select_from(assigned)
+            .outerjoin(per_order, per_order.c.queue_pk == assigned.c.pk)
+            .one()
+        )
+        assigned_total, n1, n2, n3, any_n, all_n = (int(v or 0) for v in row)
+        out.update({"assigned_total": assigned_total, "n1": n1, "n2": n2, "n3": n3, "any_n": any_n, "no_n": assigned_total - any_n, "all_n": all_n})
+        return out
+
+
+def count_stuck_confirmation_queue(store: str | None, created_before: datetime) -> Dict[str, int]:
+    """Queued orders created before ``created_before`` (naive UTC) that no agent has called or messaged yet."""
+    from sqlalchemy import func
+    with SessionLocal() as session:
+        q = _confirmation_queue_query(session, store, None)
+        total = q.with_entities(func.count(ConfirmationQueueOrder.pk)).scalar()
+        stuck = (
+            q.filter(ConfirmationQueueOrder.n_stage == 0, ConfirmationQueueOrder.wtp_stage == 0, ConfirmationQueueOrder.created_at < created_before)
+            .with_entities(func.count(ConfirmationQueueOrder.pk))
+            .scalar()
+        )
+        return {"stuck": int(stuck or 0), "scanned": int(total or 0)}
+
+
+def prune_confirmation_queue(store: str | None, synced_before: float) -> int:
+    """Drop retired rows not touched since ``synced_before``."""
+    label = (store or "").strip() or None
+    with SessionLocal() as session:
+        count = (
+            session.query(ConfirmationQueueOrder)
+            .filter(ConfirmationQueueOrder.store == label, ConfirmationQueueOrder.active == 0, ConfirmationQueueOrder.synced_at < synced_before)
+            .delete(synchronize_session=False)
+        )
+        session.commit()
+        return int(count or 0)
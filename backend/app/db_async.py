@@ -0,0 +1,121 @@
+"""Async access to the database for hot ``async def`` endpoints.
+
+The ``db.*`` helpers open a synchronous session. Called directly from an async
+handler, each query blocks the event loop. ``run(fn, *args)`` executes a
+session-taking core (``db._*_in(session, ...)``) without blocking:
+
+- With an async driver installed (asyncpg for Postgres, aiosqlite for SQLite),
+  it runs on an ``AsyncSession`` via ``run_sync``. The ORM code is shared with
+  the sync helpers, and only the I/O is awaited.
+- Without one, it runs the sync core on the threadpool.
+
+Either way the sync helpers stay available for threads and workers.
+
+Env vars (optional):
+  PTOS_DB_ASYNC                         use the async driver when installed (default 1)
+  PTOS_DB_ASYNC_STATEMENT_CACHE_SIZE    asyncpg prepared-statement cache per connection
+                                        (default 100; set 0 behind PgBouncer in transaction mode)
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import logging
+import os
+from typing import Any, Callable, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app import db, settings_cache
+
+_log = logging.getLogger("app.db_async")
+
+ASYNC_ENABLED = os.getenv("PTOS_DB_ASYNC", "1").lower() in ("1", "true", "yes")
+ASYNC_STATEMENT_CACHE_SIZE = int(os.getenv("PTOS_DB_ASYNC_STATEMENT_CACHE_SIZE", "100") or "100")
+
+
+def _async_url(url: str) -> Optional[str]:
+    """The async-driver form of the sync engine URL, or None when that driver isn't installed."""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            if importlib.util.find_spec("asyncpg") is None:
+                return None
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("sqlite:///") and ":memory:" not in url:
+        if importlib.util.find_spec("aiosqlite") is None:
+            return None
+        return "sqlite+aiosqlite:///" + url[len("sqlite:///"):]
+    return None
+
+
+def _create_async_engine():
+    url = _async_url(db.engine.url.render_as_string(hide_password=False)) if ASYNC_ENABLED else None
+    if url is None:
+        return None
+    try:
+        from sqlalchemy import event
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        kwargs: Dict[str, Any] = dict(db.ENGINE_SETTINGS)
+        if url.startswith("sqlite"):
+            kwargs = {"query_cache_size": db.ENGINE_SETTINGS["query_cache_size"]}  # driver-default pool
+        else:
+            server_settings = {"statement_timeout": str(db.PG_STATEMENT_TIMEOUT_MS)} if db.PG_STATEMENT_TIMEOUT_MS > 0 else {}
+            kwargs["connect_args"] = {
+                "timeout": db.PG_CONNECT_TIMEOUT_S,
+                "statement_cache_size": ASYNC_STATEMENT_CACHE_SIZE,
+                "server_settings": server_settings,
+            }
+            kwargs["pool_pre_ping"] = True
+        eng = create_async_engine(url, **kwargs)
+        if url.startswith("sqlite"):
+            event.listen(eng.sync_engine, "connect", db._sqlite_on_connect)
+        return eng
+    except Exception as e:
+        _log.warning("async engine unavailable, using the threadpool: %s", e)
+        return None
+
+
+async_engine = _create_async_engine()
+AsyncSessionLocal = None
+if async_engine is not None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+
+def _in_sync_session(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    with db.SessionLocal() as session:
+        return fn(session, *args, **kwargs)
+
+
+async def run(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Await ``fn(session, *args, **kwargs)`` without blocking the event loop."""
+    if AsyncSessionLocal is None:
+        return await run_in_threadpool(_in_sync_session, fn, *args, **kwargs)
+    async with AsyncSessionLocal() as session:
+        return await session.run_sync(fn, *args, **kwargs)
+
+
+async def get_app_setting(store: str | None, key: str) -> Any:
+    return await settings_cache.aget(store, key, lambda: run(db._get_app_setting_in, store, key))
+
+
+async def list_campaign_mappings(store: str | None = None) -> dict:
+    return await run(db._list_campaign_mappings_in, store)
+
+
+async def list_campaign_meta(store: str | None = None, *, include_timeline: bool = True) -> Dict[str, dict]:
+    return await run(db._list_campaign_meta_in, store, include_timeline=include_timeline)
+
+
+async def get_flow(flow_id: str) -> Optional[Dict[str, Any]]:
+    return await run(db._get_flow_in, flow_id)
+
+
+async def get_test(test_id: str) -> Optional[Dict[str, Any]]:
+    return await run(db._get_test_in, test_id)
+
+
+def async_info() -> Dict[str, Any]:
+    return {"driver": async_engine.dialect.driver if async_engine is not None else "threadpool"}
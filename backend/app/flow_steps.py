@@ -0,0 +1,103 @@
+"""Step engine for background flow automations.
+
+Automations used to append to ``ads["steps"]`` and rewrite the whole flow row
+(ads, product and settings JSON) after every sub-step. ``FlowStepLog``
+records each transition as one small append-only row in ``flow_step_events``
+instead, and the flow row is written only at milestones.
+
+The log doubles as a checkpoint: a step that already completed for the same
+inputs (``input_hash``) is not run again when the automation is relaunched
+after a failure or restart; its stored response is replayed instead.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from typing import Any, Callable
+
+from app import db
+
+_log = logging.getLogger("app.flow_steps")
+
+
+def inputs_hash(value: Any) -> str:
+    raw = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _step_key(step: str, angle_index: int | None) -> tuple[str, int | None]:
+    return step, angle_index
+
+
+def materialize_steps(events: list[dict]) -> list[dict]:
+    """Fold events into the ``ads["steps"]`` shape the UI reads (one entry per step, latest state)."""
+    steps: dict[tuple, dict] = {}
+    for ev in events:
+        key = _step_key(ev["step"], ev.get("angle_index"))
+        entry = steps.get(key)
+        if ev["status"] == "running" or entry is None:
+            entry = {"step": ev["step"], "status": ev["status"], "started_at": ev["at"]}
+            if ev.get("angle_index") is not None:
+                entry["angle_index"] = ev["angle_index"]
+            steps.pop(key, None)
+            steps[key] = entry
+        if ev["status"] == "completed":
+            entry.update({"status": "completed", "ended_at": ev["at"], "response": ev.get("data")})
+            entry.pop("error", None)
+        elif ev["status"] == "failed":
+            entry.update({"status": "failed", "ended_at": ev["at"], "error": ev.get("data")})
+        elif ev["status"] == "replayed":
+            entry.update({"status": "completed", "ended_at": ev["at"], "response": ev.get("data"), "resumed": True})
+    return list(steps.values())
+
+
+class FlowStepLog:
+    """Step transitions for one automation run of ``flow_id`` with the given inputs."""
+
+    def __init__(self, flow_id: str, input_hash: str):
+        self.flow_id = flow_id
+        self.input_hash = input_hash
+        self._checkpoints: dict[tuple, Any] = {}
+        try:
+            for ev in db.list_flow_step_events(flow_id, input_hash=input_hash):
+                if ev["status"] in ("completed", "replayed"):
+                    self._checkpoints[_step_key(ev["step"], ev.get("angle_index"))] = ev.get("data")
+        except Exception as e:
+            _log.warning("step checkpoints unavailable for flow %s: %s", flow_id, e)
+
+    def _append(self, step: str, status: str, angle_index: int | None, data: Any = None) -> None:
+        try:
+            db.append_flow_step_event(self.flow_id, step, status, input_hash=self.input_hash, angle_index=angle_index, data=data)
+        except Exception as e:
+            _log.warning("step event write failed for flow %s (%s %s): %s", self.flow_id, step, status, e)
+
+    def run(self, step: str, fn: Callable[[], Any], *, angle_index: int | None = None, raise_errors: bool = False) -> Any:
+        """Run ``fn`` as ``step`` unless a checkpoint for it exists; returns its response (None on failure)."""
+        key = _step_key(step, angle_index)
+        if key in self._checkpoints:
+            self._append(step, "replayed", angle_index, self._checkpoints[key])
+            return self._checkpoints[key]
+        self._append(step, "running", angle_index)
+        try:
+            response = fn()
+        except Exception as e:
+            self._append(step, "failed", angle_index, {"message": str(e)})
+            if raise_errors:
+                raise
+            return None
+        self._append(step, "completed", angle_index, response)
+        self._checkpoints[key] = response
+        return response
+
+    def fail(self, step: str, exc: BaseException, *, angle_index: int | None = None) -> None:
+        """Record a failure that happened outside ``run`` (e.g. a fatal error between steps)."""
+        self._append(step, "failed", angle_index, {"message": str(exc)})
+
+    def steps(self) -> list[dict]:
+        """Materialized steps of this run (events for the same inputs)."""
+        try:
+            return materialize_steps(db.list_flow_step_events(self.flow_id, input_hash=self.input_hash))
+        except Exception:
+            return []
@@ -0,0 +1,186 @@
+"""Process-wide cache for source images fetched by the generation helpers.
+
+One "promo + features + variants" session used to download the same product
+photo from the CDN once per helper. ``fetch_source_image(url)`` keeps the
+bytes in an LRU bounded by total size, revalidates stale entries with
+``If-None-Match`` / ``If-Modified-Since`` instead of re-downloading, and
+collapses concurrent fetches of one URL into a single request.
+
+Images are normalized once on the way in: Shopify CDN URLs are requested at
+the model's max input width (the CDN resizes server-side), and when Pillow is
+installed larger images are downscaled and re-encoded locally. Our own
+``/uploads/...`` assets (relative, or on this deployment's host) are read from
+storage instead of over HTTP.
+
+Env vars (optional):
+  PTOS_SOURCE_IMAGE_CACHE_MB     total cached bytes (default 64)
+  PTOS_SOURCE_IMAGE_FRESH_S      seconds an entry is served without revalidation (default 300)
+  PTOS_SOURCE_IMAGE_MAX_PX       longest side sent to image models (default 2048; 0 disables normalization)
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import requests
+
+_log = logging.getLogger("app.image_cache")
+
+CACHE_MAX_BYTES = int(os.getenv("PTOS_SOURCE_IMAGE_CACHE_MB", "64") or "64") * 1024 * 1024
+FRESH_S = int(os.getenv("PTOS_SOURCE_IMAGE_FRESH_S", "300") or "300")
+MAX_PX = int(os.getenv("PTOS_SOURCE_IMAGE_MAX_PX", "2048") or "0")
+
+_LOCK = threading.Lock()
+_ENTRIES: "OrderedDict[str, dict[str, Any]]" = OrderedDict()
+_URL_LOCKS: dict[str, threading.Lock] = {}
+_STATS = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0, "errors": 0, "local": 0}
+_total_bytes = 0
+
+
+def _try_import_pil():
+    try:
+        from PIL import Image  # type: ignore
+        return Image
+    except Exception:
+        return None
+
+
+def _request_url(url: str) -> str:
+    """Ask the Shopify CDN for a copy no wider than MAX_PX instead of the full original."""
+    if MAX_PX <= 0:
+        return url
+    try:
+        parsed = urlparse(url)
+        if "cdn.shopify.com" not in (parsed.hostname or "") and "/cdn/shop/" not in parsed.path:
+            return url
+        query = dict(parse_qsl(parsed.query, keep_blank_values=True))
+        if "width" in query or "height" in query:
+            return url
+        query["width"] = str(MAX_PX)
+        return urlunparse(parsed._replace(query=urlencode(query)))
+    except Exception:
+        return url
+
+
+def _normalize(mime: str, data: bytes) -> tuple[str, bytes]:
+    """Downscale to MAX_PX and re-encode once when Pillow is available."""
+    Image = _try_import_pil()
+    if MAX_PX <= 0 or Image is None:
+        return mime, data
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            if max(im.size) <= MAX_PX:
+                return mime, data
+            im.thumbnail((MAX_PX, MAX_PX))
+            out = io.BytesIO()
+            if im.mode in ("RGBA", "LA", "P"):
+                im.save(out, format="PNG", optimize=True)
+                return "image/png", out.getvalue()
+            im.convert("RGB").save(out, format="JPEG", quality=90)
+            return "image/jpeg", out.getvalue()
+    except Exception as e:
+        _log.debug("source image normalization skipped: %s", e)
+        return mime, data
+
+
+def _evict_locked() -> None:
+    global _total_bytes
+    while _ENTRIES and _total_bytes > CACHE_MAX_BYTES:
+        old_url, old = _ENTRIES.popitem(last=False)
+        _total_bytes -= len(old["data"])
+        _STATS["evictions"] += 1
+        url_lock = _URL_LOCKS.get(old_url)
+        if url_lock is not None and not url_lock.locked():
+            _URL_LOCKS.pop(old_url, None)
+
+
+def _store_locked(url: str, entry: dict[str, Any]) -> None:
+    global _total_bytes
+    previous = _ENTRIES.pop(url, None)
+    if previous is not None:
+        _total_bytes -= len(previous["data"])
+    if len(entry["data"]) > CACHE_MAX_BYTES:
+        return
+    _ENTRIES[url] = entry
+    _total_bytes += len(entry["data"])
+    _evict_locked()
+
+
+def fetch_source_image(url: str, *, timeout: float = 20) -> tuple[str, bytes] | None:
+    """Return (mime, bytes) for ``url`` from the cache, revalidating or fetching as needed."""
+    from app.storage import local_upload_name
+    if local_upload_name(url):
+        from app.media_assets import load_asset_bytes
+        local = load_asset_bytes(str(url))
+        if local is not None:
+            with _LOCK:
+                _STATS["local"] += 1
+            return _normalize(*local)
+    if not url or not str(url).startswith(("http://", "https://")):
+        return None
+    with _LOCK:
+        url_lock = _URL_LOCKS.setdefault(url, threading.Lock())
+    # Concurrent callers for the same URL wait here and then hit the cache.
+    with url_lock:
+        with _LOCK:
+            entry = _ENTRIES.get(url)
+            if entry is not None:
+                _ENTRIES.move_to_end(url)
+                if time.time() - entry["checked_at"] < FRESH_S:
+                    _STATS["hits"] += 1
+                    return entry["mime"], entry["data"]
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            resp = requests.get(_request_url(url), timeout=timeout, headers=headers)
+            if resp.status_code == 304 and entry is not None:
+                with _LOCK:
+                    entry["checked_at"] = time.time()
+                    _STATS["revalidated"] += 1
+                return entry["mime"], entry["data"]
+            resp.raise_for_status()
+        except Exception as e:
+            with _LOCK:
+                _STATS["errors"] += 1
+            if entry is not None:
+                # Serve the stale copy rather than failing the generation.
+                return entry["mime"], entry["data"]
+            _log.warning("source image fetch failed for %s: %s", url, e)
+            return None
+
+        mime, data = _normalize((resp.headers.get("content-type") or "image/jpeg").split(";")[0].strip(), resp.content)
+        with _LOCK:
+            _STATS["misses"] += 1
+            _store_locked(url, {
+                "mime": mime,
+                "data": data,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "checked_at": time.time(),
+            })
+        return mime, data
+
+
+def clear() -> None:
+    global _total_bytes
+    with _LOCK:
+        _ENTRIES.clear()
+        _URL_LOCKS.clear()
+        _total_bytes = 0
+
+
+def cache_stats() -> dict[str, Any]:
+    with _LOCK:
+        return {**_STATS, "entries": len(_ENTRIES), "bytes": _total_bytes, "max_bytes": CACHE_MAX_BYTES}
@@ -0,0 +1,325 @@
+"""Perceptual-hash index of stored product images.
+
+Vendors re-upload the same photo, often re-encoded or resized, and every copy
+used to become a new file, a new Shopify file/media upload and a new round of
+image-model calls. Every image we ingest (uploads, wholesale uploads, generated
+assets) is fingerprinted here by sha256. ``register_image`` resolves a
+byte-identical upload to the existing asset, the Shopify helpers record which
+store/product an image was already pushed to, and ``reuse_derived`` caches
+cleaning or analysis results per source image (exact bytes only).
+
+Near-duplicate matching is opt-in (PTOS_IMAGE_DEDUPE_DISTANCE >= 0) and only
+applies to uploads. Its signature is a 64-bit grayscale dHash plus the coarse
+colour of each image quadrant, because colour variants of one product shot
+(a red and a blue shirt on white) share a dHash. Both must agree.
+
+The signature needs Pillow. It is computed in a small process pool so decoding
+large uploads doesn't hold the GIL on the API threads. Without Pillow only
+byte-identical images are deduped.
+
+Env vars (optional):
+  PTOS_IMAGE_DEDUPE_DISTANCE   max differing dHash bits for an upload to count as a re-encode of a stored one
+                               (default -1: exact matches only)
+  PTOS_IMAGE_DEDUPE_COLOUR     max per-channel difference of the quadrant colours, in 1/16 steps (default 1)
+  PTOS_IMAGE_HASH_WORKERS      hashing processes (default 2; 0 hashes in the calling thread)
+  PTOS_IMAGE_INDEX_REFRESH_S   seconds before the in-memory hash list is reloaded from the DB (default 300)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable
+from urllib.parse import urlparse
+
+from app import db
+
+_log = logging.getLogger("app.image_index")
+
+MAX_DISTANCE = int(os.getenv("PTOS_IMAGE_DEDUPE_DISTANCE", "-1") or "-1")
+MAX_COLOUR_DELTA = int(os.getenv("PTOS_IMAGE_DEDUPE_COLOUR", "1") or "0")
+HASH_WORKERS = int(os.getenv("PTOS_IMAGE_HASH_WORKERS", "2") or "0")
+REFRESH_S = int(os.getenv("PTOS_IMAGE_INDEX_REFRESH_S", "300") or "300")
+
+_LOCK = threading.Lock()
+_HASHES: dict[str, tuple[int, bytes]] = {}  # sha256 -> (dhash, quadrant colours)
+_loaded_at = 0.0
+_pool: ProcessPoolExecutor | None = None
+_STATS = {"registered": 0, "exact_hits": 0, "near_hits": 0, "derived_hits": 0, "shopify_hits": 0}
+
+
+def _try_import_pil():
+    try:
+        from PIL import Image  # type: ignore
+        return Image
+    except Exception:
+        return None
+
+
+def _dhash_bytes(data: bytes) -> str | None:
+    """64-bit difference hash (16 hex) + 4-bit RGB of each quadrant (12 hex); runs in the hashing pool."""
+    Image = _try_import_pil()
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            im.draft("RGB", (64, 64))  # JPEG: decode at reduced scale
+            rgb = im.convert("RGB")
+            px = list(rgb.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+            quadrants = list(rgb.resize((2, 2), Image.BOX).getdata())
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                left = px[row * 9 + col]
+                right = px[row * 9 + col + 1]
+                bits = (bits << 1) | (1 if left > right else 0)
+        colour = "".join(f"{channel >> 4:x}" for pixel in quadrants for channel in pixel)
+        return f"{bits:016x}{colour}"
+    except Exception:
+        return None
+
+
+def _parse_signature(value: str | None) -> tuple[int, bytes] | None:
+    """(dhash, quadrant colours); None for signatures stored before colour was added."""
+    if not value or len(value) != 28:
+        return None
+    try:
+        return int(value[:16], 16), bytes(int(c, 16) for c in value[16:])
+    except Exception:
+        return None
+
+
+def _hash_pool() -> ProcessPoolExecutor | None:
+    global _pool
+    if HASH_WORKERS <= 0:
+        return None
+    with _LOCK:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        return _pool
+
+
+def perceptual_hash(data: bytes) -> str | None:
+    if not data or _try_import_pil() is None:
+        return None
+    pool = _hash_pool()
+    if pool is not None:
+        try:
+            return pool.submit(_dhash_bytes, data).result(timeout=30)
+        except Exception as e:
+            _log.debug("hash pool unavailable, hashing inline: %s", e)
+    return _dhash_bytes(data)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def canonical_url(url: str | None) -> str:
+    """Local uploads are indexed by path so BASE_URL/host changes don't split entries."""
+    value = (url or "").strip()
+    if not value:
+        return ""
+    try:
+        path = urlparse(value).path
+        if path.startswith("/uploads/"):
+            return path
+    except Exception:
+        pass
+    return value
+
+
+def _ensure_loaded() -> None:
+    global _loaded_at
+    if time.time() - _loaded_at < REFRESH_S:
+        return
+    try:
+        rows = db.list_image_dhashes()
+    except Exception as e:
+        _log.warning("image index load failed: %s", e)
+        return
+    with _LOCK:
+        _HASHES.clear()
+        for sha, dh in rows:
+            signature = _parse_signature(dh)
+            if signature is not None:
+                _HASHES[sha] = signature
+        _loaded_at = time.time()
+
+
+def nearest(dhash: str | None) -> tuple[str, int] | None:
+    """(sha256, distance) of the closest indexed image within MAX_DISTANCE and the colour tolerance."""
+    target = _parse_signature(dhash) if MAX_DISTANCE >= 0 else None
+    if target is None:
+        return None
+    _ensure_loaded()
+    best: tuple[str, int] | None = None
+    with _LOCK:
+        for sha, (value, colour) in _HASHES.items():
+            d = hamming(target[0], value)
+            if d > MAX_DISTANCE or max(abs(a - b) for a, b in zip(target[1], colour)) > MAX_COLOUR_DELTA:
+                continue
+            if best is None or d < best[1]:
+                best = (sha, d)
+                if d == 0:
+                    break
+    return best
+
+
+def _asset_available(url: str | None) -> bool:
+    """Local uploads can vanish with an instance's disk; only reuse ones still servable."""
+    if not url:
+        return False
+    if not url.startswith("/uploads/"):
+        return True
+    from app.storage import ROOT, load_upload_blob
+    name = url.rsplit("/", 1)[-1]
+    return (ROOT / name).is_file() or load_upload_blob(name) is not None
+
+
+def register_image(
+    data: bytes,
+    *,
+    url: str | None = None,
+    save: Callable[[], str] | None = None,
+    content_type: str | None = None,
+    source: str | None = None,
+    width: int | None = None,
+    height: int | None = None,
+    match_near: bool = False,
+) -> tuple[dict, bool]:
+    """Index ``data`` and return (record, duplicate).
+
+    ``duplicate`` is True when the image was already known, byte-for-byte or
+    (with ``match_near`` and near matching enabled) as a re-encode of a stored
+    image; ``record`` is then the existing entry and its
+    ``url`` is the asset to reuse. ``save`` is called (and must return the new
+    asset URL) only when the image is new.
+    """
+    sha = hashlib.sha256(data).hexdigest()
+    existing = db.get_image_fingerprint(sha)
+    if existing and _asset_available(existing.get("url")):
+        with _LOCK:
+            _STATS["exact_hits"] += 1
+        return existing, True
+
+    dhash = perceptual_hash(data)
+    if match_near:
+        match = nearest(dhash)
+        if match is not None:
+            near = db.get_image_fingerprint(match[0])
+            if near and _asset_available(near.get("url")):
+                with _LOCK:
+                    _STATS["near_hits"] += 1
+                return {**near, "distance": match[1]}, True
+
+    if save is not None:
+        url = save()
+    if existing:
+        # Known bytes whose asset went missing: keep the row, point it at the new copy.
+        db.update_image_fingerprint_url(sha, canonical_url(url))
+        return {**existing, "url": canonical_url(url)}, False
+
+    if width is None or height is None:
+        from app.media_assets import image_dimensions
+        size = image_dimensions(data)
+        if size:
+            width, height = size
+    record = db.save_image_fingerprint({
+        "sha256": sha,
+        "dhash": dhash,
+        "url": canonical_url(url) or None,
+        "content_type": content_type,
+        "width": width,
+        "height": height,
+        "source": source,
+    })
+    signature = _parse_signature(dhash)
+    with _LOCK:
+        _STATS["registered"] += 1
+        if signature is not None:
+            _HASHES[sha] = signature
+    return record, False
+
+
+def lookup_url(url: str | None) -> dict | None:
+    key = canonical_url(url)
+    if not key:
+        return None
+    try:
+        return db.find_image_fingerprint_by_url(key)
+    except Exception:
+        return None
+
+
+def _record_for_source(url: str) -> dict | None:
+    record = lookup_url(url)
+    if record is not None:
+        return record
+    from app.image_cache import fetch_source_image
+    fetched = fetch_source_image(url)
+    if not fetched:
+        return None
+    mime, data = fetched
+    record, _ = register_image(data, url=url, content_type=mime, source="remote", match_near=False)
+    return record
+
+
+def shopify_ref(url: str | None, scope: str) -> Any:
+    """What this image became in Shopify under ``scope`` ("<store>|<product or files>"), if anything."""
+    record = lookup_url(url)
+    value = ((record or {}).get("shopify") or {}).get(scope) if record else None
+    if value:
+        with _LOCK:
+            _STATS["shopify_hits"] += 1
+    return value
+
+
+def remember_shopify(url: str | None, scope: str, value: Any) -> None:
+    record = lookup_url(url)
+    if record and value:
+        try:
+            db.update_image_fingerprint_map(record["sha256"], "shopify", scope, value)
+        except Exception as e:
+            _log.debug("image index shopify update failed: %s", e)
+
+
+def reuse_derived(source_url: str, operation: str, compute: Callable[[], Any]) -> Any:
+    """Return the stored result of ``operation`` for the same source bytes, else compute and store it.
+
+    Results must be JSON-serializable; falsy results are not stored.
+    """
+    try:
+        record = _record_for_source(source_url)
+    except Exception as e:
+        _log.debug("image index lookup failed for %s: %s", source_url, e)
+        record = None
+    if record is not None:
+        cached = (record.get("derived") or {}).get(operation)
+        if cached:
+            with _LOCK:
+                _STATS["derived_hits"] += 1
+            return cached
+    result = compute()
+    if record is not None and result:
+        try:
+            db.update_image_fingerprint_map(record["sha256"], "derived", operation, result)
+        except Exception as e:
+            _log.debug("image index derived update failed: %s", e)
+    return result
+
+
+def index_stats() -> dict[str, Any]:
+    with _LOCK:
+        return {
+            **_STATS,
+            "perceptual_hashes": len(_HASHES),
+            "max_distance": MAX_DISTANCE,
+            "max_colour_delta": MAX_COLOUR_DELTA,
+            "pillow": _try_import_pil() is not None,
+        }
@@ -1,10 +1,19 @@
 import os
 import logging
-from typing import List, Tuple, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from app.rate_limits import provider_slot
 
 
 _log = logging.getLogger("app.gemini")
 
+# Image-set generators fan out one request per prompt/variant. Worker count
+# bounds threads; the shared "gemini" and "gemini:<model>" limiters bound
+# in-flight calls and QPS (PTOS_GEMINI_GEMINI_3_1_FLASH_IMAGE_PREVIEW_QPS, ...).
+IMAGE_GEN_WORKERS = int(os.getenv("PTOS_GEMINI_IMAGE_WORKERS", "4") or "4")
+IMAGE_MODELS = ("gemini-3.1-flash-image-preview", "gemini-2.5-flash-image-preview")
+
 
 def _try_import_genai():
     try:
@@ -23,20 +32,16 @@ def _try_import_google_genai():
         return None, None
 
 
-def _to_data_url(mime: str, b: bytes) -> str:
-    import base64
-    return f"data:{mime};base64,{base64.b64encode(b).decode('ascii')}"
+def _to_image_url(mime: str, b: bytes) -> str:
+    """Store generated bytes once and return their asset URL (see app.media_assets)."""
+    from app.media_assets import image_url_for
+    return image_url_for(mime, b)
 
 
 def _fetch_image_bytes(url: str) -> Tuple[str, bytes] | None:
-    try:
-        import requests
-        resp = requests.get(url, timeout=20)
-        resp.raise_for_status()
-        mime = resp.headers.get("content-type") or "image/jpeg"
-        return mime, resp.content
-    except Exception:
-        return None
+    # Shared with openai_client: one download per source photo per session.
+    from app.image_cache import fetch_source_image
+    return fetch_source_image(url)
 
 
 def _extract_inline_images(resp) -> List[Tuple[str, bytes]]:
@@ -119,49 +124,133 @@ def _extract_google_genai_images(resp) -> List[Tuple[str, bytes]]:
     return results
 
 
-def _generate_with_google_genai(
+def _generate_content(model, model_name: str, contents: list):
+    """model.generate_content inside the process-wide Gemini slots."""
+    with provider_slot("gemini"), provider_slot(f"gemini:{model_name}"):
+        return model.generate_content(contents)
+
+
+def _iter_concurrent(
+    count: int,
+    produce: Callable[[int], Any],
+    fallback: Callable[[int], Any],
+    max_workers: int | None = None,
+) -> Iterator[Tuple[int, Any]]:
+    """Run ``produce(i)`` for i in range(count) concurrently; yield (i, result) as each finishes.
+
+    A failing index yields ``fallback(i)``. Closing the generator early cancels
+    work that has not started yet.
+    """
+    n = max(0, int(count))
+    if n == 0:
+        return
+    workers = max(1, min(n, int(max_workers or IMAGE_GEN_WORKERS)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini-gen")
+    try:
+        futures = {pool.submit(produce, i): i for i in range(n)}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                yield i, fut.result()
+            except Exception as e:
+                _log.warning("Gemini generation %d/%d failed: %s", i + 1, n, e)
+                yield i, fallback(i)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _collect_ordered(pairs: Iterator[Tuple[int, Any]]) -> List[Any]:
+    got = dict(pairs)
+    return [got[i] for i in sorted(got)]
+
+
+def _iter_google_genai_images(
     api_key: str,
     mime: str,
     blob: bytes,
     prompt: str,
     num_images: int,
-) -> List[str]:
+) -> Iterator[str]:
     genai, types = _try_import_google_genai()
     if not (genai and types):
-        return []
+        return
 
     try:
         client = genai.Client(api_key=api_key)
     except Exception as e:
         _log.warning("google-genai client unavailable: %s", e)
-        return []
+        return
 
-    images: List[str] = []
-    for model_name in ("gemini-3.1-flash-image-preview", "gemini-2.5-flash-image-preview"):
-        for _ in range(max(1, int(num_images))):
-            try:
-                image_part = types.Part.from_bytes(data=blob, mime_type=mime)
+    for model_name in IMAGE_MODELS:
+        def _one(_i: int, model_name: str = model_name) -> List[str]:
+            image_part = types.Part.from_bytes(data=blob, mime_type=mime)
+            with provider_slot("gemini"), provider_slot(f"gemini:{model_name}"):
                 response = client.models.generate_content(
                     model=model_name,
                     contents=[prompt, image_part],
                     config=types.GenerateContentConfig(response_modalities=["TEXT", "IMAGE"]),
                 )
-                pairs = _extract_google_genai_images(response)
-                for mm, bb in pairs:
-                    images.append(_to_data_url(mm or "image/png", bb))
-            except Exception as e:
-                _log.warning("google-genai image model %s failed: %s", model_name, e)
-                continue
-        if images:
-            break
+            return [_to_image_url(mm or "image/png", bb) for mm, bb in _extract_google_genai_images(response)]
+
+        produced = 0
+        for _, urls in _iter_concurrent(max(1, int(num_images)), _one, lambda _i: []):
+            for url in urls:
+                produced += 1
+                yield url
+        if produced:
+            return
+        _log.warning("google-genai image model %s returned no images", model_name)
+
+
+def _imagen_fallback_images(genai, api_key: str, mime: str, blob: bytes, image_url: str, prompt: str, num_images: int) -> List[str]:
+    """Legacy Imagen edit, then Imagen generate; used only when every Gemini model failed."""
+    images: List[str] = []
+    try:
+        model = genai.GenerativeModel("imagen-3.0-edit-001")
+        out = model.edit_image(
+            prompt=prompt,
+            image={"mime_type": mime, "data": blob},
+            number_of_images=max(1, int(num_images)),
+        )
+        candidates = getattr(out, "images", None) or getattr(out, "candidates", None) or []
+        for c in candidates:
+            if isinstance(c, (bytes, bytearray)):
+                images.append(_to_image_url(mime, bytes(c)))
+            else:
+                try:
+                    data = c.get("image", {}).get("data")
+                    if isinstance(data, (bytes, bytearray)):
+                        images.append(_to_image_url(mime, bytes(data)))
+                except Exception:
+                    continue
+    except Exception:
+        try:
+            model = genai.GenerativeModel("imagen-3.0-generate-001")
+            out = model.generate_images(
+                prompt=f"{prompt}\nReference photo URL: {image_url}",
+                number_of_images=max(1, int(num_images)),
+            )
+            candidates = getattr(out, "images", None) or getattr(out, "candidates", None) or []
+            for c in candidates:
+                if isinstance(c, (bytes, bytearray)):
+                    images.append(_to_image_url("image/png", bytes(c)))
+                else:
+                    try:
+                        data = c.get("image", {}).get("data")
+                        if isinstance(data, (bytes, bytearray)):
+                            images.append(_to_image_url("image/png", bytes(data)))
+                    except Exception:
+                        continue
+        except Exception:
+            images = []
     return images
 
 
-def gen_ad_images_from_image(image_url: str, prompt: str, num_images: int = 1) -> List[str]:
-    """Generate ad images using Google Gemini/Imagen, conditioned on a source image.
+def iter_ad_images_from_image(image_url: str, prompt: str, num_images: int = 1) -> Iterator[str]:
+    """Yield generated ad images as they complete; see ``gen_ad_images_from_image``.
 
-    Returns a list of data URLs. If Gemini isn't configured/available, returns the
-    original image URL as a single-item list as a graceful fallback.
+    The ``num_images`` requests for a model run concurrently. Falls back to
+    yielding the source URL when nothing could be generated.
     """
     api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
     genai = _try_import_genai()
@@ -170,107 +259,77 @@ def gen_ad_images_from_image(image_url: str, prompt: str, num_images: int = 1) -
     # Fallback: no library or key → return the source image URL
     if not (api_key and (genai or google_genai)):
         _log.warning("Gemini image generation unavailable: legacy_sdk=%s new_sdk=%s api_key=%s", bool(genai), bool(google_genai), bool(api_key))
-        return [image_url]
+        yield image_url
+        return
 
     fetched = _fetch_image_bytes(image_url)
     if not fetched:
         _log.warning("Gemini image generation skipped because source image could not be fetched: %s", image_url)
         # If we can't fetch the image bytes, still return the original URL
-        return [image_url]
+        yield image_url
+        return
 
     mime, blob = fetched
-
+    produced = 0
     try:
         # Prefer the requested Gemini image preview; fall back to the previous
         # working Flash image model before trying legacy Imagen paths.
-        images: List[str] = _generate_with_google_genai(api_key, mime, blob, prompt, num_images)
+        for url in _iter_google_genai_images(api_key, mime, blob, prompt, num_images):
+            produced += 1
+            yield url
 
         if genai:
             genai.configure(api_key=api_key)
-        for model_name in ("gemini-3.1-flash-image-preview", "gemini-2.5-flash-image-preview"):
-            if images:
+        for model_name in IMAGE_MODELS:
+            if produced or not genai:
                 break
-            if not genai:
-                continue
             try:
                 model = genai.GenerativeModel(model_name)
-                count = max(1, int(num_images))
-                for _ in range(count):
-                    try:
-                        out = model.generate_content([
-                            {"mime_type": mime, "data": blob},
-                            prompt,
-                        ])
-                        pairs = _extract_inline_images(out)
-                        for mm, bb in pairs:
-                            images.append(_to_data_url(mm or "image/png", bb))
-                    except Exception as e:
-                        _log.warning("Gemini image model %s failed: %s", model_name, e)
-                        continue
-                if images:
-                    break
             except Exception as e:
                 _log.warning("Gemini image model %s unavailable: %s", model_name, e)
                 continue
 
+            def _one(_i: int, model=model, model_name: str = model_name) -> List[str]:
+                out = _generate_content(model, model_name, [{"mime_type": mime, "data": blob}, prompt])
+                return [_to_image_url(mm or "image/png", bb) for mm, bb in _extract_inline_images(out)]
+
+            for _, urls in _iter_concurrent(max(1, int(num_images)), _one, lambda _i: []):
+                for url in urls:
+                    produced += 1
+                    yield url
+
         # If Gemini paths failed, try Imagen edit, then Imagen generate as legacy fallbacks
-        if not images:
-            try:
-                model = genai.GenerativeModel("imagen-3.0-edit-001")
-                out = model.edit_image(
-                    prompt=prompt,
-                    image={"mime_type": mime, "data": blob},
-                    number_of_images=max(1, int(num_images)),
-                )
-                candidates = getattr(out, "images", None) or getattr(out, "candidates", None) or []
-                for c in candidates:
-                    if isinstance(c, (bytes, bytearray)):
-                        images.append(_to_data_url(mime, bytes(c)))
-                    else:
-                        try:
-                            data = c.get("image", {}).get("data")
-                            if isinstance(data, (bytes, bytearray)):
-                                images.append(_to_data_url(mime, bytes(data)))
-                        except Exception:
-                            continue
-            except Exception:
-                try:
-                    model = genai.GenerativeModel("imagen-3.0-generate-001")
-                    out = model.generate_images(
-                        prompt=f"{prompt}\nReference photo URL: {image_url}",
-                        number_of_images=max(1, int(num_images)),
-                    )
-                    candidates = getattr(out, "images", None) or getattr(out, "candidates", None) or []
-                    for c in candidates:
-                        if isinstance(c, (bytes, bytearray)):
-                            images.append(_to_data_url("image/png", bytes(c)))
-                        else:
-                            try:
-                                data = c.get("image", {}).get("data")
-                                if isinstance(data, (bytes, bytearray)):
-                                    images.append(_to_data_url("image/png", bytes(data)))
-                            except Exception:
-                                continue
-                except Exception:
-                    images = []
+        if not produced:
+            for url in _imagen_fallback_images(genai, api_key, mime, blob, image_url, prompt, num_images):
+                produced += 1
+                yield url
 
         # If generation failed, gracefully return the original URL
-        if not images:
+        if not produced:
             _log.warning("Gemini/Imagen returned no generated image; returning source URL fallback")
-            return [image_url]
-        return images
+            yield image_url
     except Exception as e:
         _log.warning("Gemini image generation failed: %s", e)
         # Ultimate fallback
-        return [image_url]
+        if not produced:
+            yield image_url
+
+
+def gen_ad_images_from_image(image_url: str, prompt: str, num_images: int = 1) -> List[str]:
+    """Generate ad images using Google Gemini/Imagen, conditioned on a source image.
+
+    Returns a list of generated image URLs. If Gemini isn't configured/available, returns the
+    original image URL as a single-item list as a graceful fallback.
+    """
+    return list(iter_ad_images_from_image(image_url, prompt, num_images))
 
 
 def gen_clean_wholesale_product_image(image_url: str) -> str | None:
     """Create a clean store-facing product image from a vendor source image.
 
-    Returns a data URL when generation succeeds. The original image URL is not
-    returned as a fallback because this flow must not expose vendor photos on
-    the storefront.
+    Returns the generated image's asset URL when generation succeeds. The
+    original image URL is not returned as a fallback because this flow must not
+    expose vendor photos on the storefront.
     """
     prompt = (
         "Create one professional ecommerce product photo from the reference image. "
@@ -282,9 +341,9 @@ def gen_clean_wholesale_product_image(image_url: str) -> str | None:
     )
     images = gen_ad_images_from_image(image_url, prompt, num_images=1)
     first = (images or [None])[0]
-    if isinstance(first, str) and first.startswith("data:image/"):
+    if isinstance(first, str) and first and first != image_url:
         return first
-    _log.warning("Clean wholesale image generation returned no generated data URL")
+    _log.warning("Clean wholesale image generation returned no generated image")
     return None
 
 
@@ -346,46 +405,59 @@ def build_promotional_prompts(product: Dict[str, Any], angles: List[Dict[str, An
     return prompts
 
 
-def gen_promotional_images_from_angles(
+def iter_promotional_images_from_angles(
     image_url: str,
     product: Dict[str, Any],
     angles: List[Dict[str, Any]],
     count: int = 4,
-) -> List[Dict[str, str]]:
-    """Generate a set of promotional images (and their prompts) from a source image and angles.
-
-    Returns: [{"prompt": str, "image": data_url}]
-    """
+) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Yield (index, {"prompt", "image"}) as each promotional image completes."""
     prompts = build_promotional_prompts(product, angles, count=count)
-    # Reuse core generator with Gemini 2.5; one image per prompt
-    results: List[Dict[str, str]] = []
     gen = _try_import_genai()
     api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
     fetched = _fetch_image_bytes(image_url)
+
+    def fallback(i: int) -> Dict[str, str]:
+        return {"prompt": prompts[i], "image": image_url}
+
     if not (gen and api_key and fetched):
         # graceful fallback: return the source image
-        return [{"prompt": p, "image": image_url} for p in prompts]
+        for i in range(len(prompts)):
+            yield i, fallback(i)
+        return
     mime, blob = fetched
+    model_name = IMAGE_MODELS[0]
     try:
         gen.configure(api_key=api_key)
-        model = gen.GenerativeModel("gemini-3.1-flash-image-preview")
-        for p in prompts:
-            try:
-                out = model.generate_content([
-                    {"mime_type": mime, "data": blob},
-                    p,
-                ])
-                pairs = _extract_inline_images(out)
-                if pairs:
-                    mm, bb = pairs[0]
-                    results.append({"prompt": p, "image": _to_data_url(mm or "image/png", bb)})
-                else:
-                    results.append({"prompt": p, "image": image_url})
-            except Exception:
-                results.append({"prompt": p, "image": image_url})
-        return results
+        model = gen.GenerativeModel(model_name)
     except Exception:
-        return [{"prompt": p, "image": image_url} for p in prompts]
+        for i in range(len(prompts)):
+            yield i, fallback(i)
+        return
+
+    def _one(i: int) -> Dict[str, str]:
+        p = prompts[i]
+        out = _generate_content(model, model_name, [{"mime_type": mime, "data": blob}, p])
+        pairs = _extract_inline_images(out)
+        if pairs:
+            mm, bb = pairs[0]
+            return {"prompt": p, "image": _to_image_url(mm or "image/png", bb)}
+        return fallback(i)
+
+    yield from _iter_concurrent(len(prompts), _one, fallback)
+
+
+def gen_promotional_images_from_angles(
+    image_url: str,
+    product: Dict[str, Any],
+    angles: List[Dict[str, Any]],
+    count: int = 4,
+) -> List[Dict[str, str]]:
+    """Generate a set of promotional images (and their prompts) from a source image and angles.
+
+    Returns: [{"prompt": str, "image": url}] in prompt order.
+    """
+    return _collect_ordered(iter_promotional_images_from_angles(image_url, product, angles, count=count))
 
 
 
@@ -443,76 +515,81 @@ def build_feature_benefit_prompts(product: Dict[str, Any], count: int = 6) -> Li
     return prompts
 
 
-def gen_feature_benefit_images(
+def iter_feature_benefit_images(
     image_url: str,
     product: Dict[str, Any],
     count: int = 6,
-) -> List[Dict[str, str]]:
-    """Generate a set of close-up images that showcase features/benefits.
-
-    Returns: [{"prompt": str, "image": data_url}]
-    Falls back to returning the source image if generation isn't available.
-    """
+) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Yield (index, {"prompt", "image"}) as each feature/benefit close-up completes."""
     prompts = build_feature_benefit_prompts(product, count=count)
     gen = _try_import_genai()
     api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
     fetched = _fetch_image_bytes(image_url)
+
+    def fallback(i: int) -> Dict[str, str]:
+        return {"prompt": prompts[i], "image": image_url}
+
     if not (gen and api_key and fetched):
-        return [{"prompt": p, "image": image_url} for p in prompts]
+        for i in range(len(prompts)):
+            yield i, fallback(i)
+        return
     mime, blob = fetched
+    model_name = IMAGE_MODELS[0]
     try:
         gen.configure(api_key=api_key)
-        model = gen.GenerativeModel("gemini-3.1-flash-image-preview")
-        results: List[Dict[str, str]] = []
-        for p in prompts:
-            success = False
+        model = gen.GenerativeModel(model_name)
+    except Exception:
+        for i in range(len(prompts)):
+            yield i, fallback(i)
+        return
+
+    def _one(i: int) -> Dict[str, str]:
+        p = prompts[i]
+        try:
+            out = _generate_content(model, model_name, [{"mime_type": mime, "data": blob}, p])
+            pairs = _extract_inline_images(out)
+            if pairs:
+                mm, bb = pairs[0]
+                return {"prompt": p, "image": _to_image_url(mm or "image/png", bb)}
+        except Exception:
+            pass
+
+        # Fallback to Imagen edit (acts more like an edit of the source image)
+        im = gen.GenerativeModel("imagen-3.0-edit-001")
+        with provider_slot("gemini"):
+            out2 = im.edit_image(
+                prompt=(
+                    p + "\nSTRICT: Preserve the product exactly. Perform a close crop and lighting enhancement only."
+                ),
+                image={"mime_type": mime, "data": blob},
+                number_of_images=1,
+            )
+        candidates = getattr(out2, "images", None) or getattr(out2, "candidates", None) or []
+        for c in candidates:
+            if isinstance(c, (bytes, bytearray)):
+                return {"prompt": p, "image": _to_image_url(mime, bytes(c))}
             try:
-                out = model.generate_content([
-                    {"mime_type": mime, "data": blob},
-                    p,
-                ])
-                pairs = _extract_inline_images(out)
-                if pairs:
-                    mm, bb = pairs[0]
-                    results.append({"prompt": p, "image": _to_data_url(mm or "image/png", bb)})
-                    success = True
+                data = c.get("image", {}).get("data")
+                if isinstance(data, (bytes, bytearray)):
+                    return {"prompt": p, "image": _to_image_url(mime, bytes(data))}
             except Exception:
-                success = False
+                pass
+        return fallback(i)
 
-            # Fallback to Imagen edit (acts more like an edit of the source image)
-            if not success:
-                try:
-                    im = gen.GenerativeModel("imagen-3.0-edit-001")
-                    out2 = im.edit_image(
-                        prompt=(
-                            p + "\nSTRICT: Preserve the product exactly. Perform a close crop and lighting enhancement only."
-                        ),
-                        image={"mime_type": mime, "data": blob},
-                        number_of_images=1,
-                    )
-                    candidates = getattr(out2, "images", None) or getattr(out2, "candidates", None) or []
-                    added = False
-                    for c in candidates:
-                        if isinstance(c, (bytes, bytearray)):
-                            results.append({"prompt": p, "image": _to_data_url(mime, bytes(c))})
-                            added = True
-                            break
-                        else:
-                            try:
-                                data = c.get("image", {}).get("data")
-                                if isinstance(data, (bytes, bytearray)):
-                                    results.append({"prompt": p, "image": _to_data_url(mime, bytes(data))})
-                                    added = True
-                                    break
-                            except Exception:
-                                pass
-                    if not added:
-                        results.append({"prompt": p, "image": image_url})
-                except Exception:
-                    results.append({"prompt": p, "image": image_url})
-        return results
-    except Exception:
-        return [{"prompt": p, "image": image_url} for p in prompts]
+    yield from _iter_concurrent(len(prompts), _one, fallback)
+
+
+def gen_feature_benefit_images(
+    image_url: str,
+    product: Dict[str, Any],
+    count: int = 6,
+) -> List[Dict[str, str]]:
+    """Generate a set of close-up images that showcase features/benefits.
+
+    Returns: [{"prompt": str, "image": url}] in prompt order.
+    Falls back to returning the source image if generation isn't available.
+    """
+    return _collect_ordered(iter_feature_benefit_images(image_url, product, count=count))
 
 # ---------------- Variant extraction + per-variant product images ----------------
 def _parse_json_safely(text: str) -> dict | list | None:
@@ -602,18 +679,13 @@ def analyze_variants_from_image(image_url: str, max_variants: int | None = None)
         ]
 
 
-def gen_variant_images_from_image(
+def iter_variant_images_from_image(
     image_url: str,
     style_prompt: str | None = None,
     max_variants: int | None = None,
     variants_override: list[dict] | None = None,
-) -> list[dict]:
-    """Generate per-variant product images plus a composite image.
-
-    Returns list of items:
-      - { kind: "variant", name, description, image, prompt }
-      - { kind: "composite", image, prompt }
-    """
+) -> Iterator[Tuple[int, dict]]:
+    """Yield (index, item) as each variant image (and, last index, the composite) completes."""
     # Use provided variants if available; otherwise analyze from image
     variants: list[dict] = []
     if variants_override:
@@ -628,114 +700,96 @@ def gen_variant_images_from_image(
     if not variants:
         variants = [{"name": "Variant", "description": "Product variant", "attributes": {}}]
 
-    genai = _try_import_genai()
-    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-    fetched = _fetch_image_bytes(image_url)
-    if not (genai and api_key and fetched):
+    def _fallback_items() -> Iterator[Tuple[int, dict]]:
         # Fallback to returning the original image as all outputs
-        items = []
-        for v in variants:
-            items.append({
+        for i, v in enumerate(variants):
+            yield i, {
                 "kind": "variant",
                 "name": v.get("name"),
                 "description": v.get("description"),
                 "image": image_url,
                 "prompt": "fallback",
-            })
-        items.append({"kind": "composite", "image": image_url, "prompt": "fallback"})
-        return items
+            }
+        yield len(variants), {"kind": "composite", "image": image_url, "prompt": "fallback"}
+
+    genai = _try_import_genai()
+    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+    fetched = _fetch_image_bytes(image_url)
+    if not (genai and api_key and fetched):
+        yield from _fallback_items()
+        return
 
     mime, blob = fetched
+    model_name = IMAGE_MODELS[0]
     try:
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-3.1-flash-image-preview")
-        base_style = (
-            "Professional ecommerce product photo, clean neutral background, soft studio lighting, crisp focus, "
-            "subtle ground shadow, premium look, 45-degree camera angle, 4:5 crop. "
-            "CRITICAL: Replace the original background with a new clean neutral studio backdrop; DO NOT reuse the source background."
-        )
-        items: list[dict] = []
-
-        # Generate one product image per variant
-        for v in variants:
-            name = v.get("name") or "Variant"
-            desc = v.get("description") or ""
-            style = f"{base_style} " + (style_prompt or "")
-            prompt = (
+        model = genai.GenerativeModel(model_name)
+    except Exception:
+        yield from _fallback_items()
+        return
+
+    base_style = (
+        "Professional ecommerce product photo, clean neutral background, soft studio lighting, crisp focus, "
+        "subtle ground shadow, premium look, 45-degree camera angle, 4:5 crop. "
+        "CRITICAL: Replace the original background with a new clean neutral studio backdrop; DO NOT reuse the source background."
+    )
+    style = f"{base_style} " + (style_prompt or "")
+
+    # One product image per variant, then a composite group shot of all variants together
+    jobs: list[dict] = []
+    for v in variants:
+        name = v.get("name") or "Variant"
+        desc = v.get("description") or ""
+        jobs.append({
+            "kind": "variant",
+            "name": name,
+            "description": desc,
+            "prompt": (
                 f"Create a clean standalone product image isolating the '{name}' product variant from the reference photo. "
                 f"Use the visual characteristics described: {desc}. {style}"
-            )
-            try:
-                out = model.generate_content([
-                    {"mime_type": mime, "data": blob},
-                    prompt,
-                ])
-                pairs = _extract_inline_images(out)
-                if pairs:
-                    mm, bb = pairs[0]
-                    items.append({
-                        "kind": "variant",
-                        "name": name,
-                        "description": desc,
-                        "image": _to_data_url(mm or "image/png", bb),
-                        "prompt": prompt,
-                    })
-                else:
-                    items.append({
-                        "kind": "variant",
-                        "name": name,
-                        "description": desc,
-                        "image": image_url,
-                        "prompt": prompt,
-                    })
-            except Exception:
-                items.append({
-                    "kind": "variant",
-                    "name": name,
-                    "description": desc,
-                    "image": image_url,
-                    "prompt": prompt,
-                })
-
-        # Generate a composite group shot of all variants together
-        names = ", ".join([v.get("name") or "Variant" for v in variants])
-        style = f"{base_style} " + (style_prompt or "")
-        comp_prompt = (
+            ),
+        })
+    names = ", ".join([v.get("name") or "Variant" for v in variants])
+    jobs.append({
+        "kind": "composite",
+        "prompt": (
             f"Create a single hero product image showing all distinct product variants together: {names}. "
             f"Arrange them in a balanced composition, visually appealing and well-posed. {style}"
-        )
-        try:
-            out = model.generate_content([
-                {"mime_type": mime, "data": blob},
-                comp_prompt,
-            ])
-            pairs = _extract_inline_images(out)
-            if pairs:
-                mm, bb = pairs[0]
-                items.append({
-                    "kind": "composite",
-                    "image": _to_data_url(mm or "image/png", bb),
-                    "prompt": comp_prompt,
-                })
-            else:
-                items.append({"kind": "composite", "image": image_url, "prompt": comp_prompt})
-        except Exception:
-            items.append({"kind": "composite", "image": image_url, "prompt": comp_prompt})
+        ),
+    })
 
-        return items
-    except Exception:
-        # On failure return fallbacks
-        items = []
-        for v in variants:
-            items.append({
-                "kind": "variant",
-                "name": v.get("name"),
-                "description": v.get("description"),
-                "image": image_url,
-                "prompt": "fallback",
-            })
-        items.append({"kind": "composite", "image": image_url, "prompt": "fallback"})
-        return items
+    def fallback(i: int) -> dict:
+        return {**jobs[i], "image": image_url}
+
+    def _one(i: int) -> dict:
+        out = _generate_content(model, model_name, [{"mime_type": mime, "data": blob}, jobs[i]["prompt"]])
+        pairs = _extract_inline_images(out)
+        if pairs:
+            mm, bb = pairs[0]
+            return {**jobs[i], "image": _to_image_url(mm or "image/png", bb)}
+        return fallback(i)
+
+    yield from _iter_concurrent(len(jobs), _one, fallback)
+
+
+def gen_variant_images_from_image(
+    image_url: str,
+    style_prompt: str | None = None,
+    max_variants: int | None = None,
+    variants_override: list[dict] | None = None,
+) -> list[dict]:
+    """Generate per-variant product images plus a composite image.
+
+    Returns list of items:
+      - { kind: "variant", name, description, image, prompt }
+      - { kind: "composite", image, prompt }
+    """
+    return _collect_ordered(iter_variant_images_from_image(
+        image_url,
+        style_prompt=style_prompt,
+        max_variants=max_variants,
+        variants_override=variants_override,
+    ))
 
 
 # ---- system_health instrumentation -------------------------------------------------
@@ -1,9 +1,11 @@
-import os, json, time, requests
+import os, json, time, threading, requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from urllib.parse import parse_qsl, urlparse
 from zoneinfo import ZoneInfo
 from tenacity import retry, stop_after_attempt, wait_exponential
 from dotenv import load_dotenv
+from app.rate_limits import provider_slot
 load_dotenv()
 
 
@@ -28,6 +30,7 @@ def _timed_meta_request(method: str, url: str, **kw):
     err = None
     try:
         r = requests.request(method, url, **kw)
+        _note_meta_usage(r)
         try:
             sc = int(getattr(r, "status_code", 0) or 0)
             if sc >= 500:
@@ -51,6 +54,87 @@ def _timed_meta_request(method: str, url: str, **kw):
             except Exception:
                 pass
 
+# -------- rate-limit awareness (shared by every Meta call in this process) --------
+# Meta reports how close the app/ad account is to throttling in usage headers.
+# Fan-out helpers read the latest value and slow down before Meta starts
+# returning error 17/80004 for the whole token.
+_USAGE_LOCK = threading.Lock()
+_USAGE_STATE: dict = {"pct": 0.0, "at": 0.0, "blocked_until": 0.0}
+_USAGE_HEADERS = ("x-app-usage", "x-ad-account-usage", "x-business-use-case-usage")
+ACCOUNT_FANOUT_WORKERS = max(1, int(os.getenv("META_ACCOUNT_FANOUT_WORKERS", "4") or "4"))
+ACCOUNT_FANOUT_USAGE_PCT = float(os.getenv("META_ACCOUNT_FANOUT_USAGE_PCT", "85") or "85")
+ACCOUNT_FANOUT_MAX_WAIT_S = float(os.getenv("META_ACCOUNT_FANOUT_MAX_WAIT_S", "30") or "30")
+
+
+def _usage_pct_from_header(raw: str | None) -> tuple[float, float]:
+    """Return ``(max usage percent, seconds until access is regained)`` for one header."""
+    if not raw:
+        return 0.0, 0.0
+    try:
+        payload = json.loads(raw)
+    except Exception:
+        return 0.0, 0.0
+    buckets: list = []
+    if isinstance(payload, dict):
+        # x-business-use-case-usage is keyed by business id -> list of buckets
+        if all(isinstance(v, list) for v in payload.values()) and payload:
+            for v in payload.values():
+                buckets.extend(b for b in v if isinstance(b, dict))
+        else:
+            buckets.append(payload)
+    pct = 0.0
+    regain_s = 0.0
+    for b in buckets:
+        for k in ("call_count", "total_time", "total_cputime", "acc_id_util_pct"):
+            try:
+                pct = max(pct, float(b.get(k) or 0))
+            except Exception:
+                continue
+        try:
+            regain_s = max(regain_s, float(b.get("estimated_time_to_regain_access") or 0) * 60.0)
+        except Exception:
+            pass
+    return pct, regain_s
+
+
+def _note_meta_usage(r) -> None:
+    """Record the throttling headroom reported by a Meta response. Never raises."""
+    try:
+        hdrs = getattr(r, "headers", None) or {}
+        pct = 0.0
+        regain_s = 0.0
+        reported = False
+        for name in _USAGE_HEADERS:
+            raw = hdrs.get(name)
+            if not raw:
+                continue
+            reported = True
+            p, g = _usage_pct_from_header(raw)
+            pct = max(pct, p)
+            regain_s = max(regain_s, g)
+        if int(getattr(r, "status_code", 0) or 0) == 429:
+            reported = True
+            pct = max(pct, 100.0)
+            regain_s = max(regain_s, 5.0)
+        if not reported:
+            return  # no usage info (e.g. a CDN or error page): keep the last reading
+        now = time.time()
+        with _USAGE_LOCK:
+            _USAGE_STATE["pct"] = pct
+            _USAGE_STATE["at"] = now
+            if regain_s > 0:
+                _USAGE_STATE["blocked_until"] = max(float(_USAGE_STATE.get("blocked_until") or 0.0), now + regain_s)
+    except Exception:
+        pass
+
+
+def meta_usage_snapshot() -> dict:
+    """Latest Meta usage percent and cool-down, for diagnostics."""
+    with _USAGE_LOCK:
+        state = dict(_USAGE_STATE)
+    state["cooldown_s"] = max(0.0, round(float(state.get("blocked_until") or 0.0) - time.time(), 1))
+    return state
+
 ACCESS = os.getenv("META_ACCESS_TOKEN", "")
 AD_ACCOUNT_ID = os.getenv("META_AD_ACCOUNT_ID", "")  # numeric only, no act_
 PAGE_ID = os.getenv("META_PAGE_ID", "")
@@ -216,6 +300,23 @@ def _list_graph_edge_all(path: str, params: dict | None = None, *, max_pages: in
     return rows
 
 
+def _map_concurrently(fn, items: list, *, max_workers: int | None = None) -> list[tuple]:
+    """Run ``fn(item)`` for every item concurrently; return ``(item, result, error)`` in input order."""
+    items = list(items or [])
+    if not items:
+        return []
+    workers = max(1, min(len(items), int(max_workers or ACCOUNT_FANOUT_WORKERS)))
+    out: list[tuple] = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fn, item) for item in items]
+        for item, fut in zip(items, futures):
+            try:
+                out.append((item, fut.result(), None))
+            except Exception as exc:
+                out.append((item, None, exc))
+    return out
+
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, max=16))
 def get_ad_account_info(ad_account_id: str | None = None) -> dict:
     """Fetch ad account basic info: id and name."""
@@ -238,29 +339,37 @@ def list_ad_accounts() -> list[dict]:
     errors: list[Exception] = []
     account_params = {"fields": "id,name,account_status", "limit": 100}
 
-    # Direct assignments are the fastest and most broadly permitted source.
-    try:
-        account_rows.extend(_list_graph_edge_all("me/adaccounts", account_params))
-    except Exception as exc:
-        errors.append(exc)
-
-    # Business tokens can expose additional owned/client accounts that are not
-    # included in the first direct edge response. Query each business best-effort:
-    # a permission problem in one business must not hide accounts from the others.
-    businesses: list[dict] = []
-    try:
-        businesses = _list_graph_edge_all("me/businesses", {"fields": "id,name", "limit": 100})
-    except Exception as exc:
-        errors.append(exc)
+    # Direct assignments are the fastest and most broadly permitted source, so
+    # they are read while the business list is still loading. Business tokens can
+    # expose additional owned/client accounts that are not included in the direct
+    # edge; each business edge is read best-effort and concurrently: a permission
+    # problem in one business must not hide accounts from the others. Results are
+    # merged in a fixed order so the dedupe below stays deterministic.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        direct_future = executor.submit(_list_graph_edge_all, "me/adaccounts", account_params)
+        businesses_future = executor.submit(_list_graph_edge_all, "me/businesses", {"fields": "id,name", "limit": 100})
+        try:
+            account_rows.extend(direct_future.result())
+        except Exception as exc:
+            errors.append(exc)
+        businesses: list[dict] = []
+        try:
+            businesses = businesses_future.result()
+        except Exception as exc:
+            errors.append(exc)
+
+    edge_paths: list[str] = []
     for business in businesses:
         business_id = str((business or {}).get("id") or "").strip()
         if not business_id:
             continue
         for edge in ("owned_ad_accounts", "client_ad_accounts"):
-            try:
-                account_rows.extend(_list_graph_edge_all(f"{business_id}/{edge}", account_params))
-            except Exception as exc:
-                errors.append(exc)
+            edge_paths.append(f"{business_id}/{edge}")
+    for _path, rows, exc in _map_concurrently(lambda path: _list_graph_edge_all(path, account_params), edge_paths):
+        if exc is not None:
+            errors.append(exc)
+        else:
+            account_rows.extend(rows or [])
 
     # Meta may return the same account as `123` and `act_123` across edges.
     # Preserve the first identifier while filling any missing metadata.
@@ -809,6 +918,113 @@ def list_active_campaigns_with_insights(date_preset: str = "last_7d", ad_account
     return out
 
 
+# -------- Multi-account fan-out --------
+# Shops with 6-10 ad accounts would otherwise wait for the sum of every
+# account's latency. Accounts run concurrently, each holding a slot of the
+# process-wide Meta limiter (rate_limits "meta", PTOS_META_MAX_CONCURRENCY), and
+# back off when Meta reports the token is close to its rate limit.
+
+
+def _wait_for_meta_capacity() -> None:
+    """Sleep while Meta reports a cool-down or usage above the fan-out threshold."""
+    waited = 0.0
+    while waited < ACCOUNT_FANOUT_MAX_WAIT_S:
+        with _USAGE_LOCK:
+            pct = float(_USAGE_STATE.get("pct") or 0.0)
+            seen_at = float(_USAGE_STATE.get("at") or 0.0)
+            blocked_until = float(_USAGE_STATE.get("blocked_until") or 0.0)
+        now = time.time()
+        if blocked_until > now:
+            delay = blocked_until - now
+        elif pct >= ACCOUNT_FANOUT_USAGE_PCT and (now - seen_at) < 60:
+            # Usage decays over Meta's rolling hour; a short pause per slot keeps
+            # concurrent accounts from pushing the token over 100%.
+            delay = 1.0 + (pct - ACCOUNT_FANOUT_USAGE_PCT) / 5.0
+        else:
+            return
+        delay = max(0.1, min(delay, ACCOUNT_FANOUT_MAX_WAIT_S - waited))
+        time.sleep(delay)
+        waited += delay
+
+
+def iter_ad_accounts_concurrently(accounts: list, fn, *, max_workers: int | None = None):
+    """Run ``fn(account)`` for each account and yield results as they complete.
+
+    Yields ``(account, result, error)``; ``error`` is the exception raised for
+    that account (its ``result`` is then ``None``). Concurrency is bounded both
+    per call and across the process (``provider_slot("meta")``), and each account waits for Meta capacity
+    before it starts. Callers may stop iterating early; queued accounts are then
+    cancelled.
+    """
+    unique: list = []
+    for acct in (accounts or []):
+        if acct not in unique:
+            unique.append(acct)
+    if not unique:
+        return
+
+    def _one(acct):
+        with provider_slot("meta"):
+            _wait_for_meta_capacity()
+            return fn(acct)
+
+    workers = max(1, min(len(unique), int(max_workers or ACCOUNT_FANOUT_WORKERS)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="meta-fanout")
+    try:
+        futures = {executor.submit(_one, acct): acct for acct in unique}
+        for fut in as_completed(futures):
+            acct = futures[fut]
+            try:
+                yield acct, fut.result(), None
+            except Exception as exc:
+                yield acct, None, exc
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_campaigns_for_accounts(
+    ad_account_ids: list,
+    date_preset: str = "last_7d",
+    *,
+    since: str | None = None,
+    until: str | None = None,
+    profit_only: bool = False,
+):
+    """Stream ``list_active_campaigns_with_insights`` for several ad accounts.
+
+    Yields one ``{"ad_account", "data", "error"}`` dict per account in completion
+    order so callers can start on the fastest account immediately.
+    """
+    def _fetch(acct):
+        return list_active_campaigns_with_insights(
+            date_preset,
+            ad_account_id=acct or None,
+            since=since,
+            until=until,
+            profit_only=profit_only,
+        ) or []
+
+    for acct, rows, exc in iter_ad_accounts_concurrently(ad_account_ids, _fetch):
+        yield {
+            "ad_account": acct,
+            "data": rows or [],
+            "error": str(_unwrap_retry_error(exc)) if exc is not None else None,
+        }
+
+
+def _unwrap_retry_error(exc: Exception) -> Exception:
+    """Return the last underlying error of a tenacity ``RetryError``."""
+    try:
+        from tenacity import RetryError
+        if isinstance(exc, RetryError):
+            cause = exc.last_attempt.exception()
+            if cause is not None:
+                return cause
+    except Exception:
+        pass
+    return exc
+
+
 def _upload_image(url: str):
     res = _post(f"act_{AD_ACCOUNT_ID}/adimages", {"url": url})
     images = res.get("images", {})
@@ -1,6 +1,8 @@
 import os, json
 from tenacity import retry, stop_after_attempt, wait_exponential
 from openai import OpenAI, BadRequestError
+from app.llm_gateway import complete as llm_complete
+from app.image_cache import fetch_source_image
 import base64
 import mimetypes
 import requests
@@ -69,6 +71,14 @@ def _install_openai_health_hooks():
 
 _install_openai_health_hooks()
 
+
+def _chat(*, model: str, messages: list, cache: bool = True, **params):
+    """chat.completions.create routed through the LLM gateway (cache, coalescing, limits, tokens).
+
+    Creative generators pass ``cache=False`` so a retry yields fresh output.
+    """
+    return llm_complete("openai", model, messages, client.chat.completions.create, cache=cache, **params)
+
 ANGLE_JSON_INSTRUCTIONS = {"type": "json_object"}
 
 # We build the prompt with an f-string so that only the payload vars are substituted and
@@ -119,7 +129,8 @@ def gen_angles_and_copy_full(payload: dict, model: str | None = None, prompt_ove
         {"role": "system", "content": "Respond ONLY with a json object. No prose, no markdown."},
         {"role": "user", "content": msg},
     ]
-    resp = client.chat.completions.create(
+    resp = _chat(
+        cache=False,
         model=(model or DEFAULT_LLM_MODEL),
         messages=messages,
         response_format={"type":"json_object"}
@@ -153,6 +164,9 @@ def translate_texts(items: list[str], target_language: str, *, locale: str | Non
         domain: optional domain like "ads" to bias translation style.
         model: override model.
 
+    Strings already in the translation memory are not re-sent; only misses go
+    to the model, chunked by token budget.
+
     Returns:
         A list of translated strings of equal length.
     """
@@ -188,49 +202,37 @@ def translate_texts(items: list[str], target_language: str, *, locale: str | Non
     if dom:
         instructions += f"- Domain emphasis: {dom}.\n"
 
-    messages = [
-        {"role": "system", "content": "You are a professional marketing translator. Output JSON only."},
-        {
-            "role": "user",
-            "content": (
-                instructions
-                + f"\nTarget language: {lang or 'fr'}\n"
-                + "Items to translate (JSON array):\n"
-                + json.dumps(src_items, ensure_ascii=False)
-            ),
-        },
-    ]
-    resp = client.chat.completions.create(
-        model=(model or DEFAULT_LLM_MODEL),
-        messages=messages,
-    )
-    text = resp.choices[0].message.content or "[]"
-    try:
-        parsed = json.loads(text)
-        if isinstance(parsed, list):
-            out = [str(x) for x in parsed]
-        elif isinstance(parsed, dict) and isinstance(parsed.get("translations"), list):
-            out = [str(x) for x in parsed.get("translations")]
-        else:
-            out = []
-    except Exception:
-        out = []
-    if len(out) != len(src_items):
-        out = []
-        for s in src_items:
-            try:
-                r = client.chat.completions.create(
-                    model=(model or DEFAULT_LLM_MODEL),
-                    messages=[
-                        {"role": "system", "content": "Translate the following text. Output only the translation."},
-                        {"role": "user", "content": f"Target: {lang}\n{s}"},
-                    ],
-                )
-                tr = (r.choices[0].message.content or "").strip()
-            except Exception:
-                tr = s
-            out.append(tr)
-    return out
+    from app.translation_memory import translate_with_memory
+
+    def _translate_chunk(chunk: dict) -> dict:
+        messages = [
+            {"role": "system", "content": "You are a professional marketing translator. Output JSON only."},
+            {
+                "role": "user",
+                "content": (
+                    instructions
+                    + f"\nTarget language: {lang or 'fr'}\n"
+                    + 'Return a JSON object {"translations": {"<id>": "<translated text>", ...}} with exactly the ids given.\n'
+                    + "Items to translate (JSON object of id -> text):\n"
+                    + json.dumps(chunk, ensure_ascii=False)
+                ),
+            },
+        ]
+        # Uncached: a retry round resends the same chunk and must not get the same bad
+        # response back; the translation memory already dedupes successful items.
+        resp = _chat(
+            model=(model or DEFAULT_LLM_MODEL),
+            messages=messages,
+            cache=False,
+            response_format={"type": "json_object"},
+        )
+        parsed = json.loads(resp.choices[0].message.content or "{}")
+        translations = parsed.get("translations") if isinstance(parsed, dict) else None
+        return translations if isinstance(translations, dict) else {}
+
+    translated = translate_with_memory(src_items, lang or "fr", _translate_chunk, locale=loc, domain=dom)
+    # Items the model never returned fall back to the source text, as before.
+    return [translated.get(i, s) for i, s in enumerate(src_items)]
 
 IMAGE_PROMPT = (
     "High-converting ecommerce ad image for {title}. Angle: {angle}. "
@@ -315,15 +317,16 @@ def gen_clean_wholesale_product_image_openai(image_url: str) -> str | None:
     if not source:
         return None
 
-    resp = requests.get(source, timeout=30)
-    resp.raise_for_status()
-    mime = resp.headers.get("content-type") or "image/jpeg"
-    ext = mimetypes.guess_extension(mime.split(";")[0].strip()) or ".jpg"
+    fetched = fetch_source_image(source, timeout=30)
+    if not fetched:
+        raise RuntimeError(f"could not fetch source image: {source}")
+    mime, source_bytes = fetched
+    ext = mimetypes.guess_extension(mime) or ".jpg"
 
     import tempfile
 
     with tempfile.NamedTemporaryFile(suffix=ext) as fh:
-        fh.write(resp.content)
+        fh.write(source_bytes)
         fh.flush()
         prompt = (
             "Edit the vendor product photo into ONE clean, professional Shopify product image for a wholesale storefront.\n\n"
@@ -411,7 +414,7 @@ def gen_product_from_image(image_url: str, model: str | None = None, target_cate
         "Analyze the product in this image and extract structured inputs as specified."
     )
     def _call(_messages: list[dict]):
-        return client.chat.completions.create(
+        return _chat(
             model=(model or DEFAULT_LLM_MODEL),
             messages=_messages,
             response_format={"type": "json_object"},
@@ -433,11 +436,10 @@ def gen_product_from_image(image_url: str, model: str | None = None, target_cate
     except BadRequestError:
         # Fallback: fetch image bytes and embed as a base64 data URL so the model doesn't have to fetch it remotely
         try:
-            r = requests.get(image_url, timeout=20)
-            r.raise_for_status()
-            blob = r.content
-            # Determine mime type: prefer response header; else guess from URL
-            ctype = r.headers.get("Content-Type") or mimetypes.guess_type(image_url)[0] or "image/jpeg"
+            fetched = fetch_source_image(image_url)
+            if not fetched:
+                raise RuntimeError(f"could not fetch image: {image_url}")
+            ctype, blob = fetched
             b64 = base64.b64encode(blob).decode("ascii")
             data_url = f"data:{ctype};base64,{b64}"
             messages = [
@@ -573,7 +575,8 @@ def gen_landing_copy(payload: dict, angles: list, model: str | None = None, imag
             {"role": "system", "content": "Respond ONLY with a json object. No prose, no markdown."},
             {"role":"user","content": msg}
         ]
-    resp = client.chat.completions.create(
+    resp = _chat(
+        cache=False,
         model=(model or DEFAULT_LLM_MODEL),
         messages=messages,
         response_format={"type":"json_object"}
@@ -611,7 +614,8 @@ def gen_title_and_description(payload: dict, angle: dict, prompt_override: str |
         + json.dumps(angle, ensure_ascii=False)
     )
     def _call(messages: list[dict]):
-        return client.chat.completions.create(
+        return _chat(
+            cache=False,
             model=(model or DEFAULT_LLM_MODEL),
             messages=messages,
             response_format={"type":"json_object"}
@@ -704,7 +708,7 @@ def analyze_landing_page(url: str, model: str | None = None, prompt_override: st
     )
 
     def _call(_messages: list[dict]):
-        return client.chat.completions.create(
+        return _chat(
             model=(model or DEFAULT_LLM_MODEL),
             messages=_messages,
             response_format={"type": "json_object"},
@@ -833,7 +837,8 @@ def marketing_strategist(*, page_url: str | None = None, product_info: dict | No
         {"role": "system", "content": "Respond ONLY with a JSON object. No prose, no markdown."},
         {"role": "user", "content": STRATEGIST_PROMPT + "\n".join(context_parts)},
     ]
-    resp = client.chat.completions.create(
+    resp = _chat(
+        cache=False,
         model=(model or DEFAULT_LLM_MODEL),
         messages=messages,
         response_format={"type": "json_object"},
@@ -891,7 +896,8 @@ def marketing_copywriter(*, angle: dict, product_info: dict | None = None, page_
         {"role": "system", "content": "Respond ONLY with a JSON object. No prose, no markdown."},
         {"role": "user", "content": COPYWRITER_PROMPT + "\n".join(context_parts)},
     ]
-    resp = client.chat.completions.create(
+    resp = _chat(
+        cache=False,
         model=(model or DEFAULT_LLM_MODEL),
         messages=messages,
         response_format={"type": "json_object"},
@@ -975,7 +981,8 @@ def marketing_media_buyer(*, angle: dict, copy: dict, product_info: dict | None
         {"role": "system", "content": "Respond ONLY with a JSON object. No prose, no markdown."},
         {"role": "user", "content": MEDIA_BUYER_PROMPT + "\n".join(context_parts)},
     ]
-    resp = client.chat.completions.create(
+    resp = _chat(
+        cache=False,
         model=(model or DEFAULT_LLM_MODEL),
         messages=messages,
         response_format={"type": "json_object"},
@@ -1,12 +1,13 @@
-import os, requests, base64, re, time, logging
+import os, requests, base64, re, time, logging, mimetypes, threading
 from datetime import datetime, timedelta
 try:
     from zoneinfo import ZoneInfo  # Python 3.9+
 except Exception:  # pragma: no cover
     ZoneInfo = None  # type: ignore
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception, retry_if_exception_type
 from dotenv import load_dotenv
+from app.shopify_store_registry import canonical_store_label
 load_dotenv()
 
 # -------- lightweight in-memory caches (per Cloud Run instance) --------
@@ -17,14 +18,17 @@ _PRODUCT_BRIEF_DB_TTL_S = int(os.getenv("PTOS_PRODUCTS_BRIEF_DB_TTL_S", "1800")
 _PRODUCT_BRIEF_MAX_IDS = int(os.getenv("PTOS_PRODUCTS_BRIEF_MAX_IDS", "250") or "250")  # safety cap
 _PRODUCT_BRIEF_WORKERS = int(os.getenv("PTOS_PRODUCTS_BRIEF_WORKERS", "8") or "8")
 _UTM_ORDERS_DB_TTL_S = int(os.getenv("PTOS_UTM_ORDERS_DB_TTL_S", "300") or "300")  # 5 minutes
+_STORE_CONFIG_TTL_S = int(os.getenv("PTOS_SHOPIFY_STORE_CONFIG_TTL_S", "300") or "300")  # resolved store credentials
+_STORE_POOL_SIZE = int(os.getenv("PTOS_SHOPIFY_POOL_SIZE", "16") or "16")  # pooled connections per store
 _perf_log = logging.getLogger("shopify_client.perf")
 
 
-def _timed_request(method: str, url: str, **kw):
+def _timed_request(method: str, url: str, *, session: requests.Session | None = None, op: str | None = None, **kw):
     """Drop-in replacement for ``requests.<verb>`` that records a system_health sample.
 
-    Op label is the calling helper's function name (e.g. ``_gql_store``,
-    ``_rest_get_store_raw``). Status >= 500 counts as an error sample.
+    Op label is ``op`` or the calling helper's function name (e.g. ``_gql_store``,
+    ``_rest_get_store_raw``). Sent on ``session`` when given (pooled
+    connections). Status >= 500 counts as an error sample.
     Network exceptions count as errors. Pure-additive: any failure inside
     recording is swallowed so it can never break the request.
     """
@@ -34,9 +38,9 @@ def _timed_request(method: str, url: str, **kw):
     except Exception:
         _sh_record = None  # type: ignore
 
-    op_name = method
+    op_name = op or method
     try:
-        frame = _inspect.currentframe()
+        frame = None if op else _inspect.currentframe()
         if frame and frame.f_back:
             op_name = frame.f_back.f_code.co_name or method
     except Exception:
@@ -47,7 +51,7 @@ def _timed_request(method: str, url: str, **kw):
     err = None
     status_code = None
     try:
-        r = requests.request(method, url, **kw)
+        r = (session or requests).request(method, url, **kw)
         try:
             status_code = int(getattr(r, "status_code", 0) or 0)
             if status_code >= 500:
@@ -137,6 +141,12 @@ def _store_suffix(store: str | None) -> str:
     return f"_{s}"
 
 def _get_store_config(store: str | None) -> dict:
+    """Credentials and endpoints for the given store (resolved once per StoreClient, see below)."""
+    cfg = _store_client(store).config()
+    return {**cfg, "HEADERS": dict(cfg["HEADERS"])}
+
+
+def _resolve_store_config(store: str | None) -> dict:
     """Resolve credentials and endpoints for the given store (env-suffixed values).
 
     Precedence:
@@ -202,6 +212,148 @@ def _get_store_config(store: str | None) -> dict:
         "HEADERS": hdrs,
     }
 
+
+# -------- Store registry --------
+# Every _gql_store/_rest_*_store call (including each page of a pagination loop)
+# used to re-read env vars, possibly AppSetting "shopify_oauth", and rebuild the
+# header dict. A StoreClient per store label resolves that once. It is dropped
+# when the store's shopify_oauth setting changes (OAuth callback, any instance;
+# see app.settings_cache) and re-resolved every PTOS_SHOPIFY_STORE_CONFIG_TTL_S.
+# It also owns the store's pooled HTTP session and its rate-limit state.
+# Clients are keyed by the label from app.shopify_store_registry, so "MMD",
+# " mmd" and "mmd" share one client, and "nouralibas" shares irrakids'.
+
+
+class ShopifyThrottled(requests.exceptions.HTTPError):
+    """The store is inside a Retry-After window from an earlier 429; nothing was sent."""
+
+    def __init__(self, label: str | None, retry_after: float):
+        super().__init__(f"Shopify store {label or 'default'} is rate-limited; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class StoreClient:
+    """Resolved config, pooled session and rate-limit state for one store label."""
+
+    def __init__(self, label: str | None):
+        self.label = label
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=_STORE_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._config: dict | None = None
+        self._resolved_at = 0.0
+        # monotonic, per API: REST and GraphQL have separate rate limits, so a 429 on one doesn't hold back the other
+        self.retry_at: dict[str, float] = {"rest": 0.0, "graphql": 0.0}
+        self.call_limit: str | None = None  # last X-Shopify-Shop-Api-Call-Limit ("used/size")
+        self.throttled = 0
+
+    def config(self) -> dict:
+        cfg = self._config
+        if cfg is None or time.monotonic() - self._resolved_at > _STORE_CONFIG_TTL_S:
+            cfg = _resolve_store_config(self.label)
+            self._config, self._resolved_at = cfg, time.monotonic()
+        return cfg
+
+    def refresh(self) -> None:
+        self._config = None
+
+    def credentials(self) -> tuple[dict, tuple[str, str] | None]:
+        """(config, basic auth or None); raises when the store has neither a token nor an API key/password."""
+        cfg = self.config()
+        if cfg["TOKEN"]:
+            return cfg, None
+        if cfg["API_KEY"] and cfg["PASSWORD"]:
+            return cfg, (cfg["API_KEY"], cfg["PASSWORD"])
+        raise RuntimeError("Provide either SHOPIFY_ACCESS_TOKEN or both SHOPIFY_API_KEY and SHOPIFY_PASSWORD for the selected store.")
+
+    def request(self, method: str, url: str, *, op: str, **kw):
+        """Send on the pooled session; ``op`` labels the system_health sample.
+
+        Raises ``ShopifyThrottled`` (an ``HTTPError``, so the helpers' retry
+        policies back off on it like on a 429) instead of blocking the caller
+        while an earlier Retry-After is still running.
+        """
+        api = _api_kind(url)
+        wait = self.retry_at[api] - time.monotonic()
+        if wait > 0:
+            raise ShopifyThrottled(self.label, wait)
+        r = _timed_request(method, url, session=self.session, op=op, **kw)
+        try:
+            limit = r.headers.get("X-Shopify-Shop-Api-Call-Limit")
+            if limit:
+                self.call_limit = limit
+            if r.status_code == 429:
+                self.throttled += 1
+                self.retry_at[api] = time.monotonic() + float(r.headers.get("Retry-After") or 2.0)
+        except Exception:
+            pass
+        return r
+
+    def stats(self) -> dict:
+        return {"resolved": self._config is not None, "call_limit": self.call_limit, "throttled": self.throttled}
+
+
+def _api_kind(url: str) -> str:
+    return "graphql" if url.split("?", 1)[0].endswith("/graphql.json") else "rest"
+
+
+def _is_throttled(exc: BaseException) -> bool:
+    """A 429 or a call refused inside a Retry-After window: Shopify didn't apply it, so retrying writes is safe."""
+    if isinstance(exc, ShopifyThrottled):
+        return True
+    return isinstance(exc, requests.exceptions.HTTPError) and getattr(exc.response, "status_code", None) == 429
+
+
+_STORE_CLIENTS: dict[str | None, StoreClient] = {}  # canonical label (None = default store) -> client
+_STORE_CLIENTS_LOCK = threading.Lock()
+
+
+def _store_key(store: str | None) -> str | None:
+    label = canonical_store_label(store)
+    if label is None and str(store or "").strip():
+        raise ValueError(f"invalid Shopify store label: {store!r}")
+    return label
+
+
+def _store_client(store: str | None) -> StoreClient:
+    label = _store_key(store)
+    client = _STORE_CLIENTS.get(label)
+    if client is None:
+        with _STORE_CLIENTS_LOCK:
+            client = _STORE_CLIENTS.get(label)
+            if client is None:
+                client = StoreClient(label)
+                _STORE_CLIENTS[label] = client
+    return client
+
+
+def refresh_store_config(store: str | None = None) -> None:
+    """Re-resolve credentials on next use (every store when ``store`` is None)."""
+    if store is None:
+        clients = list(_STORE_CLIENTS.values())
+    else:
+        clients = {c for c in (_STORE_CLIENTS.get(canonical_store_label(store)),) if c is not None}
+    for client in clients:
+        client.refresh()
+
+
+def store_client_stats() -> dict:
+    return {c.label or "default": c.stats() for c in list(_STORE_CLIENTS.values())}
+
+
+def _on_setting_invalidated(store: str | None, key: str) -> None:
+    if "shopify_oauth".startswith(key):
+        refresh_store_config(store)
+
+
+try:
+    from app import settings_cache as _settings_cache
+
+    _settings_cache.add_listener(_on_setting_invalidated)
+except Exception:  # pragma: no cover
+    pass
+
 PRODUCT_CREATE = """
 mutation CreateProduct($input: ProductInput!) {
   productCreate(input: $input) {
@@ -423,14 +575,9 @@ def _rest_delete(path: str):
 # Store-scoped request helpers
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, max=8), retry=retry_if_exception_type(requests.exceptions.RequestException))
 def _gql_store(store: str | None, query: str, variables: dict):
-    cfg = _get_store_config(store)
-    auth = None
-    if not cfg["TOKEN"]:
-        if cfg["API_KEY"] and cfg["PASSWORD"]:
-            auth = (cfg["API_KEY"], cfg["PASSWORD"])
-        else:
-            raise RuntimeError("Provide either SHOPIFY_ACCESS_TOKEN or both SHOPIFY_API_KEY and SHOPIFY_PASSWORD for the selected store.")
-    r = _timed_request("POST",cfg["GQL"], headers=cfg["HEADERS"], json={"query": query, "variables": variables}, timeout=60, auth=auth)
+    client = _store_client(store)
+    cfg, auth = client.credentials()
+    r = client.request("POST", cfg["GQL"], op="_gql_store", headers=cfg["HEADERS"], json={"query": query, "variables": variables}, timeout=60, auth=auth)
     r.raise_for_status()
     j = r.json()
     if "errors" in j:
@@ -444,79 +591,57 @@ def _gql_store(store: str | None, query: str, variables: dict):
         or (data or {}).get("metafieldsSet", {}).get("userErrors")
         or (data or {}).get("metafieldDefinitionCreate", {}).get("userErrors")
         or (data or {}).get("fileCreate", {}).get("userErrors")
+        or (data or {}).get("stagedUploadsCreate", {}).get("userErrors")
     )
     if ue:
         raise RuntimeError(f"GraphQL userErrors: {ue}")
     return data
 
+@retry(stop=stop_after_attempt(4), wait=wait_exponential(multiplier=1, max=8), retry=retry_if_exception(_is_throttled))
 def _gql_store_once(store: str | None, query: str, variables: dict, *, timeout: int = 60):
-    cfg = _get_store_config(store)
-    auth = None
-    if not cfg["TOKEN"]:
-        if cfg["API_KEY"] and cfg["PASSWORD"]:
-            auth = (cfg["API_KEY"], cfg["PASSWORD"])
-        else:
-            raise RuntimeError("Provide either SHOPIFY_ACCESS_TOKEN or both SHOPIFY_API_KEY and SHOPIFY_PASSWORD for the selected store.")
-    r = _timed_request("POST",cfg["GQL"], headers=cfg["HEADERS"], json={"query": query, "variables": variables}, timeout=timeout, auth=auth)
+    client = _store_client(store)
+    cfg, auth = client.credentials()
+    r = client.request("POST", cfg["GQL"], op="_gql_store_once", headers=cfg["HEADERS"], json={"query": query, "variables": variables}, timeout=timeout, auth=auth)
     r.raise_for_status()
     j = r.json()
     if "errors" in j:
         raise RuntimeError(f"GraphQL errors: {j['errors']}")
     return j.get("data")
 
+@retry(stop=stop_after_attempt(4), wait=wait_exponential(multiplier=1, max=8), retry=retry_if_exception(_is_throttled))
 def _rest_post_store(store: str | None, path: str, payload: dict):
-    cfg = _get_store_config(store)
+    client = _store_client(store)
+    cfg, auth = client.credentials()
     url = f"{cfg['BASE']}{path}"
-    auth = None
-    if not cfg["TOKEN"]:
-        if cfg["API_KEY"] and cfg["PASSWORD"]:
-            auth = (cfg["API_KEY"], cfg["PASSWORD"])
-        else:
-            raise RuntimeError("Provide either SHOPIFY_ACCESS_TOKEN or both SHOPIFY_API_KEY and SHOPIFY_PASSWORD for the selected store.")
-    r = _timed_request("POST",url, headers=cfg["HEADERS"], json=payload, timeout=60, auth=auth)
+    r = client.request("POST", url, op="_rest_post_store", headers=cfg["HEADERS"], json=payload, timeout=60, auth=auth)
     r.raise_for_status()
     return r.json() if r.content else {}
 
 @retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=0.5, max=8), retry=retry_if_exception_type(requests.exceptions.RequestException))
 def _rest_get_store(store: str | None, path: str):
-    cfg = _get_store_config(store)
+    client = _store_client(store)
+    cfg, auth = client.credentials()
     url = f"{cfg['BASE']}{path}"
-    auth = None
-    if not cfg["TOKEN"]:
-        if cfg["API_KEY"] and cfg["PASSWORD"]:
-            auth = (cfg["API_KEY"], cfg["PASSWORD"])
-        else:
-            raise RuntimeError("Provide either SHOPIFY_ACCESS_TOKEN or both SHOPIFY_API_KEY and SHOPIFY_PASSWORD for the selected store.")
-    r = _timed_request("GET",url, headers=cfg["HEADERS"], timeout=60, auth=auth)
+    r = client.request("GET", url, op="_rest_get_store", headers=cfg["HEADERS"], timeout=60, auth=auth)
     r.raise_for_status()
     return r.json() if r.content else {}
 
 
 @retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=0.5, max=8), retry=retry_if_exception_type(requests.exceptions.RequestException))
 def _rest_get_store_raw(store: str | None, path: str):
-    cfg = _get_store_config(store)
+    client = _store_client(store)
+    cfg, auth = client.credentials()
     url = f"{cfg['BASE']}{path}"
-    auth = None
-    if not cfg["TOKEN"]:
-        if cfg["API_KEY"] and cfg["PASSWORD"]:
-            auth = (cfg["API_KEY"], cfg["PASSWORD"])
-        else:
-            raise RuntimeError("Provide either SHOPIFY_ACCESS_TOKEN or both SHOPIFY_API_KEY and SHOPIFY_PASSWORD for the selected store.")
-    r = _timed_request("GET",url, headers=cfg["HEADERS"], timeout=60, auth=auth, allow_redirects=False)
+    r = client.request("GET", url, op="_rest_get_store_raw", headers=cfg["HEADERS"], timeout=60, auth=auth, allow_redirects=False)
     r.raise_for_status()
     return r
 
 
 def _rest_get_store_raw_once(store: str | None, path: str, *, timeout: int = 20):
-    cfg = _get_store_config(store)
+    client = _store_client(store)
+    cfg, auth = client.credentials()
     url = f"{cfg['BASE']}{path}"
-    auth = None
-    if not cfg["TOKEN"]:
-        if cfg["API_KEY"] and cfg["PASSWORD"]:
-            auth = (cfg["API_KEY"], cfg["PASSWORD"])
-        else:
-            raise RuntimeError("Provide either SHOPIFY_ACCESS_TOKEN or both SHOPIFY_API_KEY and SHOPIFY_PASSWORD for the selected store.")
-    r = _timed_request("GET",url, headers=cfg["HEADERS"], timeout=timeout, auth=auth, allow_redirects=False)
+    r = client.request("GET", url, op="_rest_get_store_raw_once", headers=cfg["HEADERS"], timeout=timeout, auth=auth, allow_redirects=False)
     r.raise_for_status()
     return r
 
@@ -556,29 +681,21 @@ def get_shop_timezone(store: str | None = None) -> str:
         pass
     return "UTC"
 
+@retry(stop=stop_after_attempt(4), wait=wait_exponential(multiplier=1, max=8), retry=retry_if_exception(_is_throttled))
 def _rest_put_store(store: str | None, path: str, payload: dict):
-    cfg = _get_store_config(store)
+    client = _store_client(store)
+    cfg, auth = client.credentials()
     url = f"{cfg['BASE']}{path}"
-    auth = None
-    if not cfg["TOKEN"]:
-        if cfg["API_KEY"] and cfg["PASSWORD"]:
-            auth = (cfg["API_KEY"], cfg["PASSWORD"])
-        else:
-            raise RuntimeError("Provide either SHOPIFY_ACCESS_TOKEN or both SHOPIFY_API_KEY and SHOPIFY_PASSWORD for the selected store.")
-    r = _timed_request("PUT",url, headers=cfg["HEADERS"], json=payload, timeout=60, auth=auth)
+    r = client.request("PUT", url, op="_rest_put_store", headers=cfg["HEADERS"], json=payload, timeout=60, auth=auth)
     r.raise_for_status()
     return r.json() if r.content else {}
 
+@retry(stop=stop_after_attempt(4), wait=wait_exponential(multiplier=1, max=8), retry=retry_if_exception(_is_throttled))
 def _rest_delete_store(store: str | None, path: str):
-    cfg = _get_store_config(store)
+    client = _store_client(store)
+    cfg, auth = client.credentials()
     url = f"{cfg['BASE']}{path}"
-    auth = None
-    if not cfg["TOKEN"]:
-        if cfg["API_KEY"] and cfg["PASSWORD"]:
-            auth = (cfg["API_KEY"], cfg["PASSWORD"])
-        else:
-            raise RuntimeError("Provide either SHOPIFY_ACCESS_TOKEN or both SHOPIFY_API_KEY and SHOPIFY_PASSWORD for the selected store.")
-    r = _timed_request("DELETE",url, headers=cfg["HEADERS"], timeout=60, auth=auth)
+    r = client.request("DELETE", url, op="_rest_delete_store", headers=cfg["HEADERS"], timeout=60, auth=auth)
     r.raise_for_status()
     return r.json() if r.content else {}
 
@@ -3602,78 +3719,345 @@ def _extract_numeric_id_from_gid(gid: str) -> str | None:
         return None
 
 
-def upload_images_to_product(product_gid: str, image_srcs: list[str], alt_texts: list[str] | None = None, *, store: str | None = None) -> list[str]:
-    """Attach remote images to a Shopify product and return Shopify CDN URLs.
+# Images we ingest are fingerprinted (app.image_index); remembering what each one
+# became in Shopify lets a re-upload of the same photo skip the create call.
+def _indexed_shopify_ref(src: str, store: str | None, owner: str) -> dict | None:
+    try:
+        from app.image_index import shopify_ref
+        ref = shopify_ref(src, f"{store or ''}|{owner}")
+        return ref if isinstance(ref, dict) else None
+    except Exception:
+        return None
 
-    Best-effort: continues on individual failures and returns all successful CDN URLs.
+
+def _remember_shopify_ref(src: str, store: str | None, owner: str, ref: dict) -> None:
+    try:
+        from app.image_index import remember_shopify
+        remember_shopify(src, f"{store or ''}|{owner}", ref)
+    except Exception:
+        pass
+
+
+def _cdn_key(url: str | None) -> str:
+    return (url or "").split("?", 1)[0]
+
+
+class _ProductImageSrcs:
+    """Current image URLs of a product, fetched once and only if an indexed image needs checking."""
+
+    def __init__(self, product_gid: str, store: str | None):
+        self.product_gid = product_gid
+        self.store = store
+        self._srcs: set[str] | None = None
+
+    def __contains__(self, src) -> bool:
+        if self._srcs is None:
+            self._srcs = {_cdn_key(img.get("src")) for img in list_product_images(self.product_gid, store=self.store)}
+        return bool(src) and _cdn_key(src) in self._srcs
+
+
+# ---------------- Batched product media ----------------
+# Product images are attached with one productCreateMedia mutation per batch
+# instead of one REST call per image. Local bytes go through stagedUploadsCreate
+# (one call for all files) and are PUT/POSTed to the staged targets in parallel.
+# Shopify processes media asynchronously; we poll the media nodes until they
+# have CDN URLs or MEDIA_READY_TIMEOUT_S runs out. Images still processing then
+# have no CDN URL yet; pages built from them use the source URL instead
+# (``page_image_urls``), so none go missing.
+MEDIA_UPLOAD_WORKERS = int(os.getenv("PTOS_SHOPIFY_MEDIA_UPLOAD_WORKERS", "6") or "6")
+MEDIA_READY_TIMEOUT_S = int(os.getenv("PTOS_SHOPIFY_MEDIA_READY_TIMEOUT_S", "20") or "20")
+_MEDIA_BATCH = 50
+
+STAGED_UPLOADS_CREATE = """
+mutation StagedUploadsCreate($input: [StagedUploadInput!]!) {
+  stagedUploadsCreate(input: $input) {
+    stagedTargets { url resourceUrl parameters { name value } }
+    userErrors { field message }
+  }
+}
+"""
+
+PRODUCT_CREATE_MEDIA = """
+mutation ProductCreateMedia($productId: ID!, $media: [CreateMediaInput!]!) {
+  productCreateMedia(productId: $productId, media: $media) {
+    media {
+      id
+      status
+      ... on MediaImage { image { url } }
+    }
+    mediaUserErrors { field message }
+  }
+}
+"""
+
+MEDIA_NODES = """
+query MediaNodes($ids: [ID!]!) {
+  nodes(ids: $ids) {
+    ... on MediaImage { id status image { url } }
+  }
+}
+"""
+
+
+def _media_error_indexes(errors: list[dict]) -> dict[int, str]:
+    """Map ``mediaUserErrors`` (field like ["media", "2", "originalSource"]) to input indexes."""
+    out: dict[int, str] = {}
+    for err in errors or []:
+        field = (err or {}).get("field") or []
+        try:
+            idx = int(field[1]) if len(field) > 1 else -1
+        except Exception:
+            idx = -1
+        out[idx] = str((err or {}).get("message") or "media error")
+    return out
+
+
+def _await_media_urls(media_ids: list[str], *, store: str | None = None) -> dict[str, str | None]:
+    """Poll media nodes until each is READY/FAILED or the timeout passes; returns {media_id: cdn_url}."""
+    urls: dict[str, str | None] = {mid: None for mid in media_ids if mid}
+    pending = list(urls)
+    deadline = time.time() + max(0, MEDIA_READY_TIMEOUT_S)
+    delay = 0.5
+    while pending:
+        try:
+            data = _gql_store(store, MEDIA_NODES, {"ids": pending})
+            for node in (data or {}).get("nodes") or []:
+                if not node or not node.get("id"):
+                    continue
+                url = ((node.get("image") or {}).get("url")) or None
+                if url:
+                    urls[node["id"]] = url
+                if url or node.get("status") == "FAILED":
+                    pending = [m for m in pending if m != node["id"]]
+        except Exception as e:
+            _perf_log.warning("media status poll failed: %s", e)
+            break
+        if not pending or time.time() + delay > deadline:
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 3.0)
+    return urls
+
+
+def _create_product_media(product_gid: str, sources: list[str], alt_texts: list[str], *, store: str | None = None) -> list[dict]:
+    """Attach ``sources`` (public URLs or staged resource URLs) in one mutation per batch.
+
+    Returns one {"media_id", "cdn", "error"} per source, in input order.
     """
-    if not image_srcs:
-        return []
-    numeric_id = _extract_numeric_id_from_gid(product_gid)
-    if not numeric_id:
+    results: list[dict] = []
+    for start in range(0, len(sources), _MEDIA_BATCH):
+        chunk = sources[start:start + _MEDIA_BATCH]
+        media = [
+            {"originalSource": src, "alt": (alt_texts[start + i] if start + i < len(alt_texts) else None) or "Product image", "mediaContentType": "IMAGE"}
+            for i, src in enumerate(chunk)
+        ]
+        data = _gql_store(store, PRODUCT_CREATE_MEDIA, {"productId": product_gid, "media": media})
+        payload = (data or {}).get("productCreateMedia") or {}
+        errors = _media_error_indexes(payload.get("mediaUserErrors") or [])
+        created = payload.get("media") or []
+        if errors and not created:
+            raise RuntimeError(f"productCreateMedia failed: {list(errors.values())}")
+        # Shopify omits rejected inputs from ``media``; walk both lists in order.
+        it = iter(created)
+        for i in range(len(chunk)):
+            if i in errors:
+                results.append({"media_id": None, "cdn": None, "error": errors[i]})
+                continue
+            node = next(it, None) or {}
+            results.append({"media_id": node.get("id"), "cdn": ((node.get("image") or {}).get("url")) or None, "error": None})
+    waiting = [r["media_id"] for r in results if r["media_id"] and not r["cdn"]]
+    if waiting:
+        ready = _await_media_urls(waiting, store=store)
+        for r in results:
+            if r["media_id"] in ready:
+                r["cdn"] = ready[r["media_id"]]
+    return results
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.5, max=4), retry=retry_if_exception_type(requests.exceptions.RequestException))
+def _post_staged_file(target: dict, filename: str, blob: bytes, mime: str) -> None:
+    params = {p["name"]: p["value"] for p in (target.get("parameters") or [])}
+    r = _timed_request("POST", target["url"], data=params, files={"file": (filename, blob, mime)}, timeout=120)
+    r.raise_for_status()
+
+
+def staged_upload_files(files: list[tuple[str, bytes]], *, store: str | None = None, resource: str = "IMAGE") -> list[str | None]:
+    """Upload local files through Shopify staged uploads; returns each file's resourceUrl (None on failure)."""
+    if not files:
         return []
-    cdn_urls: list[str] = []
-    for idx, src in enumerate(image_srcs):
+    mimes = [mimetypes.guess_type(name or "")[0] or "image/jpeg" for name, _ in files]
+    inputs = [
+        {"filename": name or f"image-{i}.jpg", "mimeType": mimes[i], "resource": resource, "httpMethod": "POST", "fileSize": str(len(blob))}
+        for i, (name, blob) in enumerate(files)
+    ]
+    data = _gql_store(store, STAGED_UPLOADS_CREATE, {"input": inputs})
+    targets = ((data or {}).get("stagedUploadsCreate") or {}).get("stagedTargets") or []
+    out: list[str | None] = [None] * len(files)
+
+    def _one(i: int) -> tuple[int, str | None]:
+        target = targets[i] if i < len(targets) else None
+        if not target:
+            return i, None
+        name, blob = files[i]
+        try:
+            _post_staged_file(target, inputs[i]["filename"], blob, mimes[i])
+            return i, target.get("resourceUrl")
+        except Exception as e:
+            _perf_log.warning("staged upload failed for %s: %s", name, e)
+            return i, None
+
+    workers = max(1, min(MEDIA_UPLOAD_WORKERS, len(files)))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for fut in as_completed([ex.submit(_one, i) for i in range(len(files))]):
+            i, url = fut.result()
+            out[i] = url
+    return out
+
+
+def _upload_images_rest(numeric_id: str, srcs: list[str], alt_texts: list[str], *, store: str | None = None) -> list[dict]:
+    """Per-image REST fallback when productCreateMedia is unavailable."""
+    results: list[dict] = []
+    for idx, src in enumerate(srcs):
         try:
-            alt = (alt_texts[idx] if (alt_texts and idx < len(alt_texts)) else None) or "Product image"
+            alt = (alt_texts[idx] if idx < len(alt_texts) else None) or "Product image"
             resp = _rest_post_store(store, f"/products/{numeric_id}/images.json", {"image": {"src": src, "alt": alt}})
-            try:
-                cdn = (resp or {}).get("image", {}).get("src")
-                if cdn:
-                    cdn_urls.append(cdn)
-            except Exception:
-                pass
-        except Exception:
-            # Ignore per-image failures to avoid blocking the flow
+            image = (resp or {}).get("image", {}) or {}
+            results.append({"media_id": image.get("admin_graphql_api_id") or image.get("id"), "cdn": image.get("src"), "error": None})
+        except Exception as e:
+            results.append({"media_id": None, "cdn": None, "error": str(e)})
+    return results
+
+
+def _fetchable_sources(srcs: list[str], *, store: str | None = None) -> list[str]:
+    """Swap our own uploads that Shopify can't reach (relative or localhost URLs) for staged uploads."""
+    from app.media_assets import load_asset_bytes
+    from app.storage import is_local_base, local_upload_name
+
+    local: list[int] = []
+    files: list[tuple[str, bytes]] = []
+    for i, src in enumerate(srcs):
+        name = local_upload_name(src)
+        if not name or not (src.startswith("/") or is_local_base(src)):
             continue
-    return cdn_urls
+        loaded = load_asset_bytes(src)
+        if loaded is not None:
+            local.append(i)
+            files.append((name, loaded[1]))
+    if not files:
+        return srcs
+    out = list(srcs)
+    try:
+        for i, resource_url in zip(local, staged_upload_files(files, store=store)):
+            if resource_url:
+                out[i] = resource_url
+    except Exception as e:
+        _perf_log.warning("staging local images failed: %s", e)
+    return out
 
 
-def upload_images_to_product_verbose(product_gid: str, image_srcs: list[str], alt_texts: list[str] | None = None, *, store: str | None = None) -> dict:
-    """Upload images and return detailed per-image outcomes plus collected CDN URLs."""
-    results: list[dict] = []
-    cdn_urls: list[str] = []
+def _attach_product_images(product_gid: str, image_srcs: list[str], alt_texts: list[str] | None, *, store: str | None = None) -> list[dict]:
+    """Attach images by URL, skipping ones already on the product; one result dict per source."""
     numeric_id = _extract_numeric_id_from_gid(product_gid)
-    if not (numeric_id and image_srcs):
-        return {"cdn_urls": [], "per_image": results}
+    alts = [(alt_texts[i] if (alt_texts and i < len(alt_texts)) else None) or "Product image" for i in range(len(image_srcs))]
+    results: list[dict | None] = [None] * len(image_srcs)
+    current = _ProductImageSrcs(product_gid, store)
+    todo: list[int] = []
     for idx, src in enumerate(image_srcs):
+        ref = _indexed_shopify_ref(src, store, product_gid)
+        if ref and ref.get("src") in current:
+            results[idx] = {"src": src, "ok": True, "cdn": ref["src"], "reused": True}
+        else:
+            todo.append(idx)
+    if todo:
+        srcs = _fetchable_sources([image_srcs[i] for i in todo], store=store)
         try:
-            alt = (alt_texts[idx] if (alt_texts and idx < len(alt_texts)) else None) or "Product image"
-            resp = _rest_post_store(store, f"/products/{numeric_id}/images.json", {"image": {"src": src, "alt": alt}})
-            cdn = (resp or {}).get("image", {}).get("src")
-            if cdn:
-                cdn_urls.append(cdn)
-            results.append({"src": src, "ok": True, "cdn": cdn, "resp_keys": list((resp or {}).keys())})
+            created = _create_product_media(product_gid, srcs, [alts[i] for i in todo], store=store)
         except Exception as e:
-            results.append({"src": src, "ok": False, "error": str(e)})
-            continue
-    return {"cdn_urls": cdn_urls, "per_image": results}
+            _perf_log.warning("productCreateMedia failed, falling back to REST images: %s", e)
+            created = _upload_images_rest(numeric_id, srcs, [alts[i] for i in todo], store=store)
+        for idx, outcome in zip(todo, created):
+            src = image_srcs[idx]
+            if outcome.get("cdn"):
+                _remember_shopify_ref(src, store, product_gid, {"id": outcome.get("media_id"), "src": outcome["cdn"]})
+            results[idx] = {
+                "src": src,
+                "ok": not outcome.get("error"),
+                "cdn": outcome.get("cdn"),
+                "media_id": outcome.get("media_id"),
+                **({"error": outcome["error"]} if outcome.get("error") else {}),
+            }
+    return [r for r in results if r is not None]
+
+
+def upload_images_to_product(product_gid: str, image_srcs: list[str], alt_texts: list[str] | None = None, *, store: str | None = None) -> list[str]:
+    """Attach remote images to a Shopify product and return Shopify CDN URLs.
+
+    Best-effort: continues on individual failures and returns all successful CDN URLs.
+    Images already attached to the product (same source image) are not re-uploaded.
+    """
+    if not image_srcs or not _extract_numeric_id_from_gid(product_gid):
+        return []
+    try:
+        return [r["cdn"] for r in _attach_product_images(product_gid, image_srcs, alt_texts, store=store) if r.get("cdn")]
+    except Exception:
+        return []
+
+
+def page_image_urls(per_image: list[dict]) -> list[str]:
+    """One URL per attached image, in order: the Shopify CDN URL, or the source URL while Shopify is still processing it."""
+    return [u for u in ((r.get("cdn") or r.get("src")) for r in per_image or []) if u]
+
+
+def upload_images_to_product_verbose(product_gid: str, image_srcs: list[str], alt_texts: list[str] | None = None, *, store: str | None = None) -> dict:
+    """Upload images and return detailed per-image outcomes plus collected CDN URLs."""
+    if not (_extract_numeric_id_from_gid(product_gid) and image_srcs):
+        return {"cdn_urls": [], "per_image": []}
+    try:
+        results = _attach_product_images(product_gid, image_srcs, alt_texts, store=store)
+    except Exception as e:
+        results = [{"src": src, "ok": False, "error": str(e)} for src in image_srcs]
+    return {"cdn_urls": [r["cdn"] for r in results if r.get("cdn")], "per_image": results}
 
 
 def upload_image_attachments_to_product(product_gid: str, files: list[tuple[str, bytes]], alt_texts: list[str] | None = None, *, store: str | None = None) -> dict:
-    """Upload local files as base64 attachments to a Shopify product. Returns cdn_urls and per-image outcomes.
+    """Upload local files to a Shopify product via staged uploads. Returns cdn_urls and per-image outcomes.
 
     files: list of (filename, bytes)
     """
     results: list[dict] = []
-    cdn_urls: list[str] = []
     numeric_id = _extract_numeric_id_from_gid(product_gid)
     if not (numeric_id and files):
         return {"cdn_urls": [], "per_image": results}
-    for idx, (filename, blob) in enumerate(files):
+    alts = [(alt_texts[i] if (alt_texts and i < len(alt_texts)) else None) or "Product image" for i in range(len(files))]
+    try:
+        staged = staged_upload_files(files, store=store)
+    except Exception as e:
+        _perf_log.warning("stagedUploadsCreate failed, falling back to base64 attachments: %s", e)
+        staged = [None] * len(files)
+
+    outcomes: list[dict | None] = [None] * len(files)
+    ready = [i for i, url in enumerate(staged) if url]
+    if ready:
         try:
-            b64 = base64.b64encode(blob).decode("ascii")
-            alt = (alt_texts[idx] if (alt_texts and idx < len(alt_texts)) else None) or "Product image"
-            payload = {"image": {"attachment": b64, "filename": filename, "alt": alt}}
-            resp = _rest_post_store(store, f"/products/{numeric_id}/images.json", payload)
-            cdn = (resp or {}).get("image", {}).get("src")
-            if cdn:
-                cdn_urls.append(cdn)
-            results.append({"filename": filename, "ok": True, "cdn": cdn, "resp_keys": list((resp or {}).keys())})
+            created = _create_product_media(product_gid, [staged[i] for i in ready], [alts[i] for i in ready], store=store)
+            for i, outcome in zip(ready, created):
+                outcomes[i] = outcome
         except Exception as e:
-            results.append({"filename": filename, "ok": False, "error": str(e)})
-            continue
-    return {"cdn_urls": cdn_urls, "per_image": results}
+            _perf_log.warning("productCreateMedia failed for staged files: %s", e)
+    for idx, (filename, blob) in enumerate(files):
+        outcome = outcomes[idx]
+        if outcome is None or outcome.get("error"):
+            # Staging or attaching failed for this file: fall back to a base64 REST attachment.
+            try:
+                b64 = base64.b64encode(blob).decode("ascii")
+                payload = {"image": {"attachment": b64, "filename": filename, "alt": alts[idx]}}
+                resp = _rest_post_store(store, f"/products/{numeric_id}/images.json", payload)
+                outcome = {"media_id": None, "cdn": (resp or {}).get("image", {}).get("src"), "error": None}
+            except Exception as e:
+                results.append({"filename": filename, "ok": False, "error": str(e)})
+                continue
+        results.append({"filename": filename, "ok": True, "cdn": outcome.get("cdn"), "media_id": outcome.get("media_id")})
+    return {"cdn_urls": [r["cdn"] for r in results if r.get("cdn")], "per_image": results}
 
 
 def upload_remote_image_to_shopify_files(image_url: str, alt: str | None = None, *, store: str | None = None) -> dict:
@@ -3681,6 +4065,9 @@ def upload_remote_image_to_shopify_files(image_url: str, alt: str | None = None,
     src = (image_url or "").strip()
     if not src:
         return {}
+    ref = _indexed_shopify_ref(src, store, "files")
+    if ref and ref.get("id") and ref.get("url"):
+        return {"id": ref["id"], "url": ref["url"], "status": ref.get("status"), "reused": True}
     data = _gql_store(store, FILE_CREATE, {
         "files": [{
             "originalSource": src,
@@ -3708,6 +4095,8 @@ def upload_remote_image_to_shopify_files(image_url: str, alt: str | None = None,
                     break
             except Exception:
                 break
+    if file_id and url and url != src:
+        _remember_shopify_ref(src, store, "files", {"id": file_id, "url": url, "status": status})
     return {
         "id": file_id,
         "url": url or src,
@@ -4555,80 +4944,79 @@ def create_product_and_page(payload: dict, angles: list, creatives: list, landin
         pass
 
     pdata = _gql_store(store, PRODUCT_CREATE, {"input": product_in})["productCreate"]["product"]
-    # Attach images via REST after creation and capture Shopify CDN URLs
-    shopify_image_urls: list[str] = []
-    alt_texts: list[str] = []
-    if requested_images:
-        # Prepare alt texts from landing copy sections or description/title
-        sections = (landing_copy or {}).get("sections") or []
-        base_title = title
-        base_desc = (payload.get("description") or "")
-        for idx, _ in enumerate(requested_images):
-            sec = sections[idx] if idx < len(sections) else {}
-            sec_title = sec.get("title") or "Product image"
-            sec_body = sec.get("body") or base_desc
-            alt_texts.append(f"{base_title} — {sec_title}: {sec_body[:80]}")
-        # Perform upload step and prefer returned Shopify CDN URLs
-        shopify_image_urls = upload_images_to_product(pdata["id"], requested_images, alt_texts, store=store)
-
-    # Build landing page body using the common responsive builder (ensures only provided images are embedded)
-    page_body_html = _build_page_body_html(title, landing_copy, shopify_image_urls or requested_images, alt_texts)
-
-    handle = f"offer-{pdata['id'].split('/')[-1]}"
-    page_in = {
-        "title": f"{title} – Offer",
-        "handle": handle,
-        "templateSuffix": "product_test",
-        "body": page_body_html
-    }
 
-    page = _gql_store(store, PAGE_CREATE, {"page": page_in})["pageCreate"]["page"]
-    page_url = f"https://{cfg['SHOP']}/pages/{page['handle']}"
+    def _configure_variants() -> None:
+        _configure_variants_for_product(
+            pdata["id"],
+            payload.get("base_price"),
+            payload.get("sizes"),
+            payload.get("colors"),
+            payload.get("track_quantity"),
+            payload.get("quantity"),
+            payload.get("variants"),
+            store=store,
+        )
 
-    # After landing page is generated, update product description HTML to match the provided/generated content
-    try:
-        final_desc = structured_html or page_body_html or ""
-        if final_desc:
-            update_product_description(pdata["id"], final_desc, store=store)
-    except Exception:
-        pass
+    # Only the page body depends on the media (it embeds the CDN URLs). Pricing/variants
+    # and product publishing run alongside media processing; the page follow-ups
+    # (description, landing link, page publish) run together once the page exists.
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        background = [
+            ex.submit(_configure_variants),
+            ex.submit(publish_product_all_channels, pdata["id"], store=store),
+        ]
 
-    # Configure pricing/variants/inventory via REST after product creation
-    try:
-        base_price = payload.get("base_price")
-        sizes = payload.get("sizes")
-        colors = payload.get("colors")
-        track_quantity = payload.get("track_quantity")
-        quantity = payload.get("quantity")
-        variants = payload.get("variants")
-        _configure_variants_for_product(pdata["id"], base_price, sizes, colors, track_quantity, quantity, variants, store=store)
-    except Exception:
-        pass
+        # Attach images in one batched media call and capture Shopify CDN URLs
+        page_images: list[str] = []
+        alt_texts: list[str] = []
+        if requested_images:
+            # Prepare alt texts from landing copy sections or description/title
+            sections = (landing_copy or {}).get("sections") or []
+            base_title = title
+            base_desc = (payload.get("description") or "")
+            for idx, _ in enumerate(requested_images):
+                sec = sections[idx] if idx < len(sections) else {}
+                sec_title = sec.get("title") or "Product image"
+                sec_body = sec.get("body") or base_desc
+                alt_texts.append(f"{base_title} — {sec_title}: {sec_body[:80]}")
+            # Prefer each image's Shopify CDN URL; one still processing keeps its source URL.
+            attached = upload_images_to_product_verbose(pdata["id"], requested_images, alt_texts, store=store)
+            page_images = page_image_urls(attached["per_image"])
+
+        # Build landing page body using the common responsive builder (ensures only provided images are embedded)
+        page_body_html = _build_page_body_html(title, landing_copy, page_images or requested_images, alt_texts)
+
+        handle = f"offer-{pdata['id'].split('/')[-1]}"
+        page_in = {
+            "title": f"{title} – Offer",
+            "handle": handle,
+            "templateSuffix": "product_test",
+            "body": page_body_html
+        }
 
-    # Publish to all sales channels (best-effort)
-    try:
-        publish_product_all_channels(pdata["id"], store=store)
-    except Exception:
-        pass
+        page = _gql_store(store, PAGE_CREATE, {"page": page_in})["pageCreate"]["page"]
+        page_url = f"https://{cfg['SHOP']}/pages/{page['handle']}"
 
-    # Try to link landing page to product via a product metafield (best-effort)
-    try:
-        _link_product_landing_page(pdata["id"], page["id"], store=store)
-    except Exception:
-        pass
+        # After landing page is generated, update product description HTML to match the provided/generated content
+        final_desc = structured_html or page_body_html or ""
+        if final_desc:
+            background.append(ex.submit(update_product_description, pdata["id"], final_desc, store=store))
+        # Link landing page to product via a product metafield, then publish the page (best-effort)
+        background.append(ex.submit(_link_product_landing_page, pdata["id"], page["id"], store=store))
+        background.append(ex.submit(publish_page_all_channels, page["id"], store=store))
 
-    # Publish page to all sales channels (best-effort)
-    try:
-        publish_page_all_channels(page["id"], store=store)
-    except Exception:
-        pass
+        for fut in background:
+            try:
+                fut.result()
+            except Exception:
+                pass
 
     # Include Shopify CDN image URLs used/attached so the UI can display them later
     return {
         "product_gid": pdata["id"],
         "page_gid": page["id"],
         "url": page_url,
-        "image_urls": shopify_image_urls or requested_images or [],
+        "image_urls": page_images or requested_images or [],
     }
 
 
@@ -0,0 +1,312 @@
+"""Unified runner for long background jobs.
+
+Campaign analysis, bulk analysis, action-task generation, the ads automation
+and wholesale product finalization used to run as raw threads (or FastAPI
+``BackgroundTasks``) inside the API process. Their memory and CPU competed
+with request handling, they died on scale-down, and some of their status
+existed only in memory. ``submit_job(kind, params)`` persists the job in
+AppSetting (``job:{id}``) and dispatches it to the Celery worker
+(``USE_CELERY=true``) on the kind's named queue and priority. Otherwise the
+job runs on this instance's per-queue worker pool. Any instance can answer
+``get_job`` polls because the status, result and error all live in the
+database.
+
+Kinds are registered next to the function they run. The job stores the
+module that registered it, so a worker that doesn't know the kind yet
+imports that module (e.g. ``app.main``) and the kind registers itself there.
+
+Jobs that produce a series of results (the ``app.media_jobs`` image sets)
+write each one with ``put_job_item`` to its own row (``job_item:{id}:{index}``)
+instead of rewriting the job record, and call ``touch_job`` now and then so a
+long run isn't taken for dead. ``submit_job_once`` dedupes by request hash:
+the same kind and params attach to the queued or running job, or to a
+finished one within the kind's ``reuse_s``.
+
+A delivery for a job that is already running and not stale (no write for the
+kind's ``stale_s``) returns without running it again, so acks_late
+redeliveries and retries never run or bill a job twice.
+
+Env vars (optional):
+  PTOS_JOB_WORKERS_<QUEUE>  local worker threads per queue when Celery is off
+                            (INTERACTIVE 4, MEDIA 2, BULK 1, WARM 1)
+  PTOS_JOB_STALE_S          seconds after which a job still marked running may be
+                            picked up again, e.g. redelivered after its worker
+                            died (default 21600; also the broker visibility timeout)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+from uuid import uuid4
+
+from app import db, storage
+
+_log = logging.getLogger("app.job_runner")
+
+# queue -> local worker threads. Lower Celery priority values run first.
+JOB_QUEUES: dict[str, int] = {
+    q: int(os.getenv(f"PTOS_JOB_WORKERS_{q.upper()}", str(n)) or str(n))
+    for q, n in (("interactive", 4), ("media", 2), ("bulk", 1), ("warm", 1))
+}
+
+JOB_STALE_S = int(os.getenv("PTOS_JOB_STALE_S", "21600") or "21600")
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+@dataclass
+class JobKind:
+    fn: Callable[[str, dict], Any]
+    queue: str
+    priority: int
+    celery: bool
+    module: str
+    stale_s: int
+    reuse_s: int
+
+
+_KINDS: dict[str, JobKind] = {}
+_LOCK = threading.Lock()
+_SUBMIT_LOCK = threading.Lock()
+_pools: dict[str, ThreadPoolExecutor] = {}
+_local_running: dict[str, int] = {}
+
+
+def register_job(
+    kind: str,
+    fn: Callable[[str, dict], Any],
+    *,
+    queue: str = "interactive",
+    priority: int = 5,
+    celery: bool = True,
+    stale_s: int | None = None,
+    reuse_s: int = 0,
+    module: str | None = None,
+) -> None:
+    """Register ``fn(job_id, params) -> result``; the result must be JSON-serializable.
+
+    ``module`` overrides the module a worker imports to find the kind (default
+    ``fn.__module__``), for kinds registered through a wrapper.
+    """
+    if queue not in JOB_QUEUES:
+        raise ValueError(f"unknown job queue: {queue}")
+    _KINDS[kind] = JobKind(
+        fn, queue, priority, celery,
+        module or getattr(fn, "__module__", "") or "",
+        int(stale_s if stale_s is not None else JOB_STALE_S),
+        int(reuse_s or 0),
+    )
+
+
+def _job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def _item_prefix(job_id: str) -> str:
+    return f"job_item:{job_id}:"
+
+
+def _hash_key(request_hash: str) -> str:
+    return f"job_hash:{request_hash}"
+
+
+def request_hash(kind: str, params: dict) -> str:
+    raw = json.dumps({"kind": kind, "params": params}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_job(job_id: str) -> dict | None:
+    value = db.get_app_setting(None, _job_key(job_id))
+    return value if isinstance(value, dict) else None
+
+
+def _save(job: dict) -> dict:
+    job["updated_at"] = time.time()
+    db.set_app_setting(None, _job_key(job["job_id"]), job)
+    return job
+
+
+def put_job_item(job_id: str, index: int, item: Any) -> None:
+    """Store one result of a running job; keyed by index, so a re-run overwrites it."""
+    db.set_app_setting(None, f"{_item_prefix(job_id)}{int(index):05d}", {"index": int(index), "item": item})
+
+
+def job_items(job_id: str) -> list[dict]:
+    """``{"index", "item"}`` entries in completion order."""
+    return [v for _, v in db.list_app_settings_by_prefix(None, _item_prefix(job_id)) if isinstance(v, dict)]
+
+
+def touch_job(job_id: str, **fields: Any) -> None:
+    """Heartbeat (plus small progress fields) for a running job."""
+    job = get_job(job_id)
+    if job and job.get("status") == "running":
+        job.update(fields)
+        _save(job)
+
+
+def _stale_s(job: dict) -> int:
+    spec = _KINDS.get(str(job.get("kind") or ""))
+    return spec.stale_s if spec is not None else JOB_STALE_S
+
+
+def _is_stale(job: dict) -> bool:
+    last = max(float(job.get("started_at") or 0), float(job.get("updated_at") or 0))
+    return time.time() - last >= _stale_s(job)
+
+
+def _use_celery() -> bool:
+    return os.getenv("USE_CELERY", "false").lower() in ("1", "true", "yes")
+
+
+def _run_local(job_id: str, queue: str) -> None:
+    with _LOCK:
+        pool = _pools.get(queue)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=max(1, JOB_QUEUES.get(queue, 1)), thread_name_prefix=f"job-{queue}")
+            _pools[queue] = pool
+    pool.submit(run_job, job_id)
+
+
+def submit_job(
+    kind: str,
+    params: dict,
+    *,
+    job_id: str | None = None,
+    store: str | None = None,
+    label: str | None = None,
+    request_hash: str | None = None,
+) -> dict:
+    """Persist a queued job and dispatch it; returns the job state."""
+    spec = _KINDS.get(kind)
+    if spec is None:
+        raise ValueError(f"unknown job kind: {kind}")
+    job = {
+        "job_id": job_id or uuid4().hex,
+        "kind": kind,
+        "module": spec.module,
+        "queue": spec.queue,
+        "priority": spec.priority,
+        "params": params,
+        "store": store,
+        "label": label or kind,
+        "status": "queued",
+        "result": None,
+        "error": None,
+        "runner": None,
+        "request_hash": request_hash,
+        "base_url": storage.public_base_url(),  # /uploads URLs built by the job use the submitting request's host
+        "created_at": time.time(),
+    }
+    if spec.celery and _use_celery():
+        # Record the runner before enqueueing: the worker may pick the job up immediately.
+        job["runner"] = "celery"
+        _save(job)
+        try:
+            # The media queue keeps its own task name so PTOS_CELERY_MEDIA_RATE throttles it.
+            from app.tasks import job_run, media_job_run
+            task = media_job_run if spec.queue == "media" else job_run
+            task.apply_async(args=[job["job_id"]], queue=spec.queue, priority=spec.priority)
+            return job
+        except Exception as e:
+            _log.warning("Celery enqueue failed for job %s (%s), running locally: %s", job["job_id"], kind, e)
+    job["runner"] = "local"
+    _save(job)
+    _run_local(job["job_id"], spec.queue)
+    return job
+
+
+def _reusable(job: dict | None, spec: JobKind) -> bool:
+    if not job:
+        return False
+    if job.get("status") in ACTIVE_STATUSES:
+        return not _is_stale(job)
+    finished = float(job.get("finished_at") or job.get("updated_at") or 0)
+    return job.get("status") == "done" and time.time() - finished < spec.reuse_s
+
+
+def submit_job_once(kind: str, params: dict, *, store: str | None = None, label: str | None = None) -> tuple[dict, bool]:
+    """``submit_job`` deduped by request hash; returns (job, created)."""
+    spec = _KINDS.get(kind)
+    if spec is None:
+        raise ValueError(f"unknown job kind: {kind}")
+    rhash = request_hash(kind, params)
+    with _SUBMIT_LOCK:
+        existing_id = db.get_app_setting(None, _hash_key(rhash))
+        existing = get_job(str(existing_id)) if existing_id else None
+        if _reusable(existing, spec):
+            return existing, False
+        job = submit_job(kind, params, store=store, label=label, request_hash=rhash)
+        db.set_app_setting(None, _hash_key(rhash), job["job_id"])
+    return job, True
+
+
+def _resolve(job: dict) -> JobKind | None:
+    kind = str(job.get("kind") or "")
+    if kind not in _KINDS and job.get("module"):
+        try:
+            importlib.import_module(str(job["module"]))
+        except Exception as e:
+            _log.warning("job %s: importing %s failed: %s", job.get("job_id"), job.get("module"), e)
+    return _KINDS.get(kind)
+
+
+def run_job(job_id: str) -> dict | None:
+    """Execute a persisted job and store its result or error."""
+    from app import system_health as _sh
+
+    job = get_job(job_id)
+    if not job or job.get("status") not in ACTIVE_STATUSES:
+        return job
+    if job.get("status") == "running" and not _is_stale(job):
+        return job  # duplicate delivery while the first attempt is still alive
+    spec = _resolve(job)
+    if spec is None:
+        job.update({"status": "error", "error": f"unknown kind {job.get('kind')}", "finished_at": time.time()})
+        return _save(job)
+
+    kind = str(job["kind"])
+    # Compare-and-set on the row we just read: of two workers handed the same job, one runs it.
+    claimed = {**job, "status": "running", "started_at": time.time(), "updated_at": time.time()}
+    if not db.compare_and_set_app_setting(None, _job_key(job_id), job, claimed):
+        return get_job(job_id)
+    job = claimed
+    _sh.register_inflight(f"job:{job_id}", kind, store=job.get("store"), label=f"{job.get('label')} {job_id[:8]}")
+    with _LOCK:
+        _local_running[spec.queue] = _local_running.get(spec.queue, 0) + 1
+    base_token = storage.bind_public_base(job.get("base_url"))
+    try:
+        with _sh.time_op("pipeline", f"job.{kind}", store=job.get("store")):
+            result = spec.fn(job_id, dict(job.get("params") or {}))
+        job.update({"status": "done", "result": result, "finished_at": time.time()})
+    except Exception as e:
+        _log.exception("job %s (%s) failed", job_id, kind)
+        job.update({"status": "error", "error": str(e), "finished_at": time.time()})
+    finally:
+        storage.unbind_public_base(base_token)
+        with _LOCK:
+            _local_running[spec.queue] -= 1
+        _sh.clear_inflight(f"job:{job_id}")
+    return _save(job)
+
+
+def job_public(job: dict) -> dict:
+    """Job state for polling clients (params can be large and stay server-side)."""
+    return {k: v for k, v in (job or {}).items() if k not in ("params", "module")}
+
+
+def job_stats() -> dict[str, Any]:
+    with _LOCK:
+        return {
+            "kinds": len(_KINDS),
+            "queues": dict(JOB_QUEUES),
+            "running": dict(_local_running),
+        }
@@ -0,0 +1,87 @@
+"""Paginated, conditional list responses.
+
+The dashboard polls the list endpoints (flows, tests, agents, agent runs,
+profit cards, campaign meta) and used to download and re-render the whole
+list every time. Each endpoint now does the following:
+
+- Pages with ``limit``/``cursor``. A cursor is an opaque ``created_at|id``
+  token (``db.keyset_cursor``) that continues after the last row of the
+  previous page, so deep pages cost the same as the first.
+- Filters on the server (store, status, type, ...) instead of in the browser.
+- Answers with a weak ``ETag``. The ETag is derived from the list's version
+  (``db.*_list_version``: row count and max(updated_at) under the same
+  filters) and the request's own parameters. A poll that sends the tag back
+  in ``If-None-Match`` gets an empty 304, and the page itself isn't queried.
+- Trims each item to ``fields=a,b,c`` when asked; ``id`` is always kept.
+
+The version is read before the page. A write that lands in between yields
+an older tag with newer data, so the next poll refetches. The reverse
+(an old page served under a fresh tag) cannot happen.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Awaitable, Callable
+
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+# Browsers revalidate on every use and send If-None-Match themselves.
+_CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(version: str, **params: Any) -> str:
+    raw = json.dumps([version, params], sort_keys=True, default=str)
+    return 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24] + '"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(request: Request | None, etag: str) -> bool:
+    """Whether ``If-None-Match`` already names ``etag`` (weak comparison, RFC 9110 13.1.2)."""
+    header = request.headers.get("if-none-match") if request is not None else None
+    if not header:
+        return False
+    tags = [t for t in header.split(",") if t.strip()]
+    return any(t.strip() == "*" or _opaque(t) == _opaque(etag) for t in tags)
+
+
+def parse_fields(fields: str | None) -> set[str] | None:
+    names = {f.strip() for f in (fields or "").split(",") if f.strip()}
+    return (names | {"id"}) if names else None
+
+
+def sparse(items: Any, fields: str | None) -> Any:
+    """Keep only ``fields`` (plus ``id``) of each item in a list, or of each value in a dict."""
+    names = parse_fields(fields)
+    if names is None:
+        return items
+    if isinstance(items, dict):
+        return {k: ({f: v[f] for f in names if f in v} if isinstance(v, dict) else v) for k, v in items.items()}
+    return [({f: it[f] for f in names if f in it} if isinstance(it, dict) else it) for it in items or []]
+
+
+async def conditional(
+    request: Request | None,
+    version: Callable[[], str],
+    build: Callable[[], Awaitable[dict]],
+    **params: Any,
+) -> Response:
+    """304 when the client's tag still matches; else ``await build()`` with the tag attached.
+
+    ``version`` is a blocking db call (run on the threadpool); ``params`` are
+    the request parameters that shape the body (filters, cursor, limit, fields).
+    """
+    etag = weak_etag(await run_in_threadpool(version), **params)
+    headers = {"ETag": etag, "Cache-Control": _CACHE_CONTROL}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    payload = await build()
+    return JSONResponse(jsonable_encoder(payload), headers=headers)
@@ -0,0 +1,200 @@
+"""Shared entry point for chat-completion calls to LLM providers.
+
+Every call goes through ``complete()``, which adds, in order:
+
+- an exact-match response cache keyed by (provider, model, messages, params)
+  with a TTL, so UI retries and double-clicks don't pay for the same prompt twice;
+- in-flight coalescing: identical requests that arrive while the first is still
+  running wait for its response instead of issuing their own;
+- provider and per-model concurrency limits (``rate_limits``, names ``openai``
+  and ``openai:<model>``);
+- token accounting per model.
+
+Callers whose output must differ on every call (creative generation) pass
+``cache=False``, which skips both the cache and coalescing; the limits and
+accounting still apply. The gateway is provider-agnostic: the caller supplies
+the function that performs the request.
+
+Env vars (optional):
+  PTOS_LLM_CACHE_TTL_S     seconds a response stays reusable (default 900; 0 disables the cache)
+  PTOS_LLM_CACHE_MAX       max cached responses, LRU-evicted (default 256)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from app.rate_limits import provider_slot
+
+CACHE_TTL_S = int(os.getenv("PTOS_LLM_CACHE_TTL_S", "900") or "900")
+CACHE_MAX = int(os.getenv("PTOS_LLM_CACHE_MAX", "256") or "256")
+
+_LOCK = threading.Lock()
+_CACHE: "OrderedDict[str, tuple[float, Any, int]]" = OrderedDict()  # key -> (expires_at, response, total_tokens)
+_INFLIGHT: dict[str, "_Pending"] = {}
+_STATS: dict[str, dict[str, int]] = {}
+
+
+class _Pending:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.response: Any = None
+        self.error: BaseException | None = None
+
+
+def request_key(provider: str, model: str, messages: list, params: dict | None = None) -> str:
+    raw = json.dumps(
+        {"provider": provider, "model": model, "messages": messages, "params": params or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _usage_of(resp: Any) -> tuple[int, int, int]:
+    usage = getattr(resp, "usage", None)
+    if usage is None and isinstance(resp, dict):
+        usage = resp.get("usage")
+    if usage is None:
+        return 0, 0, 0
+
+    def _get(name: str) -> int:
+        value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, 0)
+        try:
+            return int(value or 0)
+        except Exception:
+            return 0
+
+    prompt, completion = _get("prompt_tokens"), _get("completion_tokens")
+    return prompt, completion, (_get("total_tokens") or prompt + completion)
+
+
+def _count(model_key: str, **deltas: int) -> None:
+    # Caller holds _LOCK.
+    row = _STATS.setdefault(
+        model_key,
+        {
+            "calls": 0,
+            "errors": 0,
+            "cache_hits": 0,
+            "coalesced": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "tokens_saved": 0,
+        },
+    )
+    for name, amount in deltas.items():
+        row[name] = row.get(name, 0) + int(amount or 0)
+
+
+def _cache_get(key: str) -> tuple[Any, int] | None:
+    # Caller holds _LOCK.
+    entry = _CACHE.get(key)
+    if entry is None:
+        return None
+    expires_at, response, tokens = entry
+    if expires_at < time.time():
+        _CACHE.pop(key, None)
+        return None
+    _CACHE.move_to_end(key)
+    return response, tokens
+
+
+def complete(
+    provider: str,
+    model: str,
+    messages: list,
+    call: Callable[..., Any],
+    *,
+    cache: bool = True,
+    ttl_s: int | None = None,
+    **params: Any,
+) -> Any:
+    """Run ``call(model=..., messages=..., **params)`` through the gateway and return its response.
+
+    Responses may be shared between callers when ``cache`` is on, so treat
+    them as read-only.
+    """
+    model_key = f"{provider}:{model}"
+    ttl = CACHE_TTL_S if ttl_s is None else int(ttl_s)
+    key = request_key(provider, model, messages, params) if cache else None
+    pending: _Pending | None = None
+    owner = True
+
+    if key is not None:
+        with _LOCK:
+            hit = _cache_get(key) if ttl > 0 else None
+            if hit is not None:
+                _count(model_key, cache_hits=1, tokens_saved=hit[1])
+                return hit[0]
+            pending = _INFLIGHT.get(key)
+            if pending is None:
+                pending = _Pending()
+                _INFLIGHT[key] = pending
+            else:
+                owner = False
+                _count(model_key, coalesced=1)
+
+    if not owner:
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.response
+
+    try:
+        with provider_slot(provider), provider_slot(model_key):
+            response = call(model=model, messages=messages, **params)
+    except BaseException as exc:
+        with _LOCK:
+            _count(model_key, calls=1, errors=1)
+            if key is not None:
+                _INFLIGHT.pop(key, None)
+        if pending is not None:
+            pending.error = exc
+            pending.done.set()
+        raise
+
+    prompt_tokens, completion_tokens, total_tokens = _usage_of(response)
+    with _LOCK:
+        _count(
+            model_key,
+            calls=1,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens,
+        )
+        if key is not None:
+            if ttl > 0:
+                _CACHE[key] = (time.time() + ttl, response, total_tokens)
+                _CACHE.move_to_end(key)
+                while len(_CACHE) > max(1, CACHE_MAX):
+                    _CACHE.popitem(last=False)
+            _INFLIGHT.pop(key, None)
+    if pending is not None:
+        pending.response = response
+        pending.done.set()
+    return response
+
+
+def clear_cache() -> int:
+    with _LOCK:
+        count = len(_CACHE)
+        _CACHE.clear()
+        return count
+
+
+def gateway_stats() -> dict[str, Any]:
+    """Per-model call, cache and token counters since process start."""
+    with _LOCK:
+        models = {name: dict(row) for name, row in _STATS.items()}
+        cache_size = len(_CACHE)
+        inflight = len(_INFLIGHT)
+    return {"cache_size": cache_size, "cache_ttl_s": CACHE_TTL_S, "inflight": inflight, "models": models}
@@ -20,6 +20,7 @@ from app.integrations.openai_client import gen_angles_and_copy, gen_angles_and_c
 from app.integrations.openai_client import marketing_strategist, marketing_copywriter, marketing_media_buyer
 from app.agent import run_agent_until_final, run_ads_agent
 from app.integrations.gemini_client import gen_ad_images_from_image, gen_promotional_images_from_angles, gen_variant_images_from_image, gen_feature_benefit_images
+from app.integrations.gemini_client import iter_ad_images_from_image, iter_promotional_images_from_angles, iter_variant_images_from_image, iter_feature_benefit_images
 from app.integrations.gemini_client import analyze_variants_from_image, build_feature_benefit_prompts, _compute_midpoint_size_from_product
 from app.integrations.shopify_client import create_product_and_page, upload_images_to_product, create_product_only, create_page_from_copy, list_product_images, upload_images_to_product_verbose, upload_image_attachments_to_product, _link_product_landing_page
 from app.integrations.shopify_client import configure_variants_for_product
@@ -39,10 +40,10 @@ from app.integrations.shopify_client import update_product_title
 from app.integrations.shopify_client import _build_page_body_html
 from app.integrations.shopify_client import count_orders_total_processed, count_orders_total_created
 from app.integrations.shopify_client import list_orders_with_utms_processed, list_orders_with_utms_processed_multi
-from app.integrations.shopify_client import list_orders_open_unfulfilled, cycle_tag, set_cod_tag, has_cod_tag
+from app.integrations.shopify_client import list_orders_open_unfulfilled, cycle_tag, set_cod_tag
 from app.integrations.meta_client import create_campaign_with_ads
 from app.integrations.meta_client import list_saved_audiences
-from app.integrations.meta_client import list_active_campaigns_with_insights
+from app.integrations.meta_client import list_active_campaigns_with_insights, iter_campaigns_for_accounts
 from app.integrations.meta_client import get_campaign_summary
 from app.integrations.meta_client import get_ad_account_info, set_campaign_status, list_adsets_with_insights, set_adset_status, campaign_daily_insights, list_ad_accounts
 from app.integrations.meta_client import list_ads_for_adsets, list_ads_with_tracking_for_adsets, meta_tracking_signature_matches
@@ -51,11 +52,21 @@ from app.integrations.meta_client import create_draft_carousel_campaign
 from app.integrations.meta_client import get_campaign_ad_creatives
 from app.integrations.clarity_client import summarize_for_campaign as summarize_clarity_for_campaign
 from app.campaign_analyzer import analyze_campaign as run_campaign_analysis, generate_action_tasks as run_action_task_generation
-from app.storage import save_file
+from app.campaign_analyzer import invalidate_phase_memo, phase_memo_stats
+from app.storage import save_file, persist_upload_blob as _persist_upload_blob, aload_upload_blob as _aload_upload_blob
+from app.storage import public_upload_url, RequestBaseMiddleware
+from app.image_index import register_image, reuse_derived as _reuse_image_result
+from app.job_runner import register_job, submit_job, get_job, job_public
+from app.shopify_mirror import ingest as ingest_shopify_webhook, verify_webhook_hmac as verify_shopify_webhook_hmac, register_webhooks as register_shopify_webhooks, mirror_status as shopify_mirror_status, ensure_fresh as ensure_shopify_mirror_fresh
+from app import confirmation_queue
+from app.flow_steps import FlowStepLog, inputs_hash
+from app.media_jobs import register_media_job_kind, submit_media_job, get_media_job, ordered_items as _media_job_items, MEDIA_JOB_STALE_S
 from app.config import BASE_URL, UPLOADS_DIR, CHATKIT_WORKFLOW_ID
 from app.config import SHOPIFY_CLIENT_ID, SHOPIFY_CLIENT_SECRET, SHOPIFY_OAUTH_SCOPES
 from app.shopify_store_registry import build_store_registry, store_env_names, store_env_value
 from app import db
+from app import db_async
+from app import list_pages
 import re
 import threading
 import time
@@ -107,6 +118,8 @@ from app.system_health import HealthMiddleware as _HealthMiddleware  # noqa: E40
 from app.system_health_routes import router as _system_health_router  # noqa: E402
 from app import system_health as _sh  # noqa: E402
 app.add_middleware(_HealthMiddleware)
+# Lets image generators and jobs build absolute /uploads URLs without a request object.
+app.add_middleware(RequestBaseMiddleware)
 app.include_router(_system_health_router)
 
 # Internal chat / inbox (vendor + agent DMs over WebSocket; no WhatsApp API)
@@ -309,6 +322,16 @@ def _shopify_oauth_scopes() -> str:
         return "read_orders,write_orders"
 
 
+def _shopify_secret_candidates(secret: str) -> list[str]:
+    # Some dashboards display secrets with a prefix (e.g. "shpss_"). In case Shopify signs using
+    # the raw secret material only, try both forms.
+    secret = str(secret or "").strip()
+    out = [secret] if secret else []
+    if secret.startswith("shpss_") and len(secret) > 6:
+        out.append(secret.split("shpss_", 1)[1])
+    return out
+
+
 def _verify_shopify_hmac(query_params: dict, client_secret: str) -> bool:
     """Verify Shopify callback query HMAC (SHA256 hex) using app client secret.
 
@@ -327,11 +350,7 @@ def _verify_shopify_hmac(query_params: dict, client_secret: str) -> bool:
         if not (raw and provided and secret):
             return False
 
-        # Some dashboards display secrets with a prefix (e.g. "shpss_"). In case Shopify signs using
-        # the raw secret material only, try both forms.
-        secrets_to_try: list[str] = [secret]
-        if secret.startswith("shpss_") and len(secret) > 6:
-            secrets_to_try.append(secret.split("shpss_", 1)[1])
+        secrets_to_try = _shopify_secret_candidates(secret)
 
         def _digest(msg: str, sec: str) -> str:
             return hmac.new(sec.encode("utf-8"), msg.encode("utf-8"), hashlib.sha256).hexdigest()
@@ -476,38 +495,6 @@ def _verify_shopify_state(token: str) -> dict | None:
 Path(UPLOADS_DIR).mkdir(parents=True, exist_ok=True)
 
 
-def _upload_blob_key(filename: str) -> str:
-    return f"upload_blob:{filename}"
-
-
-def _persist_upload_blob(filename: str, data: bytes, content_type: str | None) -> None:
-    try:
-        if not filename or not data:
-            return
-        db.set_app_setting(None, _upload_blob_key(filename), {
-            "filename": filename,
-            "content_type": content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream",
-            "data_b64": base64.b64encode(data).decode("ascii"),
-            "created_at": datetime.utcnow().isoformat() + "Z",
-        })
-    except Exception as e:
-        logging.getLogger("app.uploads").warning("Failed to persist upload blob %s: %s", filename, e)
-
-
-def _load_upload_blob(filename: str) -> tuple[bytes, str] | None:
-    try:
-        payload = db.get_app_setting(None, _upload_blob_key(filename))
-        if not isinstance(payload, dict):
-            return None
-        raw = base64.b64decode(str(payload.get("data_b64") or ""))
-        if not raw:
-            return None
-        content_type = str(payload.get("content_type") or mimetypes.guess_type(filename)[0] or "application/octet-stream")
-        return raw, content_type
-    except Exception:
-        return None
-
-
 @app.api_route("/uploads/{filename:path}", methods=["GET", "HEAD"])
 async def api_uploads_file(filename: str, request: Request):
     safe_name = (filename or "").replace("\\", "/").split("/")[-1]
@@ -520,7 +507,7 @@ async def api_uploads_file(filename: str, request: Request):
         data = b"" if request.method == "HEAD" else local_path.read_bytes()
         return Response(content=data, media_type=content_type)
 
-    blob = _load_upload_blob(safe_name)
+    blob = await _aload_upload_blob(safe_name)
     if not blob:
         return Response(status_code=404)
     data, stored_content_type = blob
@@ -941,6 +928,102 @@ def _get_shopify_oauth_credentials(store: str) -> tuple[str, str]:
     return client_id, client_secret
 
 
+def _shopify_webhook_secrets(store_label: str) -> list[str]:
+    """Secrets a store's webhooks may be signed with: SHOPIFY_WEBHOOK_SECRET[_STORE], then the app client secret."""
+    secrets: list[str] = []
+    webhook_secret, _ = store_env_value("SHOPIFY_WEBHOOK_SECRET", store_label)
+    _, client_secret = _get_shopify_oauth_credentials(store_label)
+    for value in (webhook_secret, client_secret):
+        secrets.extend(c for c in _shopify_secret_candidates(value) if c not in secrets)
+    return secrets
+
+
+class ShopifyWebhookRegisterRequest(BaseModel):
+    store: Optional[str] = None
+    address: Optional[str] = None  # defaults to this API's /api/shopify/webhooks/{store}
+
+
+@app.post("/api/shopify/webhooks/register")
+async def api_shopify_webhooks_register(req: ShopifyWebhookRegisterRequest, request: Request):
+    store_label = _canonical_store_label(req.store) or ""
+    address = (req.address or "").strip() or f"{_abs_base_url(request).rstrip('/')}/api/shopify/webhooks/{store_label or 'default'}"
+    try:
+        return {"data": await run_in_threadpool(register_shopify_webhooks, store_label or None, address), "address": address}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/api/shopify/webhooks/{store}")
+async def api_shopify_webhook(store: str, request: Request):
+    """Shopify webhook receiver: verify, append to the durable event log, answer fast."""
+    body = await request.body()
+    store_label = _canonical_store_label(store) or ""
+    if store_label == "default":
+        store_label = ""
+    if not verify_shopify_webhook_hmac(body, request.headers.get("X-Shopify-Hmac-Sha256"), _shopify_webhook_secrets(store_label)):
+        return Response(content=json.dumps({"error": "invalid_hmac"}), media_type="application/json", status_code=401)
+    topic = (request.headers.get("X-Shopify-Topic") or "").strip().lower()
+    webhook_id = (request.headers.get("X-Shopify-Webhook-Id") or request.headers.get("X-Shopify-Event-Id") or "").strip()
+    try:
+        payload = json.loads(body or b"{}")
+    except Exception:
+        return Response(content=json.dumps({"error": "invalid_json"}), media_type="application/json", status_code=400)
+    if not webhook_id:
+        webhook_id = "sha256:" + hashlib.sha256(topic.encode("utf-8") + b"|" + body).hexdigest()
+    try:
+        created = await run_in_threadpool(ingest_shopify_webhook, store_label or None, topic, webhook_id, payload)
+    except Exception as e:
+        # Non-2xx makes Shopify retry the delivery later.
+        logger.warning("[shopify] webhook log write failed store=%s topic=%s: %s", store_label, topic, e)
+        return Response(content=json.dumps({"error": "unavailable"}), media_type="application/json", status_code=503)
+    return {"ok": True, "duplicate": not created}
+
+
+@app.post("/api/shopify/mirror/reconcile")
+async def api_shopify_mirror_reconcile(store: str | None = None):
+    """Queue a reconciliation sweep (orders/products updated since the last watermark)."""
+    store_label = _canonical_store_label(store)
+    try:
+        job = await run_in_threadpool(submit_job, "shopify.reconcile_mirror", {"store": store_label}, store=store_label, label="shopify mirror reconcile")
+        return {"job_id": job["job_id"], "status": job["status"]}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/shopify/mirror/status")
+async def api_shopify_mirror_status(store: str | None = None):
+    try:
+        store_label = _canonical_store_label(store)
+        await run_in_threadpool(ensure_shopify_mirror_fresh, store_label)
+        return {"data": await run_in_threadpool(shopify_mirror_status, store_label)}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/shopify/mirror/orders")
+async def api_shopify_mirror_orders(store: str | None = None, start: str | None = None, end: str | None = None, include_cancelled: bool = False, limit: int = 1000):
+    """Orders from the local mirror by processed_at (UTC days, inclusive); no Shopify calls."""
+    from datetime import timedelta
+    try:
+        store_label = _canonical_store_label(store)
+        await run_in_threadpool(ensure_shopify_mirror_fresh, store_label)
+        lo = datetime.fromisoformat(start) if start else None
+        hi = datetime.fromisoformat(end) if end else None
+        if hi is not None and "T" not in end:
+            hi = hi + timedelta(days=1) - timedelta(microseconds=1)
+        rows = await run_in_threadpool(
+            db.list_mirrored_orders,
+            store_label,
+            processed_min=lo,
+            processed_max=hi,
+            include_cancelled=include_cancelled,
+            limit=min(max(int(limit or 1000), 1), 10000),
+        )
+        return {"data": rows}
+    except Exception as e:
+        return {"error": str(e), "data": []}
+
+
 @app.get("/api/shopify/oauth/start")
 async def api_shopify_oauth_start(request: Request, store: str, shop: str):
     """Redirect to Shopify OAuth install screen for the given shop.
@@ -1226,27 +1309,11 @@ async def create_test(
 
     # Save uploaded images (if any) and include absolute URLs in payload
     uploaded_urls: List[str] = []
-    # Determine base URL: prefer env BASE_URL if set, otherwise derive from request
-    # Build absolute base from forwarded headers to preserve https scheme on Cloud Run
-    f_proto = request.headers.get("x-forwarded-proto")
-    f_host = request.headers.get("x-forwarded-host")
-    host = f_host or request.headers.get("host")
-    scheme = f_proto or request.url.scheme
-    req_base = f"{scheme}://{host}" if host else str(request.base_url).rstrip("/")
-    # Prefer explicit BASE_URL only if it's non-local; otherwise use computed base
-    if BASE_URL and ("localhost" not in BASE_URL and "127.0.0.1" not in BASE_URL):
-        abs_base = BASE_URL.rstrip("/")
-    else:
-        abs_base = req_base
     for i, f in enumerate(images or []):
         filename = f"{test_id}_{i}_{f.filename}"
         url_path = save_file(filename, await f.read())  # returns /uploads/...
-        # Construct absolute, URL-encoded URL so external services can fetch it directly (no redirects)
-        encoded_path = quote(url_path, safe="/:")
-        if abs_base.endswith("/"):
-            uploaded_urls.append(f"{abs_base[:-1]}{encoded_path}")
-        else:
-            uploaded_urls.append(f"{abs_base}{encoded_path}")
+        # Absolute, URL-encoded URL so external services can fetch it directly (no redirects)
+        uploaded_urls.append(public_upload_url(url_path, request))
 
     if uploaded_urls:
         payload["uploaded_images"] = uploaded_urls
@@ -1281,7 +1348,7 @@ async def create_test(
 
 @app.get("/api/tests/{test_id}")
 async def get_test(test_id: str, slim: bool | None = False):
-    t = db.get_test(test_id)
+    t = await db_async.get_test(test_id)
     if not t:
         return {"error": "not_found"}
     if slim:
@@ -1297,68 +1364,31 @@ async def get_test(test_id: str, slim: bool | None = False):
 
 
 @app.get("/api/tests")
-async def list_tests(limit: int | None = None):
+async def list_tests(request: Request, limit: int | None = None, store: str | None = None, cursor: str | None = None, status: str | None = None, flow_type: str | None = None, fields: str | None = None):
     try:
         # Cap and default limit to keep payload small and fast
         eff_limit = min(max(limit or 48, 1), 100)
-        items = db.list_tests_light(limit=eff_limit)
-
-        # Quick regex to find first Shopify CDN image URL without parsing large JSON
-        shopify_re = re.compile(r"https://cdn\\.shopify\\.com[^\s\"']+", re.IGNORECASE)
 
-        slim: list[dict] = []
-        for it in items:
-            image: str | None = None
-            try:
-                rj = it.get("result_json") or ""
-                m = shopify_re.search(rj)
-                if m:
-                    image = m.group(0)
-            except Exception:
-                image = None
-            # If not found in result, try payload (e.g., saved flow nodes)
-            if not image:
-                try:
-                    pj = it.get("payload_json") or ""
-                    m2 = shopify_re.search(pj)
-                    if m2:
-                        image = m2.group(0)
-                except Exception:
-                    image = None
-
-            # As a last resort, if still no image, try explicit 'card_image' in payload
-            if not image:
-                try:
-                    p_explicit = it.get("payload_json")
-                    if p_explicit:
-                        p_obj = json.loads(p_explicit)
-                        ci = (p_obj or {}).get("card_image")
-                        if isinstance(ci, str) and ci.startswith("https://cdn.shopify.com"):
-                            image = ci
-                except Exception:
-                    pass
+        async def _page():
+            items = await run_in_threadpool(db.list_tests_light, limit=eff_limit, store=store, cursor=cursor, status=status, flow_type=flow_type)
+            slim: list[dict] = []
+            for it in items:
+                slim.append({
+                    "id": it.get("id"),
+                    "status": it.get("status"),
+                    "page_url": it.get("page_url"),
+                    "created_at": it.get("created_at"),
+                    "payload": {"title": it.get("title")},
+                    # Only Shopify-hosted images are ever stored for tests; never local uploads
+                    "card_image": it.get("card_image"),
+                })
+            next_cursor = db.keyset_cursor(items[-1]) if len(items) == eff_limit else None
+            return {"data": list_pages.sparse(slim, fields), "next_cursor": next_cursor}
 
-            # Extract only the minimal title from payload
-            title_only = None
-            try:
-                p_raw = it.get("payload_json")
-                if p_raw:
-                    p = json.loads(p_raw)
-                    if isinstance(p, dict):
-                        title_only = {"title": p.get("title")}
-            except Exception:
-                title_only = None
-
-            slim.append({
-                "id": it.get("id"),
-                "status": it.get("status"),
-                "page_url": it.get("page_url"),
-                "created_at": it.get("created_at"),
-                "payload": title_only,
-                # Only expose Shopify-hosted images; never local uploads
-                "card_image": image,
-            })
-        return {"data": slim}
+        return await list_pages.conditional(
+            request, lambda: db.tests_list_version(store, status=status, flow_type=flow_type), _page,
+            limit=eff_limit, store=store, cursor=cursor, status=status, flow_type=flow_type, fields=fields,
+        )
     except Exception as e:
         return {"error": str(e), "data": []}
 
@@ -2045,13 +2075,21 @@ def _ads_warm_utm_orders_sync(store_list: list[str | None], start: str, end: str
             shopify_logger.warning("ads_mgmt.utm_warm_failed store=%s err=%s", st, e)
 
 
+def _ads_warm_utm_orders_job(job_id: str, params: dict) -> None:
+    # The UTM order cache is DB-backed, so warming it on a worker serves every API instance.
+    _ads_warm_utm_orders_sync(params.get("stores") or [], params["start"], params["end"])
+
+
+register_job("ads.warm_utm_orders", _ads_warm_utm_orders_job, queue="warm", priority=9)
+
+
 @app.post("/api/ads-management/utm-orders/warm")
-async def api_ads_management_utm_orders_warm(req: AdsManagementUtmWarmRequest, background_tasks: BackgroundTasks):
+async def api_ads_management_utm_orders_warm(req: AdsManagementUtmWarmRequest):
     try:
         store_list = [_canonical_store_label(s) for s in (req.stores or []) if str(s or "").strip()]
         if not store_list:
             store_list = [_canonical_store_label(req.store) or "irrakids"]
-        background_tasks.add_task(_ads_warm_utm_orders_sync, store_list, req.start, req.end)
+        await run_in_threadpool(submit_job, "ads.warm_utm_orders", {"stores": store_list, "start": req.start, "end": req.end}, label="utm warm")
         return {"ok": True, "queued": True, "stores": store_list}
     except Exception as e:
         return {"error": str(e), "queued": False}
@@ -2215,10 +2253,22 @@ async def api_upsert_campaign_meta(req: CampaignMetaUpsertRequest):
 
 
 @app.get("/api/campaign_meta")
-async def api_list_campaign_meta(store: str | None = None, include_timeline: bool = True):
+async def api_list_campaign_meta(request: Request, store: str | None = None, include_timeline: bool = True, limit: int | None = None, cursor: str | None = None, fields: str | None = None):
+    """All campaign meta keyed by campaign_key, or one page of it (most recently updated first) when ``limit`` is set."""
     try:
-        items = db.list_campaign_meta(store, include_timeline=bool(include_timeline))
-        return {"data": items}
+        eff = None if limit is None else min(max(limit, 1), 500)
+
+        async def _page():
+            if eff is None:
+                items, next_cursor = await db_async.list_campaign_meta(store, include_timeline=bool(include_timeline)), None
+            else:
+                items, next_cursor = await run_in_threadpool(db.list_campaign_meta_page, store, limit=eff, cursor=cursor, include_timeline=bool(include_timeline))
+            return {"data": list_pages.sparse(items, fields), "next_cursor": next_cursor}
+
+        return await list_pages.conditional(
+            request, lambda: db.campaign_meta_list_version(store), _page,
+            store=store, include_timeline=bool(include_timeline), limit=eff, cursor=cursor, fields=fields,
+        )
     except Exception as e:
         return {"error": str(e), "data": {}}
 
@@ -2432,7 +2482,7 @@ async def _ads_management_bundle_compute(acct, date_preset, start, end, store, p
 
     async def _fetch_mappings():
         try:
-            return db.list_campaign_mappings(store)
+            return await db_async.list_campaign_mappings(store)
         except Exception:
             return {}
 
@@ -2440,13 +2490,13 @@ async def _ads_management_bundle_compute(acct, date_preset, start, end, store, p
         try:
             # The table only needs list-view fields and task badge counts. Large
             # analysis timelines are fetched for one campaign when its modal opens.
-            return db.list_campaign_meta(store, include_timeline=False)
+            return await db_async.list_campaign_meta(store, include_timeline=False)
         except Exception:
             return {}
 
     async def _fetch_product_life_instructions():
         try:
-            data = db.get_app_setting(store, "product_life_instructions")
+            data = await db_async.get_app_setting(store, "product_life_instructions")
             if not isinstance(data, dict):
                 data = {"phases": {"testing": [], "action1": [], "micro_scaling": [], "macro_scaling": []}}
             return data
@@ -2469,8 +2519,7 @@ async def _ads_management_bundle_compute(acct, date_preset, start, end, store, p
 
 
 # -------- Campaign AI Analyzer (async job pattern) --------
-# In-memory job store: { job_id: { status, result, error } }
-_analysis_jobs: Dict[str, Dict[str, Any]] = {}
+# Jobs run through app.job_runner; status/result are persisted, so polls work on any instance.
 
 class CampaignAnalyzeRequest(BaseModel):
     campaign_id: Optional[str] = None
@@ -2539,7 +2588,7 @@ def _analysis_landing_urls(ad_creatives: list, product_info: dict, store: str |
 
 
 def _run_analysis_job(job_id: str, req_data: dict):
-    """Run the full analysis pipeline in a background thread."""
+    """Run the full analysis pipeline as a background job; returns the analysis."""
     try:
         cids = req_data.get("cids", [])
         pid = req_data.get("pid", "")
@@ -2611,12 +2660,13 @@ def _run_analysis_job(job_id: str, req_data: dict):
         try:
             ck = campaign_key or (cids[0] if cids else "")
             if ck:
-                meta = db.get_app_setting(store, f"campaign_meta:{ck}")
+                meta = db.get_campaign_meta(store, ck, include_timeline=False)
                 if isinstance(meta, dict):
                     # Get saved checks
                     saved_checks = meta.get("analysis_checks") or {}
                     # Find the most recent analysis from timeline
-                    timeline = meta.get("timeline") or []
+                    last_analysis = db.last_campaign_timeline_entry(store, ck, kind="analysis")
+                    timeline = [last_analysis] if last_analysis else []
                     prev_analysis = None
                     for entry in reversed(timeline):
                         try:
@@ -2729,39 +2779,44 @@ def _run_analysis_job(job_id: str, req_data: dict):
                     "age_days": campaign_age_days,
                     "analysis": result,
                 }, ensure_ascii=False)
-                db.append_campaign_timeline(store, ck, timeline_text)
+                db.append_campaign_timeline(store, ck, timeline_text, return_meta=False)
                 # Reset analysis checks for the new analysis
                 db.set_campaign_meta(store, ck, {"analysis_checks": {}})
         except Exception as save_err:
             logger.warning("Failed to save analysis to timeline: %s", save_err)
 
-        _analysis_jobs[job_id] = {"status": "done", "result": result}
-    except Exception as e:
+        return result
+    except Exception:
         import traceback
         traceback.print_exc()
-        _analysis_jobs[job_id] = {"status": "error", "error": str(e)}
+        raise
+
+
+def _job_poll_status(job_id: str) -> dict:
+    """Legacy poll shape: {status: 'pending'|'done'|'error', result?, error?}."""
+    job = get_job(job_id)
+    if not job:
+        return {"status": "not_found", "error": "Job not found"}
+    status = str(job.get("status") or "")
+    if status == "done":
+        return {"status": "done", "result": job.get("result")}
+    if status == "error":
+        return {"status": "error", "error": job.get("error")}
+    return {"status": "pending"}
+
+
+register_job("campaign.analysis", _run_analysis_job, queue="interactive", priority=3)
 
 
 @app.post("/api/campaign/analyze")
 async def api_campaign_analyze(req: CampaignAnalyzeRequest):
     """Start AI-powered campaign analysis as a background job. Returns job_id immediately."""
-    import threading
-    from uuid import uuid4
     try:
         cids = req.campaign_ids or ([req.campaign_id] if req.campaign_id else [])
         cids = [str(c).strip() for c in cids if str(c or "").strip()]
         if not cids:
             return {"error": "campaign_id or campaign_ids required"}
 
-        job_id = str(uuid4())
-        _analysis_jobs[job_id] = {"status": "pending"}
-
-        # Clean old jobs (keep last 50)
-        if len(_analysis_jobs) > 60:
-            keys = list(_analysis_jobs.keys())
-            for old_key in keys[:len(keys) - 50]:
-                _analysis_jobs.pop(old_key, None)
-
         pid = (req.product_id or "").strip()
         store = req.store or None
         dr = req.date_range or {}
@@ -2780,18 +2835,8 @@ async def api_campaign_analyze(req: CampaignAnalyzeRequest):
             "campaign_name": (req.campaign_name or "").strip(),
         }
 
-        def _tracked_analysis(_jid: str, _rd: dict):
-            _sh.register_inflight(f"analysis:{_jid}", "campaign_analysis", store=(_rd or {}).get("store"), label=f"analysis {_jid}")
-            try:
-                with _sh.time_op("pipeline", "run_analysis_job", store=(_rd or {}).get("store")):
-                    _run_analysis_job(_jid, _rd)
-            finally:
-                _sh.clear_inflight(f"analysis:{_jid}")
-
-        thread = threading.Thread(target=_tracked_analysis, args=(job_id, req_data), daemon=True)
-        thread.start()
-
-        return {"job_id": job_id}
+        job = await run_in_threadpool(submit_job, "campaign.analysis", req_data, store=store, label=f"analysis {','.join(cids)[:40]}")
+        return {"job_id": job["job_id"]}
     except Exception as e:
         return {"error": str(e)}
 
@@ -2799,10 +2844,7 @@ async def api_campaign_analyze(req: CampaignAnalyzeRequest):
 @app.get("/api/campaign/analyze/status/{job_id}")
 async def api_campaign_analyze_status(job_id: str):
     """Poll for analysis job status. Returns {status: 'pending'|'done'|'error', result?, error?}"""
-    job = _analysis_jobs.get(job_id)
-    if not job:
-        return {"status": "not_found", "error": "Job not found"}
-    return job
+    return await run_in_threadpool(_job_poll_status, job_id)
 
 
 class ClarityCampaignDebugRequest(BaseModel):
@@ -2828,63 +2870,42 @@ async def api_clarity_campaign_debug(req: ClarityCampaignDebugRequest):
 
 
 # -------- Action Task Agent (generate tasks from multiple analyses) --------
-_action_task_jobs: Dict[str, Dict[str, Any]] = {}
-
 
 class GenerateActionTasksRequest(BaseModel):
     analyses: list  # list of campaign analysis results
     store: Optional[str] = None
 
 
-def _run_action_task_job(job_id: str, analyses: list, store: str | None):
-    """Run the action task generation in a background thread."""
+def _run_action_task_job(job_id: str, params: dict):
+    """Run the action task generation as a background job; returns the tasks."""
+    store = params.get("store")
+    result = run_action_task_generation(analyses=params.get("analyses") or [])
+    # Save tasks to DB
     try:
-        result = run_action_task_generation(analyses=analyses)
-        # Save tasks to DB
-        try:
-            db.set_app_setting(store, "action_tasks", result)
-        except Exception as save_err:
-            logger.warning("Failed to save action tasks: %s", save_err)
-        _action_task_jobs[job_id] = {"status": "done", "result": result}
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        _action_task_jobs[job_id] = {"status": "error", "error": str(e)}
+        db.set_app_setting(store, "action_tasks", result)
+    except Exception as save_err:
+        logger.warning("Failed to save action tasks: %s", save_err)
+    return result
+
+
+register_job("campaign.action_tasks", _run_action_task_job, queue="interactive", priority=3)
 
 
 @app.post("/api/campaign/generate_action_tasks")
 async def api_generate_action_tasks(req: GenerateActionTasksRequest):
     """Start action task generation as a background job."""
-    import threading
-    from uuid import uuid4
     try:
         if not req.analyses or not isinstance(req.analyses, list):
             return {"error": "analyses list required"}
 
-        job_id = str(uuid4())
-        _action_task_jobs[job_id] = {"status": "pending"}
-
-        # Clean old jobs
-        if len(_action_task_jobs) > 30:
-            keys = list(_action_task_jobs.keys())
-            for old_key in keys[:len(keys) - 20]:
-                _action_task_jobs.pop(old_key, None)
-
-        def _tracked_action_tasks(_jid: str, _analyses, _store):
-            _sh.register_inflight(f"action_tasks:{_jid}", "action_tasks", store=_store, label=f"action_tasks {_jid}")
-            try:
-                with _sh.time_op("pipeline", "run_action_task_job", store=_store):
-                    _run_action_task_job(_jid, _analyses, _store)
-            finally:
-                _sh.clear_inflight(f"action_tasks:{_jid}")
-
-        thread = threading.Thread(
-            target=_tracked_action_tasks,
-            args=(job_id, req.analyses, req.store),
-            daemon=True,
+        job = await run_in_threadpool(
+            submit_job,
+            "campaign.action_tasks",
+            {"analyses": req.analyses, "store": req.store},
+            store=req.store,
+            label="action_tasks",
         )
-        thread.start()
-        return {"job_id": job_id}
+        return {"job_id": job["job_id"]}
     except Exception as e:
         return {"error": str(e)}
 
@@ -2892,10 +2913,7 @@ async def api_generate_action_tasks(req: GenerateActionTasksRequest):
 @app.get("/api/campaign/generate_action_tasks/status/{job_id}")
 async def api_action_task_status(job_id: str):
     """Poll for action task generation status."""
-    job = _action_task_jobs.get(job_id)
-    if not job:
-        return {"status": "not_found", "error": "Job not found"}
-    return job
+    return await run_in_threadpool(_job_poll_status, job_id)
 
 
 @app.get("/api/campaign/action_tasks")
@@ -2961,274 +2979,411 @@ def _extract_product_id_from_name(name: str | None) -> str | None:
         return None
 
 
-def _run_bulk_analysis_job(job_id: str, store: str | None, ad_accounts: list[str] | None, s_date: str, e_date: str):
-    """Run the full analyze-all pipeline in a background thread.
-    
-    This thread is non-daemon and persists job state to DB, so it
-    survives browser close and can be polled later.
-    """
-    logger = logging.getLogger("bulk_analysis")
+_BULK_PREFETCH_WORKERS = int(os.getenv("PTOS_BULK_PREFETCH_WORKERS", "6") or "6")
+_BULK_LLM_WORKERS = int(os.getenv("PTOS_BULK_LLM_WORKERS", "4") or "4")
+_BULK_STALE_S = int(os.getenv("PTOS_BULK_ANALYSIS_STALE_S", "600") or "600")
+_BULK_HEARTBEAT_S = 30
+
+
+def _bulk_group_campaigns(active_campaigns: list[dict], mappings: dict) -> list[dict]:
+    """Group active campaigns by product ID (manual mapping first, then the name)."""
+    by_pid: dict[str, list] = {}
+    ungrouped: list = []
+    for c in active_campaigns:
+        cid = str(c.get("campaign_id") or "")
+        name = str(c.get("name") or "")
+        pid = None
+        # Check manual mapping first
+        for key in (cid, name):
+            if not key:
+                continue
+            m = mappings.get(key)
+            if m and m.get("kind") == "product" and m.get("id"):
+                pid = str(m.get("id") or m.get("target_id") or "")
+                break
+        # Fallback to extracting from name
+        if not pid:
+            pid = _extract_product_id_from_name(name)
+        if pid:
+            by_pid.setdefault(pid, []).append(c)
+        else:
+            ungrouped.append(c)
+
+    # For ungrouped campaigns, treat each as its own "group"
+    all_groups: list[dict] = []
+    for pid, rows in by_pid.items():
+        all_groups.append({"product_id": pid, "campaigns": rows})
+    for c in ungrouped:
+        fake_pid = str(c.get("campaign_id") or c.get("name") or "")
+        all_groups.append({"product_id": fake_pid, "campaigns": [c]})
+    return all_groups
+
+
+def _bulk_prefetch_shared(store: str | None, pids: list[str], s_date: str, e_date: str) -> dict:
+    """Batch the Shopify reads that accept many product IDs at once."""
+    numeric = [p for p in dict.fromkeys(pids) if p and p.isdigit()]
+    out: dict = {"briefs": {}, "orders": {}}
+    if not numeric:
+        return out
+    from app.integrations.shopify_client import count_orders_by_product_or_variant_processed_batch
+
+    def _briefs():
+        return get_products_brief(numeric, store=store) or {}
+
+    def _orders():
+        return count_orders_by_product_or_variant_processed_batch(numeric, s_date, e_date, store=store, include_closed=True) or {}
+
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        briefs_future = ex.submit(_briefs)
+        orders_future = ex.submit(_orders)
+        try:
+            out["briefs"] = briefs_future.result()
+        except Exception as e:
+            logging.getLogger("bulk_analysis").warning("Bulk prefetch: product briefs failed: %s", e)
+        try:
+            out["orders"] = orders_future.result()
+        except Exception as e:
+            logging.getLogger("bulk_analysis").warning("Bulk prefetch: order counts failed: %s", e)
+    return out
+
+
+def _analysis_product_info(store: str | None, pid: str, brief: dict) -> dict:
+    """Product context bulk analysis gives the analyzer; the Phase-1 memo key is derived from it."""
+    from app.rate_limits import provider_slot
+
+    product_info: dict = {
+        "price": brief.get("price"),
+        "image_url": brief.get("image") or "",
+        "inventory": brief.get("total_available"),
+    }
     try:
-        # --- Step 1: Save initial state ---
-        db.save_bulk_analysis_job(store, job_id, {
-            "status": "fetching_campaigns",
-            "progress": {"done": 0, "total": 0, "phase": "fetching"},
-        })
+        from app.integrations.shopify_client import _rest_get_store
+        with provider_slot("shopify"):
+            prod_data = _rest_get_store(store, f"/products/{pid}.json?fields=id,title,body_html,handle,status")
+        prod = (prod_data or {}).get("product") or {}
+        product_info["title"] = prod.get("title") or ""
+        product_info["description"] = prod.get("body_html") or ""
+        product_info["handle"] = prod.get("handle") or ""
+        try:
+            from app.integrations.shopify_client import _get_store_config
+            cfg = _get_store_config(store)
+            shop_domain = cfg.get("SHOP", "")
+            if shop_domain and product_info.get("handle"):
+                product_info["product_url"] = f"https://{shop_domain}/products/{product_info['handle']}"
+        except Exception:
+            pass
+    except Exception:
+        pass
+    return product_info
 
-        # --- Step 2: Fetch all campaigns from Meta ---
-        accounts: list[str | None] = []
-        for raw in (ad_accounts or []):
-            acct = _normalize_ad_acct_id(raw)
-            if acct and acct not in accounts:
-                accounts.append(acct)
-        if not accounts:
+
+def _bulk_prefetch_group(group: dict, store: str | None, s_date: str, e_date: str, shared: dict) -> dict:
+    """Stage 1: gather Meta/Shopify/Clarity inputs for one product group (no LLM)."""
+    from app.rate_limits import provider_slot
+    logger = logging.getLogger("bulk_analysis")
+    pid = group["product_id"]
+    rows = group["campaigns"]
+
+    # Aggregate metrics across all campaigns in the group
+    total_spend = sum(float(c.get("spend", 0) or 0) for c in rows)
+    total_purchases = sum(int(c.get("purchases", 0) or 0) for c in rows)
+    total_atc = sum(int(c.get("add_to_cart", 0) or 0) for c in rows)
+    # Weighted average CTR
+    ctr_val = None
+    try:
+        ctr_sum = sum(float(c.get("ctr", 0) or 0) * float(c.get("spend", 0) or 0) for c in rows)
+        if total_spend > 0:
+            ctr_val = ctr_sum / total_spend
+    except Exception:
+        pass
+    cpp_val = (total_spend / total_purchases) if total_purchases > 0 else None
+
+    # Campaign age from first campaign's created_time
+    age_days = None
+    for c in rows:
+        ct = c.get("created_time")
+        if ct:
             try:
-                conf = db.get_app_setting(store, "meta_ad_account")
-                acct = _normalize_ad_acct_id(((conf or {}).get("id") if isinstance(conf, dict) else None))
-                if acct:
-                    accounts.append(acct)
+                from datetime import datetime as _dt
+                diff = _dt.utcnow() - _dt.fromisoformat(str(ct).replace("Z", "+00:00").replace("+00:00", ""))
+                age_days = max(0, diff.days)
             except Exception:
                 pass
-        if not accounts:
-            accounts = [None]
-
-        campaigns: list[dict] = []
-        seen_campaigns: set[str] = set()
-        for acct in accounts:
-            try:
-                rows = list_active_campaigns_with_insights(
-                    "last_7d",
-                    ad_account_id=acct or None,
-                    since=s_date,
-                    until=e_date,
-                ) or []
-            except Exception as fetch_err:
-                logger.warning("Bulk analysis failed fetching campaigns for account %s: %s", acct, fetch_err)
-                rows = []
-            for c in rows:
-                cid = str((c or {}).get("campaign_id") or (c or {}).get("name") or "")
-                dedupe_key = f"{acct or ''}:{cid}"
-                if not cid or dedupe_key in seen_campaigns:
-                    continue
-                seen_campaigns.add(dedupe_key)
-                campaigns.append({**c, "_ad_account": acct})
+            break
 
-        # --- Step 3: Filter to ACTIVE campaigns ---
-        active_campaigns = [
-            c for c in campaigns
-            if str(c.get("status", "")).upper() == "ACTIVE"
-        ]
+    # Fetch ad creatives from first campaign
+    ad_creatives = []
+    try:
+        cid0 = str(rows[0].get("campaign_id", ""))
+        if cid0:
+            with provider_slot("meta"):
+                ad_creatives = get_campaign_ad_creatives(cid0) or []
+    except Exception:
+        pass
 
-        if not active_campaigns:
-            db.save_bulk_analysis_job(store, job_id, {
-                "status": "done",
-                "progress": {"done": 0, "total": 0, "phase": "done"},
-                "result": {"message": "No active campaigns found", "task_count": 0},
-            })
-            return
+    # Fetch product info
+    product_info: dict = {}
+    if pid and pid.isdigit():
+        brief = ((shared or {}).get("briefs") or {}).get(pid) or {}
+        product_info = _analysis_product_info(store, pid, brief)
 
-        # --- Step 4: Group campaigns by product ID ---
-        mappings = {}
+    # Shopify orders count
+    shopify_orders = None
+    if pid and pid.isdigit():
         try:
-            mappings = db.list_campaign_mappings(store) or {}
+            shopify_orders = int((((shared or {}).get("orders") or {}).get(pid, 0)) or 0)
         except Exception:
             pass
 
-        by_pid: dict[str, list] = {}
-        ungrouped: list = []
-        for c in active_campaigns:
-            cid = str(c.get("campaign_id") or "")
-            name = str(c.get("name") or "")
-            pid = None
-            # Check manual mapping first
-            for key in (cid, name):
-                if not key:
-                    continue
-                m = mappings.get(key)
-                if m and m.get("kind") == "product" and m.get("id"):
-                    pid = str(m.get("id") or m.get("target_id") or "")
-                    break
-            # Fallback to extracting from name
-            if not pid:
-                pid = _extract_product_id_from_name(name)
-            if pid:
-                by_pid.setdefault(pid, []).append(c)
-            else:
-                ungrouped.append(c)
+    true_cpp = (total_spend / shopify_orders) if shopify_orders and shopify_orders > 0 else None
+
+    campaign_metrics = {
+        "spend": total_spend,
+        "purchases": total_purchases,
+        "ctr": ctr_val,
+        "cpp": cpp_val,
+        "add_to_cart": total_atc,
+        "shopify_orders": shopify_orders,
+        "true_cpp": true_cpp,
+        "status": "Active",
+    }
+    if age_days is not None:
+        campaign_metrics["campaign_age_days"] = age_days
 
-        # For ungrouped campaigns, treat each as its own "group"
-        all_groups: list[dict] = []
-        for pid, rows in by_pid.items():
-            all_groups.append({"product_id": pid, "campaigns": rows})
-        for c in ungrouped:
-            fake_pid = str(c.get("campaign_id") or c.get("name") or "")
-            all_groups.append({"product_id": fake_pid, "campaigns": [c]})
+    clarity_insights: dict = {}
+    try:
+        first_row = rows[0] if rows else {}
+        with provider_slot("clarity"):
+            clarity_insights = summarize_clarity_for_campaign(
+                campaign_id=str(first_row.get("campaign_id") or ""),
+                campaign_name=str(first_row.get("name") or product_info.get("title") or ""),
+                landing_urls=_analysis_landing_urls(ad_creatives, product_info, store),
+                num_days=_clarity_days_for_range(s_date, e_date),
+            )
+    except Exception as clarity_err:
+        logger.warning("Failed to summarize Clarity data for bulk group %s: %s", pid, clarity_err)
+        clarity_insights = {"enabled": False, "error": str(clarity_err)}
 
-        total_groups = len(all_groups)
-        db.save_bulk_analysis_job(store, job_id, {
-            "status": "analyzing",
-            "progress": {"done": 0, "total": total_groups, "phase": "analyzing"},
-        })
+    return {
+        "campaign_metrics": campaign_metrics,
+        "ad_creatives": ad_creatives,
+        "product_info": product_info,
+        "clarity_insights": clarity_insights,
+        "age_days": age_days,
+    }
 
-        # --- Step 5: Analyze each group ---
-        all_analyses: list[dict] = []
-        for idx, group in enumerate(all_groups):
-            pid = group["product_id"]
-            rows = group["campaigns"]
-            try:
-                # Aggregate metrics across all campaigns in the group
-                total_spend = sum(float(c.get("spend", 0) or 0) for c in rows)
-                total_purchases = sum(int(c.get("purchases", 0) or 0) for c in rows)
-                total_atc = sum(int(c.get("add_to_cart", 0) or 0) for c in rows)
-                # Weighted average CTR
-                ctr_val = None
-                try:
-                    ctr_sum = sum(float(c.get("ctr", 0) or 0) * float(c.get("spend", 0) or 0) for c in rows)
-                    if total_spend > 0:
-                        ctr_val = ctr_sum / total_spend
-                except Exception:
-                    pass
-                cpp_val = (total_spend / total_purchases) if total_purchases > 0 else None
 
-                # Campaign age from first campaign's created_time
-                age_days = None
-                for c in rows:
-                    ct = c.get("created_time")
-                    if ct:
-                        try:
-                            from datetime import datetime as _dt
-                            diff = _dt.utcnow() - _dt.fromisoformat(str(ct).replace("Z", "+00:00").replace("+00:00", ""))
-                            age_days = max(0, diff.days)
-                        except Exception:
-                            pass
-                        break
+def _bulk_analyze_group(group: dict, inputs: dict) -> dict:
+    """Stage 2: run the two LLM phases for one prefetched group."""
+    pid = group["product_id"]
+    rows = group["campaigns"]
+    product_info = inputs.get("product_info") or {}
+    result = run_campaign_analysis(
+        campaign_metrics=inputs.get("campaign_metrics") or {},
+        ad_creatives=inputs.get("ad_creatives") or [],
+        product_info=product_info,
+        clarity_insights=inputs.get("clarity_insights") or {},
+    )
+    result["meta_inputs"] = inputs.get("campaign_metrics") or {}
+    result["product_info_input"] = {k: v for k, v in product_info.items() if k != "description"}
+    result["clarity_insights_input"] = inputs.get("clarity_insights") or {}
+    result["campaign_name"] = product_info.get("title") or rows[0].get("name") or pid
+    result["campaign_key"] = pid
+    result["product_id"] = pid
+    result["campaign_ids"] = [str(c.get("campaign_id", "")) for c in rows]
+    result["age_days"] = inputs.get("age_days")
+    return result
 
-                # Fetch ad creatives from first campaign
-                ad_creatives = []
-                try:
-                    cid0 = str(rows[0].get("campaign_id", ""))
-                    if cid0:
-                        ad_creatives = get_campaign_ad_creatives(cid0) or []
-                except Exception:
-                    pass
 
-                # Fetch product info
-                product_info: dict = {}
-                if pid and pid.isdigit():
-                    try:
-                        briefs = get_products_brief([pid], store=store)
-                        brief = (briefs or {}).get(pid) or {}
-                        product_info["price"] = brief.get("price")
-                        product_info["image_url"] = brief.get("image") or ""
-                        product_info["inventory"] = brief.get("total_available")
-                    except Exception:
-                        pass
-                    try:
-                        from app.integrations.shopify_client import _rest_get_store
-                        prod_data = _rest_get_store(store, f"/products/{pid}.json?fields=id,title,body_html,handle,status")
-                        prod = (prod_data or {}).get("product") or {}
-                        product_info["title"] = prod.get("title") or ""
-                        product_info["description"] = prod.get("body_html") or ""
-                        product_info["handle"] = prod.get("handle") or ""
-                        try:
-                            from app.integrations.shopify_client import _get_store_config
-                            cfg = _get_store_config(store)
-                            shop_domain = cfg.get("SHOP", "")
-                            if shop_domain and product_info.get("handle"):
-                                product_info["product_url"] = f"https://{shop_domain}/products/{product_info['handle']}"
-                        except Exception:
-                            pass
-                    except Exception:
-                        pass
+def _bulk_checkpoint_group(store: str | None, job_id: str, group: dict, result: dict) -> None:
+    """Stage 3: persist one group's analysis (campaign timelines + job checkpoint)."""
+    logger = logging.getLogger("bulk_analysis")
+    # Save the group analysis on each concrete campaign. Product-group
+    # timelines are retired in favor of per-campaign daily activity.
+    try:
+        timeline_text = json.dumps({
+            "type": "analysis",
+            "verdict": result.get("overall_verdict", ""),
+            "confidence": result.get("confidence_level", ""),
+            "summary": result.get("summary", ""),
+            "age_days": result.get("age_days"),
+            "analysis": result,
+            "source": "bulk_analyze_all",
+            "job_id": job_id,
+        }, ensure_ascii=False)
+        for campaign in group["campaigns"]:
+            campaign_key = str(campaign.get("campaign_id") or campaign.get("name") or "").strip()
+            if campaign_key:
+                db.append_campaign_timeline(store, campaign_key, timeline_text, return_meta=False)
+    except Exception as te:
+        logger.warning("Failed to save bulk analysis to campaign timelines: %s", te)
+    db.save_bulk_analysis_group_result(store, job_id, group["product_id"], result)
+
+
+def _run_bulk_analysis_job(job_id: str, store: str | None, ad_accounts: list[str] | None, s_date: str, e_date: str, *, resume: bool = False):
+    """Run the full analyze-all pipeline in a background thread.
+
+    This thread is non-daemon and persists job state to DB, so it
+    survives browser close and can be polled later. Groups are processed as a
+    staged pipeline (prefetch inputs -> bounded LLM pool -> checkpoint), and
+    every finished group is checkpointed so ``resume=True`` (e.g. after an
+    instance restart) only analyzes the groups that were still pending.
+    A ticker thread persists the heartbeat for the whole run, whichever
+    process or worker executes it.
+    """
+    logger = logging.getLogger("bulk_analysis")
+    heartbeat_stop = threading.Event()
+
+    def _heartbeat() -> None:
+        while not heartbeat_stop.wait(_BULK_HEARTBEAT_S):
+            try:
+                db.touch_bulk_analysis_heartbeat(store, job_id)
+            except Exception as e:
+                logger.warning("Bulk analysis heartbeat failed for %s: %s", job_id, e)
+
+    db.touch_bulk_analysis_heartbeat(store, job_id)
+    threading.Thread(target=_heartbeat, name=f"bulk-heartbeat-{job_id[:8]}", daemon=True).start()
+    try:
+        saved = (db.get_bulk_analysis_job(store, job_id) or {}) if resume else {}
+        all_groups: list[dict] = saved.get("groups") if isinstance(saved.get("groups"), list) else []
 
-                # Shopify orders count
-                shopify_orders = None
+        if not all_groups:
+            # --- Step 1: Save initial state ---
+            db.patch_bulk_analysis_job(store, job_id, {
+                "status": "fetching_campaigns",
+                "progress": {"done": 0, "total": 0, "phase": "fetching"},
+                "date_range": {"start": s_date, "end": e_date},
+                "ad_accounts": list(ad_accounts or []),
+            })
+
+            # --- Step 2: Fetch all campaigns from Meta ---
+            accounts: list[str | None] = []
+            for raw in (ad_accounts or []):
+                acct = _normalize_ad_acct_id(raw)
+                if acct and acct not in accounts:
+                    accounts.append(acct)
+            if not accounts:
                 try:
-                    if pid and pid.isdigit():
-                        from app.integrations.shopify_client import count_orders_by_product_or_variant_processed_batch
-                        oc = count_orders_by_product_or_variant_processed_batch([pid], s_date, e_date, store=store, include_closed=True) or {}
-                        shopify_orders = int(oc.get(pid, 0) or 0)
+                    conf = db.get_app_setting(store, "meta_ad_account")
+                    acct = _normalize_ad_acct_id(((conf or {}).get("id") if isinstance(conf, dict) else None))
+                    if acct:
+                        accounts.append(acct)
                 except Exception:
                     pass
+            if not accounts:
+                accounts = [None]
+
+            campaigns: list[dict] = []
+            seen_campaigns: set[str] = set()
+            accounts_done = 0
+            # Accounts are fetched concurrently and merged as each one completes.
+            for item in iter_campaigns_for_accounts(accounts, "last_7d", since=s_date, until=e_date):
+                acct = item.get("ad_account")
+                if item.get("error"):
+                    logger.warning("Bulk analysis failed fetching campaigns for account %s: %s", acct, item.get("error"))
+                for c in (item.get("data") or []):
+                    cid = str((c or {}).get("campaign_id") or (c or {}).get("name") or "")
+                    dedupe_key = f"{acct or ''}:{cid}"
+                    if not cid or dedupe_key in seen_campaigns:
+                        continue
+                    seen_campaigns.add(dedupe_key)
+                    campaigns.append({**c, "_ad_account": acct})
+                accounts_done += 1
+                if len(accounts) > 1:
+                    db.patch_bulk_analysis_job(store, job_id, {
+                        "status": "fetching_campaigns",
+                        "progress": {"done": accounts_done, "total": len(accounts), "phase": "fetching"},
+                    })
 
-                true_cpp = (total_spend / shopify_orders) if shopify_orders and shopify_orders > 0 else None
+            # --- Step 3: Filter to ACTIVE campaigns ---
+            active_campaigns = [
+                c for c in campaigns
+                if str(c.get("status", "")).upper() == "ACTIVE"
+            ]
 
-                campaign_metrics = {
-                    "spend": total_spend,
-                    "purchases": total_purchases,
-                    "ctr": ctr_val,
-                    "cpp": cpp_val,
-                    "add_to_cart": total_atc,
-                    "shopify_orders": shopify_orders,
-                    "true_cpp": true_cpp,
-                    "status": "Active",
-                }
-                if age_days is not None:
-                    campaign_metrics["campaign_age_days"] = age_days
+            if not active_campaigns:
+                db.patch_bulk_analysis_job(store, job_id, {
+                    "status": "done",
+                    "progress": {"done": 0, "total": 0, "phase": "done"},
+                    "result": {"message": "No active campaigns found", "task_count": 0},
+                })
+                return
 
-                clarity_insights: dict = {}
-                try:
-                    first_row = rows[0] if rows else {}
-                    clarity_insights = summarize_clarity_for_campaign(
-                        campaign_id=str(first_row.get("campaign_id") or ""),
-                        campaign_name=str(first_row.get("name") or product_info.get("title") or ""),
-                        landing_urls=_analysis_landing_urls(ad_creatives, product_info, store),
-                        num_days=_clarity_days_for_range(s_date, e_date),
-                    )
-                except Exception as clarity_err:
-                    logger.warning("Failed to summarize Clarity data for bulk group %s: %s", pid, clarity_err)
-                    clarity_insights = {"enabled": False, "error": str(clarity_err)}
-
-                # Run AI analysis
-                result = run_campaign_analysis(
-                    campaign_metrics=campaign_metrics,
-                    ad_creatives=ad_creatives,
-                    product_info=product_info,
-                    clarity_insights=clarity_insights,
-                )
-                result["meta_inputs"] = campaign_metrics
-                result["product_info_input"] = {k: v for k, v in product_info.items() if k != "description"}
-                result["clarity_insights_input"] = clarity_insights
-                result["campaign_name"] = product_info.get("title") or rows[0].get("name") or pid
-                result["campaign_key"] = pid
-                result["product_id"] = pid
-                result["campaign_ids"] = [str(c.get("campaign_id", "")) for c in rows]
-
-                # Save the group analysis on each concrete campaign. Product-group
-                # timelines are retired in favor of per-campaign daily activity.
-                try:
-                    timeline_text = json.dumps({
-                        "type": "analysis",
-                        "verdict": result.get("overall_verdict", ""),
-                        "confidence": result.get("confidence_level", ""),
-                        "summary": result.get("summary", ""),
-                        "age_days": age_days,
-                        "analysis": result,
-                        "source": "bulk_analyze_all",
-                        "job_id": job_id,
-                    }, ensure_ascii=False)
-                    for campaign in rows:
-                        campaign_key = str(campaign.get("campaign_id") or campaign.get("name") or "").strip()
-                        if campaign_key:
-                            db.append_campaign_timeline(store, campaign_key, timeline_text)
-                except Exception as te:
-                    logger.warning("Failed to save bulk analysis to campaign timelines: %s", te)
+            # --- Step 4: Group campaigns by product ID ---
+            mappings = {}
+            try:
+                mappings = db.list_campaign_mappings(store) or {}
+            except Exception:
+                pass
+            all_groups = _bulk_group_campaigns(active_campaigns, mappings)
 
-                all_analyses.append(result)
+        total_groups = len(all_groups)
+        checkpoints = db.list_bulk_analysis_group_results(store, job_id) if resume else {}
+        analyses_by_pid: dict[str, dict] = {
+            str(g["product_id"]): checkpoints[str(g["product_id"])]
+            for g in all_groups if str(g["product_id"]) in checkpoints
+        }
+        pending_groups = [g for g in all_groups if str(g["product_id"]) not in analyses_by_pid]
+        done_count = total_groups - len(pending_groups)
+        db.patch_bulk_analysis_job(store, job_id, {
+            "status": "analyzing",
+            "groups": all_groups,
+            "progress": {"done": done_count, "total": total_groups, "phase": "analyzing"},
+        })
+        if resume:
+            logger.info("Bulk analysis job %s resumed: %d/%d groups already checkpointed", job_id, done_count, total_groups)
+
+        # --- Step 5: Analyze groups as a pipeline ---
+        # Shopify batch reads run once for every product, then each group is
+        # prefetched concurrently and handed to a bounded LLM pool as soon as
+        # its inputs exist. Only this thread writes job state and timelines.
+        from concurrent.futures import FIRST_COMPLETED, wait as _wait_futures
+        shared = _bulk_prefetch_shared(store, [str(g["product_id"]) for g in pending_groups], s_date, e_date) if pending_groups else {}
+        prefetch_pool = ThreadPoolExecutor(max_workers=max(1, _BULK_PREFETCH_WORKERS), thread_name_prefix=f"bulk-prefetch-{job_id[:8]}")
+        llm_pool = ThreadPoolExecutor(max_workers=max(1, _BULK_LLM_WORKERS), thread_name_prefix=f"bulk-llm-{job_id[:8]}")
+        try:
+            stages: dict = {}
+            for group in pending_groups:
+                stages[prefetch_pool.submit(_bulk_prefetch_group, group, store, s_date, e_date, shared)] = ("prefetch", group)
+            pending = set(stages)
+            while pending:
+                finished, pending = _wait_futures(pending, timeout=_BULK_HEARTBEAT_S, return_when=FIRST_COMPLETED)
+                progressed = False
+                for fut in finished:
+                    stage, group = stages.pop(fut)
+                    pid = str(group["product_id"])
+                    try:
+                        value = fut.result()
+                    except Exception as e:
+                        logger.warning("Bulk analysis failed for product group %s (%s): %s", pid, stage, e)
+                        done_count += 1
+                        progressed = True
+                        continue
+                    if stage == "prefetch":
+                        nxt = llm_pool.submit(_bulk_analyze_group, group, value)
+                        stages[nxt] = ("analyze", group)
+                        pending.add(nxt)
+                        continue
+                    try:
+                        _bulk_checkpoint_group(store, job_id, group, value)
+                        analyses_by_pid[pid] = value
+                    except Exception as e:
+                        logger.warning("Bulk analysis checkpoint failed for product group %s: %s", pid, e)
+                    done_count += 1
+                    progressed = True
+                if progressed:
+                    db.patch_bulk_analysis_job(store, job_id, {
+                        "status": "analyzing",
+                        "progress": {"done": done_count, "total": total_groups, "phase": "analyzing"},
+                    })
+        finally:
+            prefetch_pool.shutdown(wait=False, cancel_futures=True)
+            llm_pool.shutdown(wait=False, cancel_futures=True)
 
-            except Exception as e:
-                logger.warning("Bulk analysis failed for product group %s: %s", pid, e)
-                import traceback
-                traceback.print_exc()
-
-            # Update progress
-            db.save_bulk_analysis_job(store, job_id, {
-                "status": "analyzing",
-                "progress": {"done": idx + 1, "total": total_groups, "phase": "analyzing"},
-            })
+        all_analyses = [analyses_by_pid[str(g["product_id"])] for g in all_groups if str(g["product_id"]) in analyses_by_pid]
 
         if not all_analyses:
-            db.save_bulk_analysis_job(store, job_id, {
+            db.patch_bulk_analysis_job(store, job_id, {
                 "status": "done",
                 "progress": {"done": total_groups, "total": total_groups, "phase": "done"},
                 "result": {"message": "No analyses completed successfully", "task_count": 0},
@@ -3236,7 +3391,7 @@ def _run_bulk_analysis_job(job_id: str, store: str | None, ad_accounts: list[str
             return
 
         # --- Step 6: Generate action tasks from all analyses ---
-        db.save_bulk_analysis_job(store, job_id, {
+        db.patch_bulk_analysis_job(store, job_id, {
             "status": "generating_tasks",
             "progress": {"done": total_groups, "total": total_groups, "phase": "generating_tasks"},
         })
@@ -3306,14 +3461,14 @@ def _run_bulk_analysis_job(job_id: str, store: str | None, ad_accounts: list[str
                         for c in (g.get("campaigns") or []):
                             ck = str(c.get("campaign_id") or c.get("name") or "").strip()
                             if ck:
-                                db.append_campaign_timeline(store, ck, task_entry)
+                                db.append_campaign_timeline(store, ck, task_entry, return_meta=False)
                 except Exception:
                     pass
 
         # --- Step 8: Mark job done ---
         total_task_count = len(tasks)
         incomplete_count = len([t for t in tasks if not t.get("done")])
-        db.save_bulk_analysis_job(store, job_id, {
+        db.patch_bulk_analysis_job(store, job_id, {
             "status": "done",
             "progress": {"done": total_groups, "total": total_groups, "phase": "done"},
             "result": {
@@ -3325,26 +3480,112 @@ def _run_bulk_analysis_job(job_id: str, store: str | None, ad_accounts: list[str
             },
         })
 
+        # Analyses now live on the campaign timelines; drop the per-group checkpoints.
+        try:
+            db.delete_bulk_analysis_group_results(store, job_id)
+        except Exception:
+            pass
+
         # Refresh campaign meta cache
         try:
             _analysis_cache_buster = f"bulk_done_{job_id}"
         except Exception:
             pass
 
-        logger.info("Bulk analysis job %s completed: %d groups, %d analyses, %d tasks",
-                     job_id, total_groups, len(all_analyses), total_task_count)
+        logger.info("Bulk analysis job %s completed: %d groups, %d analyses, %d tasks",
+                     job_id, total_groups, len(all_analyses), total_task_count)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        try:
+            db.patch_bulk_analysis_job(store, job_id, {
+                "status": "error",
+                "error": str(e),
+                "progress": {"done": 0, "total": 0, "phase": "error"},
+            })
+        except Exception:
+            pass
+    finally:
+        heartbeat_stop.set()
+        try:
+            job = db.get_bulk_analysis_job(store, job_id) or {}
+            if str(job.get("status") or "") not in _BULK_ACTIVE_STATUSES:
+                db.delete_bulk_analysis_heartbeat(store, job_id)
+        except Exception:
+            pass
+
+
+_BULK_ACTIVE_STATUSES = ("pending", "fetching_campaigns", "analyzing", "generating_tasks")
+
+
+def _bulk_job_public(job: dict) -> dict:
+    """Job state for polling clients (the resume-only group list stays server-side)."""
+    return {k: v for k, v in (job or {}).items() if k != "groups"}
+
+
+def _bulk_job_is_stale(store: str | None, job: dict) -> bool:
+    """No progress write and no heartbeat for PTOS_BULK_ANALYSIS_STALE_S (persisted state only)."""
+    try:
+        seen = [datetime.fromisoformat(str(job.get("updated_at") or "").replace("Z", ""))]
+    except Exception:
+        return False
+    beat = db.bulk_analysis_heartbeat_at(store, str(job.get("job_id") or ""))
+    if beat is not None:
+        seen.append(beat)
+    return (datetime.utcnow() - max(seen)).total_seconds() > _BULK_STALE_S
+
+
+def _bulk_analysis_job(job_id: str, params: dict) -> dict:
+    # Progress and the final result live in the bulk_analysis_job row; the runner only tracks the attempt.
+    _run_bulk_analysis_job(
+        params["bulk_job_id"],
+        params.get("store"),
+        params.get("ad_accounts") or [],
+        params.get("s_date") or "",
+        params.get("e_date") or "",
+        resume=bool(params.get("resume")),
+    )
+    return {"bulk_job_id": params["bulk_job_id"]}
+
+
+register_job("campaign.bulk_analysis", _bulk_analysis_job, queue="bulk", priority=8)
+
+
+def _start_bulk_analysis_job(job_id: str, store: str | None, ad_accounts: list[str], s_date: str, e_date: str, *, resume: bool = False) -> None:
+    submit_job(
+        "campaign.bulk_analysis",
+        {"bulk_job_id": job_id, "store": store, "ad_accounts": ad_accounts, "s_date": s_date, "e_date": e_date, "resume": resume},
+        store=store,
+        label=f"bulk_analysis {job_id[:8]}",
+    )
+
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        try:
-            db.save_bulk_analysis_job(store, job_id, {
-                "status": "error",
-                "error": str(e),
-                "progress": {"done": 0, "total": 0, "phase": "error"},
-            })
-        except Exception:
-            pass
+def _resume_bulk_analysis_job(store: str | None, job: dict, *, force: bool = False) -> bool:
+    """Restart an interrupted job in this instance from its last checkpoint.
+
+    A job counts as interrupted when it is still in an active status but
+    neither its progress (``updated_at``) nor its heartbeat has moved for
+    PTOS_BULK_ANALYSIS_STALE_S, which is what an instance restart, scale-down
+    or lost worker leaves behind. Only persisted state is consulted, so a job
+    running on a Celery worker is never restarted from an API instance.
+    """
+    job_id = str((job or {}).get("job_id") or "")
+    if not job_id or str(job.get("status") or "") not in _BULK_ACTIVE_STATUSES:
+        return False
+    if not force and not _bulk_job_is_stale(store, job):
+        return False
+    dr = job.get("date_range") or {}
+    s_date = str(dr.get("start") or "")
+    e_date = str(dr.get("end") or "")
+    if not s_date or not e_date:
+        return False
+    # Claim through the heartbeat row: of several instances polling this job, one resumes it.
+    if not db.claim_bulk_analysis_job(store, job_id, 0 if force else _BULK_STALE_S):
+        return False
+    db.patch_bulk_analysis_job(store, job_id, {"resumed_at": datetime.utcnow().isoformat() + "Z"})
+    _start_bulk_analysis_job(job_id, store, list(job.get("ad_accounts") or []), s_date, e_date, resume=True)
+    return True
 
 
 class BulkAnalyzeRequest(BaseModel):
@@ -3376,29 +3617,17 @@ async def api_analyze_all_campaigns(req: BulkAnalyzeRequest):
             s_date = (now - timedelta(days=7)).strftime("%Y-%m-%d")
             e_date = now.strftime("%Y-%m-%d")
 
+        ad_accounts = list(req.ad_accounts or ([req.ad_account] if req.ad_account else []))
+
         # Save initial job state
         db.save_bulk_analysis_job(store, job_id, {
             "status": "pending",
             "progress": {"done": 0, "total": 0, "phase": "starting"},
             "date_range": {"start": s_date, "end": e_date},
+            "ad_accounts": ad_accounts,
         })
 
-        def _tracked_bulk(_jid: str, _store, _accts, _s, _e):
-            _sh.register_inflight(f"bulk_analysis:{_jid}", "bulk_analysis", store=_store, label=f"bulk_analysis {_jid}")
-            try:
-                with _sh.time_op("pipeline", "run_bulk_analysis_job", store=_store):
-                    _run_bulk_analysis_job(_jid, _store, _accts, _s, _e)
-            finally:
-                _sh.clear_inflight(f"bulk_analysis:{_jid}")
-
-        # Launch background thread (daemon=False so it survives request lifecycle)
-        thread = threading.Thread(
-            target=_tracked_bulk,
-            args=(job_id, store, (req.ad_accounts or ([req.ad_account] if req.ad_account else [])), s_date, e_date),
-            daemon=False,
-            name=f"bulk-analysis-{job_id[:8]}",
-        )
-        thread.start()
+        _start_bulk_analysis_job(job_id, store, ad_accounts, s_date, e_date)
 
         return {"job_id": job_id}
     except Exception as e:
@@ -3412,7 +3641,23 @@ async def api_analyze_all_status(job_id: str, store: str | None = None):
         job = db.get_bulk_analysis_job(store, job_id)
         if not job:
             return {"status": "not_found", "error": "Job not found"}
-        return job
+        # A stale active job means its instance went away; pick it up here.
+        if _resume_bulk_analysis_job(store, job):
+            job = db.get_bulk_analysis_job(store, job_id) or job
+        return _bulk_job_public(job)
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+
+@app.post("/api/campaign/analyze_all/resume/{job_id}")
+async def api_analyze_all_resume(job_id: str, store: str | None = None, force: bool = False):
+    """Resume an interrupted bulk analysis from its per-group checkpoints."""
+    try:
+        job = db.get_bulk_analysis_job(store, job_id)
+        if not job:
+            return {"status": "not_found", "error": "Job not found"}
+        resumed = _resume_bulk_analysis_job(store, job, force=force)
+        return {"job_id": job_id, "resumed": resumed, "status": job.get("status")}
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
@@ -3424,11 +3669,36 @@ async def api_analyze_all_latest(store: str | None = None):
         job = db.get_latest_bulk_analysis_job(store)
         if not job:
             return {"data": None}
-        return {"data": job}
+        if _resume_bulk_analysis_job(store, job):
+            job = db.get_bulk_analysis_job(store, str(job.get("job_id") or "")) or job
+        return {"data": _bulk_job_public(job)}
     except Exception as e:
         return {"error": str(e), "data": None}
 
 
+@app.get("/api/campaign/analysis_memo/stats")
+async def api_analysis_memo_stats():
+    """Phase-memo hit rate and tokens saved since process start."""
+    return {"data": phase_memo_stats()}
+
+
+@app.delete("/api/campaign/analysis_memo")
+async def api_analysis_memo_clear(product_id: str | None = None, store: str | None = None):
+    """Drop memoized customer profiles (one product when product_id is given, else all)."""
+    try:
+        product_info = None
+        if product_id:
+            pid = str(product_id)
+            # The same context bulk analysis builds (brief image, product URL), or the key won't match.
+            brief = (await run_in_threadpool(get_products_brief, [pid], store=store) or {}).get(pid) or {}
+            product_info = await run_in_threadpool(_analysis_product_info, store, pid, brief)
+            if not (product_info.get("title") or product_info.get("description")):
+                return {"error": "Product not found", "deleted": 0}
+        return {"deleted": await run_in_threadpool(invalidate_phase_memo, product_info)}
+    except Exception as e:
+        return {"error": str(e), "deleted": 0}
+
+
 # -------- Profit Calculator costs (per product, stored in AppSetting) --------
 class ProfitCostsUpsertRequest(BaseModel):
     product_id: str
@@ -3633,10 +3903,19 @@ class ProfitCardCreateRequest(BaseModel):
 
 
 @app.get("/api/profit_cards")
-async def api_list_profit_cards(store: str | None = None):
+async def api_list_profit_cards(request: Request, store: str | None = None, limit: int | None = None, cursor: str | None = None, fields: str | None = None):
     try:
-        items = db.list_profit_cards(store)
-        return {"data": items}
+        eff = None if limit is None else min(max(limit, 1), 200)
+
+        async def _page():
+            items = await run_in_threadpool(db.list_profit_cards, store, limit=eff, cursor=cursor)
+            next_cursor = db.keyset_cursor(items[-1], "updated_at") if eff and len(items) == eff else None
+            return {"data": list_pages.sparse(items, fields), "next_cursor": next_cursor}
+
+        return await list_pages.conditional(
+            request, lambda: db.profit_cards_list_version(store), _page,
+            store=store, limit=eff, cursor=cursor, fields=fields,
+        )
     except Exception as e:
         return {"error": str(e), "data": []}
 
@@ -4040,19 +4319,7 @@ def _confirmation_order_is_visible(order: dict, tags_list: list[str]) -> bool:
     """Only count/show open, unfulfilled, not-canceled, not-COD orders."""
     if not isinstance(order, dict):
         return False
-    if has_cod_tag(tags_list):
-        return False
-    if order.get("cancelled_at") or order.get("canceled_at"):
-        return False
-    if order.get("closed_at"):
-        return False
-    status = str(order.get("status") or "").strip().lower()
-    if status in ("closed", "cancelled", "canceled", "archived"):
-        return False
-    fulfillment = str(order.get("fulfillment_status") or "").strip().lower()
-    if fulfillment and fulfillment != "unfulfilled":
-        return False
-    return True
+    return confirmation_queue.in_queue(order, tags_list)
 
 
 def _confirmation_agent_tags(users: list[dict], agent_email: str | None) -> list[str]:
@@ -4087,6 +4354,28 @@ def _confirmation_order_assigned_to_agent(tags_list: list[str], agent_tags: list
     return _confirmation_order_has_any_tag(tags_list, agent_tags)
 
 
+def _parse_confirmation_users(val: Any) -> list[dict]:
+    """Users from a list of {email, password, name?, tags?} or an {email: password} map."""
+    out: list[dict] = []
+    if isinstance(val, list):
+        for u in val:
+            if isinstance(u, dict) and u.get("email") and u.get("password"):
+                out.append({"email": str(u["email"]).strip().lower(), "password": str(u["password"]), "name": u.get("name"), "tags": _normalize_confirmation_tags(u.get("tags") or [])})
+    elif isinstance(val, dict):
+        for k, v in val.items():
+            if k and v:
+                out.append({"email": str(k).strip().lower(), "password": str(v), "name": None, "tags": []})
+    return out
+
+
+def _env_confirmation_users() -> list[dict]:
+    try:
+        raw = (os.getenv("CONFIRMATION_USERS", "") or "").strip()
+        return _parse_confirmation_users(json.loads(raw)) if raw else []
+    except Exception:
+        return []
+
+
 def _load_confirmation_users(store: str | None) -> list[dict]:
     """Resolve confirmation users (email + password + optional name).
 
@@ -4094,39 +4383,20 @@ def _load_confirmation_users(store: str | None) -> list[dict]:
       - AppSetting(store, 'confirmation_users') if set
       - env CONFIRMATION_USERS (JSON)
     """
-    out: list[dict] = []
-    # 1) DB setting per store
     try:
-        val = db.get_app_setting(store, "confirmation_users")
-        if isinstance(val, list):
-            for u in val:
-                if isinstance(u, dict) and u.get("email") and u.get("password"):
-                    out.append({"email": str(u["email"]).strip().lower(), "password": str(u["password"]), "name": u.get("name"), "tags": _normalize_confirmation_tags(u.get("tags") or [])})
-        elif isinstance(val, dict):
-            # allow {"email":"pw"} map
-            for k, v in val.items():
-                if k and v:
-                    out.append({"email": str(k).strip().lower(), "password": str(v), "name": None, "tags": []})
+        out = _parse_confirmation_users(db.get_app_setting(store, "confirmation_users"))
     except Exception:
-        pass
-    if out:
-        return out
-    # 2) ENV fallback
+        out = []
+    return out or _env_confirmation_users()
+
+
+async def _aload_confirmation_users(store: str | None) -> list[dict]:
+    """``_load_confirmation_users`` for async handlers."""
     try:
-        raw = (os.getenv("CONFIRMATION_USERS", "") or "").strip()
-        if raw:
-            parsed = json.loads(raw)
-            if isinstance(parsed, list):
-                for u in parsed:
-                    if isinstance(u, dict) and u.get("email") and u.get("password"):
-                        out.append({"email": str(u["email"]).strip().lower(), "password": str(u["password"]), "name": u.get("name"), "tags": _normalize_confirmation_tags(u.get("tags") or [])})
-            elif isinstance(parsed, dict):
-                for k, v in parsed.items():
-                    if k and v:
-                        out.append({"email": str(k).strip().lower(), "password": str(v), "name": None, "tags": []})
+        out = _parse_confirmation_users(await db_async.get_app_setting(store, "confirmation_users"))
     except Exception:
-        pass
-    return out
+        out = []
+    return out or _env_confirmation_users()
 
 
 class ConfirmationLoginRequest(BaseModel):
@@ -4143,7 +4413,7 @@ async def api_confirmation_login(req: ConfirmationLoginRequest):
         pw = (req.password or "")
         if not email or not pw:
             return {"error": "missing_credentials"}
-        users = _load_confirmation_users(req.store)
+        users = await _aload_confirmation_users(req.store)
         ok = False
         name = None
         for u in (users or []):
@@ -4311,7 +4581,7 @@ async def api_confirmation_admin_users(req: Request, store: str | None = None):
         admin = _get_confirmation_admin(req)
         if not admin:
             return {"error": "unauthorized", "data": []}
-        users = _load_confirmation_users(store)
+        users = await _aload_confirmation_users(store)
         # Never return passwords
         out = [{"email": u.get("email"), "name": u.get("name"), "tags": _normalize_confirmation_tags(u.get("tags") or [])} for u in (users or []) if isinstance(u, dict) and u.get("email")]
         # stable sort
@@ -4341,7 +4611,7 @@ async def api_confirmation_admin_user_upsert(req: Request, body: ConfirmationAdm
             return {"error": "invalid_email"}
         name = (body.name or "").strip() if isinstance(body.name, str) else None
         tags = _normalize_confirmation_tags(body.tags or [])
-        users = _load_confirmation_users(store)
+        users = await _aload_confirmation_users(store)
         existing = next((u for u in (users or []) if isinstance(u, dict) and _normalize_email(str(u.get("email") or "")) == email), None)
         pw = (body.password or "").strip()
         generated = None
@@ -4375,7 +4645,7 @@ async def api_confirmation_admin_user_delete(req: Request, body: ConfirmationAdm
         email = _normalize_email(body.email)
         if not email:
             return {"error": "invalid_email"}
-        users = _load_confirmation_users(store)
+        users = await _aload_confirmation_users(store)
         kept = [u for u in (users or []) if isinstance(u, dict) and _normalize_email(str(u.get("email") or "")) != email]
         _save_confirmation_users(store, kept)
         return {"data": {"ok": True}}
@@ -4404,7 +4674,7 @@ async def api_confirmation_admin_user_reset_password(req: Request, body: Confirm
         if not pw:
             generated = _gen_password()
             pw = generated
-        users = _load_confirmation_users(store)
+        users = await _aload_confirmation_users(store)
         found = False
         merged: list[dict] = []
         for u in (users or []):
@@ -4436,7 +4706,7 @@ async def api_confirmation_orders(req: Request, body: ConfirmationOrdersRequest)
         if not agent:
             return {"error": "unauthorized", "data": {"orders": []}}
         agent_email = str((agent or {}).get("sub") or "").strip().lower()
-        users = _load_confirmation_users(body.store)
+        users = await _aload_confirmation_users(body.store)
         agent_tags = _confirmation_agent_tags(users, agent_email)
         fields = ",".join([
             "id", "name", "created_at", "processed_at", "total_price", "currency",
@@ -4444,12 +4714,18 @@ async def api_confirmation_orders(req: Request, body: ConfirmationOrdersRequest)
             "cancelled_at", "canceled_at", "closed_at", "status",
             "customer", "shipping_address", "billing_address", "line_items",
         ])
-        res = list_orders_open_unfulfilled(store=body.store, limit=int(body.limit or 50), page_info=body.page_info, fields=fields)
-        orders = (res or {}).get("orders") or []
         filtered: list[tuple[dict, list[str]]] = []
-        product_ids: set[str] = set()
-        for o in orders:
-            try:
+        confirmation_queue.ensure_fresh(body.store)
+        use_queue = confirmation_queue.ready(body.store) and (not body.page_info or confirmation_queue.decode_cursor(body.page_info) is not None)
+        if use_queue:
+            # Server-side pagination over the local queue: every page is full of this agent's orders.
+            res = confirmation_queue.list_page(body.store, agent_tags, limit=int(body.limit or 50), cursor=body.page_info)
+            for row in res["rows"]:
+                o = row.get("data") or {"id": row["order_id"], "name": row.get("name"), "tags": ", ".join(row.get("tags") or [])}
+                filtered.append((o, row.get("tags") or []))
+        else:
+            res = list_orders_open_unfulfilled(store=body.store, limit=int(body.limit or 50), page_info=body.page_info, fields=fields)
+            for o in (res or {}).get("orders") or []:
                 if not isinstance(o, dict):
                     continue
                 tags_list = _confirmation_tags_list(o.get("tags"))
@@ -4458,6 +4734,9 @@ async def api_confirmation_orders(req: Request, body: ConfirmationOrdersRequest)
                 if not _confirmation_order_assigned_to_agent(tags_list, agent_tags):
                     continue
                 filtered.append((o, tags_list))
+        product_ids: set[str] = set()
+        for o, _tags in filtered:
+            try:
                 for li in (o.get("line_items") or []):
                     if isinstance(li, dict):
                         pid = str(li.get("product_id") or "").strip()
@@ -4561,7 +4840,10 @@ def _confirmation_agent_order_analytics(store: str | None, agent_email: str) ->
     users = _load_confirmation_users(store)
     agent_tags = _confirmation_agent_tags(users, ae)
     all_agent_tags = _confirmation_all_agent_tags(users)
-    # Pull all pages (best-effort) because the UI list is paginated.
+    confirmation_queue.ensure_fresh(store)
+    if confirmation_queue.ready(store):
+        return {**db.confirmation_queue_counts(store, agent_tags, sorted(all_agent_tags)), "truncated": False}
+    # Queue not synced yet: pull all pages (best-effort) because the UI list is paginated.
     fields = "id,tags,financial_status,fulfillment_status,cancelled_at,canceled_at,closed_at,status"
     page_info: str | None = None
     max_pages = 20  # safety guard
@@ -4658,6 +4940,7 @@ async def api_confirmation_order_action(req: Request, body: ConfirmationOrderAct
             return {"error": "invalid_order_id"}
         if action == "phone":
             tags = cycle_tag(oid, "n", store=store, max_n=3)
+            confirmation_queue.note_tags(store, oid, tags)
             try:
                 db.log_confirmation_event(store, agent.get("sub") or "unknown", oid, "phone")
             except Exception:
@@ -4665,6 +4948,7 @@ async def api_confirmation_order_action(req: Request, body: ConfirmationOrderAct
             return {"data": {"tags": tags}}
         if action == "whatsapp":
             tags = cycle_tag(oid, "wtp", store=store, max_n=3)
+            confirmation_queue.note_tags(store, oid, tags)
             try:
                 db.log_confirmation_event(store, agent.get("sub") or "unknown", oid, "whatsapp")
             except Exception:
@@ -4673,6 +4957,7 @@ async def api_confirmation_order_action(req: Request, body: ConfirmationOrderAct
         if action == "confirm":
             ddmmyy = _to_ddmmyy(body.date or "")
             tags = set_cod_tag(oid, ddmmyy, store=store)
+            confirmation_queue.note_tags(store, oid, tags)
             try:
                 db.log_confirmation_event(store, agent.get("sub") or "unknown", oid, "confirm", meta={"cod": ddmmyy})
             except Exception:
@@ -4716,17 +5001,51 @@ async def api_confirmation_agent_analytics(req: Request, store: str | None = Non
         return {"error": str(e), "data": {}}
 
 @app.get("/api/confirmation/admin/analytics")
-async def api_confirmation_admin_analytics(req: Request, store: str | None = None, days: int | None = 30):
+async def api_confirmation_admin_analytics(req: Request, store: str | None = None, days: int | None = 30, start: str | None = None, end: str | None = None):
+    """Admin analytics for the last ``days`` days, or ``start``..``end`` (YYYY-MM-DD, up to a year)."""
     try:
         admin = _get_confirmation_admin(req)
         if not admin:
             return {"error": "unauthorized", "data": {}}
-        data = db.confirmation_analytics(store, days=days)
+        data = await run_in_threadpool(db.confirmation_analytics, store, days=days, start=start, end=end)
         return {"data": data}
     except Exception as e:
         return {"error": str(e), "data": {}}
 
 
+def _confirmation_rollups_job(job_id: str, params: dict) -> dict:
+    return {"rows": db.rebuild_confirmation_rollups(params.get("store"))}
+
+
+register_job("confirmation.rebuild_rollups", _confirmation_rollups_job, queue="bulk", priority=8)
+
+
+@app.post("/api/confirmation/admin/rollups/rebuild")
+async def api_confirmation_admin_rollups_rebuild(req: Request, store: str | None = None):
+    """Backfill the daily analytics rollups from the event log (all stores when ``store`` is omitted)."""
+    try:
+        admin = _get_confirmation_admin(req)
+        if not admin:
+            return {"error": "unauthorized", "data": {}}
+        job = await run_in_threadpool(submit_job, "confirmation.rebuild_rollups", {"store": store}, store=store, label="confirmation rollups")
+        return {"data": {"job_id": job["job_id"]}}
+    except Exception as e:
+        return {"error": str(e), "data": {}}
+
+
+@app.post("/api/confirmation/admin/queue/sync")
+async def api_confirmation_admin_queue_sync(req: Request, store: str | None = None, full: bool = False):
+    """Queue a sync of the local confirmation queue (``full`` re-reads the whole open set)."""
+    try:
+        admin = _get_confirmation_admin(req)
+        if not admin:
+            return {"error": "unauthorized", "data": {}}
+        job = await run_in_threadpool(submit_job, "confirmation.sync_queue", {"store": store, "full": bool(full)}, store=store, label=f"confirmation queue {store or 'default'}")
+        return {"data": {"job_id": job["job_id"], "queue": await run_in_threadpool(confirmation_queue.queue_status, store)}}
+    except Exception as e:
+        return {"error": str(e), "data": {}}
+
+
 # ---------------- LLM step endpoints (interactive flow) ----------------
 class AnglesRequest(BaseModel):
     product: ProductInput
@@ -5231,13 +5550,133 @@ async def api_translate(req: TranslateRequest):
     except Exception as e:
         return {"translations": [], "error": str(e), "target": req.target}
 
+# ---------------- Media generation jobs ----------------
+# Long multi-image generations can run as background jobs instead of holding
+# the request open: POST /api/media/jobs (or ``job: true`` on the generator
+# endpoints) returns a job id at once; progress is read from
+# GET /api/media/jobs/{id} or streamed as Server-Sent Events from
+# GET /api/media/jobs/{id}/events. Identical requests attach to the same job.
+class MediaJobRequest(BaseModel):
+    kind: str
+    params: dict = {}
+
+
+def _media_job_public(job: dict) -> dict:
+    return {
+        "job_id": job.get("job_id"),
+        "kind": job.get("kind"),
+        "status": job.get("status"),
+        "error": job.get("error"),
+        "runner": job.get("runner"),
+        "completed": len(job.get("items") or []),
+        "items": _media_job_items(job),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+
+def _media_job_response(kind: str, params: dict) -> dict:
+    job, created = submit_media_job(kind, params)
+    return {
+        "job_id": job["job_id"],
+        "status": job.get("status"),
+        "attached": not created,
+        "events_url": f"/api/media/jobs/{job['job_id']}/events",
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+async def api_job_get(job_id: str):
+    """Status of any background job (analysis, bulk analysis, action tasks, ads automation, wholesale setup)."""
+    job = await run_in_threadpool(get_job, job_id)
+    if not job:
+        return Response(content=json.dumps({"error": "not_found"}), media_type="application/json", status_code=404)
+    return job_public(job)
+
+
+@app.post("/api/media/jobs")
+async def api_media_job_submit(req: MediaJobRequest):
+    try:
+        return await run_in_threadpool(_media_job_response, req.kind, req.params or {})
+    except ValueError as e:
+        return Response(content=json.dumps({"error": str(e)}), media_type="application/json", status_code=400)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/media/jobs/{job_id}")
+async def api_media_job_get(job_id: str):
+    job = await run_in_threadpool(get_media_job, job_id)
+    if not job:
+        return Response(content=json.dumps({"error": "not_found"}), media_type="application/json", status_code=404)
+    return _media_job_public(job)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/api/media/jobs/{job_id}/events")
+async def api_media_job_events(job_id: str, request: Request):
+    """SSE: one ``item`` event per finished image, ``progress`` on status changes, then ``done`` or ``error``."""
+
+    async def _events():
+        sent = 0
+        last_status = None
+        deadline = time.time() + MEDIA_JOB_STALE_S
+        while True:
+            job = await run_in_threadpool(get_media_job, job_id)
+            if not job:
+                yield _sse("error", {"job_id": job_id, "error": "not_found"})
+                return
+            items = job.get("items") or []
+            for entry in items[sent:]:
+                yield _sse("item", entry)
+            if len(items) > sent:
+                deadline = time.time() + MEDIA_JOB_STALE_S
+            sent = len(items)
+            status = job.get("status")
+            if status != last_status:
+                last_status = status
+                yield _sse("progress", {"job_id": job_id, "status": status, "completed": sent})
+            if status == "done":
+                yield _sse("done", {"job_id": job_id, "count": sent})
+                return
+            if status == "error":
+                yield _sse("error", {"job_id": job_id, "error": job.get("error"), "count": sent})
+                return
+            if time.time() > deadline or await request.is_disconnected():
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 # ---------------- Gemini image generation ----------------
+# Every /api/gemini/* generator accepts ``stream: true``: the response is then
+# NDJSON with one ``{"index", "item"}`` line per image as it completes (in
+# completion order) and a final ``{"done": true, "count", ...}`` line.
+def _gemini_ndjson_stream(pairs, **extra):
+    def _lines():
+        count = 0
+        for index, item in pairs:
+            count += 1
+            yield json.dumps({"index": index, "item": item}, ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "count": count, **extra}, ensure_ascii=False) + "\n"
+
+    # Sync generator → Starlette runs it in the threadpool; generation never blocks the loop.
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
 class GeminiAdImageRequest(BaseModel):
     image_url: str
     prompt: str
     num_images: Optional[int] = 1
     # When true (default), enforce a clean neutral studio background. When false, allow natural scenes.
     neutral_background: Optional[bool] = True
+    stream: Optional[bool] = False
+    job: Optional[bool] = False
 
 
 @app.post("/api/gemini/ad_image")
@@ -5251,6 +5690,14 @@ async def api_gemini_ad_image(req: GeminiAdImageRequest):
                 "Never reuse the background from any provided or source images."
             )
             prompt = prompt + bg_rule
+        if req.job:
+            return _media_job_response("gemini.ad_image", {"image_url": req.image_url, "prompt": prompt, "num_images": req.num_images or 1})
+        if req.stream:
+            return _gemini_ndjson_stream(
+                enumerate(iter_ad_images_from_image(req.image_url, prompt, req.num_images or 1)),
+                prompt=prompt,
+                input_image_url=req.image_url,
+            )
         imgs = gen_ad_images_from_image(req.image_url, prompt, req.num_images or 1)
         return {"images": imgs, "prompt": prompt, "input_image_url": req.image_url}
     except Exception as e:
@@ -5263,11 +5710,21 @@ class GeminiPromoSetRequest(BaseModel):
     angles: List[dict]
     image_url: str
     count: Optional[int] = 4
+    stream: Optional[bool] = False
+    job: Optional[bool] = False
 
 
 @app.post("/api/gemini/promotional_set")
 async def api_gemini_promotional_set(req: GeminiPromoSetRequest):
     try:
+        if req.job:
+            return _media_job_response("gemini.promotional_set", {"image_url": req.image_url, "product": req.product.model_dump(), "angles": req.angles or [], "count": req.count or 4})
+        if req.stream:
+            return _gemini_ndjson_stream(
+                iter_promotional_images_from_angles(req.image_url, req.product.model_dump(), req.angles or [], count=req.count or 4),
+                model="gemini-2.5-flash-image-preview",
+                input_image_url=req.image_url,
+            )
         items = gen_promotional_images_from_angles(req.image_url, req.product.model_dump(), req.angles or [], count=req.count or 4)
         return {"items": items, "model": "gemini-2.5-flash-image-preview", "input_image_url": req.image_url}
     except Exception as e:
@@ -5278,11 +5735,21 @@ class GeminiFeatureBenefitRequest(BaseModel):
     product: ProductInput
     image_url: str
     count: Optional[int] = 6
+    stream: Optional[bool] = False
+    job: Optional[bool] = False
 
 
 @app.post("/api/gemini/feature_benefit_set")
 async def api_gemini_feature_benefit_set(req: GeminiFeatureBenefitRequest):
     try:
+        if req.job:
+            return _media_job_response("gemini.feature_benefit_set", {"image_url": req.image_url, "product": req.product.model_dump(), "count": req.count or 6})
+        if req.stream:
+            return _gemini_ndjson_stream(
+                iter_feature_benefit_images(req.image_url, req.product.model_dump(), count=req.count or 6),
+                model="gemini-2.5-flash-image-preview",
+                input_image_url=req.image_url,
+            )
         items = gen_feature_benefit_images(req.image_url, req.product.model_dump(), count=req.count or 6)
         return {"items": items, "model": "gemini-2.5-flash-image-preview", "input_image_url": req.image_url}
     except Exception as e:
@@ -5295,11 +5762,31 @@ class GeminiVariantSetRequest(BaseModel):
     max_variants: int | None = None
     # When provided, generate one image per provided variant using its description
     variant_descriptions: Optional[list[dict]] = None
+    stream: Optional[bool] = False
+    job: Optional[bool] = False
 
 
 @app.post("/api/gemini/variant_set")
 async def api_gemini_variant_set(req: GeminiVariantSetRequest):
     try:
+        if req.job:
+            return _media_job_response("gemini.variant_set", {
+                "image_url": req.image_url,
+                "style_prompt": req.style_prompt,
+                "max_variants": req.max_variants,
+                "variants_override": req.variant_descriptions or None,
+            })
+        if req.stream:
+            return _gemini_ndjson_stream(
+                iter_variant_images_from_image(
+                    req.image_url,
+                    style_prompt=req.style_prompt,
+                    max_variants=req.max_variants,
+                    variants_override=(req.variant_descriptions or None),
+                ),
+                model="gemini-2.5-flash-image-preview",
+                input_image_url=req.image_url,
+            )
         items = gen_variant_images_from_image(
             req.image_url,
             style_prompt=req.style_prompt,
@@ -5392,6 +5879,8 @@ class AdsAutomationLaunchRequest(BaseModel):
     num_angles: Optional[int] = 3
     prompts: Optional[dict] = None  # { analyze_landing_prompt, angles_prompt, headlines_prompt, copies_prompt, gemini_ad_prompt }
     model: Optional[str] = None
+    # Reuse completed steps of an earlier failed run with the same settings (default true)
+    resume: Optional[bool] = True
 
 
 def _ads_update(flow_id: str, *, ads: dict | None = None, product: dict | None = None, settings: dict | None = None, status: str | None = None, card_image: str | None = None):
@@ -5409,8 +5898,71 @@ def _safe(obj: object, key: str, default):
         return default
 
 
+def _ads_angle_prompt(prompts: dict, key: str, angle: dict) -> str | None:
+    # Inject ANGLE context into the prompt override
+    base = _safe(prompts, key, None)
+    if base:
+        base = str(base).strip() + "\n\nANGLE: " + _json.dumps(angle, ensure_ascii=False)
+    return base
+
+
+def _ads_collect_headlines(out: dict) -> list[str]:
+    heads: list[str] = []
+    for it in out.get("angles") or []:
+        hs = it.get("headlines") if isinstance(it.get("headlines"), list) else []
+        for h in hs:
+            if isinstance(h, str) and h.strip() and len(heads) < 12:
+                heads.append(h.strip())
+    return heads[:8]
+
+
+def _ads_collect_primaries(out: dict) -> list[str]:
+    prims: list[str] = []
+    for it in out.get("angles") or []:
+        ps = []
+        if isinstance(it.get("primaries"), list):
+            ps = it.get("primaries") or []
+        elif isinstance(it.get("primaries"), dict):
+            cand = [it.get("primaries", {}).get("short"), it.get("primaries", {}).get("medium"), it.get("primaries", {}).get("long")]
+            ps = [p for p in cand if isinstance(p, str)]
+        for p in ps:
+            if isinstance(p, str) and p.strip() and len(prims) < 12:
+                prims.append(p.strip())
+    return prims[:2]
+
+
+def _ads_automation_hashes(ads: dict, payload: dict, product: dict, prompts: dict, landing_url, source_image, k: int, model) -> dict:
+    """Hashes for ``ads["automation"]``; ``input_hash`` keys the step checkpoints.
+
+    A relaunch resumes the previous run only when the settings and the product
+    are unchanged. The product is compared as the user supplied it and as that
+    run saved it after the landing-page analysis filled empty fields, so a
+    relaunch from the stored flow resumes but an edited product starts over.
+    """
+    settings_hash = inputs_hash({"landing_url": landing_url, "source_image": source_image, "prompts": prompts, "k": k, "model": model})
+    product_hash = inputs_hash({"product": product})
+    prev = ads.get("automation") if isinstance(ads.get("automation"), dict) else {}
+    if (
+        (payload or {}).get("resume", True)
+        and prev.get("settings_hash") == settings_hash
+        and prev.get("input_hash")
+        and product_hash in (prev.get("product_hash"), prev.get("prefilled_product_hash"))
+    ):
+        return {name: prev[name] for name in ("input_hash", "settings_hash", "product_hash", "prefilled_product_hash") if prev.get(name)}
+    return {
+        "input_hash": inputs_hash({"settings": settings_hash, "product": product}),
+        "settings_hash": settings_hash,
+        "product_hash": product_hash,
+    }
+
+
 def run_ads_automation_sync(flow_id: str, payload: dict):
-    """Runs the Ads flow in the background, updating the Flow row after each step.
+    """Runs the Ads flow in the background as a sequence of checkpointed steps.
+
+    Each step transition is one row in ``flow_step_events`` (see app.flow_steps);
+    the Flow row is only rewritten at milestones (start, analysis, angles, end).
+    Steps that completed in an earlier run with the same inputs are replayed
+    from their checkpoint instead of being re-run.
 
     payload keys:
       - product: dict (audience, benefits[], pain_points[], title?, sizes?, colors?)
@@ -5419,12 +5971,13 @@ def run_ads_automation_sync(flow_id: str, payload: dict):
       - prompts: dict
       - num_angles: int
       - model: str
+      - resume: bool (default true) — reuse checkpoints of a previous run with the same settings
     """
     f = db.get_flow(flow_id)
     if not f:
         return
-    # Mark as running
-    _ads_update(flow_id, status="running")
+    log: FlowStepLog | None = None
+    ads: dict = {}
     try:
         product = (payload or {}).get("product") or (f.get("product") or {}) or {}
         prompts = (payload or {}).get("prompts") or (f.get("prompts") or {}) or {}
@@ -5434,22 +5987,20 @@ def run_ads_automation_sync(flow_id: str, payload: dict):
         model = (payload or {}).get("model") or None
 
         ads = (f.get("ads") or {}) if isinstance(f.get("ads"), dict) else {}
+        automation = _ads_automation_hashes(ads, payload, product, prompts, landing_url, source_image, k, model)
+        log = FlowStepLog(flow_id, automation["input_hash"])
         if landing_url:
             ads["landing_url"] = landing_url
-        ads.setdefault("steps", [])
-        _ads_update(flow_id, ads=ads)
+        ads["automation"] = {**automation, "started_at": time.time()}
+        ads["steps"] = log.steps()
+        # Milestone: started
+        _ads_update(flow_id, ads=ads, status="running")
 
         # Step 1: Analyze landing page (optional)
         analyzed_images: list[str] = []
         if landing_url:
-            step = {"step": "analyze_landing_page", "status": "running", "started_at": time.time()}
-            ads["steps"].append(step)
-            _ads_update(flow_id, ads=ads)
-            try:
-                out = analyze_landing_page(landing_url, model=model, prompt_override=_safe(prompts, "analyze_landing_prompt", None))
-                step["status"] = "completed"
-                step["ended_at"] = time.time()
-                step["response"] = out
+            out = log.run("analyze_landing_page", lambda: analyze_landing_page(landing_url, model=model, prompt_override=_safe(prompts, "analyze_landing_prompt", None)))
+            if isinstance(out, dict):
                 ads["analyze"] = out
                 # Prefill product if empty fields
                 try:
@@ -5465,12 +6016,9 @@ def run_ads_automation_sync(flow_id: str, payload: dict):
                     analyzed_images = [u for u in (out.get("images") or []) if isinstance(u, str)]
                 except Exception:
                     analyzed_images = []
+                # Milestone: analysis
+                ads["automation"]["prefilled_product_hash"] = inputs_hash({"product": product})
                 _ads_update(flow_id, ads=ads, product=product)
-            except Exception as e:
-                step["status"] = "failed"
-                step["ended_at"] = time.time()
-                step["error"] = {"message": str(e)}
-                _ads_update(flow_id, ads=ads)
 
         # Step 2: Angles (prefer analyze angles; else generate)
         angles: list[dict] = []
@@ -5478,163 +6026,128 @@ def run_ads_automation_sync(flow_id: str, payload: dict):
             if isinstance(ads.get("analyze", {}).get("angles"), list) and ads.get("analyze", {}).get("angles"):
                 angles = ads.get("analyze", {}).get("angles")[:k]
             else:
-                step = {"step": "generate_angles", "status": "running", "started_at": time.time()}
-                ads["steps"].append(step)
-                _ads_update(flow_id, ads=ads)
-                data = gen_angles_and_copy_full(product, model=model, prompt_override=_safe(prompts, "angles_prompt", None))
-                angles = (data.get("angles") or [])[:k]
-                step["status"] = "completed"
-                step["ended_at"] = time.time()
-                step["response"] = {"angles": angles}
+                def _gen_angles() -> dict:
+                    data = gen_angles_and_copy_full(product, model=model, prompt_override=_safe(prompts, "angles_prompt", None))
+                    return {"angles": (data.get("angles") or [])[:k]}
+                angles = (log.run("generate_angles", _gen_angles, raise_errors=True) or {}).get("angles") or []
             ads["angles"] = angles
+            # Milestone: angles
             _ads_update(flow_id, ads=ads)
-        except Exception as e:
-            try:
-                step["status"] = "failed"  # type: ignore
-                step["ended_at"] = time.time()  # type: ignore
-                step["error"] = {"message": str(e)}  # type: ignore
-            except Exception:
-                pass
+        except Exception:
+            ads["steps"] = log.steps()
             _ads_update(flow_id, ads=ads, status="failed")
             return
 
         # Step 3: Per-angle expansions (headlines, copies, images)
         per_angle: list[dict] = []
-        ads["per_angle"] = per_angle
         # Select a source image
         src_image = source_image or (analyzed_images[0] if analyzed_images else None)
+        card_image = None
+        new_images: list[str] = []
         for idx, a in enumerate(angles or []):
             item = {"angle": a, "headlines": [], "primaries": [], "images": []}
             per_angle.append(item)
-            # Headlines
-            try:
-                step = {"step": "generate_headlines", "angle_index": idx, "status": "running", "started_at": time.time()}
-                ads["steps"].append(step)
-                _ads_update(flow_id, ads=ads)
-                # Inject ANGLE context into the prompt override
-                base = _safe(prompts, "headlines_prompt", None)
-                if base:
-                    base = str(base).strip() + "\n\nANGLE: " + _json.dumps(a, ensure_ascii=False)
-                out = gen_angles_and_copy_full(product, model=model, prompt_override=base)
-                arr = out.get("angles") or []
-                # Aggregate headlines
-                heads: list[str] = []
-                for it in arr:
-                    hs = it.get("headlines") if isinstance(it.get("headlines"), list) else []
-                    for h in hs:
-                        if isinstance(h, str) and h.strip() and len(heads) < 12:
-                            heads.append(h.strip())
-                item["headlines"] = heads[:8]
-                step["status"] = "completed"
-                step["ended_at"] = time.time()
-                step["response"] = {"headlines": item["headlines"]}
-                _ads_update(flow_id, ads=ads)
-            except Exception as e:
-                step["status"] = "failed"  # type: ignore
-                step["ended_at"] = time.time()  # type: ignore
-                step["error"] = {"message": str(e)}  # type: ignore
-                _ads_update(flow_id, ads=ads)
-
-            # Copies
-            try:
-                step = {"step": "generate_copies", "angle_index": idx, "status": "running", "started_at": time.time()}
-                ads["steps"].append(step)
-                _ads_update(flow_id, ads=ads)
-                base = _safe(prompts, "copies_prompt", None)
-                if base:
-                    base = str(base).strip() + "\n\nANGLE: " + _json.dumps(a, ensure_ascii=False)
-                out = gen_angles_and_copy_full(product, model=model, prompt_override=base)
-                arr = out.get("angles") or []
-                prims: list[str] = []
-                for it in arr:
-                    ps = []
-                    if isinstance(it.get("primaries"), list):
-                        ps = it.get("primaries") or []
-                    elif isinstance(it.get("primaries"), dict):
-                        cand = [it.get("primaries", {}).get("short"), it.get("primaries", {}).get("medium"), it.get("primaries", {}).get("long")]
-                        ps = [p for p in cand if isinstance(p, str)]
-                    for p in ps:
-                        if isinstance(p, str) and p.strip() and len(prims) < 12:
-                            prims.append(p.strip())
-                item["primaries"] = prims[:2]
-                step["status"] = "completed"
-                step["ended_at"] = time.time()
-                step["response"] = {"primaries": item["primaries"]}
-                _ads_update(flow_id, ads=ads)
-            except Exception as e:
-                step["status"] = "failed"  # type: ignore
-                step["ended_at"] = time.time()  # type: ignore
-                step["error"] = {"message": str(e)}  # type: ignore
-                _ads_update(flow_id, ads=ads)
+            heads = log.run(
+                "generate_headlines",
+                lambda: {"headlines": _ads_collect_headlines(gen_angles_and_copy_full(product, model=model, prompt_override=_ads_angle_prompt(prompts, "headlines_prompt", a)))},
+                angle_index=idx,
+            )
+            item["headlines"] = (heads or {}).get("headlines") or []
+            copies = log.run(
+                "generate_copies",
+                lambda: {"primaries": _ads_collect_primaries(gen_angles_and_copy_full(product, model=model, prompt_override=_ads_angle_prompt(prompts, "copies_prompt", a)))},
+                angle_index=idx,
+            )
+            item["primaries"] = (copies or {}).get("primaries") or []
 
-            # Images
-            try:
-                step = {"step": "generate_images", "angle_index": idx, "status": "running", "started_at": time.time()}
-                ads["steps"].append(step)
-                _ads_update(flow_id, ads=ads)
+            def _gen_images() -> dict:
                 src = src_image or (product.get("uploaded_images", [None])[0])
                 if not src and isinstance(ads.get("analyze", {}).get("images"), list):
                     arr_imgs = ads.get("analyze", {}).get("images") or []
                     src = arr_imgs[0] if arr_imgs else None
-                if src:
-                    offer_text = ""
-                    try:
-                        offers = ads.get("analyze", {}).get("offers") if isinstance(ads.get("analyze"), dict) else []
-                        if isinstance(offers, list) and offers:
-                            offer_text = f" Emphasize the offer/promotion: {offers[0]}"
-                    except Exception:
-                        offer_text = ""
-                    base_prompt = _safe(prompts, "gemini_ad_prompt", "Create a high\u200a-quality ad image from this product photo. No text, premium look.")
-                    angle_suffix = (" Angle: " + str(a.get("name"))) if isinstance(a.get("name"), str) else ""
-                    prompt = f"{base_prompt}{offer_text}{angle_suffix}"
-                    imgs = gen_ad_images_from_image(src, prompt, num_images=4)
-                else:
-                    imgs = []
-                item["images"] = imgs
-                # Opportunistically set card_image to a Shopify CDN URL if present in outputs
-                card_image = None
-                try:
-                    for u in imgs:
-                        if isinstance(u, str) and u.startswith("https://cdn.shopify.com"):
-                            card_image = u
-                            break
-                except Exception:
-                    card_image = None
-                step["status"] = "completed"
-                step["ended_at"] = time.time()
-                step["response"] = {"images": imgs}
-                # Update settings.assets_used.feature_gallery
-                settings = f.get("settings") or {}
+                if not src:
+                    return {"images": []}
+                offer_text = ""
                 try:
-                    assets = settings.get("assets_used") or {}
-                    gallery = list(assets.get("feature_gallery") or [])
-                    for u in imgs:
-                        if isinstance(u, str) and u not in gallery:
-                            gallery.append(u)
-                    assets["feature_gallery"] = gallery
-                    settings["assets_used"] = assets
+                    offers = ads.get("analyze", {}).get("offers") if isinstance(ads.get("analyze"), dict) else []
+                    if isinstance(offers, list) and offers:
+                        offer_text = f" Emphasize the offer/promotion: {offers[0]}"
                 except Exception:
-                    settings = settings or {}
-                _ads_update(flow_id, ads=ads, settings=settings, card_image=card_image)
-            except Exception as e:
-                step["status"] = "failed"  # type: ignore
-                step["ended_at"] = time.time()  # type: ignore
-                step["error"] = {"message": str(e)}  # type: ignore
-                _ads_update(flow_id, ads=ads)
+                    offer_text = ""
+                base_prompt = _safe(prompts, "gemini_ad_prompt", "Create a high\u200a-quality ad image from this product photo. No text, premium look.")
+                angle_suffix = (" Angle: " + str(a.get("name"))) if isinstance(a.get("name"), str) else ""
+                return {"images": gen_ad_images_from_image(src, f"{base_prompt}{offer_text}{angle_suffix}", num_images=4)}
 
-        # Done
-        _ads_update(flow_id, ads=ads, status="completed")
+            imgs = (log.run("generate_images", _gen_images, angle_index=idx) or {}).get("images") or []
+            item["images"] = imgs
+            for u in imgs:
+                if not isinstance(u, str):
+                    continue
+                new_images.append(u)
+                # Opportunistically set card_image to a Shopify CDN URL if present in outputs
+                if card_image is None and u.startswith("https://cdn.shopify.com"):
+                    card_image = u
+
+        # Update settings.assets_used.feature_gallery
+        settings = f.get("settings") or {}
+        try:
+            assets = settings.get("assets_used") or {}
+            gallery = list(assets.get("feature_gallery") or [])
+            for u in new_images:
+                if u not in gallery:
+                    gallery.append(u)
+            assets["feature_gallery"] = gallery
+            settings["assets_used"] = assets
+        except Exception:
+            settings = settings or {}
+
+        # Milestone: done
+        ads["per_angle"] = per_angle
+        ads["steps"] = log.steps()
+        ads["automation"]["finished_at"] = time.time()
+        _ads_update(flow_id, ads=ads, settings=settings if new_images else None, card_image=card_image, status="completed")
     except Exception as e:
         try:
-            ads = (db.get_flow(flow_id) or {}).get("ads") or {}
-            steps = ads.get("steps") or []
-            steps.append({"step": "fatal", "status": "failed", "error": {"message": str(e)}, "ended_at": time.time()})
-            ads["steps"] = steps
+            if log is not None:
+                log.fail("fatal", e)
+                ads["steps"] = log.steps()
+            else:
+                ads = (db.get_flow(flow_id) or {}).get("ads") or {}
+                steps = ads.get("steps") or []
+                steps.append({"step": "fatal", "status": "failed", "error": {"message": str(e)}, "ended_at": time.time()})
+                ads["steps"] = steps
             _ads_update(flow_id, ads=ads, status="failed")
         except Exception:
             _ads_update(flow_id, status="failed")
 
 
+def _ads_live_steps(flow: dict) -> list[dict] | None:
+    """Step list of a running automation, read from the event log rather than the (milestone-only) flow row."""
+    ads = flow.get("ads") if isinstance(flow.get("ads"), dict) else {}
+    input_hash = (ads.get("automation") or {}).get("input_hash") if isinstance(ads.get("automation"), dict) else None
+    if flow.get("status") != "running" or not input_hash:
+        return None
+    return FlowStepLog(flow["id"], input_hash).steps()
+
+
+@app.get("/api/flows/{flow_id}/ads/events")
+async def api_ads_events(flow_id: str, after_id: int = 0, limit: int | None = 500):
+    """Append-only step events of the ads automation (poll with ``after_id`` = last seen id)."""
+    try:
+        events = await run_in_threadpool(db.list_flow_step_events, flow_id, after_id=after_id, limit=min(max(int(limit or 500), 1), 1000))
+        return {"data": events, "last_id": events[-1]["id"] if events else after_id}
+    except Exception as e:
+        return {"error": str(e), "data": []}
+
+
+def _ads_automation_job(job_id: str, params: dict) -> dict:
+    run_ads_automation_sync(params["flow_id"], params.get("payload") or {})
+    return {"flow_id": params["flow_id"]}
+
+
+register_job("flows.ads_automation", _ads_automation_job, queue="media", priority=4)
+
+
 @app.post("/api/flows/ads/launch")
 async def api_ads_launch(req: AdsAutomationLaunchRequest):
     try:
@@ -5652,18 +6165,10 @@ async def api_ads_launch(req: AdsAutomationLaunchRequest):
             "prompts": req.prompts or (f.get("prompts") or {}),
             "num_angles": req.num_angles or 3,
             "model": req.model,
+            "resume": req.resume is not False,
         }
-        def _tracked_ads(_fid: str, _pl: dict):
-            _sh.register_inflight(f"ads_automation:{_fid}", "ads_automation", store=None, label=f"ads {_fid}")
-            try:
-                with _sh.time_op("pipeline", "run_ads_automation_sync"):
-                    run_ads_automation_sync(_fid, _pl)
-            finally:
-                _sh.clear_inflight(f"ads_automation:{_fid}")
-
-        t = threading.Thread(target=_tracked_ads, args=(req.flow_id, payload), daemon=True)
-        t.start()
-        return {"flow_id": req.flow_id, "status": "queued"}
+        job = await run_in_threadpool(submit_job, "flows.ads_automation", {"flow_id": req.flow_id, "payload": payload}, label=f"ads {req.flow_id}")
+        return {"flow_id": req.flow_id, "status": "queued", "job_id": job["job_id"]}
     except Exception as e:
         return {"error": str(e)}
 
@@ -5687,9 +6192,19 @@ async def api_create_agent(req: AgentCreateRequest):
 
 
 @app.get("/api/agents")
-async def api_list_agents(limit: int | None = None):
+async def api_list_agents(request: Request, limit: int | None = None, cursor: str | None = None, q: str | None = None, fields: str | None = None):
     try:
-        return {"data": db.list_agents(limit=limit)}
+        eff = None if limit is None else min(max(limit, 1), 200)
+
+        async def _page():
+            items = await run_in_threadpool(db.list_agents, limit=eff, cursor=cursor, q=q)
+            next_cursor = db.keyset_cursor(items[-1]) if eff and len(items) == eff else None
+            return {"data": list_pages.sparse(items, fields), "next_cursor": next_cursor}
+
+        return await list_pages.conditional(
+            request, lambda: db.agents_list_version(q), _page,
+            limit=eff, cursor=cursor, q=q, fields=fields,
+        )
     except Exception as e:
         return {"error": str(e), "data": []}
 
@@ -5734,6 +6249,34 @@ async def api_set_ad_account(req: AdAccountSetRequest):
         return {"error": str(e)}
 
 
+@app.get("/api/meta/campaigns/multi")
+async def get_meta_campaigns_multi(ad_accounts: str, date_preset: str | None = None, start: str | None = None, end: str | None = None, profit_only: bool | None = False):
+    """Stream campaigns for several ad accounts as newline-delimited JSON.
+
+    One line per account (``{"ad_account", "data", "error"}``) is written as soon
+    as that account finishes, so the UI can render the fastest account first.
+    """
+    accounts: list[str] = []
+    for raw in (ad_accounts or "").split(","):
+        acct = _normalize_ad_acct_id(raw)
+        if acct and acct not in accounts:
+            accounts.append(acct)
+
+    def _lines():
+        for item in iter_campaigns_for_accounts(
+            accounts,
+            date_preset or "last_7d",
+            since=start,
+            until=end,
+            profit_only=bool(profit_only),
+        ):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    # Starlette iterates sync generators in its threadpool, so blocking Meta
+    # calls never run on the event loop.
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
 @app.get("/api/meta/ad_accounts")
 async def api_list_ad_accounts():
     try:
@@ -6179,9 +6722,19 @@ async def api_update_agent_run(agent_id: str, run_id: str, req: AgentRunUpdateRe
 
 
 @app.get("/api/agents/{agent_id}/runs")
-async def api_list_agent_runs(agent_id: str, limit: int | None = None):
+async def api_list_agent_runs(request: Request, agent_id: str, limit: int | None = None, cursor: str | None = None, status: str | None = None, fields: str | None = None):
     try:
-        return {"data": db.list_agent_runs(agent_id, limit=limit)}
+        eff = None if limit is None else min(max(limit, 1), 200)
+
+        async def _page():
+            items = await run_in_threadpool(db.list_agent_runs, agent_id, limit=eff, cursor=cursor, status=status)
+            next_cursor = db.keyset_cursor(items[-1]) if eff and len(items) == eff else None
+            return {"data": list_pages.sparse(items, fields), "next_cursor": next_cursor}
+
+        return await list_pages.conditional(
+            request, lambda: db.agent_runs_list_version(agent_id, status=status), _page,
+            agent_id=agent_id, limit=eff, cursor=cursor, status=status, fields=fields,
+        )
     except Exception as e:
         return {"error": str(e), "data": []}
 
@@ -6307,21 +6860,32 @@ async def api_update_draft(test_id: str, req: DraftSaveRequest):
 @app.get("/api/flows/{flow_id}")
 async def api_get_flow(flow_id: str):
     try:
-        f = db.get_flow(flow_id)
+        f = await db_async.get_flow(flow_id)
         if not f:
             return {"error": "not_found"}
+        live = await run_in_threadpool(_ads_live_steps, f)
+        if live is not None:
+            f["ads"]["steps"] = live
         return f
     except Exception as e:
         return {"error": str(e)}
 
 
 @app.get("/api/flows")
-async def api_list_flows(limit: int | None = None, store: str | None = None):
+async def api_list_flows(request: Request, limit: int | None = None, store: str | None = None, cursor: str | None = None, status: str | None = None, flow_type: str | None = None, fields: str | None = None):
     try:
         # When no limit provided, return all flows; otherwise cap to 200
         eff = None if (limit is None) else min(max(limit, 1), 200)
-        items = db.list_flows_light(limit=eff, store=store)
-        return {"data": items}
+
+        async def _page():
+            items = await run_in_threadpool(db.list_flows_light, limit=eff, store=store, cursor=cursor, status=status, flow_type=flow_type)
+            next_cursor = db.keyset_cursor(items[-1]) if eff and len(items) == eff else None
+            return {"data": list_pages.sparse(items, fields), "next_cursor": next_cursor}
+
+        return await list_pages.conditional(
+            request, lambda: db.flows_list_version(store, status=status, flow_type=flow_type), _page,
+            limit=eff, store=store, cursor=cursor, status=status, flow_type=flow_type, fields=fields,
+        )
     except Exception as e:
         return {"error": str(e), "data": []}
 
@@ -6589,31 +7153,75 @@ async def api_shopify_upload_files(
     return {"urls": verbose.get("cdn_urls", []), "images": images, "per_image": verbose.get("per_image", [])}
 
 
+def _ingest_upload(filename: str, data: bytes, content_type: str | None, source: str, *, persist: bool = False) -> str:
+    """Store an upload and return its /uploads path, reusing a stored copy of the same image."""
+    def _save() -> str:
+        path = save_file(filename, data)
+        if persist:
+            _persist_upload_blob(filename, data, content_type)
+        return path
+
+    if not str(content_type or mimetypes.guess_type(filename)[0] or "").startswith("image/"):
+        return _save()
+    try:
+        record, _ = register_image(data, save=_save, content_type=content_type, source=source, match_near=True)
+        url = str(record.get("url") or "")
+        if url.startswith("/uploads/"):
+            return url
+    except Exception as e:
+        logging.getLogger("app.uploads").warning("image index unavailable for %s: %s", filename, e)
+    return _save()
+
+
 # Simple uploads endpoint to store images and return absolute URLs for multimodal prompts or Shopify
 @app.post("/api/uploads")
 async def api_uploads(request: Request, files: List[UploadFile] = File(...)):
     upload_id = str(uuid4())
-    f_proto = request.headers.get("x-forwarded-proto")
-    f_host = request.headers.get("x-forwarded-host")
-    host = f_host or request.headers.get("host")
-    scheme = f_proto or request.url.scheme
-    req_base = f"{scheme}://{host}" if host else str(request.base_url).rstrip("/")
-    if BASE_URL and ("localhost" not in BASE_URL and "127.0.0.1" not in BASE_URL):
-        abs_base = BASE_URL.rstrip("/")
-    else:
-        abs_base = req_base
     urls: List[str] = []
     for i, f in enumerate(files or []):
         filename = f"{upload_id}_{i}_{f.filename}"
-        url_path = save_file(filename, await f.read())
-        encoded_path = quote(url_path, safe="/:")
-        if abs_base.endswith("/"):
-            urls.append(f"{abs_base[:-1]}{encoded_path}")
-        else:
-            urls.append(f"{abs_base}{encoded_path}")
+        url_path = await run_in_threadpool(_ingest_upload, filename, await f.read(), f.content_type, "upload")
+        urls.append(public_upload_url(url_path, request))
     return {"urls": urls}
 
 
+_MEDIA_MIGRATION_KEY = "media_inline_image_migration"
+_media_migration_lock = threading.Lock()
+
+
+def _run_media_migration(limit: int | None) -> None:
+    from app.media_assets import migrate_flow_inline_images
+    _sh.register_inflight("media_migration", "media_migration", label="inline image migration")
+    try:
+        db.set_app_setting(None, _MEDIA_MIGRATION_KEY, {"status": "running", "started_at": time.time()})
+        with _sh.time_op("pipeline", "migrate_flow_inline_images"):
+            stats = migrate_flow_inline_images(limit=limit)
+        db.set_app_setting(None, _MEDIA_MIGRATION_KEY, {"status": "done", "finished_at": time.time(), **stats})
+    except Exception as e:
+        db.set_app_setting(None, _MEDIA_MIGRATION_KEY, {"status": "error", "error": str(e), "finished_at": time.time()})
+    finally:
+        _sh.clear_inflight("media_migration")
+        _media_migration_lock.release()
+
+
+@app.post("/api/media/migrate_inline_images")
+async def api_media_migrate_inline_images(limit: int | None = None):
+    """Rewrite flows that embed base64 images to reference stored assets (runs in the background)."""
+    if not _media_migration_lock.acquire(blocking=False):
+        return {"status": "running"}
+    try:
+        threading.Thread(target=_run_media_migration, args=(limit,), daemon=False, name="media-migration").start()
+    except Exception as e:
+        _media_migration_lock.release()
+        return {"status": "error", "error": str(e)}
+    return {"status": "started"}
+
+
+@app.get("/api/media/migrate_inline_images")
+async def api_media_migrate_inline_images_status():
+    return {"data": db.get_app_setting(None, _MEDIA_MIGRATION_KEY)}
+
+
 @app.get("/proxy/image")
 async def proxy_image(url: str):
     """Fetch a remote image server-side and return it as same-origin.
@@ -8233,6 +8841,7 @@ mutation ThemeFilesUpsert($themeId: ID!, $files: [OnlineStoreThemeFilesUpsertFil
 
 def _theme_editor_openai_plan(prompt: str, theme_files: dict[str, str], repair_context: dict[str, Any] | None = None) -> dict[str, Any]:
     from app.integrations.openai_client import DEFAULT_LLM_MODEL, client as openai_client
+    from app.llm_gateway import complete as llm_complete
 
     compact_files: dict[str, str] = {}
     notes: list[str] = []
@@ -8271,12 +8880,16 @@ def _theme_editor_openai_plan(prompt: str, theme_files: dict[str, str], repair_c
         },
         ensure_ascii=False,
     )
-    resp = openai_client.chat.completions.create(
-        model=os.getenv("THEME_EDITOR_AGENT_MODEL", DEFAULT_LLM_MODEL),
-        messages=[
+    # A retry after a bad plan must ask again rather than replay the cached one.
+    resp = llm_complete(
+        "openai",
+        os.getenv("THEME_EDITOR_AGENT_MODEL", DEFAULT_LLM_MODEL),
+        [
             {"role": "system", "content": system},
             {"role": "user", "content": user},
         ],
+        openai_client.chat.completions.create,
+        cache=False,
         response_format={"type": "json_object"},
     )
     text = resp.choices[0].message.content or "{}"
@@ -8820,12 +9433,9 @@ async def api_wholesale_upload_image(request: Request, image: UploadFile = File(
         filename = f"wholesale_{file_id}_{safe_name}"
         data = await image.read()
         content_type = image.content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
-        url_path = save_file(filename, data)
-        _persist_upload_blob(filename, data, content_type)
-        # Build absolute URL using BASE_URL from config
-        base = (BASE_URL or "").rstrip("/")
-        encoded_path = quote(url_path, safe="/:")
-        abs_url = f"{base}{encoded_path}" if base else encoded_path
+        url_path = await run_in_threadpool(_ingest_upload, filename, data, content_type, "wholesale", persist=True)
+        filename = url_path.rsplit("/", 1)[-1]
+        abs_url = public_upload_url(url_path, request)
         return {
             "data": {
                 "url": abs_url,
@@ -8841,6 +9451,7 @@ async def api_wholesale_upload_image(request: Request, image: UploadFile = File(
 class WholesaleAnalyzeImageRequest(BaseModel):
     image_url: str
     target_category: Optional[str] = None
+    job: Optional[bool] = False
 
 
 def _wholesale_title_description_prompts() -> dict[str, str]:
@@ -8891,29 +9502,50 @@ async def api_wholesale_analyze_image(req: WholesaleAnalyzeImageRequest):
         image_url = (req.image_url or "").strip()
         if not image_url:
             return {"error": "image_url is required"}
-        data = await run_in_threadpool(gen_product_from_image, image_url, None, req.target_category)
-        if isinstance(data, dict):
-            org_req = WholesaleProductCreate(
-                title=data.get("title"),
-                description=". ".join(str(b).strip() for b in (data.get("benefits") or []) if str(b).strip()),
-                segment=data.get("segment"),
-                season=data.get("season"),
-                collection=data.get("collection"),
-                product_type=data.get("product_type"),
-                tags=[str(t) for t in (data.get("tags") or []) if str(t).strip()],
-                colors=[str(c) for c in (data.get("colors") or []) if str(c).strip()],
-                sizes=[str(s) for s in (data.get("sizes") or []) if str(s).strip()],
-            )
-            org = _wholesale_build_product_organization(org_req, store_type=req.target_category)
-            for key in ("segment", "season", "collection", "product_type"):
-                if org.get(key):
-                    data[key] = org.get(key)
-            data["tags"] = _wholesale_unique_labels([*(data.get("tags") or []), *(org.get("tags") or [])])
+        if req.job:
+            return _media_job_response("wholesale.analyze_image", {"image_url": image_url, "target_category": req.target_category})
+        data = await run_in_threadpool(_wholesale_analyze_image_sync, image_url, req.target_category)
         return {"data": data, "image_url": image_url}
     except Exception as e:
         return {"error": str(e)}
 
 
+def _wholesale_analyze_image_sync(image_url: str, target_category: str | None) -> Any:
+    data = _reuse_image_result(
+        image_url,
+        f"openai.product_from_image:{(target_category or '').strip().lower()}",
+        lambda: gen_product_from_image(image_url, None, target_category),
+    )
+    if isinstance(data, dict):
+        data = dict(data)
+        org_req = WholesaleProductCreate(
+            title=data.get("title"),
+            description=". ".join(str(b).strip() for b in (data.get("benefits") or []) if str(b).strip()),
+            segment=data.get("segment"),
+            season=data.get("season"),
+            collection=data.get("collection"),
+            product_type=data.get("product_type"),
+            tags=[str(t) for t in (data.get("tags") or []) if str(t).strip()],
+            colors=[str(c) for c in (data.get("colors") or []) if str(c).strip()],
+            sizes=[str(s) for s in (data.get("sizes") or []) if str(s).strip()],
+        )
+        org = _wholesale_build_product_organization(org_req, store_type=target_category)
+        for key in ("segment", "season", "collection", "product_type"):
+            if org.get(key):
+                data[key] = org.get(key)
+        data["tags"] = _wholesale_unique_labels([*(data.get("tags") or []), *(org.get("tags") or [])])
+    return data
+
+
+def _wholesale_analyze_image_job(params: dict):
+    image_url = params["image_url"]
+    yield 0, {"data": _wholesale_analyze_image_sync(image_url, params.get("target_category")), "image_url": image_url}
+
+
+# Depends on main-only helpers, so it always runs in the API process.
+register_media_job_kind("wholesale.analyze_image", _wholesale_analyze_image_job, celery=False)
+
+
 class PageBuilderTranslateRequest(BaseModel):
     slug: str
     store: str | None = None
@@ -9205,6 +9837,28 @@ def _wholesale_decode_data_url_image(data_url: str, fallback_name: str) -> tuple
         return None
 
 
+def _wholesale_clean_image_file(source: str, fallback_name: str) -> tuple[str, bytes] | None:
+    """Cleaned storefront image for ``source``; the same source bytes reuse the stored result."""
+    from app.media_assets import load_asset_bytes, store_data_url
+
+    def _generate() -> str | None:
+        data_url = gen_clean_wholesale_product_image_openai(source) or ""
+        try:
+            return store_data_url(data_url) or data_url or None
+        except Exception:
+            return data_url or None
+
+    result = _reuse_image_result(source, "openai.clean_wholesale", _generate) or ""
+    if result.startswith("data:"):
+        return _wholesale_decode_data_url_image(result, fallback_name)
+    loaded = load_asset_bytes(result)
+    if not loaded:
+        return None
+    mime, data = loaded
+    ext = mimetypes.guess_extension(mime) or ".png"
+    return f"{fallback_name}{'.jpg' if ext == '.jpe' else ext}", data
+
+
 def _wholesale_store_original_image_metafields(
     product_gid: str,
     image_url: str | None,
@@ -9257,8 +9911,7 @@ def _wholesale_prepare_storefront_images(
             logging.getLogger("app.wholesale").warning("Failed to upload vendor original to Shopify Files: %s", e)
 
         try:
-            clean_data_url = gen_clean_wholesale_product_image_openai(source)
-            decoded = _wholesale_decode_data_url_image(clean_data_url or "", f"wholesale-clean-{label}-{uuid4().hex[:8]}")
+            decoded = _wholesale_clean_image_file(source, f"wholesale-clean-{label}-{uuid4().hex[:8]}")
             if decoded:
                 generated_files.append(decoded)
             else:
@@ -9565,6 +10218,17 @@ def _wholesale_configure_product_background(
         pass
 
 
+def _wholesale_configure_product_job(job_id: str, params: dict) -> dict:
+    collection_name = params.pop("collection_name", None)
+    _wholesale_configure_product_background(**params)
+    if collection_name:
+        _wholesale_attach_product_to_collection(params["product_gid"], collection_name)
+    return {"product_gid": params["product_gid"]}
+
+
+register_job("wholesale.configure_product", _wholesale_configure_product_job, queue="media", priority=5)
+
+
 def _wholesale_inventory_levels_for_items(inventory_item_ids: list[Any]) -> dict[str, dict[str, Any]]:
     ids = [str(i).strip() for i in (inventory_item_ids or []) if str(i).strip() and str(i).strip() != "None"]
     max_ids = int(os.getenv("PTOS_WHOLESALE_INVENTORY_MAX_IDS", "250") or "250")
@@ -9865,7 +10529,7 @@ async def api_chat_catalog_product(vendor: str, id: str):
 
 
 @app.post("/api/wholesale/vendors/{vendor_id}/products")
-async def api_wholesale_create_product(vendor_id: str, req: WholesaleProductCreate, background_tasks: BackgroundTasks):
+async def api_wholesale_create_product(vendor_id: str, req: WholesaleProductCreate):
     """Create a product on the MMD Shopify store tagged with the vendor name."""
     try:
         vid = (vendor_id or "").strip().lower()
@@ -10014,32 +10678,32 @@ async def api_wholesale_create_product(vendor_id: str, req: WholesaleProductCrea
                 )
             except Exception as e:
                 logging.getLogger("app.wholesale").warning("Failed to save original wholesale image before background task: %s", e)
-            background_tasks.add_task(
-                _wholesale_configure_product_background,
-                product_gid,
-                title,
-                image_url,
-                catalog_image_url,
-                req.title,
-                req.description,
-                segment,
-                season,
-                req.cog_price,
-                explicit_variants[0]["price"] if explicit_variants else req.sale_price,
-                explicit_variants if explicit_variants else None,
-                vendor_name,
-                store_type,
-                req.colors,
-                req.size_groups,
-                req.sale_price,
-                req.compare_at_price,
+            await run_in_threadpool(
+                submit_job,
+                "wholesale.configure_product",
+                {
+                    "product_gid": product_gid,
+                    "initial_title": title,
+                    "image_url": image_url,
+                    "catalog_image_url": catalog_image_url,
+                    "title": req.title,
+                    "description": req.description,
+                    "segment": segment,
+                    "season": season,
+                    "cog_price": req.cog_price,
+                    "base_price": explicit_variants[0]["price"] if explicit_variants else req.sale_price,
+                    "explicit_variants": explicit_variants if explicit_variants else None,
+                    "vendor_name": vendor_name,
+                    "store_type": store_type,
+                    "colors": req.colors,
+                    "size_groups": req.size_groups,
+                    "sale_price": req.sale_price,
+                    "compare_at_price": req.compare_at_price,
+                    "collection_name": collection_name,
+                },
+                store=WHOLESALE_STORE,
+                label=f"wholesale product {title[:40]}",
             )
-            if collection_name:
-                background_tasks.add_task(
-                    _wholesale_attach_product_to_collection,
-                    product_gid,
-                    collection_name,
-                )
 
         return {"data": result, "background_processing": bool(product_gid), "organization": organization}
     except Exception as e:
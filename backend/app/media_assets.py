@@ -0,0 +1,189 @@
+"""Content-addressed store for generated images.
+
+Image generators used to hand back ``data:image/...;base64`` strings, which
+ended up inside flow JSON and were re-serialized on every flow update. Generated
+bytes are now written once to ``UPLOADS_DIR`` as ``gen_<sha256>.<ext>`` (mirrored
+into the DB like every other upload) and referenced by their ``/uploads/...``
+URL, made absolute with ``storage.public_upload_url`` so Shopify, Meta and the
+image models can fetch it. Identical images share one file.
+
+``migrate_flow_inline_images`` rewrites flows that still embed data URLs.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import logging
+import mimetypes
+import re
+import struct
+from pathlib import Path
+from typing import Any
+from urllib.parse import unquote
+
+from app.storage import ROOT, persist_upload_blob, public_upload_url, save_file
+
+_log = logging.getLogger("app.media_assets")
+
+_DATA_URL_RE = re.compile(r"^data:(image/[A-Za-z0-9.+-]+);base64,(.+)$", re.DOTALL)
+_EXT_BY_MIME = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/gif": ".gif"}
+
+
+def image_dimensions(data: bytes) -> tuple[int, int] | None:
+    """Width/height from PNG, JPEG, GIF or WebP headers (no image library needed)."""
+    try:
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            return struct.unpack(">II", data[16:24])
+        if data[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", data[6:10])
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            chunk = data[12:16]
+            if chunk == b"VP8 ":
+                w, h = struct.unpack("<HH", data[26:30])
+                return w & 0x3FFF, h & 0x3FFF
+            if chunk == b"VP8L":
+                bits = int.from_bytes(data[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        if data[:2] == b"\xff\xd8":
+            i = 2
+            while i + 9 < len(data):
+                if data[i] != 0xFF:
+                    i += 1
+                    continue
+                marker = data[i + 1]
+                if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                    h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                    return w, h
+                i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    except Exception:
+        return None
+    return None
+
+
+def store_image_bytes(data: bytes, mime: str | None = None) -> dict[str, Any]:
+    """Write generated image bytes once and return {url, sha256, width, height, bytes, content_type}."""
+    content_type = (mime or "image/png").split(";")[0].strip().lower() or "image/png"
+    digest = hashlib.sha256(data).hexdigest()
+    ext = _EXT_BY_MIME.get(content_type) or mimetypes.guess_extension(content_type) or ".png"
+    filename = f"gen_{digest[:32]}{ext}"
+    size = image_dimensions(data)
+    width, height = (size or (None, None))
+    if not (Path(ROOT) / filename).exists():
+        path = save_file(filename, data)
+        persist_upload_blob(filename, data, content_type, sha256=digest, width=width, height=height)
+    else:
+        path = f"/uploads/{filename}"
+    try:
+        from app.image_index import register_image
+        # Generated variants of one product look alike on purpose; index them without collapsing.
+        register_image(data, url=path, content_type=content_type, source="generated", width=width, height=height, match_near=False)
+    except Exception as e:
+        _log.debug("image index registration skipped for %s: %s", filename, e)
+    return {
+        "url": public_upload_url(path),
+        "sha256": digest,
+        "width": width,
+        "height": height,
+        "bytes": len(data),
+        "content_type": content_type,
+    }
+
+
+def image_url_for(mime: str | None, data: bytes) -> str:
+    """Asset URL for generated bytes; falls back to a data URL if the store is unavailable."""
+    try:
+        return store_image_bytes(data, mime)["url"]
+    except Exception as e:
+        _log.warning("Failed to store generated image, returning inline data URL: %s", e)
+        return f"data:{mime or 'image/png'};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def load_asset_bytes(url: str) -> tuple[str, bytes] | None:
+    """(content_type, bytes) for a stored ``/uploads/...`` asset, from disk or the DB mirror."""
+    from app.storage import load_upload_blob
+
+    name = unquote((url or "").split("?", 1)[0].rsplit("/", 1)[-1])
+    if not name or "/uploads/" not in (url or ""):
+        return None
+    local = Path(ROOT) / name
+    if local.is_file():
+        return mimetypes.guess_type(name)[0] or "application/octet-stream", local.read_bytes()
+    blob = load_upload_blob(name)
+    if not blob:
+        return None
+    data, content_type = blob
+    return content_type, data
+
+
+def store_data_url(value: str) -> str | None:
+    """Asset URL for an inline ``data:image/...`` string, or None when it isn't one."""
+    m = _DATA_URL_RE.match(value or "")
+    if not m:
+        return None
+    try:
+        data = base64.b64decode(m.group(2))
+    except Exception:
+        return None
+    if not data:
+        return None
+    return store_image_bytes(data, m.group(1))["url"]
+
+
+def rewrite_inline_images(value: Any) -> tuple[Any, int]:
+    """Replace every inline image data URL in a JSON-like value; returns (value, replaced_count)."""
+    if isinstance(value, str):
+        if value.startswith("data:image/"):
+            url = store_data_url(value)
+            if url:
+                return url, 1
+        return value, 0
+    if isinstance(value, list):
+        total = 0
+        out_list = []
+        for item in value:
+            new_item, n = rewrite_inline_images(item)
+            out_list.append(new_item)
+            total += n
+        return out_list, total
+    if isinstance(value, dict):
+        total = 0
+        out_dict = {}
+        for key, item in value.items():
+            new_item, n = rewrite_inline_images(item)
+            out_dict[key] = new_item
+            total += n
+        return out_dict, total
+    return value, 0
+
+
+def migrate_flow_inline_images(limit: int | None = None) -> dict[str, int]:
+    """Rewrite stored flows so generated images are referenced by asset URL instead of inline base64."""
+    from app import db
+
+    stats = {"flows_scanned": 0, "flows_updated": 0, "images_replaced": 0, "errors": 0}
+    for flow_id in db.list_flow_ids_with_inline_images(limit=limit):
+        stats["flows_scanned"] += 1
+        try:
+            flow = db.get_flow(flow_id) or {}
+            changes: dict[str, Any] = {}
+            replaced = 0
+            for section in ("product", "flow", "ui", "prompts", "settings", "ads"):
+                new_value, n = rewrite_inline_images(flow.get(section))
+                if n:
+                    changes[section] = new_value
+                    replaced += n
+            card_image, n = rewrite_inline_images(flow.get("card_image"))
+            if n:
+                changes["card_image"] = card_image
+                replaced += n
+            if changes:
+                db.update_flow_row(flow_id, **changes)
+                stats["flows_updated"] += 1
+                stats["images_replaced"] += replaced
+        except Exception as e:
+            stats["errors"] += 1
+            _log.warning("Inline image migration failed for flow %s: %s", flow_id, e)
+    return stats
@@ -0,0 +1,126 @@
+"""Background jobs for multi-image generation.
+
+Each media kind is a ``app.job_runner`` kind on the ``media`` queue, so
+persistence, Celery dispatch, the local worker pool, duplicate-delivery
+handling and health reporting are the job runner's. This module adapts
+runners that yield ``(index, item)`` pairs: every finished image goes to its
+own row through ``job_runner.put_job_item`` and the caller streams them from
+the database on any instance, while the job record only gets a heartbeat
+every few seconds.
+
+Jobs are idempotent by request hash (``job_runner.submit_job_once``).
+Submitting the same kind and params while a job is queued or running
+returns that job instead of starting a new one, so retries and double
+clicks attach to it. A finished job is not reused by default: generation is
+creative, and "regenerate" with the same prompt must produce new images.
+A kind can opt in with ``reuse_s``.
+
+Env vars (optional):
+  PTOS_MEDIA_JOB_REUSE_S    seconds a finished job answers identical requests, for kinds
+                            that don't pass ``reuse_s`` (default 0: never)
+  PTOS_MEDIA_JOB_STALE_S    seconds without progress before a running job counts as dead (default 900)
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Callable, Iterator, Tuple
+
+from app import job_runner
+
+MEDIA_JOB_REUSE_S = int(os.getenv("PTOS_MEDIA_JOB_REUSE_S", "0") or "0")
+MEDIA_JOB_STALE_S = int(os.getenv("PTOS_MEDIA_JOB_STALE_S", "900") or "900")
+
+_PROGRESS_WRITE_S = 5  # job record heartbeat (completed count) while items stream
+_PRIORITY = 4
+
+
+def _job_fn(runner: Callable[[dict], Iterator[Tuple[int, Any]]]) -> Callable[[str, dict], dict]:
+    def run(job_id: str, params: dict) -> dict:
+        done: set[int] = {int(e.get("index", -1)) for e in job_runner.job_items(job_id)}
+        last_touch = time.time()
+        for index, item in runner(params):
+            job_runner.put_job_item(job_id, index, item)
+            done.add(int(index))
+            if time.time() - last_touch >= _PROGRESS_WRITE_S:
+                job_runner.touch_job(job_id, completed=len(done))
+                last_touch = time.time()
+        return {"completed": len(done)}
+
+    return run
+
+
+def register_media_job_kind(
+    kind: str,
+    runner: Callable[[dict], Iterator[Tuple[int, Any]]],
+    *,
+    celery: bool = True,
+    reuse_s: int | None = None,
+) -> None:
+    """Register a job kind. Pass ``celery=False`` for runners the worker process can't import.
+
+    ``reuse_s`` lets a deterministic kind answer identical requests from a
+    finished job for that long (default ``MEDIA_JOB_REUSE_S``).
+    """
+    job_runner.register_job(
+        kind,
+        _job_fn(runner),
+        queue="media",
+        priority=_PRIORITY,
+        celery=celery,
+        stale_s=MEDIA_JOB_STALE_S,
+        reuse_s=MEDIA_JOB_REUSE_S if reuse_s is None else reuse_s,
+        module=getattr(runner, "__module__", None),
+    )
+
+
+def submit_media_job(kind: str, params: dict) -> tuple[dict, bool]:
+    """Create (or attach to) a job; returns (job, created)."""
+    return job_runner.submit_job_once(kind, params)
+
+
+def get_media_job(job_id: str) -> dict | None:
+    """Job record with ``items`` (completion order) loaded from the per-item rows."""
+    job = job_runner.get_job(job_id)
+    if job is None:
+        return None
+    job["items"] = job_runner.job_items(job_id)
+    return job
+
+
+def ordered_items(job: dict) -> list:
+    """Items in request order (``get_media_job`` returns completion order for streaming)."""
+    return [e["item"] for e in sorted(job.get("items") or [], key=lambda e: e.get("index", 0))]
+
+
+# ---------------- Built-in kinds (Gemini image sets) ----------------
+def _gemini_ad_image(params: dict) -> Iterator[Tuple[int, Any]]:
+    from app.integrations.gemini_client import iter_ad_images_from_image
+    return enumerate(iter_ad_images_from_image(params["image_url"], params["prompt"], int(params.get("num_images") or 1)))
+
+
+def _gemini_promotional_set(params: dict) -> Iterator[Tuple[int, Any]]:
+    from app.integrations.gemini_client import iter_promotional_images_from_angles
+    return iter_promotional_images_from_angles(params["image_url"], params.get("product") or {}, params.get("angles") or [], count=int(params.get("count") or 4))
+
+
+def _gemini_feature_benefit_set(params: dict) -> Iterator[Tuple[int, Any]]:
+    from app.integrations.gemini_client import iter_feature_benefit_images
+    return iter_feature_benefit_images(params["image_url"], params.get("product") or {}, count=int(params.get("count") or 6))
+
+
+def _gemini_variant_set(params: dict) -> Iterator[Tuple[int, Any]]:
+    from app.integrations.gemini_client import iter_variant_images_from_image
+    return iter_variant_images_from_image(
+        params["image_url"],
+        style_prompt=params.get("style_prompt"),
+        max_variants=params.get("max_variants"),
+        variants_override=params.get("variants_override"),
+    )
+
+
+register_media_job_kind("gemini.ad_image", _gemini_ad_image)
+register_media_job_kind("gemini.promotional_set", _gemini_promotional_set)
+register_media_job_kind("gemini.feature_benefit_set", _gemini_feature_benefit_set)
+register_media_job_kind("gemini.variant_set", _gemini_variant_set)
@@ -45,6 +45,8 @@ from app.page_builder_templates import (
     render_description,
     render_product,
 )
+from app.llm_gateway import complete as _llm_complete
+from app.translation_memory import translate_with_memory
 
 
 client = OpenAI()
@@ -158,12 +160,16 @@ RULES:
 - Return ONLY valid JSON, no markdown, no explanation."""
 
     try:
-        resp = client.chat.completions.create(
-            model=PAGE_BUILDER_MODEL,
-            messages=[
+        # Creative copy: a regenerate must not return the previous page's text.
+        resp = _llm_complete(
+            "openai",
+            PAGE_BUILDER_MODEL,
+            [
                 {"role": "system", "content": "You are a JSON generator. Output ONLY valid JSON. No markdown, no explanation."},
                 {"role": "user", "content": content_prompt},
             ],
+            client.chat.completions.create,
+            cache=False,
             temperature=0.7,
             timeout=25,
         )
@@ -1075,9 +1081,13 @@ def run_page_builder_agent(
         _log.info(f"Agent iteration {iteration + 1}/{max_iters}")
         # Force tool call on EVERY iteration — agent must always use tools
         try:
-            resp = client.chat.completions.create(
-                model=(model or PAGE_BUILDER_MODEL),
-                messages=working,
+            # Each turn drives tool calls that create or edit pages, so it is never served from cache.
+            resp = _llm_complete(
+                "openai",
+                model or PAGE_BUILDER_MODEL,
+                working,
+                client.chat.completions.create,
+                cache=False,
                 tools=PAGE_BUILDER_TOOLS,
                 tool_choice="required",
                 timeout=30,
@@ -1266,22 +1276,29 @@ def _translate_sections_batch(
         'Return a JSON object: {"translations": {"section_id": "translated_html", ...}}'
     )
 
-    user_parts = ["Translate these HTML sections:\n"]
-    for sid, html in sections_html.items():
-        user_parts.append(f"=== SECTION: {sid} ===\n{html}\n")
-
-    try:
-        resp = client.chat.completions.create(
-            model="gpt-5.4-mini",
-            messages=[
+    def _translate_chunk(chunk: dict[str, str]) -> dict:
+        user_parts = ["Translate these HTML sections:\n"]
+        for sid, html in chunk.items():
+            user_parts.append(f"=== SECTION: {sid} ===\n{html}\n")
+        resp = _llm_complete(
+            "openai",
+            "gpt-5.4-mini",
+            [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": "\n".join(user_parts)},
             ],
+            client.chat.completions.create,
+            cache=False,  # retry rounds resend the same chunk; the translation memory dedupes
             response_format={"type": "json_object"},
             temperature=0.3,
         )
         result = json.loads(resp.choices[0].message.content)
         return result.get("translations", result)
+
+    # Sections already translated on a previous run come from the translation
+    # memory; only new or edited section HTML is sent to the model.
+    try:
+        return translate_with_memory(sections_html, locale, _translate_chunk, domain="page_section", kind="html")
     except Exception as e:
         _log.error(f"Translation to {locale} failed: {e}")
         return {}
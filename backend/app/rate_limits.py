@@ -0,0 +1,129 @@
+"""Process-wide concurrency and pacing limits per outbound provider.
+
+Background jobs fan out to OpenAI, Gemini, Meta, Shopify and Clarity from many
+threads at once. ``provider_slot("openai")`` bounds how many calls to one
+provider run concurrently in this process and spaces call starts so an optional
+per-provider QPS is never exceeded. Limits are shared by every caller, so two
+bulk jobs running side by side split the budget instead of doubling it.
+
+Limiter names may be scoped, e.g. ``"openai:gpt-5"`` for a per-model budget;
+a scoped limiter defaults to its provider's limits.
+
+Env vars (optional; ``<PROVIDER>`` is the upper-cased name with every
+non-alphanumeric character replaced by ``_``, e.g. ``OPENAI_GPT_5``):
+  PTOS_<PROVIDER>_MAX_CONCURRENCY   concurrent calls allowed (see DEFAULT_LIMITS)
+  PTOS_<PROVIDER>_QPS               max call starts per second; 0 = unpaced
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import re
+import threading
+import time
+from typing import Any
+
+# provider -> (max concurrency, qps)
+DEFAULT_LIMITS: dict[str, tuple[int, float]] = {
+    "openai": (6, 0.0),
+    "gemini": (3, 0.0),
+    "meta": (4, 0.0),
+    "shopify": (4, 4.0),
+    "clarity": (2, 0.0),
+}
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        raw = os.getenv(name, "")
+        return float(raw) if raw not in (None, "") else default
+    except Exception:
+        return default
+
+
+class ProviderLimiter:
+    """Bounded semaphore plus a start-time pacer for one provider."""
+
+    def __init__(self, name: str, max_concurrency: int, qps: float = 0.0):
+        self.name = name
+        self.max_concurrency = max(1, int(max_concurrency or 1))
+        self.qps = max(0.0, float(qps or 0.0))
+        self._sem = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+        self._in_flight = 0
+        self._calls = 0
+        self._wait_ms_total = 0.0
+
+    def _pace(self) -> None:
+        if self.qps <= 0:
+            return
+        interval = 1.0 / self.qps
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + interval
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Hold one concurrency slot for the duration of the block."""
+        started = time.perf_counter()
+        self._sem.acquire()
+        try:
+            self._pace()
+            with self._lock:
+                self._in_flight += 1
+                self._calls += 1
+                self._wait_ms_total += (time.perf_counter() - started) * 1000.0
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+        finally:
+            self._sem.release()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "qps": self.qps,
+                "in_flight": self._in_flight,
+                "calls": self._calls,
+                "avg_wait_ms": round(self._wait_ms_total / self._calls, 1) if self._calls else 0.0,
+            }
+
+
+_LIMITERS: dict[str, ProviderLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    name = str(provider or "").strip().lower() or "default"
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(name)
+        if limiter is None:
+            default_conc, default_qps = DEFAULT_LIMITS.get(name) or DEFAULT_LIMITS.get(name.split(":", 1)[0], (4, 0.0))
+            prefix = "PTOS_" + re.sub(r"[^A-Z0-9]", "_", name.upper())
+            limiter = ProviderLimiter(
+                name,
+                int(_env_number(f"{prefix}_MAX_CONCURRENCY", default_conc)),
+                _env_number(f"{prefix}_QPS", default_qps),
+            )
+            _LIMITERS[name] = limiter
+        return limiter
+
+
+def provider_slot(provider: str):
+    """Context manager: ``with provider_slot("openai"): client.chat...``."""
+    return get_limiter(provider).slot()
+
+
+def limiter_stats() -> dict[str, dict[str, Any]]:
+    with _LIMITERS_LOCK:
+        items = list(_LIMITERS.items())
+    return {name: limiter.stats() for name, limiter in items}
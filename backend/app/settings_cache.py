@@ -0,0 +1,287 @@
+"""Read-through cache for hot AppSetting keys.
+
+Request paths read the same few settings over and over. Examples are the
+ad account, the product-life instructions, the confirmation users, the USD
+rate, each store's ``shopify_oauth`` record (needed to resolve every Shopify
+call's token) and wholesale vendor records. Each read used to open a session
+and decode JSON. ``db.get_app_setting`` now serves these keys from process
+memory, and ``db.set_app_setting`` and the deletes drop the local entry.
+
+Entries are versioned. Every invalidation bumps the key's version, and a value
+loaded before that bump is not cached. A slow read therefore can't put back
+what a concurrent write just replaced.
+
+Other instances learn about a write through Redis pub/sub. A daemon thread
+subscribes to the invalidation channel and publishes this instance's
+invalidations. While the bus is disconnected, entries live only TTL_S, which
+bounds staleness across instances. The cache is also cleared on every
+(re)connect, because messages may have been missed.
+
+``add_listener`` lets derived state follow the same invalidations. For
+example, shopify_client's per-store config re-resolves when ``shopify_oauth``
+changes.
+
+Env vars (optional):
+  PTOS_SETTINGS_CACHE_TTL_S        entry lifetime while the invalidation bus is down (default 30; 0 disables the cache)
+  PTOS_SETTINGS_CACHE_BUS_TTL_S    entry lifetime while the bus is connected (default 600)
+  PTOS_SETTINGS_CACHE_REDIS_URL    Redis for invalidation messages (default CELERY_BROKER_URL; "off" disables)
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Awaitable, Callable
+from uuid import uuid4
+
+_log = logging.getLogger("app.settings_cache")
+
+TTL_S = int(os.getenv("PTOS_SETTINGS_CACHE_TTL_S", "30") or "0")
+BUS_TTL_S = int(os.getenv("PTOS_SETTINGS_CACHE_BUS_TTL_S", "600") or "0")
+
+HOT_KEYS = frozenset({
+    "meta_ad_account",
+    "product_life_instructions",
+    "confirmation_users",
+    "usd_to_mad_rate",
+    "shopify_oauth",
+})
+HOT_PREFIXES = ("wholesale_vendor:",)
+
+INSTANCE_ID = uuid4().hex[:10]
+_CHANNEL = "settings_invalidate_v1"
+_BUS_RETRY_S = 30
+
+_LOCK = threading.Lock()
+_ENTRIES: dict[tuple[str, str], tuple[tuple[int, int], float, Any]] = {}  # (store, key) -> (version, loaded_at, value)
+_VERSIONS: dict[tuple[str, str], int] = {}
+_epoch = 0  # bumped by prefix invalidations and clears, which can't enumerate the keys they cover
+_STATS = {"hits": 0, "misses": 0, "invalidations": 0, "remote_invalidations": 0}
+
+_LISTENERS: list[Callable[[str | None, str], None]] = []
+
+_outbox: "queue.SimpleQueue[str]" = queue.SimpleQueue()
+_bus_checked = False
+_bus_thread: threading.Thread | None = None
+_bus_connected = False
+
+
+def cacheable(key: str) -> bool:
+    return TTL_S > 0 and (key in HOT_KEYS or key.startswith(HOT_PREFIXES))
+
+
+def _ck(store: str | None, key: str) -> tuple[str, str]:
+    return (store or "").strip(), key
+
+
+def _copy(value: Any) -> Any:
+    # Callers mutate what they read (read-modify-write), so never hand out the cached object.
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+
+def lookup(store: str | None, key: str) -> tuple[bool, Any, tuple[int, int]]:
+    """(hit, value, version); after a miss, pass ``version`` to ``fill`` with the loaded value."""
+    ck = _ck(store, key)
+    ttl = BUS_TTL_S if _bus_connected else TTL_S
+    with _LOCK:
+        version = (_epoch, _VERSIONS.get(ck, 0))
+        entry = _ENTRIES.get(ck)
+        if entry is not None and entry[0] == version and time.monotonic() - entry[1] < ttl:
+            _STATS["hits"] += 1
+            return True, _copy(entry[2]), version
+        _STATS["misses"] += 1
+        return False, None, version
+
+
+def fill(store: str | None, key: str, version: tuple[int, int], value: Any) -> None:
+    """Cache a value loaded after ``lookup`` unless the key was invalidated in between."""
+    ck = _ck(store, key)
+    with _LOCK:
+        if (_epoch, _VERSIONS.get(ck, 0)) == version:
+            _ENTRIES[ck] = (version, time.monotonic(), _copy(value))
+
+
+def get(store: str | None, key: str, load: Callable[[], Any]) -> Any:
+    if not cacheable(key):
+        return load()
+    _ensure_bus()
+    hit, value, version = lookup(store, key)
+    if hit:
+        return value
+    value = load()
+    fill(store, key, version, value)
+    return value
+
+
+async def aget(store: str | None, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+    if not cacheable(key):
+        return await load()
+    _ensure_bus()
+    hit, value, version = lookup(store, key)
+    if hit:
+        return value
+    value = await load()
+    fill(store, key, version, value)
+    return value
+
+
+def add_listener(fn: Callable[[str | None, str], None]) -> None:
+    """Call ``fn(store, key_or_prefix)`` on every invalidation, local or remote (``store`` None: every store)."""
+    _LISTENERS.append(fn)
+
+
+def _notify(store: str | None, key: str) -> None:
+    for fn in list(_LISTENERS):
+        try:
+            fn(store, key)
+        except Exception as e:
+            _log.warning("settings cache listener failed for %s: %s", key, e)
+
+
+def _drop(store: str | None, key: str) -> None:
+    ck = _ck(store, key)
+    with _LOCK:
+        _VERSIONS[ck] = _VERSIONS.get(ck, 0) + 1
+        _ENTRIES.pop(ck, None)
+        _STATS["invalidations"] += 1
+    _notify(store, key)
+
+
+def _drop_prefix(store: str | None, prefix: str) -> None:
+    global _epoch
+    with _LOCK:
+        _epoch += 1
+        for ck in [ck for ck in _ENTRIES if ck[1].startswith(prefix) and (store is None or ck[0] == (store or "").strip())]:
+            _ENTRIES.pop(ck, None)
+        _STATS["invalidations"] += 1
+    _notify(store, prefix)
+
+
+def _prefix_may_cover(prefix: str) -> bool:
+    return TTL_S > 0 and (
+        any(k.startswith(prefix) for k in HOT_KEYS)
+        or any(p.startswith(prefix) or prefix.startswith(p) for p in HOT_PREFIXES)
+    )
+
+
+def invalidate(store: str | None, key: str) -> None:
+    """Drop ``key`` here and on every other instance (call after the write commits)."""
+    if not cacheable(key):
+        return
+    _drop(store, key)
+    _publish({"store": store, "key": key})
+
+
+def invalidate_prefix(store: str | None, prefix: str) -> None:
+    """Drop every cached key starting with ``prefix`` (``store=None``: in every store)."""
+    if not _prefix_may_cover(prefix):
+        return
+    _drop_prefix(store, prefix)
+    _publish({"store": store, "prefix": prefix})
+
+
+def clear() -> None:
+    global _epoch
+    with _LOCK:
+        _epoch += 1
+        _ENTRIES.clear()
+    _notify(None, "")
+
+
+def stats() -> dict[str, Any]:
+    with _LOCK:
+        return {**_STATS, "entries": len(_ENTRIES), "bus_connected": _bus_connected, "ttl_s": BUS_TTL_S if _bus_connected else TTL_S}
+
+
+# ---------------------------------------------------------------------------
+# Cross-instance invalidation (Redis pub/sub; degrades to TTL_S expiry)
+# ---------------------------------------------------------------------------
+
+
+def _redis_url() -> str:
+    url = (os.getenv("PTOS_SETTINGS_CACHE_REDIS_URL") or "").strip()
+    if not url:
+        try:
+            from app.config import CELERY_BROKER_URL as url
+        except Exception:
+            url = ""
+    return "" if url.lower() == "off" else url
+
+
+def _publish(message: dict) -> None:
+    _ensure_bus()
+    if _bus_thread is not None:
+        _outbox.put(json.dumps({**message, "origin": INSTANCE_ID}))
+
+
+def _on_message(raw: Any) -> None:
+    try:
+        message = json.loads(raw)
+    except Exception:
+        return
+    if not isinstance(message, dict) or message.get("origin") == INSTANCE_ID:
+        return
+    if message.get("prefix"):
+        _drop_prefix(message.get("store"), str(message["prefix"]))
+    elif message.get("key"):
+        _drop(message.get("store"), str(message["key"]))
+    else:
+        return
+    with _LOCK:
+        _STATS["remote_invalidations"] += 1
+
+
+def _bus_loop(url: str) -> None:
+    global _bus_connected
+    import redis  # type: ignore
+
+    while True:
+        try:
+            client = redis.Redis.from_url(url, decode_responses=True, socket_connect_timeout=3, socket_timeout=5, health_check_interval=30)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_CHANNEL)
+            clear()  # invalidations sent while we were disconnected are lost
+            _bus_connected = True
+            _log.info("settings cache bus connected (instance=%s)", INSTANCE_ID)
+            while True:
+                msg = pubsub.get_message(timeout=0.5)
+                if msg and msg.get("type") == "message":
+                    _on_message(msg.get("data"))
+                while True:
+                    try:
+                        payload = _outbox.get_nowait()
+                    except queue.Empty:
+                        break
+                    client.publish(_CHANNEL, payload)
+        except Exception as e:
+            _log.warning("settings cache bus unavailable; entries expire after %ss: %s", TTL_S, e)
+        _bus_connected = False
+        while True:  # nobody is listening for these; peers fall back to their own TTL
+            try:
+                _outbox.get_nowait()
+            except queue.Empty:
+                break
+        time.sleep(_BUS_RETRY_S)
+
+
+def _ensure_bus() -> None:
+    global _bus_checked, _bus_thread
+    if _bus_checked:
+        return
+    with _LOCK:
+        if _bus_checked:
+            return
+        _bus_checked = True
+        url = _redis_url()
+        try:
+            import redis  # type: ignore  # noqa: F401
+        except Exception:
+            url = ""
+        if url:
+            _bus_thread = threading.Thread(target=_bus_loop, args=(url,), name="settings-cache-bus", daemon=True)
+            _bus_thread.start()
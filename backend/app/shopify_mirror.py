@@ -0,0 +1,325 @@
+"""Webhook-fed local mirrors of Shopify orders, products and inventory.
+
+Read paths used to poll Shopify for every dashboard load. Here, Shopify pushes
+``orders/*``, ``products/*`` and ``inventory_levels/update`` webhooks to
+``/api/shopify/webhooks/{store}``. Each delivery is written to the durable
+``shopify_webhook_events`` log, idempotent by webhook id, before the endpoint
+answers. A debounced applier then drains the log in batches: it keeps the
+latest payload per resource and upserts into the mirror tables. The upserts
+never let an older ``updated_at`` overwrite a newer row, so retries and
+out-of-order deliveries are harmless. Order upserts also feed the
+confirmation work queue (``app.confirmation_queue``).
+
+``reconcile(store)`` covers missed deliveries. It pages orders and products
+updated since the last watermark (minus an overlap) through the REST API and
+upserts them the same way. Inventory levels have no ``updated_at_min`` filter,
+so it re-reads the levels of every mirrored variant's inventory item. It runs
+as a job on the ``warm`` queue; mirror reads call ``ensure_fresh`` to schedule
+it every RECONCILE_S.
+
+Env vars (optional):
+  PTOS_SHOPIFY_WEBHOOK_BATCH_MS      debounce before the applier drains new events (default 500)
+  PTOS_SHOPIFY_WEBHOOK_BATCH_SIZE    events per applier batch (default 500)
+  PTOS_SHOPIFY_WEBHOOK_RETAIN_DAYS   processed events kept in the log (default 7)
+  PTOS_SHOPIFY_MIRROR_BACKFILL_DAYS  first reconcile looks back this far (default 30)
+  PTOS_SHOPIFY_MIRROR_OVERLAP_S      reconcile re-reads this much before the watermark (default 600)
+  PTOS_SHOPIFY_MIRROR_MAX_PAGES      REST pages per resource per reconcile (default 40)
+  PTOS_SHOPIFY_MIRROR_RECONCILE_S    seconds between reconciles triggered by reads (default 900)
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any
+from urllib.parse import urlencode
+
+from app import db
+from app.job_runner import register_job
+
+_log = logging.getLogger("app.shopify_mirror")
+
+BATCH_MS = int(os.getenv("PTOS_SHOPIFY_WEBHOOK_BATCH_MS", "500") or "500")
+BATCH_SIZE = int(os.getenv("PTOS_SHOPIFY_WEBHOOK_BATCH_SIZE", "500") or "500")
+RETAIN_DAYS = int(os.getenv("PTOS_SHOPIFY_WEBHOOK_RETAIN_DAYS", "7") or "7")
+BACKFILL_DAYS = int(os.getenv("PTOS_SHOPIFY_MIRROR_BACKFILL_DAYS", "30") or "30")
+OVERLAP_S = int(os.getenv("PTOS_SHOPIFY_MIRROR_OVERLAP_S", "600") or "600")
+MAX_PAGES = int(os.getenv("PTOS_SHOPIFY_MIRROR_MAX_PAGES", "40") or "40")
+RECONCILE_S = int(os.getenv("PTOS_SHOPIFY_MIRROR_RECONCILE_S", "900") or "900")
+
+# topic -> (mirror, action)
+TOPICS: dict[str, tuple[str, str]] = {
+    "orders/create": ("orders", "upsert"),
+    "orders/updated": ("orders", "upsert"),
+    "orders/cancelled": ("orders", "upsert"),
+    "orders/delete": ("orders", "delete"),
+    "products/create": ("products", "upsert"),
+    "products/update": ("products", "upsert"),
+    "products/delete": ("products", "delete"),
+    "inventory_levels/update": ("inventory", "upsert"),
+}
+
+_SYNC_KEY = "shopify_mirror_sync"
+_LOCK = threading.Lock()
+_APPLY_LOCK = threading.Lock()
+_timer: threading.Timer | None = None
+_STATS = {"received": 0, "duplicates": 0, "applied": 0, "batches": 0, "errors": 0}
+_submitted: dict[str | None, float] = {}
+# /inventory_levels.json accepts at most 50 inventory_item_ids per request.
+_INVENTORY_CHUNK = 50
+
+
+def verify_webhook_hmac(body: bytes, provided: str | None, secrets: list[str]) -> bool:
+    """Shopify signs the raw body: base64(HMAC-SHA256(secret, body)) in X-Shopify-Hmac-Sha256."""
+    sig = str(provided or "").strip()
+    if not (body is not None and sig):
+        return False
+    for secret in secrets:
+        if not secret:
+            continue
+        digest = base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+        if hmac.compare_digest(digest, sig):
+            return True
+    return False
+
+
+def _resource_id(topic: str, payload: dict) -> str | None:
+    if topic == "inventory_levels/update":
+        return f"{payload.get('inventory_item_id')}:{payload.get('location_id')}"
+    rid = payload.get("id")
+    return str(rid) if rid is not None else None
+
+
+def ingest(store: str | None, topic: str, webhook_id: str, payload: dict) -> bool:
+    """Log a verified delivery and schedule the applier; False for duplicates and unknown topics."""
+    if topic not in TOPICS or not isinstance(payload, dict):
+        return False
+    created = db.record_shopify_webhook_event(webhook_id, store, topic, payload, resource_id=_resource_id(topic, payload))
+    with _LOCK:
+        _STATS["received" if created else "duplicates"] += 1
+    if created:
+        schedule_apply()
+    return created
+
+
+def schedule_apply(delay_ms: int | None = None) -> None:
+    """Drain the log shortly; bursts of deliveries collapse into one batch."""
+    global _timer
+    with _LOCK:
+        if _timer is not None and _timer.is_alive():
+            return
+        _timer = threading.Timer(max(0, BATCH_MS if delay_ms is None else delay_ms) / 1000.0, _apply_in_background)
+        _timer.daemon = True
+        _timer.start()
+
+
+def _apply_in_background() -> None:
+    try:
+        apply_pending()
+    except Exception as e:
+        _log.warning("shopify webhook applier failed: %s", e)
+
+
+def _updated_key(payload: dict) -> str:
+    return str(payload.get("updated_at") or "")
+
+
+def _upsert_orders(store: str | None, orders: list[dict]) -> int:
+    """Order mirror upsert plus the confirmation-queue projection derived from it."""
+    from app.confirmation_queue import apply_orders
+
+    written = db.upsert_shopify_orders(store, orders)
+    try:
+        apply_orders(store, orders)
+    except Exception as e:
+        _log.warning("confirmation queue projection failed store=%s: %s", store, e)
+    return written
+
+
+def apply_pending(*, max_batches: int = 20) -> dict[str, int]:
+    """Apply unprocessed events in batches; returns counts for this run."""
+    totals = {"events": 0, "orders": 0, "products": 0, "inventory": 0, "deleted": 0}
+    if not _APPLY_LOCK.acquire(blocking=False):
+        return totals  # another applier in this process is already draining
+    try:
+        for _ in range(max(1, max_batches)):
+            events = db.list_pending_shopify_webhook_events(BATCH_SIZE)
+            if not events:
+                break
+            # Latest payload per (store, mirror, resource): a burst of orders/updated for one order writes once.
+            latest: dict[tuple, dict] = {}
+            deletes: dict[tuple[str | None, str], list[str]] = {}
+            for ev in events:
+                mirror, action = TOPICS.get(ev["topic"], (None, None))
+                payload = ev.get("payload") or {}
+                if mirror is None or not isinstance(payload, dict):
+                    continue
+                if action == "delete":
+                    deletes.setdefault((ev["store"], mirror), []).append(str(payload.get("id") or ""))
+                    continue
+                key = (ev["store"], mirror, ev.get("resource_id"))
+                prev = latest.get(key)
+                if prev is None or _updated_key(payload) >= _updated_key(prev):
+                    latest[key] = payload
+
+            grouped: dict[tuple[str | None, str], list[dict]] = {}
+            for (store, mirror, _), payload in latest.items():
+                grouped.setdefault((store, mirror), []).append(payload)
+            errors: dict[int, str] = {}
+            for (store, mirror), payloads in grouped.items():
+                try:
+                    if mirror == "orders":
+                        totals["orders"] += _upsert_orders(store, payloads)
+                    elif mirror == "products":
+                        totals["products"] += db.upsert_shopify_products(store, payloads)
+                    else:
+                        totals["inventory"] += db.upsert_shopify_inventory_levels(store, payloads)
+                except Exception as e:
+                    _log.warning("mirror upsert failed store=%s mirror=%s: %s", store, mirror, e)
+                    for ev in events:
+                        if ev["store"] == store and TOPICS.get(ev["topic"], ("",))[0] == mirror:
+                            errors[ev["id"]] = str(e)
+            for (store, mirror), ids in deletes.items():
+                totals["deleted"] += db.delete_shopify_mirror_rows(store, mirror, ids)
+                if mirror == "orders":
+                    db.retire_confirmation_queue(store, order_ids=ids)
+            db.mark_shopify_webhook_events([ev["id"] for ev in events], errors=errors)
+            totals["events"] += len(events)
+            with _LOCK:
+                _STATS["applied"] += len(events)
+                _STATS["batches"] += 1
+                _STATS["errors"] += len(errors)
+            if len(events) < BATCH_SIZE:
+                break
+        if totals["events"]:
+            db.prune_shopify_webhook_events(time.time() - RETAIN_DAYS * 86400)
+    finally:
+        _APPLY_LOCK.release()
+    return totals
+
+
+def _page_resource(store: str | None, resource: str, params: dict) -> tuple[list[dict], bool]:
+    """All pages of ``/{resource}.json`` for params (cursor pagination); (rows, complete)."""
+    from app.integrations.shopify_client import _parse_link_rel, _rest_get_store_raw
+
+    rows: list[dict] = []
+    page_info: str | None = None
+    for _ in range(max(1, MAX_PAGES)):
+        q = {"page_info": page_info, "limit": 250} if page_info else params
+        resp = _rest_get_store_raw(store, f"/{resource}.json?" + urlencode(q))
+        data = resp.json() if resp.content else {}
+        rows.extend((data or {}).get(resource) or [])
+        page_info = _parse_link_rel(resp.headers.get("Link"), "next")
+        if not page_info:
+            return rows, True
+    return rows, False
+
+
+def reconcile(store: str | None, *, since: datetime | None = None) -> dict[str, Any]:
+    """Re-read orders/products updated since the watermark and upsert them (covers missed webhooks)."""
+    apply_pending()  # events left behind by an instance that died before its applier ran
+    state = db.get_app_setting(store, _SYNC_KEY) or {}
+    if not isinstance(state, dict):
+        state = {}
+    started = datetime.utcnow()
+    out: dict[str, Any] = {"store": store}
+    for resource, upsert, extra in (
+        ("orders", _upsert_orders, {"status": "any"}),
+        ("products", db.upsert_shopify_products, {}),
+    ):
+        mark = since
+        if mark is None:
+            last = db._shopify_ts(state.get(f"{resource}_updated_at"))
+            mark = (last - timedelta(seconds=OVERLAP_S)) if last else (started - timedelta(days=BACKFILL_DAYS))
+        params = {**extra, "updated_at_min": mark.isoformat() + "Z", "limit": 250, "order": "updated_at asc"}
+        rows, complete = _page_resource(store, resource, params)
+        written = upsert(store, rows)
+        out[resource] = {"fetched": len(rows), "written": written, "complete": complete, "since": params["updated_at_min"]}
+        if complete:
+            state[f"{resource}_updated_at"] = started.isoformat() + "Z"
+        elif rows:
+            # Partial sweep: resume from the newest row we stored instead of the start time.
+            newest = max((str(r.get("updated_at") or "") for r in rows), default="")
+            if newest:
+                state[f"{resource}_updated_at"] = newest
+    out["inventory"] = _reconcile_inventory(store)
+    state["reconciled_at"] = time.time()
+    db.set_app_setting(store, _SYNC_KEY, state)
+    return out
+
+
+def _reconcile_inventory(store: str | None) -> dict[str, Any]:
+    """Current levels for the inventory items of mirrored products (missed inventory_levels/update)."""
+    items = db.list_mirrored_inventory_item_ids(store)
+    fetched = written = 0
+    complete = True
+    for i in range(0, len(items), _INVENTORY_CHUNK):
+        chunk = items[i:i + _INVENTORY_CHUNK]
+        rows, done = _page_resource(store, "inventory_levels", {"inventory_item_ids": ",".join(chunk), "limit": 250})
+        fetched += len(rows)
+        written += db.upsert_shopify_inventory_levels(store, rows)
+        complete = complete and done
+    return {"items": len(items), "fetched": fetched, "written": written, "complete": complete}
+
+
+def _reconcile_job(job_id: str, params: dict) -> dict:
+    return reconcile(params.get("store"))
+
+
+def ensure_fresh(store: str | None) -> None:
+    """Schedule a reconcile when the last one is older than RECONCILE_S (at most one pending per store and instance)."""
+    now = time.time()
+    with _LOCK:
+        if now - _submitted.get(store, 0.0) < RECONCILE_S:
+            return
+        _submitted[store] = now
+    try:
+        state = db.get_app_setting(store, _SYNC_KEY)
+        if now - float((state if isinstance(state, dict) else {}).get("reconciled_at") or 0) < RECONCILE_S:
+            return
+        from app.job_runner import submit_job
+        submit_job("shopify.reconcile_mirror", {"store": store}, store=store, label=f"shopify mirror reconcile {store or 'default'}")
+    except Exception as e:
+        _log.warning("shopify mirror reconcile submit failed for %s: %s", store, e)
+
+
+WEBHOOK_SUBSCRIPTION_CREATE = """
+mutation webhookSubscriptionCreate($topic: WebhookSubscriptionTopic!, $sub: WebhookSubscriptionInput!) {
+  webhookSubscriptionCreate(topic: $topic, webhookSubscription: $sub) {
+    webhookSubscription { id topic }
+    userErrors { field message }
+  }
+}
+"""
+
+
+def register_webhooks(store: str | None, address: str) -> list[dict]:
+    """Subscribe the store to every mirrored topic at ``address``; existing subscriptions come back as userErrors."""
+    from app.integrations.shopify_client import _gql_store
+
+    out: list[dict] = []
+    for topic in TOPICS:
+        enum = topic.replace("/", "_").upper()
+        try:
+            data = _gql_store(store, WEBHOOK_SUBSCRIPTION_CREATE, {"topic": enum, "sub": {"callbackUrl": address, "format": "JSON"}})
+            res = (data or {}).get("webhookSubscriptionCreate") or {}
+            out.append({"topic": topic, "id": (res.get("webhookSubscription") or {}).get("id"), "errors": res.get("userErrors") or []})
+        except Exception as e:
+            out.append({"topic": topic, "id": None, "errors": [{"message": str(e)}]})
+    return out
+
+
+def mirror_status(store: str | None = None) -> dict[str, Any]:
+    state = db.get_app_setting(store, _SYNC_KEY) if store is not None else None
+    with _LOCK:
+        stats = dict(_STATS)
+    return {**db.shopify_mirror_counts(store), "sync": state if isinstance(state, dict) else None, "stats": stats}
+
+
+register_job("shopify.reconcile_mirror", _reconcile_job, queue="warm", priority=9)
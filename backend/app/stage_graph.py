@@ -0,0 +1,116 @@
+"""Minimal dependency-graph executor for multi-step pipelines.
+
+A pipeline is a list of ``Stage(name, fn, deps)``. Each stage starts as soon
+as all of its ``deps`` have finished and receives their results as a dict,
+so independent work (e.g. landing copy vs. image generation) overlaps instead
+of running in declaration order. Every stage gets a timing record (start, end,
+duration, status) and ``critical_path`` reconstructs the chain of stages that
+determined the total wall time.
+
+A failing stage stops the scheduling of anything downstream; stages already
+running are allowed to finish, then the first error is re-raised. The records
+(and any partial results) stay available through ``StageRun`` for tracing.
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[dict], Any]
+    deps: tuple[str, ...] = ()
+
+
+@dataclass
+class StageRun:
+    results: dict[str, Any] = field(default_factory=dict)
+    timings: dict[str, dict] = field(default_factory=dict)
+    started_at: float = field(default_factory=time.time)
+
+    def record(self, name: str, deps: tuple[str, ...], started: float, ended: float, status: str, error: str | None = None) -> None:
+        self.timings[name] = {
+            "stage": name,
+            "deps": list(deps),
+            "started_at": round(started, 3),
+            "ended_at": round(ended, 3),
+            "offset_ms": int((started - self.started_at) * 1000),
+            "duration_ms": int((ended - started) * 1000),
+            "status": status,
+            **({"error": error} if error else {}),
+        }
+
+    def timeline(self) -> list[dict]:
+        """Stage records in start order; stages that never ran (status "skipped") come last."""
+        ran = sorted((t for t in self.timings.values() if "started_at" in t), key=lambda t: (t["started_at"], t["stage"]))
+        return ran + [t for t in self.timings.values() if "started_at" not in t]
+
+    def critical_path(self) -> list[str]:
+        """Stages on the longest chain: from the last stage to finish, follow the dep that finished last."""
+        ran = {name: t for name, t in self.timings.items() if "ended_at" in t}
+        if not ran:
+            return []
+        current = max(ran.values(), key=lambda t: (t["ended_at"], t["started_at"]))
+        path = [current["stage"]]
+        while current["deps"]:
+            done = [ran[d] for d in current["deps"] if d in ran]
+            if not done:
+                break
+            current = max(done, key=lambda t: (t["ended_at"], t["started_at"]))
+            path.append(current["stage"])
+        return list(reversed(path))
+
+
+def run_stages(stages: list[Stage], *, max_workers: int = 4, run: StageRun | None = None) -> StageRun:
+    """Execute ``stages`` respecting their deps; returns the StageRun (results + timings)."""
+    run = run or StageRun()
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"stage {s.name} depends on unknown stage(s) {missing}")
+
+    pending = dict(by_name)
+    first_error: BaseException | None = None
+
+    def _call(stage: Stage) -> Any:
+        started = time.time()
+        try:
+            result = stage.fn({d: run.results.get(d) for d in stage.deps})
+        except BaseException as exc:
+            run.record(stage.name, stage.deps, started, time.time(), "error", str(exc))
+            raise
+        run.record(stage.name, stage.deps, started, time.time(), "ok")
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        running: dict[Any, str] = {}
+        while pending or running:
+            if first_error is None:
+                for name, stage in list(pending.items()):
+                    if all(d in run.results for d in stage.deps):
+                        running[ex.submit(_call, stage)] = name
+                        pending.pop(name)
+            if not running:
+                if pending and first_error is None:
+                    raise ValueError(f"stages {sorted(pending)} can never run (dependency cycle)")
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    run.results[name] = fut.result()
+                except BaseException as exc:
+                    if first_error is None:
+                        first_error = exc
+        for name, stage in pending.items():
+            run.timings.setdefault(name, {"stage": name, "deps": list(stage.deps), "status": "skipped"})
+
+    if first_error is not None:
+        raise first_error
+    return run
@@ -1,6 +1,12 @@
+import base64
+import logging
+import mimetypes
+from contextvars import ContextVar
+from datetime import datetime
 from pathlib import Path
-from typing import BinaryIO, Union
-from app.config import UPLOADS_DIR
+from typing import Any, BinaryIO, Union
+from urllib.parse import quote, unquote, urlparse
+from app.config import BASE_URL, UPLOADS_DIR
 
 ROOT = Path(UPLOADS_DIR)
 ROOT.mkdir(parents=True, exist_ok=True)
@@ -13,3 +19,130 @@ def save_file(filename: str, fh: Union[BinaryIO, bytes, bytearray]) -> str:
         else:
             out.write(fh.read())
     return f"/uploads/{filename}"
+
+
+# Cloud Run instances don't share a disk, so uploads are mirrored into the
+# database and /uploads falls back to that copy when the local file is missing.
+def upload_blob_key(filename: str) -> str:
+    return f"upload_blob:{filename}"
+
+
+def persist_upload_blob(filename: str, data: bytes, content_type: str | None, **meta: Any) -> None:
+    from app import db
+    try:
+        if not filename or not data:
+            return
+        db.set_app_setting(None, upload_blob_key(filename), {
+            "filename": filename,
+            "content_type": content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            "data_b64": base64.b64encode(data).decode("ascii"),
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            **meta,
+        })
+    except Exception as e:
+        logging.getLogger("app.uploads").warning("Failed to persist upload blob %s: %s", filename, e)
+
+
+def _decode_upload_blob(filename: str, payload: Any) -> tuple[bytes, str] | None:
+    if not isinstance(payload, dict):
+        return None
+    raw = base64.b64decode(str(payload.get("data_b64") or ""))
+    if not raw:
+        return None
+    content_type = str(payload.get("content_type") or mimetypes.guess_type(filename)[0] or "application/octet-stream")
+    return raw, content_type
+
+
+def load_upload_blob(filename: str) -> tuple[bytes, str] | None:
+    from app import db
+    try:
+        return _decode_upload_blob(filename, db.get_app_setting(None, upload_blob_key(filename)))
+    except Exception:
+        return None
+
+
+async def aload_upload_blob(filename: str) -> tuple[bytes, str] | None:
+    """``load_upload_blob`` for async handlers (doesn't block the event loop)."""
+    from app import db_async
+    try:
+        return _decode_upload_blob(filename, await db_async.get_app_setting(None, upload_blob_key(filename)))
+    except Exception:
+        return None
+
+
+# Shopify, Meta and the image models fetch /uploads URLs themselves, so the
+# URLs we hand out must be absolute and publicly reachable. A public BASE_URL
+# wins. Otherwise the host the current request came in on is used, which
+# RequestBaseMiddleware records for code that has no request object (image
+# generators, jobs). Jobs capture it at submission and re-bind it when they run.
+_REQUEST_BASE: ContextVar[str] = ContextVar("uploads_request_base", default="")
+
+
+def is_local_base(base: str | None) -> bool:
+    host = (urlparse(base or "").hostname or "").lower()
+    return not host or host in ("localhost", "127.0.0.1", "0.0.0.0") or host.endswith(".local")
+
+
+def request_base_url(request) -> str:
+    """scheme://host the request came in on (honours X-Forwarded-* behind Cloud Run)."""
+    host = request.headers.get("x-forwarded-host") or request.headers.get("host")
+    scheme = request.headers.get("x-forwarded-proto") or request.url.scheme
+    return (f"{scheme}://{host}" if host else str(request.base_url)).rstrip("/")
+
+
+def public_base_url(request=None) -> str:
+    configured = (BASE_URL or "").strip().rstrip("/")
+    if configured and not is_local_base(configured):
+        return configured
+    current = request_base_url(request) if request is not None else _REQUEST_BASE.get()
+    return current or configured
+
+
+def bind_public_base(base: str | None):
+    """Make ``base`` the request base for this context; returns a token for ``unbind_public_base``."""
+    return _REQUEST_BASE.set((base or "").rstrip("/"))
+
+
+def unbind_public_base(token) -> None:
+    _REQUEST_BASE.reset(token)
+
+
+def public_upload_url(path: str, request=None) -> str:
+    """Absolute URL for an ``/uploads/...`` path (other values are returned unchanged)."""
+    if not (path or "").startswith("/uploads/"):
+        return path
+    base = public_base_url(request)
+    encoded = quote(path, safe="/:")
+    return f"{base}{encoded}" if base else encoded
+
+
+def local_upload_name(url: str | None) -> str | None:
+    """Filename of one of our own uploads, given its path or an absolute URL on this deployment."""
+    value = (url or "").split("?", 1)[0].split("#", 1)[0]
+    parsed = urlparse(value)
+    if not parsed.path.startswith("/uploads/"):
+        return None
+    if parsed.scheme or parsed.netloc:
+        own = {urlparse(b).netloc.lower() for b in (BASE_URL, _REQUEST_BASE.get()) if b}
+        if parsed.netloc.lower() not in own and not is_local_base(value):
+            return None
+    name = unquote(parsed.path.rsplit("/", 1)[-1])
+    return name or None
+
+
+class RequestBaseMiddleware:
+    """Pure ASGI middleware that records each request's base URL for ``public_base_url``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope.get("type") != "http":
+            await self.app(scope, receive, send)
+            return
+        from starlette.requests import Request
+        token = bind_public_base(request_base_url(Request(scope)))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            unbind_public_base(token)
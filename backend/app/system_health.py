@@ -43,6 +43,8 @@ Latency thresholds (p95, milliseconds — warn,crit)
   HEALTH_CLARITY_P95_CRIT_MS       (15000)
   HEALTH_DB_P95_WARN_MS            (100)
   HEALTH_DB_P95_CRIT_MS            (500)
+  HEALTH_DB_POOL_WAIT_P95_WARN_MS  (100)   wait for a pooled DB connection
+  HEALTH_DB_POOL_WAIT_P95_CRIT_MS  (2000)
   HEALTH_REQ_P95_WARN_MS           (2000)
   HEALTH_REQ_P95_CRIT_MS           (8000)
 
@@ -56,6 +58,7 @@ Pipeline & queue thresholds
   HEALTH_PIPELINE_STALE_S          (1800)  in-flight pipeline older than this is "stuck"
   HEALTH_CELERY_QUEUE_WARN         (20)
   HEALTH_CELERY_QUEUE_CRIT         (100)
+  HEALTH_CELERY_INTERACTIVE_AGE_S  (30)    oldest waiting interactive message older than this is a warning
 
 Confirmation SLA
   HEALTH_CONFIRMATION_STUCK_HOURS  (24)    open+assigned without n/wtp action for X hours
@@ -131,6 +134,7 @@ THRESHOLDS_MS: dict[str, tuple[int, int]] = {
     "gemini":       (_int_env("HEALTH_GEMINI_P95_WARN_MS", 5000),  _int_env("HEALTH_GEMINI_P95_CRIT_MS", 20000)),
     "clarity":      (_int_env("HEALTH_CLARITY_P95_WARN_MS", 5000), _int_env("HEALTH_CLARITY_P95_CRIT_MS", 15000)),
     "db":           (_int_env("HEALTH_DB_P95_WARN_MS", 100),       _int_env("HEALTH_DB_P95_CRIT_MS", 500)),
+    "db_pool":      (_int_env("HEALTH_DB_POOL_WAIT_P95_WARN_MS", 100), _int_env("HEALTH_DB_POOL_WAIT_P95_CRIT_MS", 2000)),
     "request":      (_int_env("HEALTH_REQ_P95_WARN_MS", 2000),     _int_env("HEALTH_REQ_P95_CRIT_MS", 8000)),
 }
 
@@ -142,6 +146,7 @@ INFLIGHT_CRIT = _int_env("HEALTH_INFLIGHT_PIPELINES_CRIT", 15)
 PIPELINE_STALE_S = _int_env("HEALTH_PIPELINE_STALE_S", 1800)
 CELERY_QUEUE_WARN = _int_env("HEALTH_CELERY_QUEUE_WARN", 20)
 CELERY_QUEUE_CRIT = _int_env("HEALTH_CELERY_QUEUE_CRIT", 100)
+CELERY_INTERACTIVE_AGE_S = _int_env("HEALTH_CELERY_INTERACTIVE_AGE_S", 30)
 
 CONFIRMATION_STUCK_HOURS = _int_env("HEALTH_CONFIRMATION_STUCK_HOURS", 24)
 CONFIRMATION_STUCK_WARN = _int_env("HEALTH_CONFIRMATION_STUCK_WARN", 10)
@@ -194,6 +199,7 @@ _POLLER_LOCK = threading.Lock()
 
 # A reference to the SQLAlchemy engine (set by db.py once it's created)
 _DB_ENGINE: Any = None
+_DB_SETTINGS: dict[str, Any] = {}
 
 
 # ---------------- core recording ----------------
@@ -391,10 +397,11 @@ def _slow_ops(limit: int = 50) -> list[dict[str, Any]]:
 
 # ---------------- DB / engine ----------------
 
-def attach_db_engine(engine: Any) -> None:
-    """Called by db.py once the SQLAlchemy engine is created."""
-    global _DB_ENGINE
+def attach_db_engine(engine: Any, settings: Optional[dict[str, Any]] = None) -> None:
+    """Called by db.py once the SQLAlchemy engine is created (``settings``: pool/timeout config)."""
+    global _DB_ENGINE, _DB_SETTINGS
     _DB_ENGINE = engine
+    _DB_SETTINGS = dict(settings or {})
 
 
 def _db_info() -> dict[str, Any]:
@@ -420,9 +427,17 @@ def _db_info() -> dict[str, Any]:
                 "checked_in": getattr(pool, "checkedin", lambda: None)() if callable(getattr(pool, "checkedin", None)) else None,
                 "checked_out": getattr(pool, "checkedout", lambda: None)() if callable(getattr(pool, "checkedout", None)) else None,
                 "overflow": getattr(pool, "overflow", lambda: None)() if callable(getattr(pool, "overflow", None)) else None,
+                # Time spent waiting for a connection at checkout (samples recorded by db._TimedQueuePool)
+                "checkout_wait": _summarize_category("db_pool"),
             }
         except Exception:
             pass
+        info["settings"] = dict(_DB_SETTINGS)
+        try:
+            from app import settings_cache as _settings_cache
+            info["settings_cache"] = _settings_cache.stats()
+        except Exception:
+            pass
         try:
             # Flag the SQLite-on-Cloud-Run footgun
             if (info.get("driver") or "").lower() == "sqlite":
@@ -437,11 +452,53 @@ def _db_info() -> dict[str, Any]:
 
 # ---------------- Celery ----------------
 
+def _message_enqueued_at(raw: Any) -> float | None:
+    """``enqueued_at`` header stamped by app.tasks on publish (None for older messages)."""
+    if not raw:
+        return None
+    try:
+        msg = json.loads(raw)
+        value = (msg.get("headers") or {}).get("enqueued_at")
+        return float(value) if value is not None else None
+    except Exception:
+        return None
+
+
+def _celery_queue_metrics(chan: Any, queues: tuple[str, ...]) -> dict[str, dict[str, Any]]:
+    """Depth and oldest-message age per queue, published as autoscaling signals.
+
+    On Redis each queue is one list per priority step; messages are pushed on
+    the left, so the oldest one sits at index -1. Other brokers only report depth.
+    """
+    now = time.time()
+    client = getattr(chan, "client", None)
+    out: dict[str, dict[str, Any]] = {}
+    for name in queues:
+        depth: int | None = None
+        oldest: float | None = None
+        try:
+            if client is not None and hasattr(chan, "_q_for_pri"):
+                keys = list(dict.fromkeys(chan._q_for_pri(name, pri) for pri in chan.priority_steps))
+                depth = 0
+                for key in keys:
+                    depth += int(client.llen(key) or 0)
+                    ts = _message_enqueued_at(client.lindex(key, -1))
+                    if ts is not None and (oldest is None or ts < oldest):
+                        oldest = ts
+            else:
+                depth = getattr(chan.queue_declare(queue=name, passive=True), "message_count", None)
+        except Exception:
+            pass
+        out[name] = {"depth": depth, "oldest_age_s": round(now - oldest, 1) if oldest is not None else None}
+    return out
+
+
 def _celery_info() -> dict[str, Any]:
     info: dict[str, Any] = {
         "broker_ok": None,
         "broker_url": None,
         "queue_depth": None,
+        "queues": None,
         "active_workers": None,
         "last_error": None,
     }
@@ -449,7 +506,7 @@ def _celery_info() -> dict[str, Any]:
         from app.config import CELERY_BROKER_URL
         info["broker_url"] = (CELERY_BROKER_URL or "").split("@")[-1] or None
         try:
-            from app.tasks import celery as _celery  # type: ignore
+            from app.tasks import celery as _celery, CELERY_QUEUES  # type: ignore
         except Exception as e:
             info["last_error"] = f"celery_import: {e}"
             return info
@@ -458,9 +515,10 @@ def _celery_info() -> dict[str, Any]:
                 conn.ensure_connection(max_retries=1, timeout=1.5)
                 info["broker_ok"] = True
                 try:
-                    chan = conn.default_channel
-                    qd = chan.queue_declare(queue="celery", passive=True)
-                    info["queue_depth"] = getattr(qd, "message_count", None)
+                    queues = _celery_queue_metrics(conn.default_channel, CELERY_QUEUES)
+                    info["queues"] = queues
+                    depths = [q["depth"] for q in queues.values() if isinstance(q.get("depth"), int)]
+                    info["queue_depth"] = sum(depths) if depths else None
                 except Exception:
                     info["queue_depth"] = None
         except Exception as e:
@@ -529,9 +587,9 @@ def _process_info() -> dict[str, Any]:
 
 # ---------------- application cache hooks ----------------
 
-# main.py's _API_CACHE / _API_INFLIGHT and the campaign analysis _analysis_jobs
-# dict are module-private. We expose lazy accessors so this module never imports
-# main.py at module load time (avoids circular imports).
+# main.py's _API_CACHE / _API_INFLIGHT dicts are module-private. We expose lazy
+# accessors so this module never imports main.py at module load time (avoids
+# circular imports). analysis_jobs counts background jobs running in this process.
 def _app_cache_stats() -> dict[str, Any]:
     out: dict[str, Any] = {"api_cache_size": None, "api_inflight": None, "analysis_jobs": None}
     try:
@@ -539,15 +597,45 @@ def _app_cache_stats() -> dict[str, Any]:
         m = importlib.import_module("app.main")
         c = getattr(m, "_API_CACHE", None)
         f = getattr(m, "_API_INFLIGHT", None)
-        j = getattr(m, "_analysis_jobs", None)
         if isinstance(c, dict):
             out["api_cache_size"] = len(c)
         if isinstance(f, dict):
             out["api_inflight"] = len(f)
-        if isinstance(j, dict):
-            out["analysis_jobs"] = len(j)
     except Exception:
         pass
+    try:
+        from app.shopify_mirror import mirror_status
+        out["shopify_mirror"] = mirror_status()
+    except Exception:
+        out["shopify_mirror"] = None
+    try:
+        from app.job_runner import job_stats
+        out["jobs"] = job_stats()
+        out["analysis_jobs"] = sum(out["jobs"]["running"].values())
+    except Exception:
+        out["jobs"] = None
+    try:
+        from app.campaign_analyzer import phase_memo_stats
+        out["analysis_memo"] = phase_memo_stats()
+    except Exception:
+        out["analysis_memo"] = None
+    try:
+        from app.llm_gateway import gateway_stats
+        from app.rate_limits import limiter_stats
+        out["llm_gateway"] = gateway_stats()
+        out["provider_limits"] = limiter_stats()
+    except Exception:
+        out["llm_gateway"] = None
+    try:
+        from app.image_cache import cache_stats as _source_image_stats
+        out["source_images"] = _source_image_stats()
+    except Exception:
+        out["source_images"] = None
+    try:
+        from app.image_index import index_stats as _image_index_stats
+        out["image_index"] = _image_index_stats()
+    except Exception:
+        out["image_index"] = None
     return out
 
 
@@ -556,8 +644,10 @@ def _app_cache_stats() -> dict[str, Any]:
 def _confirmation_probe_cached() -> Optional[dict[str, Any]]:
     """Best-effort cached count of open+assigned orders sitting for > CONFIRMATION_STUCK_HOURS.
 
-    Does the heavy Shopify scan in a background thread no more than once per
-    CONFIRMATION_PROBE_TTL_S so the snapshot endpoint stays fast.
+    Runs in a background thread no more than once per CONFIRMATION_PROBE_TTL_S
+    so the snapshot endpoint stays fast. Stores whose local confirmation queue
+    is ready are counted with one indexed query; others fall back to a
+    Shopify scan.
     """
     now = time.time()
     with _CONFIRMATION_PROBE_LOCK:
@@ -607,8 +697,20 @@ def _confirmation_probe_run() -> None:
             except Exception:
                 return False
 
+        try:
+            from app import confirmation_queue as _cq
+            from app import db as _db
+        except Exception:
+            _cq = None  # type: ignore
+
         for st in stores:
             try:
+                if _cq is not None and _cq.ready(st):
+                    # Indexed count over the local queue instead of paging Shopify.
+                    counts = _db.count_stuck_confirmation_queue(st, cutoff.replace(tzinfo=None))
+                    results["by_store"][st] = {**counts, "source": "queue"}
+                    results["stuck_total"] += counts["stuck"]
+                    continue
                 stuck = 0
                 total = 0
                 page_info: Optional[str] = None
@@ -713,6 +815,7 @@ def snapshot() -> dict[str, Any]:
             "inflight_warn": INFLIGHT_WARN,
             "inflight_crit": INFLIGHT_CRIT,
             "pipeline_stale_s": PIPELINE_STALE_S,
+            "celery_interactive_age_s": CELERY_INTERACTIVE_AGE_S,
             "confirmation_stuck_hours": CONFIRMATION_STUCK_HOURS,
             "confirmation_probe_ttl_s": CONFIRMATION_PROBE_TTL_S,
         },
@@ -868,6 +971,15 @@ def status() -> dict[str, Any]:
         elif p95 >= warn:
             _add("warn", "DB_P95", f"DB p95 {p95}ms ≥ {warn}ms", value=p95, threshold=warn)
 
+    wait = (db.get("pool") or {}).get("checkout_wait") or {}
+    if (wait.get("count") or 0) >= MIN_SAMPLES:
+        warn, crit = THRESHOLDS_MS["db_pool"]
+        p95 = wait.get("p95") or 0
+        if p95 >= crit:
+            _add("crit", "DB_POOL_WAIT", f"DB pool checkout p95 {p95}ms ≥ {crit}ms (n={wait.get('count')})", value=p95, threshold=crit)
+        elif p95 >= warn or wait.get("err"):
+            _add("warn", "DB_POOL_WAIT", f"DB pool checkout p95 {p95}ms, {wait.get('err') or 0} timeouts (n={wait.get('count')})", value=p95, threshold=warn)
+
     # 2) Provider checks
     for p, data in (snap.get("providers") or {}).items():
         s = (data or {}).get("summary") or {}
@@ -927,6 +1039,10 @@ def status() -> dict[str, Any]:
         elif qd >= CELERY_QUEUE_WARN:
             _add("warn", "CELERY_QUEUE",
                  f"Celery queue depth {qd} ≥ {CELERY_QUEUE_WARN}", value=qd, threshold=CELERY_QUEUE_WARN)
+    age = ((cel.get("queues") or {}).get("interactive") or {}).get("oldest_age_s")
+    if isinstance(age, (int, float)) and age >= CELERY_INTERACTIVE_AGE_S:
+        _add("warn", "CELERY_INTERACTIVE_WAIT",
+             f"Oldest interactive job has waited {age}s ≥ {CELERY_INTERACTIVE_AGE_S}s", value=age, threshold=CELERY_INTERACTIVE_AGE_S)
 
     pipes = snap.get("pipelines") or {}
     in_n = int(pipes.get("count") or 0)
@@ -1,100 +1,198 @@
 from celery import Celery
+from celery.signals import before_task_publish
+from kombu import Queue
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from app.integrations.openai_client import gen_angles_and_copy, gen_images, IMAGE_PROMPT, LANDING_COPY_PROMPT, gen_landing_copy, DEFAULT_LLM_MODEL
 from app.integrations.shopify_client import create_product_and_page
 from app.integrations.meta_client import create_campaign_with_ads
 from app.config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND
 from app import db
+from app.rate_limits import provider_slot
+from app.stage_graph import Stage, StageRun, run_stages
+from app.job_runner import JOB_QUEUES, JOB_STALE_S
 
 celery = Celery(__name__, broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
 
+# Queues by job class. worker_entrypoint.sh runs a worker per class so a bulk
+# analysis never sits ahead of an interactive pipeline launch; "celery" stays
+# consumed for messages published before routing existed.
+CELERY_QUEUES = ("celery", *JOB_QUEUES)
 
-def run_pipeline_sync(test_id: str, payload: dict):
-    """Runs the pipeline inline (no Celery). Safe fallback when broker/worker is unavailable."""
-    # Mark running
-    db.update_test_status(test_id, "running")
+# Per-worker-process rate limits by task type ("" = unlimited), e.g. "30/m".
+_RATE_LIMITS = {
+    "pipeline_launch": os.getenv("PTOS_CELERY_PIPELINE_RATE", "") or "",
+    "media_job_run": os.getenv("PTOS_CELERY_MEDIA_RATE", "30/m") or "",
+    "job_run": os.getenv("PTOS_CELERY_JOB_RATE", "") or "",
+}
+
+celery.conf.update(
+    task_queues=[Queue(name) for name in CELERY_QUEUES],
+    task_default_queue="celery",
+    task_routes={
+        "pipeline_launch": {"queue": "interactive", "priority": 0},
+        # job_run and media_job_run are routed per call by app.job_runner.submit_job
+    },
+    task_annotations={name: {"rate_limit": rate} for name, rate in _RATE_LIMITS.items() if rate},
+    # One message per process at a time: long jobs don't hoard work another worker could start.
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    broker_transport_options={
+        "priority_steps": list(range(10)),
+        "sep": ":",
+        "queue_order_strategy": "priority",
+        # Unacked messages are redelivered after this; keep it above the longest job.
+        "visibility_timeout": JOB_STALE_S,
+    },
+)
+
+
+@before_task_publish.connect
+def _stamp_enqueued_at(headers=None, **_):
+    # Lets system_health report the age of the oldest waiting message per queue.
+    if isinstance(headers, dict):
+        headers.setdefault("enqueued_at", time.time())
+
+
+PIPELINE_IMAGE_WORKERS = int(os.getenv("PTOS_PIPELINE_IMAGE_WORKERS", "4") or "4")
+
+
+def _angles_prompt_for_trace(payload: dict) -> str | None:
+    # reconstruct exact prompt for trace
     try:
-        trace = []
-        angles = []
-        creatives = []
-        landing_copy = None
-        # Step 1: Angles & copy
-        model = payload.get("model")
-        angles_prompt = (payload or {}).get("angles_prompt")
-        angles = gen_angles_and_copy(payload, model=model, prompt_override=angles_prompt)
-        # reconstruct exact prompt for trace
-        try:
-            import json as _json
-            angles_prompt = (
-                "You are a direct-response strategist. Given the PRODUCT INFO as JSON, respond with ONLY valid JSON following this exact schema: "
-                '{"angles":[{"name":str,"ksp":[str,str,str],"headlines":[str,str,str,str,str],"titles":[str,str],"primaries":[str,str]}]}.\n'
-                "Rules: headlines <= 40 chars; titles <= 30; primaries <= 120; avoid disallowed ad claims.\n"
-                + "PRODUCT INFO:\n" + _json.dumps(payload, ensure_ascii=False)
-                + f"\nAudience: {payload.get('audience')}"
-            )
-        except Exception:
-            angles_prompt = None
-        trace.append({
-            "step": "generate_copy",
-            "provider": "openai",
-            "request": {"model": model or DEFAULT_LLM_MODEL, "prompt": angles_prompt},
-            "response": {"angles": angles},
-        })
+        import json as _json
+        return (
+            "You are a direct-response strategist. Given the PRODUCT INFO as JSON, respond with ONLY valid JSON following this exact schema: "
+            '{"angles":[{"name":str,"ksp":[str,str,str],"headlines":[str,str,str,str,str],"titles":[str,str],"primaries":[str,str]}]}.\n'
+            "Rules: headlines <= 40 chars; titles <= 30; primaries <= 120; avoid disallowed ad claims.\n"
+            + "PRODUCT INFO:\n" + _json.dumps(payload, ensure_ascii=False)
+            + f"\nAudience: {payload.get('audience')}"
+        )
+    except Exception:
+        return None
 
-        # Step 2: Build creatives. Prefer uploaded images if provided; otherwise use AI images
-        uploaded = payload.get("uploaded_images") or []
-        creatives = []
-        image_items = []
-        for idx, a in enumerate(angles):
-            image_url = None
+
+def _angle_images(run: StageRun, angles: list, payload: dict) -> list[dict]:
+    """One image per angle, generated concurrently; uploaded images are assigned round-robin instead."""
+    uploaded = payload.get("uploaded_images") or []
+    items: list[dict] = [{} for _ in angles]
+
+    def _one(idx: int) -> None:
+        a = angles[idx]
+        started = time.time()
+        image_url = None
+        status = "error"
+        try:
             if uploaded:
                 image_url = uploaded[idx % len(uploaded)]
             else:
-                imgs = gen_images(a, payload)
+                with provider_slot("openai:gpt-image-1"):
+                    imgs = gen_images(a, payload)
                 image_url = imgs[0] if imgs else None
-            if image_url:
-                creatives.append({"angle": a, "image_url": image_url})
+            status = "ok" if image_url else "empty"
+        finally:
+            run.record(f"image:{idx}", ("angles",), started, time.time(), status)
             # capture image generation prompt and result (or uploaded)
             try:
                 prompt = IMAGE_PROMPT.format(title=payload.get("title") or "product", angle=a.get("name"))
             except Exception:
                 prompt = None
-            image_items.append({"angle": a.get("name"), "prompt": prompt, "image_url": image_url})
+            items[idx] = {"angle": a.get("name"), "prompt": prompt, "image_url": image_url}
+
+    if angles:
+        with ThreadPoolExecutor(max_workers=max(1, min(PIPELINE_IMAGE_WORKERS, len(angles)))) as ex:
+            for fut in [ex.submit(_one, idx) for idx in range(len(angles))]:
+                fut.result()
+    return items
+
+
+def run_pipeline_sync(test_id: str, payload: dict):
+    """Runs the pipeline inline (no Celery). Safe fallback when broker/worker is unavailable.
+
+    Stages run as a dependency graph: per-angle images and landing copy both
+    start once angles exist, Shopify starts when both are done. Each trace step
+    carries its stage timings and a final ``timeline`` step lists every stage
+    plus the critical path.
+    """
+    # Mark running
+    db.update_test_status(test_id, "running")
+    run = StageRun()
+    trace: list = []
+    model = payload.get("model")
+    uploaded = payload.get("uploaded_images") or []
+    shopify_request = {"endpoint": "graphql", "url": "{}/admin/api/{}/graphql.json".format(os.getenv("SHOPIFY_SHOP_DOMAIN",""), os.getenv("SHOPIFY_API_VERSION","2025-07")), "operations": ["productCreate", "pageCreate"]}
+
+    def _angles(_: dict) -> list:
+        return gen_angles_and_copy(payload, model=model, prompt_override=(payload or {}).get("angles_prompt"))
+
+    def _images(deps: dict) -> list:
+        return _angle_images(run, deps["angles"] or [], payload)
+
+    def _landing(deps: dict):
+        # Generate landing copy via OpenAI (for transparency + optional page body); only needs the angles.
+        return gen_landing_copy(payload, deps["angles"] or [], model=model, prompt_override=(payload or {}).get("landing_copy_prompt"))
+
+    def _shopify(deps: dict) -> dict:
+        creatives = [{"angle": a, "image_url": it.get("image_url")} for a, it in zip(run.results["angles"] or [], deps["images"]) if it.get("image_url")]
+        return create_product_and_page(payload, run.results["angles"] or [], creatives, deps["landing_copy"])
+
+    def _build_trace() -> list:
+        steps: list = []
+
+        def _timed(stage: str) -> dict:
+            t = run.timings.get(stage) or {}
+            return {k: t[k] for k in ("started_at", "ended_at", "duration_ms") if k in t}
+
+        if "angles" in run.results:
+            steps.append({
+                "step": "generate_copy",
+                "provider": "openai",
+                "request": {"model": model or DEFAULT_LLM_MODEL, "prompt": _angles_prompt_for_trace(payload)},
+                "response": {"angles": run.results["angles"]},
+                **_timed("angles"),
+            })
+        image_items = run.results.get("images") or []
         if image_items:
-            trace.append({
+            steps.append({
                 "step": "gen_images",
                 "provider": "openai" if not uploaded else "uploads",
                 "request": {"model": "gpt-image-1" if not uploaded else None, "items": [{"angle": it["angle"], "prompt": it["prompt"]} for it in image_items]},
                 "response": {"items": image_items},
+                **_timed("images"),
             })
+        if "landing_copy" in run.results:
+            steps.append({
+                "step": "landing_copy",
+                "provider": "openai",
+                "request": {"model": model or DEFAULT_LLM_MODEL, "prompt": LANDING_COPY_PROMPT, "context": {"angles": (run.results.get("angles") or [])[:3]}},
+                "response": run.results["landing_copy"],
+                **_timed("landing_copy"),
+            })
+        shopify_timing = run.timings.get("shopify") or {}
+        if "shopify" in run.results:
+            steps.append({"step": "shopify", "provider": "shopify", "request": shopify_request, "response": {"page": run.results["shopify"]}, **_timed("shopify")})
+        elif shopify_timing.get("status") == "error":
+            steps.append({"step": "shopify", "provider": "shopify", "request": shopify_request, "error": {"message": shopify_timing.get("error")}, **_timed("shopify")})
+        return steps
 
-        # Step 3: Shopify product + page
-        # Step 2.5: Generate landing copy via OpenAI (for transparency + optional page body)
-        landing_prompt = (payload or {}).get("landing_copy_prompt")
-        landing_copy = gen_landing_copy(payload, angles, model=model, prompt_override=landing_prompt)
-        trace.append({
-            "step": "landing_copy",
-            "provider": "openai",
-            "request": {"model": model or DEFAULT_LLM_MODEL, "prompt": LANDING_COPY_PROMPT, "context": {"angles": angles[:3]}},
-            "response": landing_copy,
-        })
+    def _timeline_step() -> dict:
+        return {"step": "timeline", "stages": run.timeline(), "critical_path": run.critical_path(), "total_ms": int((time.time() - run.started_at) * 1000)}
 
-        try:
-            page = create_product_and_page(payload, angles, creatives, landing_copy)
-            trace.append({
-                "step": "shopify",
-                "provider": "shopify",
-                "request": {"endpoint": "graphql", "url": "{}/admin/api/{}/graphql.json".format(os.getenv("SHOPIFY_SHOP_DOMAIN",""), os.getenv("SHOPIFY_API_VERSION","2025-07")), "operations": ["productCreate", "pageCreate"]},
-                "response": {"page": page},
-            })
-        except Exception as shopify_err:
-            trace.append({
-                "step": "shopify",
-                "provider": "shopify",
-                "request": {"endpoint": "graphql", "url": "{}/admin/api/{}/graphql.json".format(os.getenv("SHOPIFY_SHOP_DOMAIN",""), os.getenv("SHOPIFY_API_VERSION","2025-07")), "operations": ["productCreate", "pageCreate"]},
-                "error": {"message": str(shopify_err)},
-            })
-            raise
+    try:
+        run_stages(
+            [
+                Stage("angles", _angles),
+                Stage("images", _images, ("angles",)),
+                Stage("landing_copy", _landing, ("angles",)),
+                Stage("shopify", _shopify, ("images", "landing_copy")),
+            ],
+            run=run,
+        )
+        trace = _build_trace()
+        page = run.results["shopify"]
+        creatives = [{"angle": a, "image_url": it.get("image_url")} for a, it in zip(run.results["angles"] or [], run.results["images"]) if it.get("image_url")]
 
         # Step 4: Meta campaign + ads (paused by request)
         campaign = None
@@ -104,13 +202,17 @@ def run_pipeline_sync(test_id: str, payload: dict):
             "request": {"endpoints": ["campaigns","adsets","adcreatives","ads"]},
             "response": {"status": "skipped"},
         })
+        trace.append(_timeline_step())
 
         # Persist results
-        db.set_test_result(test_id, page, campaign, creatives, angles=angles, trace=trace)
+        db.set_test_result(test_id, page, campaign, creatives, angles=run.results["angles"], trace=trace)
         return {"ok": True, "page": page, "campaign": campaign}
     except Exception as e:
         # Persist partial context so UI can still show prompts/outputs of earlier steps
-        db.set_test_failed(test_id, {"message": str(e)}, trace=trace, partial={"angles": angles, "creatives": creatives, "landing_copy": landing_copy})
+        trace = _build_trace() + [_timeline_step()]
+        angles = run.results.get("angles") or []
+        creatives = [{"angle": a, "image_url": it.get("image_url")} for a, it in zip(angles, run.results.get("images") or []) if it.get("image_url")]
+        db.set_test_failed(test_id, {"message": str(e)}, trace=trace, partial={"angles": angles, "creatives": creatives, "landing_copy": run.results.get("landing_copy")})
         raise
 
 @celery.task(name="pipeline_launch")
@@ -128,3 +230,18 @@ def pipeline_launch(test_id: str, payload: dict):
             _sh.clear_inflight(f"pipeline:{test_id}")
     except Exception:
         return run_pipeline_sync(test_id, payload)
+
+
+@celery.task(name="media_job_run")
+def media_job_run(job_id: str):
+    # job_run under the media queue's own rate limit (PTOS_CELERY_MEDIA_RATE).
+    return job_run(job_id)
+
+
+@celery.task(name="job_run")
+def job_run(job_id: str):
+    # Routed to the job kind's queue by app.job_runner.submit_job; status,
+    # result and error are persisted so the API instance only polls the DB.
+    from app.job_runner import run_job
+    job = run_job(job_id) or {}
+    return {"job_id": job_id, "status": job.get("status")}
@@ -0,0 +1,142 @@
+"""Translation memory and batch translation driver.
+
+Translations are stored per source string (or HTML fragment) keyed by
+(kind, target language, locale, domain, source hash), so a string that was
+translated once is never sent to the model again. ``translate_with_memory``
+looks every item up, sends only the misses to a caller-supplied
+``translate_chunk`` function in token-budgeted chunks, validates the returned
+map item by item and retries only the ids that came back missing or empty.
+
+Env vars (optional):
+  PTOS_TRANSLATION_CHUNK_TOKENS    approx. source tokens per model request (default 3000)
+  PTOS_TRANSLATION_RETRY_ROUNDS    extra rounds for missing ids (default 2)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from typing import Callable
+
+logger = logging.getLogger("translation_memory")
+
+CHUNK_TOKENS = int(os.getenv("PTOS_TRANSLATION_CHUNK_TOKENS", "3000") or "3000")
+RETRY_ROUNDS = int(os.getenv("PTOS_TRANSLATION_RETRY_ROUNDS", "2") or "2")
+
+# translate_chunk({"0": source, ...}) -> {"0": translation, ...}; ids absent from the result count as failed.
+ChunkTranslator = Callable[[dict], dict]
+
+
+def _norm(value: str | None) -> str:
+    return (value or "").strip().lower()
+
+
+def source_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def memory_key(text: str, target_language: str, *, locale: str | None = None, domain: str | None = None, kind: str = "text") -> str:
+    raw = "\x1f".join([kind, _norm(target_language), _norm(locale), _norm(domain), source_hash(text)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _approx_tokens(text: str) -> int:
+    # ~3 chars/token keeps Arabic/French output comfortably inside the budget.
+    return len(text) // 3 + 1
+
+
+def chunk_by_tokens(items: dict, budget: int | None = None) -> list[dict]:
+    """Split {id: text} into insertion-ordered chunks of at most ``budget`` approx. tokens."""
+    limit = max(1, int(budget or CHUNK_TOKENS))
+    chunks: list[dict] = []
+    current: dict = {}
+    used = 0
+    for item_id, text in items.items():
+        cost = _approx_tokens(text)
+        if current and used + cost > limit:
+            chunks.append(current)
+            current, used = {}, 0
+        current[item_id] = text
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def translate_with_memory(
+    items: list[str] | dict,
+    target_language: str,
+    translate_chunk: ChunkTranslator,
+    *,
+    locale: str | None = None,
+    domain: str | None = None,
+    kind: str = "text",
+    token_budget: int | None = None,
+) -> dict:
+    """Translate ``items`` (a list, or an {id: text} map) reusing stored translations.
+
+    Returns {id: translation} (list indices as ids for list input). Items that
+    still fail after the retry rounds are absent from the result.
+    """
+    from app import db
+
+    sources = dict(enumerate(items)) if isinstance(items, list) else dict(items or {})
+    keys = {
+        item_id: memory_key(text, target_language, locale=locale, domain=domain, kind=kind)
+        for item_id, text in sources.items()
+        if isinstance(text, str) and text.strip()
+    }
+    try:
+        stored = db.get_translation_memory(list(set(keys.values())))
+    except Exception as exc:
+        logger.warning("translation memory lookup failed: %s", exc)
+        stored = {}
+
+    out: dict = {item_id: stored[key] for item_id, key in keys.items() if key in stored}
+    # One request per distinct source: repeated strings share a single slot.
+    key_sources = {key: sources[item_id] for item_id, key in keys.items()}
+    pending: dict = {key: key_sources[key] for item_id, key in keys.items() if item_id not in out}
+
+    translated: dict = {}
+    rounds = 0
+    while pending and rounds <= max(0, RETRY_ROUNDS):
+        rounds += 1
+        for chunk in chunk_by_tokens(pending, token_budget):
+            # The model sees short per-chunk ids ("0", "1", ...) instead of memory keys.
+            local_keys = list(chunk)
+            try:
+                result = translate_chunk({str(i): chunk[key] for i, key in enumerate(local_keys)}) or {}
+            except Exception as exc:
+                logger.warning("translation chunk of %d items to %s failed: %s", len(chunk), target_language, exc)
+                continue
+            for i, key in enumerate(local_keys):
+                value = result.get(str(i))
+                if isinstance(value, str) and value.strip():
+                    translated[key] = value
+        pending = {key: text for key, text in pending.items() if key not in translated}
+
+    if pending:
+        logger.warning("translation to %s left %d items untranslated", target_language, len(pending))
+
+    if translated:
+        try:
+            db.save_translation_memory([
+                {
+                    "key": key,
+                    "source_hash": source_hash(key_sources[key]),
+                    "kind": kind,
+                    "target_language": _norm(target_language),
+                    "locale": _norm(locale) or None,
+                    "domain": _norm(domain) or None,
+                    "translation": value,
+                }
+                for key, value in translated.items()
+            ])
+        except Exception as exc:
+            logger.warning("translation memory save failed: %s", exc)
+
+    for item_id, key in keys.items():
+        if item_id not in out and key in translated:
+            out[item_id] = translated[key]
+    return out
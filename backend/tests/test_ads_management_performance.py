@@ -1,3 +1,7 @@
+import os
+import time
+from datetime import datetime, timedelta
+
 from app import db
 from app.integrations import meta_client, shopify_client
 
@@ -423,3 +427,447 @@ def test_delivery_rate_rest_fallback_counts_each_fulfilled_order_once(monkeypatc
     assert result == {"123": {"fulfilled_orders": 3, "paid_or_delivered_orders": 2}}
     assert "fulfillment_status" in paths[0]
     assert "tags" in paths[0]
+
+
+def test_meta_campaign_fan_out_streams_each_account_with_errors_isolated(monkeypatch):
+    def fake_campaigns(_preset, *, ad_account_id=None, since=None, until=None, profit_only=False):
+        if ad_account_id == "bad":
+            raise RuntimeError("permission denied")
+        return [{"campaign_id": f"{ad_account_id}-1", "status": "ACTIVE"}]
+
+    monkeypatch.setattr(meta_client, "list_active_campaigns_with_insights", fake_campaigns)
+
+    items = list(meta_client.iter_campaigns_for_accounts(["1", "bad", "2", "1"], since="2026-07-01", until="2026-07-14"))
+
+    by_account = {item["ad_account"]: item for item in items}
+    assert sorted(by_account) == ["1", "2", "bad"]
+    assert by_account["1"]["data"] == [{"campaign_id": "1-1", "status": "ACTIVE"}]
+    assert by_account["bad"]["data"] == []
+    assert "permission denied" in by_account["bad"]["error"]
+
+
+def test_meta_usage_headers_feed_the_fan_out_throttle():
+    class _Resp:
+        status_code = 200
+        headers = {
+            "x-app-usage": '{"call_count": 12, "total_time": 4, "total_cputime": 3}',
+            "x-business-use-case-usage": '{"42": [{"type": "ads_insights", "call_count": 91, "estimated_time_to_regain_access": 0}]}',
+        }
+
+    meta_client._note_meta_usage(_Resp())
+
+    assert meta_client.meta_usage_snapshot()["pct"] == 91
+    assert meta_client.meta_usage_snapshot()["cooldown_s"] == 0
+
+    class _Bare:
+        status_code = 200
+        headers = {"content-type": "application/json"}
+
+    meta_client._note_meta_usage(_Bare())  # no usage headers: the last reading stands
+    assert meta_client.meta_usage_snapshot()["pct"] == 91
+    meta_client._USAGE_STATE.update({"pct": 0.0, "at": 0.0, "blocked_until": 0.0})
+
+
+def test_bulk_analysis_checkpoints_survive_job_state_updates():
+    db.save_bulk_analysis_job("perf-test", "job-1", {"status": "pending", "date_range": {"start": "a", "end": "b"}})
+    db.patch_bulk_analysis_job("perf-test", "job-1", {"status": "analyzing", "groups": [{"product_id": "1", "campaigns": []}]})
+    db.save_bulk_analysis_group_result("perf-test", "job-1", "1", {"summary": "ok"})
+
+    job = db.get_bulk_analysis_job("perf-test", "job-1")
+    assert job["status"] == "analyzing"
+    assert job["date_range"] == {"start": "a", "end": "b"}
+    assert db.list_bulk_analysis_group_results("perf-test", "job-1") == {"1": {"summary": "ok"}}
+    assert db.get_latest_bulk_analysis_job("perf-test")["job_id"] == "job-1"
+
+    assert db.delete_bulk_analysis_group_results("perf-test", "job-1") == 1
+    assert db.list_bulk_analysis_group_results("perf-test", "job-1") == {}
+
+
+def test_bulk_analysis_resume_claims_only_through_the_persisted_heartbeat():
+    job_id = f"hb-{int(time.time() * 1000)}"
+    # No heartbeat yet (job from before heartbeats, or never started): one claimant wins.
+    assert db.claim_bulk_analysis_job("perf-test", job_id, 600)
+    assert not db.claim_bulk_analysis_job("perf-test", job_id, 600)
+
+    db.touch_bulk_analysis_heartbeat("perf-test", job_id)
+    beat = db.bulk_analysis_heartbeat_at("perf-test", job_id)
+    assert beat is not None and (datetime.utcnow() - beat).total_seconds() < 5
+    assert not db.claim_bulk_analysis_job("perf-test", job_id, 600)
+
+    # A heartbeat older than the stale window can be taken over, once.
+    with db.SessionLocal() as session:
+        row = session.get(db.AppSetting, db._mk_setting_pk("perf-test", f"bulk_analysis_heartbeat:{job_id}"))
+        row.updated_at = datetime.utcnow() - timedelta(seconds=900)
+        session.commit()
+    assert db.claim_bulk_analysis_job("perf-test", job_id, 600)
+    assert not db.claim_bulk_analysis_job("perf-test", job_id, 600)
+    assert db.claim_bulk_analysis_job("perf-test", job_id, 0)  # forced resume
+
+    db.delete_bulk_analysis_heartbeat("perf-test", job_id)
+    assert db.bulk_analysis_heartbeat_at("perf-test", job_id) is None
+
+
+def test_customer_profile_phase_is_memoized_by_product_content(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    from app import campaign_analyzer
+
+    calls = []
+
+    def fake_llm(system_prompt, user_content, model=None, usage_out=None):
+        calls.append(system_prompt)
+        if usage_out is not None:
+            usage_out["total_tokens"] = 120
+        if system_prompt == campaign_analyzer.CUSTOMER_PROFILER_PROMPT:
+            return {"persona": "parents"}
+        return {"summary": "ok"}
+
+    monkeypatch.setattr(campaign_analyzer, "_call_llm", fake_llm)
+    campaign_analyzer.invalidate_phase_memo()
+    product = {
+        "title": "Kids Dress",
+        "price": "199",
+        "description": "<p>Soft  cotton</p>",
+        "image_url": "https://cdn/x.jpg?v=1",
+        "product_url": "https://shop/products/dress",
+    }
+    first = campaign_analyzer.analyze_campaign(campaign_metrics={}, ad_creatives=[], product_info=product, model="m1")
+    same = dict(product, title=" kids dress ", price=199.0, description="Soft cotton", image_url="https://cdn/x.jpg?v=2")
+    second = campaign_analyzer.analyze_campaign(campaign_metrics={}, ad_creatives=[], product_info=same, model="m1")
+
+    assert first["customer_profile_source"] == "llm"
+    assert second["customer_profile_source"] == "memo"
+    assert second["customer_profile"] == {"persona": "parents"}
+    assert calls.count(campaign_analyzer.CUSTOMER_PROFILER_PROMPT) == 1
+
+    # The prompt shows both URLs, so another product page or photo is another profile.
+    other_image = dict(product, image_url="https://cdn/y.jpg")
+    other_page = dict(product, product_url="https://shop/products/other")
+    for info in (other_image, other_page):
+        result = campaign_analyzer.analyze_campaign(campaign_metrics={}, ad_creatives=[], product_info=info, model="m1")
+        assert result["customer_profile_source"] == "llm"
+
+    # Nothing to profile (failed product fetch): never memoized, never shared.
+    unknown = {"title": "", "description": "", "image_url": "https://cdn/z.jpg"}
+    for _ in range(2):
+        result = campaign_analyzer.analyze_campaign(campaign_metrics={}, ad_creatives=[], product_info=unknown, model="m1")
+        assert result["customer_profile_source"] == "llm"
+    assert calls.count(campaign_analyzer.CUSTOMER_PROFILER_PROMPT) == 5
+
+    third = campaign_analyzer.analyze_campaign(campaign_metrics={}, ad_creatives=[], product_info=product, model="m2")
+    assert third["customer_profile_source"] == "llm"
+    assert campaign_analyzer.invalidate_phase_memo(product, model="m1") == 1
+    assert campaign_analyzer.phase_memo_stats()["tokens_saved"] >= 120
+
+
+def test_memo_clear_endpoint_drops_the_entry_bulk_analysis_wrote(monkeypatch):
+    import asyncio
+
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY") or "test-key")
+    from app import campaign_analyzer, main
+
+    pid = str(int(time.time() * 1000))
+    brief = {"price": "149", "image": f"https://cdn/{pid}.jpg?v=3", "total_available": 4}
+    monkeypatch.setattr(shopify_client, "_rest_get_store", lambda store, path: {
+        "product": {"id": pid, "title": "Linen Shirt", "body_html": "<p>Breathable</p>", "handle": f"shirt-{pid}"},
+    })
+    monkeypatch.setattr(shopify_client, "_get_store_config", lambda store: {"SHOP": "memo.myshopify.com"})
+    monkeypatch.setattr(main, "get_products_brief", lambda pids, store=None: {pid: brief})
+    monkeypatch.setattr(campaign_analyzer, "_call_llm", lambda system_prompt, user_content, model=None, usage_out=None: {"persona": "x"})
+
+    product_info = main._analysis_product_info("memo", pid, brief)
+    assert product_info["product_url"] == f"https://memo.myshopify.com/products/shirt-{pid}"
+    campaign_analyzer.analyze_campaign(campaign_metrics={}, ad_creatives=[], product_info=product_info)
+
+    cleared = asyncio.run(main.api_analysis_memo_clear(product_id=pid, store="memo"))
+    assert cleared == {"deleted": 1}
+
+
+def test_gemini_feature_set_generates_concurrently_and_keeps_prompt_order(monkeypatch):
+    import threading
+    import time
+
+    from app.integrations import gemini_client
+    from app.rate_limits import get_limiter
+
+    state = {"active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class _Model:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            prompt = contents[1]
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            # Later prompts finish first so completion order differs from prompt order.
+            time.sleep(0.02 * (6 - int(prompt.split("#")[1])))
+            with lock:
+                state["active"] -= 1
+            return prompt
+
+    class _FakeGenai:
+        GenerativeModel = _Model
+
+        @staticmethod
+        def configure(api_key):
+            return None
+
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setattr(gemini_client, "_try_import_genai", lambda: _FakeGenai)
+    monkeypatch.setattr(gemini_client, "_fetch_image_bytes", lambda url: ("image/png", b"src"))
+    monkeypatch.setattr(gemini_client, "_extract_inline_images", lambda out: [("image/png", out.encode())])
+    monkeypatch.setattr(gemini_client, "build_feature_benefit_prompts", lambda product, count=6: [f"p#{i}" for i in range(count)])
+
+    streamed = [index for index, _ in gemini_client.iter_feature_benefit_images("https://x/src.png", {}, count=6)]
+    items = gemini_client.gen_feature_benefit_images("https://x/src.png", {}, count=6)
+
+    assert sorted(streamed) == list(range(6))
+    assert streamed != list(range(6))
+    assert [item["prompt"] for item in items] == [f"p#{i}" for i in range(6)]
+    assert all("/uploads/gen_" in item["image"] for item in items)
+    assert 1 < state["peak"] <= get_limiter("gemini").max_concurrency
+
+
+def test_inline_flow_images_migrate_to_content_addressed_assets():
+    import base64
+    import struct
+
+    from app import media_assets
+
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\rIHDR" + struct.pack(">II", 64, 48) + b"\x08\x02\x00\x00\x00"
+    data_url = "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+    db.create_flow_row(
+        "media-migration-flow",
+        settings={"assets_used": {"feature_gallery": [data_url, "https://cdn.shopify.com/a.png"]}},
+        ads={"steps": [{"response": {"images": [data_url]}}]},
+        card_image=data_url,
+    )
+
+    stats = media_assets.migrate_flow_inline_images()
+    flow = db.get_flow("media-migration-flow")
+
+    url = flow["card_image"]
+    assert "/uploads/gen_" in url and url.endswith(".png")
+    assert flow["settings"]["assets_used"]["feature_gallery"] == [url, "https://cdn.shopify.com/a.png"]
+    assert flow["ads"]["steps"][0]["response"]["images"] == [url]
+    assert stats["images_replaced"] >= 3
+    assert "media-migration-flow" not in db.list_flow_ids_with_inline_images()
+    assert media_assets.store_image_bytes(png, "image/png")["width"] == 64
+    db.delete_flow_row("media-migration-flow")
+
+
+def test_generated_asset_urls_are_absolute_and_served_locally(monkeypatch):
+    import struct
+    from uuid import uuid4
+
+    from app import image_cache, media_assets, storage
+
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\rIHDR" + struct.pack(">II", 8, 8) + uuid4().bytes
+    monkeypatch.setattr(storage, "BASE_URL", "")
+    token = storage.bind_public_base("https://studio.example.com")
+    try:
+        url = media_assets.store_image_bytes(png, "image/png")["url"]
+        assert url.startswith("https://studio.example.com/uploads/gen_")
+        # Our own assets are read from storage, not fetched over HTTP.
+        monkeypatch.setattr(image_cache.requests, "get", lambda *a, **k: (_ for _ in ()).throw(AssertionError("fetched")))
+        assert image_cache.fetch_source_image(url) == ("image/png", png)
+        assert image_cache.fetch_source_image(url[len("https://studio.example.com"):]) == ("image/png", png)
+        assert storage.local_upload_name("https://cdn.shopify.com/uploads/x.png") is None
+    finally:
+        storage.unbind_public_base(token)
+
+    monkeypatch.setattr(storage, "BASE_URL", "http://localhost:8080")
+    assert storage.public_upload_url("/uploads/a b.png") == "http://localhost:8080/uploads/a%20b.png"
+    monkeypatch.setattr(storage, "BASE_URL", "https://api.example.com/")
+    assert storage.public_upload_url("/uploads/a.png") == "https://api.example.com/uploads/a.png"
+
+
+def test_attachments_use_one_staged_upload_and_one_media_mutation(monkeypatch):
+    gql_calls = []
+    posted = []
+
+    def fake_gql(store, query, variables):
+        gql_calls.append(query)
+        if "stagedUploadsCreate" in query:
+            return {"stagedUploadsCreate": {"stagedTargets": [
+                {"url": f"https://upload/{i}", "resourceUrl": f"https://staged/{i}", "parameters": [{"name": "key", "value": str(i)}]}
+                for i in range(len(variables["input"]))
+            ]}}
+        if "productCreateMedia" in query:
+            return {"productCreateMedia": {"media": [
+                {"id": f"gid://shopify/MediaImage/{m['originalSource'][-1]}", "status": "UPLOADED", "image": None}
+                for m in variables["media"]
+            ], "mediaUserErrors": []}}
+        if "MediaNodes" in query:
+            return {"nodes": [{"id": mid, "status": "READY", "image": {"url": f"https://cdn/{mid[-1]}.jpg"}} for mid in variables["ids"]]}
+        raise AssertionError(query)
+
+    class _Ok:
+        def raise_for_status(self):
+            return None
+
+    def fake_request(method, url, **kw):
+        posted.append((url, kw["data"]["key"], kw["files"]["file"][0]))
+        return _Ok()
+
+    monkeypatch.setattr(shopify_client, "_gql_store", fake_gql)
+    monkeypatch.setattr(shopify_client, "_timed_request", fake_request)
+    monkeypatch.setattr(shopify_client, "_rest_post_store", lambda *a, **k: (_ for _ in ()).throw(AssertionError("REST fallback used")))
+
+    files = [(f"img{i}.png", b"x" * (i + 1)) for i in range(3)]
+    out = shopify_client.upload_image_attachments_to_product("gid://shopify/Product/9", files, store="s")
+
+    assert sum("stagedUploadsCreate" in q for q in gql_calls) == 1
+    assert sum("productCreateMedia" in q for q in gql_calls) == 1
+    assert sorted(posted) == [(f"https://upload/{i}", str(i), f"img{i}.png") for i in range(3)]
+    assert out["cdn_urls"] == ["https://cdn/0.jpg", "https://cdn/1.jpg", "https://cdn/2.jpg"]
+
+
+def test_page_images_keep_the_source_url_while_shopify_is_still_processing(monkeypatch):
+    def fake_gql(store, query, variables):
+        if "productCreateMedia" in query:
+            return {"productCreateMedia": {"media": [
+                {"id": f"gid://shopify/MediaImage/{i}", "status": "UPLOADED", "image": None}
+                for i, _ in enumerate(variables["media"])
+            ], "mediaUserErrors": []}}
+        if "MediaNodes" in query:
+            return {"nodes": [
+                {"id": mid, "status": "READY", "image": {"url": "https://cdn/0.jpg"}} if mid.endswith("/0")
+                else {"id": mid, "status": "PROCESSING", "image": None}
+                for mid in variables["ids"]
+            ]}
+        raise AssertionError(query)
+
+    monkeypatch.setattr(shopify_client, "_gql_store", fake_gql)
+    monkeypatch.setattr(shopify_client, "MEDIA_READY_TIMEOUT_S", 0)
+    monkeypatch.setattr(shopify_client, "_ProductImageSrcs", lambda product_gid, store: set())
+    monkeypatch.setattr(shopify_client, "_indexed_shopify_ref", lambda src, store, product_gid: None)
+    monkeypatch.setattr(shopify_client, "_fetchable_sources", lambda srcs, store=None: list(srcs))
+    monkeypatch.setattr(shopify_client, "_remember_shopify_ref", lambda *a, **k: None)
+
+    srcs = ["https://img/a.jpg", "https://img/b.jpg"]
+    out = shopify_client.upload_images_to_product_verbose("gid://shopify/Product/9", srcs, store="s")
+
+    assert out["cdn_urls"] == ["https://cdn/0.jpg"]
+    assert shopify_client.page_image_urls(out["per_image"]) == ["https://cdn/0.jpg", "https://img/b.jpg"]
+
+
+def test_pipeline_overlaps_landing_copy_with_images_and_records_stage_timeline(monkeypatch):
+    import threading
+
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY") or "test-key")
+    from app import tasks
+
+    landing_started = threading.Event()
+    saved = {}
+
+    def fake_images(angle, payload):
+        # Images only finish once landing copy is already running.
+        assert landing_started.wait(2)
+        time.sleep(0.02)
+        return [f"https://img/{angle['name']}.png"]
+
+    def fake_landing(payload, angles, model=None, prompt_override=None):
+        landing_started.set()
+        return {"headline": "h"}
+
+    monkeypatch.setattr(tasks, "gen_angles_and_copy", lambda payload, model=None, prompt_override=None: [{"name": "a"}, {"name": "b"}])
+    monkeypatch.setattr(tasks, "gen_images", fake_images)
+    monkeypatch.setattr(tasks, "gen_landing_copy", fake_landing)
+    monkeypatch.setattr(tasks, "create_product_and_page", lambda payload, angles, creatives, landing: {"url": "u", "creatives": len(creatives)})
+    monkeypatch.setattr(tasks.db, "update_test_status", lambda *a, **k: None)
+    monkeypatch.setattr(tasks.db, "set_test_result", lambda test_id, page, campaign, creatives, angles=None, trace=None: saved.update(page=page, trace=trace))
+
+    assert tasks.run_pipeline_sync("t-graph", {"title": "Shoe"})["page"]["creatives"] == 2
+
+    timeline = saved["trace"][-1]
+    assert timeline["step"] == "timeline"
+    stages = {t["stage"]: t for t in timeline["stages"]}
+    assert {"angles", "images", "image:0", "image:1", "landing_copy", "shopify"} <= set(stages)
+    assert stages["landing_copy"]["started_at"] < stages["images"]["ended_at"]
+    assert stages["shopify"]["started_at"] >= max(stages["images"]["ended_at"], stages["landing_copy"]["ended_at"])
+    assert timeline["critical_path"][0] == "angles" and timeline["critical_path"][-1] == "shopify"
+    assert [s["step"] for s in saved["trace"][:4]] == ["generate_copy", "gen_images", "landing_copy", "shopify"]
+
+
+def test_celery_routes_job_classes_and_reports_queue_depth_and_age(monkeypatch):
+    import json
+
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY") or "test-key")
+    from app import system_health, tasks
+
+    assert set(tasks.CELERY_QUEUES) == {"celery", "interactive", "media", "bulk", "warm"}
+    assert tasks.celery.conf.task_routes["pipeline_launch"]["queue"] == "interactive"
+    assert tasks.celery.conf.worker_prefetch_multiplier == 1
+
+    headers = {}
+    tasks._stamp_enqueued_at(headers=headers)
+    now = headers["enqueued_at"]
+
+    class FakeRedis:
+        lists = {
+            "interactive": [json.dumps({"headers": {"enqueued_at": now - 5}})],
+            "interactive:3": [json.dumps({"headers": {}}), json.dumps({"headers": {"enqueued_at": now - 40}})],
+            "bulk:8": [json.dumps({"headers": {"enqueued_at": now - 600}})] * 3,
+        }
+
+        def llen(self, key):
+            return len(self.lists.get(key, []))
+
+        def lindex(self, key, index):
+            items = self.lists.get(key) or []
+            return items[index] if items else None
+
+    class FakeChannel:
+        client = FakeRedis()
+        priority_steps = list(range(10))
+
+        def _q_for_pri(self, queue, pri):
+            return f"{queue}:{pri}" if pri else queue
+
+    metrics = system_health._celery_queue_metrics(FakeChannel(), tasks.CELERY_QUEUES)
+    assert metrics["interactive"]["depth"] == 3 and metrics["interactive"]["oldest_age_s"] >= 40
+    assert metrics["bulk"]["depth"] == 3 and metrics["media"] == {"depth": 0, "oldest_age_s": None}
+
+
+def test_flow_and_test_listing_reads_typed_columns_with_keyset_pages():
+    from uuid import uuid4
+
+    store = f"list-{uuid4().hex[:8]}"
+    ids = [f"{store}-{i}" for i in range(3)]
+    db.create_flow_row(ids[0], product={"title": "Old", "uploaded_images": ["/uploads/a.jpg"]}, settings={"store": store.upper(), "flow_type": "ads"})
+    db.create_flow_row(ids[1], product={"title": "Mid"}, settings={"store": store, "assets_used": {"feature_gallery": ["https://cdn.shopify.com/g.jpg"]}})
+    db.create_flow_row(ids[2], product={"title": "New"}, settings={"store": store}, card_image="https://cdn.shopify.com/card.jpg")
+    db.update_flow_row(ids[0], settings={"store": store, "flow_type": "promotion"})
+
+    page1 = db.list_flows_light(limit=2, store=store)
+    assert [(f["id"], f["card_image"]) for f in page1] == [(ids[2], "https://cdn.shopify.com/card.jpg"), (ids[1], "https://cdn.shopify.com/g.jpg")]
+    page2 = db.list_flows_light(limit=2, store=store, cursor=db.keyset_cursor(page1[-1]))
+    assert [(f["id"], f["flow_type"], f["store"], f["card_image"]) for f in page2] == [(ids[0], "promotion", store, "/uploads/a.jpg")]
+
+    test_id = f"{store}-test"
+    db.create_test_row(test_id, {"title": "Shirt", "settings": {"store": store}, "card_image": "/uploads/local.jpg"})
+    db.set_test_result(test_id, {"url": "https://x.myshopify.com/p"}, {}, [{"image": "https://cdn.shopify.com/s/files/1/hero.png"}])
+    [row] = db.list_tests_light(limit=5, store=store)
+    assert (row["title"], row["card_image"], row["store"]) == ("Shirt", "https://cdn.shopify.com/s/files/1/hero.png", store)
+
+
+def test_db_engine_uses_wal_and_reports_pool_checkout_waits():
+    from sqlalchemy import text
+
+    from app import system_health
+
+    if db.engine.dialect.name == "sqlite":
+        with db.engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar().lower() == "wal"
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == db.SQLITE_BUSY_TIMEOUT_MS
+    assert isinstance(db.engine.pool, db._TimedQueuePool)
+    for _ in range(6):
+        with db.SessionLocal() as session:
+            session.execute(text("SELECT 1"))
+
+    info = system_health._db_info()
+    assert info["pool"]["checkout_wait"]["count"] >= 6
+    assert info["settings"]["pool_size"] == db.ENGINE_SETTINGS["pool_size"]
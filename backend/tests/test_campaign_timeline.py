@@ -0,0 +1,44 @@
+import time
+
+from app import db
+
+
+def test_campaign_timeline_rows_replace_the_inline_json_array():
+    store = f"tl-{int(time.time() * 1000)}"
+    task_id = f"{store}-t1"
+    # A meta row written before campaign_timeline existed keeps its array inline.
+    db.set_app_setting(store, "campaign_meta:c1", {"owner": "adil", "timeline": [
+        {"text": '{"type":"analysis","analysis":{"large":"payload"}}', "at": "2024-05-01T10:00:00Z"},
+        {"text": '{"type":"task","id":"%s","done":false}' % task_id, "at": "2024-05-02T10:00:00Z"},
+    ]})
+
+    db.append_campaign_timeline(store, "c1", "plain note", return_meta=False)
+    db.append_campaign_timeline(store, "c1", '{"type":"campaign_action","day":"2024-05-03"}', return_meta=False)
+    assert "timeline" not in db.get_app_setting(store, "campaign_meta:c1")
+
+    [summary] = db.list_campaign_meta(store, include_timeline=False).values()
+    assert (summary["owner"], summary["timeline_entries"], summary["incomplete_tasks"]) == ("adil", 4, 1)
+    assert summary["life_activity_days"]["2024-05-03"] == {"actions": 1, "notes": 0}
+
+    assert db.sync_campaign_timeline_task_states(store, {task_id: True}) == 1
+    assert db.list_campaign_meta(store, include_timeline=False)["c1"]["incomplete_tasks"] == 0
+
+    timeline = db.get_campaign_meta(store, "c1")["timeline"]
+    assert '"done": true' in timeline[1]["text"]
+    def _ids():
+        with db.SessionLocal() as session:
+            return [r.id for r in session.query(db.CampaignTimelineEntry).filter_by(store=store).order_by(db.CampaignTimelineEntry.id)]
+
+    ids_before = _ids()
+    meta = db.set_campaign_meta(store, "c1", {"timeline": timeline[:1] + timeline[2:]})
+    assert [e["text"] for e in meta["timeline"]] == [timeline[0]["text"], "plain note", timeline[3]["text"]]
+    ids_after = _ids()
+    assert ids_after == ids_before[:1] + ids_before[2:]
+    assert db.last_campaign_timeline_entry(store, "c1", kind="analysis")["at"] == "2024-05-01T10:00:00Z"
+
+    # Two readers that loaded the same inline row before either migrated it move the entries once.
+    db.set_app_setting(store, "campaign_meta:c2", {"owner": "sara", "timeline": [{"text": "a", "at": "2024-05-01T10:00:00Z"}, {"text": "b", "at": "2024-05-02T10:00:00Z"}]})
+    with db.SessionLocal() as first, db.SessionLocal() as second:
+        rows = [s.get(db.AppSetting, db._mk_setting_pk(store, "campaign_meta:c2")) for s in (first, second)]
+        assert [db._slim_campaign_meta_in(s, r) for s, r in zip((first, second), rows)] == [{"owner": "sara"}] * 2
+    assert [e["text"] for e in db.get_campaign_meta(store, "c2")["timeline"]] == ["a", "b"]
@@ -0,0 +1,49 @@
+from datetime import datetime
+from uuid import uuid4
+
+from app import confirmation_queue, db, shopify_mirror
+
+
+def test_confirmation_queue_pages_by_agent_tag_and_counts_from_indexes(monkeypatch):
+    store = f"cq-{uuid4().hex[:8]}"
+
+    def order(i, tags, **kw):
+        return {"id": 9000 + i, "name": f"#{i}", "created_at": f"2026-10-{i:02d}T08:00:00Z", "updated_at": f"2026-10-{i:02d}T09:00:00Z", "tags": tags, "fulfillment_status": None, **kw}
+
+    open_set = [
+        order(1, "Sara, n1"), order(2, "sara, n2"), order(3, "sara"), order(4, "omar, n1"),
+        order(5, "sara, cod 01/10/26"), order(6, ""),
+    ]
+    calls = []
+
+    def fake_page(st, resource, params):
+        calls.append(params)
+        return (open_set if params.get("fulfillment_status") else [order(3, "sara, n3", updated_at="2026-10-03T10:00:00Z")]), True
+
+    monkeypatch.setattr(shopify_mirror, "_page_resource", fake_page)
+    assert not confirmation_queue.ready(store)
+    assert confirmation_queue.sync(store)["mode"] == "full"
+    assert confirmation_queue.ready(store)
+
+    first = confirmation_queue.list_page(store, ["sara"], limit=2)
+    assert [r["order_id"] for r in first["rows"]] == ["9003", "9002"] and first["prev_page_info"] is None
+    second = confirmation_queue.list_page(store, ["sara"], limit=2, cursor=first["next_page_info"])
+    assert [r["order_id"] for r in second["rows"]] == ["9001"] and second["next_page_info"] is None
+    back = confirmation_queue.list_page(store, ["sara"], limit=2, cursor=second["prev_page_info"])
+    assert [r["order_id"] for r in back["rows"]] == ["9003", "9002"]
+    assert back["rows"][1]["data"]["name"] == "#2"  # full payload from the order mirror
+
+    counts = db.confirmation_queue_counts(store, ["sara"], ["sara", "omar"])
+    assert counts == {"assigned_total": 3, "unassigned_total": 1, "n1": 1, "n2": 1, "n3": 0, "any_n": 2, "no_n": 1, "all_n": 0}
+
+    # Incremental sweep picks up the n3 tag; an agent confirming with COD takes the order out right away.
+    assert confirmation_queue.sync(store)["mode"] == "incremental" and "updated_at_min" in calls[-1]
+    confirmation_queue.note_tags(store, "9001", ["Sara", "n1", "cod 20/10/26"])
+    counts = db.confirmation_queue_counts(store, ["sara"], ["sara", "omar"])
+    assert (counts["assigned_total"], counts["n1"], counts["n3"]) == (2, 0, 1)
+    assert db.count_stuck_confirmation_queue(store, datetime(2026, 10, 7)) == {"stuck": 1, "scanned": 4}
+
+    # A full re-read retires orders that left the open set while no webhook told us.
+    open_set[:] = [o for o in open_set if o["id"] not in (9001, 9002)] + [order(1, "Sara, n1, cod 20/10/26", updated_at="2026-10-19T10:00:00Z")]
+    assert confirmation_queue.sync(store, full=True)["retired"] == 1
+    assert [r["order_id"] for r in confirmation_queue.list_page(store, ["sara"])["rows"]] == ["9003"]
@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from app import db
+
+
+def test_confirmation_analytics_read_daily_rollups_and_backfill_matches(monkeypatch):
+    store = f"roll-{uuid4().hex[:8]}"
+    db.count_confirmation_events(store)  # builds the rollups once if this DB never had them
+    for agent, kind in (("Sara@x.com", "confirm"), ("Sara@x.com", "confirm"), ("sara@x.com", "phone"), ("omar@x.com", "whatsapp")):
+        assert db.log_confirmation_event(store, agent, "1001", kind)["ok"]
+    earlier = datetime.utcnow() - timedelta(days=40)
+    monkeypatch.setattr(db, "_now", lambda: earlier)
+    db.log_confirmation_event(store, "omar@x.com", "1002", "confirm")
+    monkeypatch.undo()
+
+    def snapshot():
+        recent = db.confirmation_analytics(store, days=30)
+        year = db.confirmation_analytics(store, start=(earlier.date() - timedelta(days=1)).isoformat())
+        return db.count_confirmation_events(store, kind="confirm"), recent["totals"], recent["agents"]["sara@x.com"]["confirm"], year["totals"], len(year["daily"])
+
+    before = snapshot()
+    assert before[:4] == ({"Sara@x.com": 2, "omar@x.com": 1}, {"confirm": 2, "phone": 1, "whatsapp": 1}, 2, {"confirm": 3, "phone": 1, "whatsapp": 1})
+    assert before[4] == 42  # every day in the range, including empty ones
+    assert db.rebuild_confirmation_rollups(store) == 4
+    assert snapshot() == before
+    try:
+        db.confirmation_analytics(store, start="2024-01-01", end="2025-06-01")
+        raise AssertionError("range over a year accepted")
+    except ValueError:
+        pass
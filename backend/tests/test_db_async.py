@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+from app import chat, db, db_async
+
+
+def test_async_db_helpers_match_sync_helpers():
+    store = f"async-{int(time.time() * 1000)}"
+    db.set_app_setting(store, "product_life_instructions", {"phases": {"testing": ["a"]}})
+    db.set_app_setting(store, "confirmation_users", [{"email": "A@x.io", "password": "pw", "tags": ["n1"]}])
+    chat.upsert_account(f"{store}-me", name="Me")
+    db.create_flow_row(f"{store}-flow", product={"title": "Async"}, settings={"store": store})
+    db.create_test_row(f"{store}-test", {"title": "Async"})
+
+    async def _read():
+        return await asyncio.gather(
+            db_async.get_app_setting(store, "product_life_instructions"),
+            db_async.list_campaign_mappings(store),
+            db_async.run(chat._get_account_in, f"{store}-me"),
+            db_async.get_flow(f"{store}-flow"),
+            db_async.get_test(f"{store}-test"),
+        )
+
+    one, mappings, account, flow, test = asyncio.run(_read())
+    assert one == db.get_app_setting(store, "product_life_instructions")
+    assert mappings == db.list_campaign_mappings(store)
+    assert account["name"] == "Me"
+    assert flow == db.get_flow(f"{store}-flow") and flow["product"] == {"title": "Async"}
+    assert test == db.get_test(f"{store}-test")
+    db.delete_flow_row(f"{store}-flow")
+    db.delete_test_row(f"{store}-test")
@@ -0,0 +1,52 @@
+import os
+from uuid import uuid4
+
+from app import db
+from app.flow_steps import FlowStepLog
+
+
+def test_flow_step_log_appends_events_and_resumes_from_checkpoints():
+    flow_id = f"flow-steps-{uuid4().hex[:8]}"
+    calls = []
+
+    def flaky():
+        calls.append("images")
+        raise RuntimeError("gemini down")
+
+    first = FlowStepLog(flow_id, "inputs-v1")
+    assert first.run("generate_angles", lambda: calls.append("angles") or {"angles": ["a"]}) == {"angles": ["a"]}
+    assert first.run("generate_images", flaky, angle_index=0) is None
+
+    steps = first.steps()
+    assert [(s["step"], s["status"]) for s in steps] == [("generate_angles", "completed"), ("generate_images", "failed")]
+    assert steps[1]["angle_index"] == 0 and steps[1]["error"] == {"message": "gemini down"}
+
+    resumed = FlowStepLog(flow_id, "inputs-v1")
+    assert resumed.run("generate_angles", lambda: calls.append("angles-again")) == {"angles": ["a"]}
+    assert resumed.run("generate_images", lambda: calls.append("images-ok") or {"images": ["u"]}, angle_index=0) == {"images": ["u"]}
+    assert calls == ["angles", "images", "images-ok"]
+    assert [s["status"] for s in resumed.steps()] == ["completed", "completed"]
+
+    # Different inputs never see the old checkpoints.
+    assert FlowStepLog(flow_id, "inputs-v2").run("generate_angles", lambda: {"angles": ["b"]}) == {"angles": ["b"]}
+    assert len(db.list_flow_step_events(flow_id)) == 9
+    db.delete_flow_step_events(flow_id)
+
+
+def test_ads_automation_resumes_only_for_the_same_product(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY") or "test-key")
+    from app import main
+    from app.flow_steps import inputs_hash
+
+    settings = dict(prompts={}, landing_url="https://shop/p", source_image=None, k=3, model=None)
+    supplied = {"title": "", "benefits": ["soft"]}
+    first = main._ads_automation_hashes({}, {}, dict(supplied), **settings)
+
+    # The failed run prefilled the product from the landing page and saved it.
+    prefilled = dict(supplied, title="Dress from page")
+    ads = {"automation": dict(first, prefilled_product_hash=inputs_hash({"product": prefilled}))}
+
+    assert main._ads_automation_hashes(ads, {}, dict(supplied), **settings)["input_hash"] == first["input_hash"]
+    assert main._ads_automation_hashes(ads, {}, dict(prefilled), **settings)["input_hash"] == first["input_hash"]
+    edited = dict(supplied, benefits=["soft", "washable"])
+    assert main._ads_automation_hashes(ads, {}, edited, **settings)["input_hash"] != first["input_hash"]
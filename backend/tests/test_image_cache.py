@@ -0,0 +1,41 @@
+from app import image_cache
+
+
+def test_source_image_cache_revalidates_with_etag_and_bounds_bytes(monkeypatch):
+    image_cache.clear()
+    calls = []
+
+    class _Resp:
+        def __init__(self, status, content=b"", headers=None):
+            self.status_code = status
+            self.content = content
+            self.headers = headers or {}
+
+        def raise_for_status(self):
+            if self.status_code >= 400:
+                raise RuntimeError(self.status_code)
+
+    def fake_get(url, timeout=None, headers=None):
+        calls.append((url, dict(headers or {})))
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return _Resp(304)
+        return _Resp(200, b"x" * 10, {"content-type": "image/png", "ETag": '"v1"'})
+
+    monkeypatch.setattr(image_cache.requests, "get", fake_get)
+    url = "https://cdn.shopify.com/s/files/1/p.png?v=1"
+
+    assert image_cache.fetch_source_image(url) == ("image/png", b"x" * 10)
+    assert image_cache.fetch_source_image(url) == ("image/png", b"x" * 10)
+    assert len(calls) == 1
+    assert "width=" in calls[0][0]
+
+    monkeypatch.setattr(image_cache, "FRESH_S", 0)
+    assert image_cache.fetch_source_image(url) == ("image/png", b"x" * 10)
+    assert calls[-1][1] == {"If-None-Match": '"v1"'}
+    assert image_cache.cache_stats()["revalidated"] == 1
+
+    monkeypatch.setattr(image_cache, "CACHE_MAX_BYTES", 15)
+    image_cache.fetch_source_image("https://example.com/other.png")
+    stats = image_cache.cache_stats()
+    assert stats["entries"] == 1 and stats["bytes"] == 10
+    image_cache.clear()
@@ -0,0 +1,58 @@
+import time
+from uuid import uuid4
+
+from app import image_index
+from app.storage import save_file
+
+
+def test_image_index_dedupes_exact_bytes_and_only_opted_in_near_duplicates(monkeypatch):
+    token = uuid4().hex
+    original, reencoded, blue = f"orig-{token}".encode(), f"reenc-{token}".encode(), f"blue-{token}".encode()
+    base = int(token[:15], 16) << 4
+    white_red, white_blue = "fff" "f00" "fff" "fff", "fff" "00f" "fff" "fff"
+    hashes = {
+        original: f"{base:016x}{white_red}",
+        reencoded: f"{base | 0b11:016x}{white_red}",
+        blue: f"{base:016x}{white_blue}",  # colour variant: same grayscale dHash
+    }
+    monkeypatch.setattr(image_index, "perceptual_hash", lambda data: hashes.get(data))
+    monkeypatch.setattr(image_index, "_loaded_at", 0.0)
+
+    saved = []
+
+    def saver(name, data):
+        def _save():
+            saved.append(name)
+            return save_file(name, data)
+        return _save
+
+    first, dup = image_index.register_image(original, save=saver(f"{token}_a.jpg", original), source="upload", match_near=True)
+    assert not dup and first["url"] == f"/uploads/{token}_a.jpg"
+
+    again, dup_exact = image_index.register_image(original, save=saver(f"{token}_b.jpg", original), match_near=True)
+    assert dup_exact and again["sha256"] == first["sha256"]
+
+    # Near matching is off by default, even when the caller asks for it.
+    assert image_index.MAX_DISTANCE < 0
+    other, dup_off = image_index.register_image(reencoded, save=saver(f"{token}_c.jpg", reencoded), match_near=True)
+    assert not dup_off and other["url"] == f"/uploads/{token}_c.jpg"
+
+    monkeypatch.setattr(image_index, "MAX_DISTANCE", 4)
+    monkeypatch.setattr(image_index, "_HASHES", {first["sha256"]: image_index._parse_signature(hashes[original])})
+    monkeypatch.setattr(image_index, "_loaded_at", time.time())
+    assert image_index.nearest(hashes[reencoded]) == (first["sha256"], 2)
+    assert image_index.nearest(hashes[blue]) is None
+    variant, dup_variant = image_index.register_image(blue, save=saver(f"{token}_d.jpg", blue), match_near=True)
+    assert not dup_variant and variant["url"] == f"/uploads/{token}_d.jpg"
+    assert saved == [f"{token}_a.jpg", f"{token}_c.jpg", f"{token}_d.jpg"]
+
+    calls = []
+    compute = lambda: calls.append(1) or {"title": f"Shirt {len(calls)}"}
+    assert image_index.reuse_derived(f"https://api.example.com{first['url']}", "analyze", compute) == {"title": "Shirt 1"}
+    assert image_index.reuse_derived(first["url"], "analyze", compute) == {"title": "Shirt 1"}
+    # Derived results never cross to a near-identical source.
+    assert image_index.reuse_derived(other["url"], "analyze", compute) == {"title": "Shirt 2"}
+    assert image_index.reuse_derived(variant["url"], "analyze", compute) == {"title": "Shirt 3"}
+
+    image_index.remember_shopify(first["url"], "store|gid://shopify/Product/1", {"id": 7, "src": "https://cdn/x.jpg"})
+    assert image_index.shopify_ref(first["url"], "store|gid://shopify/Product/1")["id"] == 7
@@ -0,0 +1,67 @@
+import os
+
+
+def test_job_runner_persists_status_and_routes_celery_jobs_to_their_queue(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY") or "test-key")
+    from app import job_runner, tasks
+
+    def fake_job(job_id, params):
+        if params.get("fail"):
+            raise RuntimeError("boom")
+        return {"echo": params["value"], "job_id": job_id}
+
+    job_runner.register_job("test.echo", fake_job, queue="bulk", priority=9)
+
+    monkeypatch.delenv("USE_CELERY", raising=False)
+    queued = []
+    monkeypatch.setattr(job_runner, "_run_local", lambda job_id, queue: queued.append((job_id, queue)))
+    job = job_runner.submit_job("test.echo", {"value": 7}, store="s1")
+    assert queued == [(job["job_id"], "bulk")]
+    assert job_runner.get_job(job["job_id"])["status"] == "queued"
+
+    done = job_runner.run_job(job["job_id"])
+    assert done["status"] == "done" and done["result"] == {"echo": 7, "job_id": job["job_id"]}
+    assert job_runner.run_job(job["job_id"])["finished_at"] == done["finished_at"]  # finished jobs don't rerun
+    assert "params" not in job_runner.job_public(done)
+
+    failed = job_runner.submit_job("test.echo", {"fail": True})
+    assert job_runner.run_job(failed["job_id"])["error"] == "boom"
+
+    sent = []
+    monkeypatch.setenv("USE_CELERY", "true")
+    monkeypatch.setattr(tasks.job_run, "apply_async", lambda **kw: sent.append(kw))
+    remote = job_runner.submit_job("test.echo", {"value": 1})
+    assert sent == [{"args": [remote["job_id"]], "queue": "bulk", "priority": 9}]
+    assert job_runner.get_job(remote["job_id"])["runner"] == "celery"
+
+    # A worker that never registered the kind imports the registering module first.
+    imported = []
+
+    def fake_import(name):
+        imported.append(name)
+        job_runner.register_job("test.echo", fake_job, queue="bulk", priority=9)
+
+    job_runner._KINDS.pop("test.echo")
+    monkeypatch.setattr(job_runner.importlib, "import_module", fake_import)
+    assert job_runner.run_job(remote["job_id"])["result"]["echo"] == 1
+    assert imported == [fake_job.__module__]
+
+
+def test_only_one_worker_claims_a_queued_job(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY") or "test-key")
+    from app import job_runner
+
+    ran = []
+    job_runner.register_job("test.claim", lambda job_id, params: ran.append(job_id) or "ok", queue="bulk")
+    monkeypatch.delenv("USE_CELERY", raising=False)
+    monkeypatch.setattr(job_runner, "_run_local", lambda job_id, queue: None)
+    job = job_runner.submit_job("test.claim", {})
+
+    # Two deliveries both read the job while it was still queued; only the first claim goes through.
+    real_get_job = job_runner.get_job
+    seen = real_get_job(job["job_id"])
+    monkeypatch.setattr(job_runner, "get_job", lambda job_id: dict(seen))
+    assert job_runner.run_job(job["job_id"])["status"] == "done"
+    job_runner.run_job(job["job_id"])
+    assert ran == [job["job_id"]]
+    assert real_get_job(job["job_id"])["status"] == "done"
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from starlette.requests import Request
+
+from app import db, list_pages
+
+
+def test_list_pages_keyset_cursor_filters_fields_and_etag_304():
+    tag = f"pager{int(time.time() * 1000)}"
+    for i in range(3):
+        db.create_agent(f"{tag}-{i}", f"{tag} agent {i}")
+        db.create_agent_run(f"{tag}-0", f"{tag}-run-{i}", status="done" if i else "draft")
+
+    first = db.list_agents(limit=2, q=tag)
+    rest = db.list_agents(limit=2, cursor=db.keyset_cursor(first[-1]), q=tag)
+    assert [a["id"] for a in first + rest] == [f"{tag}-2", f"{tag}-1", f"{tag}-0"]
+    assert [r["id"] for r in db.list_agent_runs(f"{tag}-0", status="done")] == [f"{tag}-run-2", f"{tag}-run-1"]
+    assert list_pages.sparse(first, "name") == [{"id": f"{tag}-2", "name": f"{tag} agent 2"}, {"id": f"{tag}-1", "name": f"{tag} agent 1"}]
+
+    built = []
+
+    async def _page():
+        built.append(1)
+        return {"data": db.list_agents(q=tag)}
+
+    def _request(etag=None):
+        headers = [(b"if-none-match", etag.encode())] if etag else []
+        return Request({"type": "http", "method": "GET", "path": "/api/agents", "headers": headers})
+
+    def _get(etag=None):
+        return asyncio.run(list_pages.conditional(_request(etag), lambda: db.agents_list_version(tag), _page, q=tag))
+
+    resp = _get()
+    etag = resp.headers["etag"]
+    assert resp.status_code == 200 and etag.startswith('W/"')
+    assert _get(etag).status_code == 304 and len(built) == 1
+    assert _get(etag.removeprefix("W/")).status_code == 304
+
+    time.sleep(0.002)
+    db.update_agent(f"{tag}-1", name=f"{tag} renamed")
+    resp = _get(etag)
+    assert resp.status_code == 200 and resp.headers["etag"] != etag and len(built) == 2
@@ -0,0 +1,44 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from app import llm_gateway
+
+
+def test_llm_gateway_caches_coalesces_and_honours_opt_out():
+    llm_gateway.clear_cache()
+    calls = []
+    release = threading.Event()
+
+    def fake_create(**kwargs):
+        calls.append(kwargs)
+        release.wait(2)
+        return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=7, completion_tokens=3, total_tokens=10), text=len(calls))
+
+    messages = [{"role": "user", "content": "same prompt"}]
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(llm_gateway.complete("openai", "gw-test", messages, fake_create, temperature=0)))
+        for _ in range(3)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert {id(r) for r in results} == {id(results[0])}
+    assert llm_gateway.complete("openai", "gw-test", messages, fake_create, temperature=0) is results[0]
+    assert len(calls) == 1
+
+    llm_gateway.complete("openai", "gw-test", messages, fake_create, temperature=1)
+    llm_gateway.complete("openai", "gw-test", messages, fake_create, cache=False, temperature=0)
+    assert len(calls) == 3
+
+    stats = llm_gateway.gateway_stats()["models"]["openai:gw-test"]
+    assert stats["calls"] == 3
+    assert stats["coalesced"] + stats["cache_hits"] == 3
+    assert stats["total_tokens"] == 30
+    assert stats["tokens_saved"] == 10
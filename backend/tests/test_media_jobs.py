@@ -0,0 +1,52 @@
+import time
+
+from app import db, job_runner, media_jobs
+
+
+def test_media_job_is_idempotent_by_request_hash_and_keeps_item_order(monkeypatch):
+    started = []
+    monkeypatch.delenv("USE_CELERY", raising=False)
+    monkeypatch.setattr(job_runner, "_run_local", lambda job_id, queue: started.append((job_id, queue)))
+
+    def fake_runner(params):
+        for index in reversed(range(params["count"])):
+            yield index, f"img-{index}"
+
+    media_jobs.register_media_job_kind("test.fake_set", fake_runner)
+    params = {"image_url": "https://x/src.png", "count": 3, "nonce": str(time.time())}
+
+    job, created = media_jobs.submit_media_job("test.fake_set", params)
+    again, created_again = media_jobs.submit_media_job("test.fake_set", dict(params))
+    assert created and not created_again
+    assert again["job_id"] == job["job_id"]
+    assert started == [(job["job_id"], "media")]  # a job_runner kind on the media queue
+
+    # A redelivered task while the first attempt is alive does nothing.
+    live = dict(job, status="running", started_at=time.time())
+    job_runner._save(live)
+    assert job_runner.run_job(job["job_id"])["status"] == "running"
+    assert media_jobs.get_media_job(job["job_id"])["items"] == []
+
+    live.update(started_at=time.time() - media_jobs.MEDIA_JOB_STALE_S - 1, updated_at=time.time() - media_jobs.MEDIA_JOB_STALE_S - 1)
+    db.set_app_setting(None, job_runner._job_key(job["job_id"]), live)
+    job_runner.run_job(job["job_id"])
+    done = media_jobs.get_media_job(job["job_id"])
+    assert done["status"] == "done" and done["result"] == {"completed": 3}
+    assert [e["index"] for e in done["items"]] == [2, 1, 0]
+    assert "items" not in job_runner.get_job(job["job_id"])
+
+    # Re-running after a stale attempt overwrites items by index instead of appending.
+    requeued = {k: v for k, v in done.items() if k != "items"}
+    db.set_app_setting(None, job_runner._job_key(job["job_id"]), dict(requeued, status="queued"))
+    job_runner.run_job(job["job_id"])
+    assert media_jobs.ordered_items(media_jobs.get_media_job(job["job_id"])) == ["img-0", "img-1", "img-2"]
+
+    # Finished jobs are not replayed: the same request ("regenerate") starts a new job ...
+    fresh, created_fresh = media_jobs.submit_media_job("test.fake_set", params)
+    assert created_fresh and fresh["job_id"] != job["job_id"]
+
+    # ... unless the kind opted into reuse.
+    media_jobs.register_media_job_kind("test.fake_set_reused", fake_runner, reuse_s=60)
+    reused, _ = media_jobs.submit_media_job("test.fake_set_reused", params)
+    job_runner.run_job(reused["job_id"])
+    assert media_jobs.submit_media_job("test.fake_set_reused", params) == (job_runner.get_job(reused["job_id"]), False)
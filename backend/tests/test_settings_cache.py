@@ -0,0 +1,33 @@
+import json
+import time
+
+from app import db, settings_cache
+
+
+def test_hot_settings_are_cached_and_invalidated_on_write():
+    store = f"sc-{int(time.time() * 1000)}"
+    db.set_app_setting(store, "shopify_oauth", {"shop": "a.myshopify.com", "access_token": "t1"})
+    assert db.get_app_setting(store, "shopify_oauth")["access_token"] == "t1"
+    hits = settings_cache.stats()["hits"]
+    rec = db.get_app_setting(store, "shopify_oauth")
+    assert settings_cache.stats()["hits"] == hits + 1
+    rec["access_token"] = "mutated by caller"
+    assert db.get_app_setting(store, "shopify_oauth")["access_token"] == "t1"
+
+    db.set_app_setting(store, "shopify_oauth", {"shop": "a.myshopify.com", "access_token": "t2"})
+    assert db.get_app_setting(store, "shopify_oauth")["access_token"] == "t2"
+
+    # A value loaded before a concurrent invalidation is not cached.
+    hit, _, version = settings_cache.lookup(store, "usd_to_mad_rate")
+    assert not hit
+    settings_cache.invalidate(store, "usd_to_mad_rate")
+    settings_cache.fill(store, "usd_to_mad_rate", version, 9.5)
+    assert settings_cache.lookup(store, "usd_to_mad_rate")[0] is False
+
+    # Another instance's write arrives over the bus.
+    with db.SessionLocal() as session:
+        session.get(db.AppSetting, db._mk_setting_pk(store, "shopify_oauth")).value = json.dumps({"access_token": "t3"})
+        session.commit()
+    assert db.get_app_setting(store, "shopify_oauth")["access_token"] == "t2"
+    settings_cache._on_message(json.dumps({"store": store, "key": "shopify_oauth", "origin": "other-instance"}))
+    assert db.get_app_setting(store, "shopify_oauth")["access_token"] == "t3"
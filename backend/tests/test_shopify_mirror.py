@@ -0,0 +1,71 @@
+import base64
+import hashlib
+import hmac
+import time
+from uuid import uuid4
+
+from app import db, shopify_mirror
+
+
+def test_shopify_webhooks_are_logged_once_and_applied_newest_first(monkeypatch):
+    monkeypatch.setattr(shopify_mirror, "schedule_apply", lambda delay_ms=None: None)
+    store = f"mirror-{uuid4().hex[:8]}"
+    body = b'{"id": 1}'
+    sig = base64.b64encode(hmac.new(b"shpss_secret", body, hashlib.sha256).digest()).decode()
+    assert shopify_mirror.verify_webhook_hmac(body, sig, ["shpss_secret"])
+    assert not shopify_mirror.verify_webhook_hmac(body + b" ", sig, ["shpss_secret"])
+
+    newer = {"id": 501, "name": "#501", "updated_at": "2026-10-01T10:05:00+01:00", "processed_at": "2026-10-01T10:00:00+01:00", "tags": "n1, agent:sara", "total_price": "199.00"}
+    older = {**newer, "updated_at": "2026-10-01T10:01:00+01:00", "tags": "n0"}
+    assert shopify_mirror.ingest(store, "orders/updated", f"{store}-a", newer)
+    assert not shopify_mirror.ingest(store, "orders/updated", f"{store}-a", newer)  # Shopify retry
+    assert shopify_mirror.ingest(store, "orders/create", f"{store}-b", older)
+    assert shopify_mirror.ingest(store, "inventory_levels/update", f"{store}-c", {"inventory_item_id": 9, "location_id": 1, "available": 4, "updated_at": "2026-10-01T10:00:00Z"})
+    assert shopify_mirror.ingest(store, "inventory_levels/update", f"{store}-d", {"inventory_item_id": 9, "location_id": 2, "available": 3, "updated_at": "2026-10-01T10:00:00Z"})
+    assert not shopify_mirror.ingest(store, "shop/update", f"{store}-e", {"id": 1})
+
+    shopify_mirror.apply_pending()
+    orders = db.list_mirrored_orders(store)
+    assert [(o["order_id"], o["tags"], o["processed_at"]) for o in orders] == [("501", "n1, agent:sara", "2026-10-01T09:00:00Z")]
+    assert db.get_mirrored_inventory(store, ["9"])["9"] == {"available": 7, "locations": {"1": 4, "2": 3}}
+
+    # A late, older delivery never overwrites the newer row; deletes remove it.
+    assert shopify_mirror.ingest(store, "orders/updated", f"{store}-f", older)
+    shopify_mirror.apply_pending()
+    assert db.list_mirrored_orders(store)[0]["tags"] == "n1, agent:sara"
+    assert shopify_mirror.ingest(store, "orders/delete", f"{store}-g", {"id": 501})
+    shopify_mirror.apply_pending()
+    assert db.list_mirrored_orders(store) == []
+
+
+def test_reconcile_sweeps_inventory_of_mirrored_products_and_reads_schedule_it(monkeypatch):
+    store = f"mirror-{uuid4().hex[:8]}"
+    product = {"id": 77, "title": "Lamp", "updated_at": "2026-10-01T10:00:00Z", "variants": [{"id": 1, "inventory_item_id": 901}, {"id": 2, "inventory_item_id": 902}]}
+    levels = [
+        {"inventory_item_id": 901, "location_id": 1, "available": 5, "updated_at": "2026-10-02T10:00:00Z"},
+        {"inventory_item_id": 902, "location_id": 1, "available": 0, "updated_at": "2026-10-02T10:00:00Z"},
+    ]
+    calls = []
+
+    def fake_page(store_, resource, params):
+        calls.append((resource, params))
+        return {"orders": [], "products": [product], "inventory_levels": levels}[resource], True
+
+    monkeypatch.setattr(shopify_mirror, "_page_resource", fake_page)
+    out = shopify_mirror.reconcile(store)
+    assert out["inventory"] == {"items": 2, "fetched": 2, "written": 2, "complete": True}
+    assert [p["inventory_item_ids"] for r, p in calls if r == "inventory_levels"] == ["901,902"]
+    assert db.get_mirrored_inventory(store, ["901", "902"]) == {"901": {"available": 5, "locations": {"1": 5}}, "902": {"available": 0, "locations": {"1": 0}}}
+
+    from app import job_runner
+
+    submitted = []
+    monkeypatch.setattr(job_runner, "submit_job", lambda kind, params, **kw: submitted.append((kind, params)) or {"job_id": "j", "status": "queued"})
+    shopify_mirror.ensure_fresh(store)  # just reconciled
+    assert submitted == []
+    state = db.get_app_setting(store, shopify_mirror._SYNC_KEY)
+    db.set_app_setting(store, shopify_mirror._SYNC_KEY, {**state, "reconciled_at": time.time() - shopify_mirror.RECONCILE_S - 1})
+    shopify_mirror._submitted.pop(store, None)
+    shopify_mirror.ensure_fresh(store)
+    shopify_mirror.ensure_fresh(store)  # throttled in-process
+    assert submitted == [("shopify.reconcile_mirror", {"store": store})]
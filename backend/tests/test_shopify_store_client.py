@@ -0,0 +1,83 @@
+import time
+
+from app import db
+from app.integrations import shopify_client
+
+
+def test_store_client_memoizes_config_and_refreshes_on_oauth_change(monkeypatch):
+    store = f"reg{int(time.time() * 1000)}"
+    suffix = store.upper()
+    monkeypatch.setenv("SHOPIFY_OAUTH_STORES", store)
+    monkeypatch.setenv(f"SHOPIFY_SHOP_DOMAIN_{suffix}", f"https://{store}.myshopify.com/")
+    db.set_app_setting(store, "shopify_oauth", {"shop": f"{store}.myshopify.com", "access_token": "tok-1"})
+
+    resolved = []
+    real_resolve = shopify_client._resolve_store_config
+    monkeypatch.setattr(shopify_client, "_resolve_store_config", lambda s: resolved.append(s) or real_resolve(s))
+
+    class _Resp:
+        content = b"{}"
+
+        def __init__(self, status_code=200, headers=None):
+            self.status_code = status_code
+            self.headers = headers or {}
+
+        def json(self):
+            return {}
+
+        def raise_for_status(self):
+            if self.status_code >= 400:
+                raise shopify_client.requests.exceptions.HTTPError(response=self)
+
+    sent = []
+    client = shopify_client._store_client(store.upper())
+    assert shopify_client._store_client(store) is client
+
+    def fake_request(method, url, **kw):
+        sent.append((url, kw["headers"].get("X-Shopify-Access-Token")))
+        return _Resp(headers={"X-Shopify-Shop-Api-Call-Limit": "3/40"})
+
+    monkeypatch.setattr(client.session, "request", fake_request)
+    for _ in range(3):
+        shopify_client._rest_get_store(store, "/orders.json")
+    assert resolved == [store]
+    assert sent[-1] == (f"https://{store}.myshopify.com/admin/api/2025-07/orders.json", "tok-1")
+    assert client.call_limit == "3/40"
+
+    db.set_app_setting(store, "shopify_oauth", {"shop": f"{store}.myshopify.com", "access_token": "tok-2"})
+    shopify_client._rest_get_store(store, "/orders.json")
+    assert len(resolved) == 2 and sent[-1][1] == "tok-2"
+
+    monkeypatch.setattr(client.session, "request", lambda *a, **k: _Resp(429, {"Retry-After": "1.5"}))
+    try:
+        shopify_client._rest_get_store_raw_once(store, "/orders.json")
+        raise AssertionError("expected the 429")
+    except shopify_client.requests.exceptions.HTTPError as e:
+        assert e.response.status_code == 429
+    assert client.throttled == 1 and client.retry_at["rest"] > time.monotonic() + 1 and client.retry_at["graphql"] == 0.0
+
+    # Inside the Retry-After window the caller gets the wait back instead of being blocked.
+    started = time.monotonic()
+    try:
+        shopify_client._rest_get_store_raw_once(store, "/orders.json")
+        raise AssertionError("expected ShopifyThrottled")
+    except shopify_client.ShopifyThrottled as e:
+        assert 1 < e.retry_after <= 1.5
+    assert time.monotonic() - started < 0.5 and client.throttled == 1
+
+    # GraphQL has its own bucket, and throttled writes are retried instead of failing.
+    monkeypatch.setattr(client.session, "request", lambda *a, **k: _Resp(200))
+    assert shopify_client._gql_store_once(store, "{ shop { id } }", {}) is None
+    client.retry_at["rest"] = 0.0
+    statuses = [429, 200]
+    monkeypatch.setattr(client.session, "request", lambda *a, **k: _Resp(statuses.pop(0), {"Retry-After": "0"}))
+    post = shopify_client._rest_post_store.retry_with(wait=shopify_client.wait_exponential(max=0))
+    assert post(store, "/products/1/variants.json", {}) == {} and statuses == []
+
+    # One client per canonical label; labels the store registry rejects are refused.
+    assert list(shopify_client._STORE_CLIENTS).count(store) == 1 and store.upper() not in shopify_client._STORE_CLIENTS
+    try:
+        shopify_client._store_client("not a store!")
+        raise AssertionError("expected ValueError")
+    except ValueError:
+        pass
@@ -0,0 +1,49 @@
+import os
+from types import SimpleNamespace
+
+from app import db, translation_memory
+
+
+def test_translation_memory_sends_only_misses_and_retries_missing_ids():
+    db.delete_translation_memory("zz")
+    sent = []
+
+    def flaky_chunk(chunk):
+        sent.append(dict(chunk))
+        # First call drops one item; the retry round must only resend that one.
+        out = {cid: f"T({text})" for cid, text in chunk.items()}
+        if len(sent) == 1:
+            out.pop(next(iter(chunk)))
+        return out
+
+    first = translation_memory.translate_with_memory(["a", "b", "a", ""], "zz", flaky_chunk, domain="ads")
+    assert first == {0: "T(a)", 1: "T(b)", 2: "T(a)"}
+    assert sorted(sent[0].values()) == ["a", "b"]
+    assert list(sent[1].values()) == ["a"]
+
+    sent.clear()
+    second = translation_memory.translate_with_memory({"x": "b", "y": "c"}, "zz", flaky_chunk, domain="ads")
+    assert second == {"x": "T(b)", "y": "T(c)"}
+    assert all(list(call.values()) == ["c"] for call in sent)
+
+    assert translation_memory.chunk_by_tokens({"a": "x" * 30, "b": "y" * 30, "c": "z"}, budget=12) == [
+        {"a": "x" * 30},
+        {"b": "y" * 30, "c": "z"},
+    ]
+
+
+def test_translation_retry_round_resends_instead_of_replaying_a_bad_response(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY") or "test-key")
+    from app.integrations import openai_client
+
+    db.delete_translation_memory("zy")
+    replies = iter(['{"translations": {}}', '{"translations": {"0": "bonjour"}}'])
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs["messages"])
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content=next(replies)))])
+
+    monkeypatch.setattr(openai_client.client.chat.completions, "create", fake_create)
+    assert openai_client.translate_texts(["hello"], "zy") == ["bonjour"]
+    assert len(calls) == 2 and calls[0] == calls[1]  # same prompt, sent again rather than served from cache
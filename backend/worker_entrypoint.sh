@@ -1,5 +1,13 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-celery -A app.tasks worker --loglevel=info --concurrency=2 &
+# One worker per job class so bulk analytics never queue ahead of interactive work.
+# Each scales independently; autoscaling signals (depth and oldest-message age
+# per queue) are published by system_health's celery section.
+celery -A app.tasks worker --loglevel=info -n interactive@%h -Q interactive,celery \
+  --concurrency="${PTOS_CELERY_INTERACTIVE_CONCURRENCY:-2}" --prefetch-multiplier=1 &
+celery -A app.tasks worker --loglevel=info -n media@%h -Q media \
+  --concurrency="${PTOS_CELERY_MEDIA_CONCURRENCY:-2}" --prefetch-multiplier=1 &
+celery -A app.tasks worker --loglevel=info -n bulk@%h -Q bulk,warm \
+  --concurrency="${PTOS_CELERY_BULK_CONCURRENCY:-1}" --prefetch-multiplier=1 &
 exec uvicorn app.worker_health:app --host 0.0.0.0 --port ${PORT:-8080}
@@ -143,15 +143,17 @@ export async function confirmationAdminUserResetPassword(payload:{ store?: strin
   return data as { data?: { email: string, generated_password?: string|null }, error?: string }
 }
 
-export async function confirmationAdminAnalytics(payload?:{ store?: string, days?: number }){
+export async function confirmationAdminAnalytics(payload?:{ store?: string, days?: number, start?: string, end?: string }){
   const store = payload?.store ?? selectedStore()
   const days = payload?.days
   const parts: string[] = []
   if(store) parts.push(`store=${encodeURIComponent(store)}`)
   if(typeof days === 'number') parts.push(`days=${days}`)
+  if(payload?.start) parts.push(`start=${encodeURIComponent(payload.start)}`)
+  if(payload?.end) parts.push(`end=${encodeURIComponent(payload.end)}`)
   const qp = parts.length? `?${parts.join('&')}` : ''
   const {data} = await axios.get(`${base}/api/confirmation/admin/analytics${qp}`, { headers: { ...confirmationAdminHeaders() } })
-  return data as { data?: { totals: {confirm:number, phone:number, whatsapp:number}, agents: Record<string, {confirm:number, phone:number, whatsapp:number, last_at?: string|null}>, daily: Array<{date:string, confirm:number, phone:number, whatsapp:number}> }, error?: string }
+  return data as { data?: { totals: {confirm:number, phone:number, whatsapp:number}, agents: Record<string, {confirm:number, phone:number, whatsapp:number, last_at?: string|null}>, daily: Array<{date:string, confirm:number, phone:number, whatsapp:number}>, start?: string, end?: string }, error?: string }
 }
 export async function launchTest(payload:{audience:string, benefits:string[], pain_points:string[], base_price?:number, title?:string, images?:File[], targeting?:any, advantage_plus?:boolean, adset_budget?:number, model?:string, angles_prompt?:string, title_desc_prompt?:string, landing_copy_prompt?:string, sizes?:string[], colors?:string[] }){
   const form = new FormData()
@@ -225,14 +227,15 @@ export async function getFlow(id: string){
   const {data} = await axios.get(`${base}/api/flows/${id}`)
   return data as { id:string, status:string, title?:string|null, card_image?:string|null, page_url?:string|null, product?:any, flow?:any, ui?:any, prompts?:any, settings?:any, ads?:any, created_at?:string }
 }
-export async function listFlows(limit?: number, store?: string){
+export async function listFlows(limit?: number, store?: string, cursor?: string|null){
   const parts: string[] = []
   if(typeof limit==='number') parts.push(`limit=${limit}`)
   const s = (store||selectedStore())
   if(s) parts.push(`store=${encodeURIComponent(s)}`)
+  if(cursor) parts.push(`cursor=${encodeURIComponent(cursor)}`)
   const q = parts.length? `?${parts.join('&')}` : ''
   const {data} = await axios.get(`${base}/api/flows${q}`)
-  return data as { data: Array<{ id:string, status:string, title?:string|null, card_image?:string|null, page_url?:string|null, created_at?:string, flow_type?: 'product'|'ads'|'promotion', store?: string }>, error?:string }
+  return data as { data: Array<{ id:string, status:string, title?:string|null, card_image?:string|null, page_url?:string|null, created_at?:string, flow_type?: 'product'|'ads'|'promotion', store?: string }>, next_cursor?: string|null, error?:string }
 }
 
 export async function deleteFlow(id: string){